@@ -0,0 +1,99 @@
+"""
+Committing an edit of the Asset Allocation page (one weight changed in a large allocation): rewriting
+the edited tables and rebalancing every portfolio (previous path) vs. applying the row-level
+difference and rebalancing the affected portfolio only (apply_allocation_edits).
+
+Run from the project root:  python -m benchmarks.bench_allocation_edits
+"""
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.data_ingestion import replace_table_rows, apply_allocation_edits
+from benchmarks.bench_columnar_store import timeit, N_REPEATS
+
+
+def make_allocation(n_portfolios: int, n_assets: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    portfolio_ids = [f"PF_{i:04d}" for i in range(n_portfolios)]
+    asset_ids = [f"A{i:04d}" for i in range(n_assets)]
+
+    allocation = pd.MultiIndex.from_product([portfolio_ids, asset_ids], names=['portfolio_id', 'asset_id']).to_frame(index=False)
+    allocation['asset_weight'] = rng.uniform(size=len(allocation))
+    allocation['asset_weight'] /= allocation.groupby('portfolio_id')['asset_weight'].transform('sum')
+
+    return {
+        'assets': pd.DataFrame({'asset_id': asset_ids, 'asset_name': [f"Asset {i}" for i in asset_ids]}),
+        'portfolios': pd.DataFrame({'portfolio_id': portfolio_ids, 'portfolio_name': portfolio_ids}),
+        'asset_allocation': allocation,
+    }
+
+
+def edit_one_weight(conn) -> dict:
+    # What the page passes on: the tables as shown, with one weight doubled
+    edits = {table: pd.read_sql_query(f"SELECT * FROM {table}", conn) for table in ['asset_allocation', 'portfolios', 'assets']}
+    edits['asset_allocation'].loc[0, 'asset_weight'] *= 2
+    return edits
+
+
+def replace_path(conn, edits):
+    # Reproduces the page before row-level commits: every edited table rewritten, then all portfolios rebalanced
+    for table, df in edits.items():
+        replace_table_rows(conn, table, df)
+    conn.commit()
+    allocation = pd.read_sql_query("SELECT * FROM asset_allocation", conn)
+    allocation['asset_weight'] /= allocation.groupby('portfolio_id')['asset_weight'].transform('sum')
+    replace_table_rows(conn, 'asset_allocation', allocation)
+    conn.commit()
+
+
+def delta_path(conn, edits):
+    apply_allocation_edits(conn, {table: edits[table] for table in ['asset_allocation', 'portfolios']})
+
+
+def run(n_portfolios: int = 200, n_assets: int = 250) -> pd.DataFrame:
+
+    data = make_allocation(n_portfolios, n_assets)
+    cwd = os.getcwd()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'db'))
+        os.makedirs(os.path.join(tmp, 'config'))
+        with open(os.path.join(cwd, 'config', 'database_schema.json')) as src, \
+                open(os.path.join(tmp, 'config', 'database_schema.json'), 'w') as dst:
+            dst.write(src.read())
+
+        os.chdir(tmp)
+        try:
+            DataBase(full_rebuild=True)
+            with db_connection() as conn:
+                for table, df in data.items():
+                    replace_table_rows(conn, table, df)
+
+            with db_connection() as conn:
+                for path, commit in {'replace tables, rebalance all': replace_path, 'row-level diff': delta_path}.items():
+                    before = conn.total_changes
+                    results.append({
+                        'path': path,
+                        'allocation_rows': len(data['asset_allocation']),
+                        'commit_s': timeit(lambda: commit(conn, edit_one_weight(conn))),
+                        'rows_written_per_commit': (conn.total_changes - before) / N_REPEATS,
+                    })
+            close_db_connections()
+        finally:
+            os.chdir(cwd)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    pd.set_option('display.width', 200)
+    print(run(n_portfolios=int(200 * scale)).round(4).to_string(index=False))
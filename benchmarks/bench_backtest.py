@@ -0,0 +1,124 @@
+"""
+Rebalancing backtests of many portfolios and parameter sets: a loop simulating one run at a time
+(weights drifting period by period, pandas statistics of the value path) vs. BacktestEngine
+(all runs of a chunk as one weight matrix, summary statistics accumulated on the way), in-process
+and over a process pool, on synthetic monthly prices. The loop is timed on a sample of the runs.
+
+Run from the project root:  python -m benchmarks.bench_backtest
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from calculations.calc_backtest import BacktestEngine, BACKTEST_SUMMARY
+from calculations.calc_portfolio import PortfolioReturnsEngine
+
+N_MONTHS = 294
+N_ASSETS = 250
+ASSETS_PER_PORTFOLIO = 15
+CASES = [2, 10, 50]  # portfolios, each swept over the default parameter grid
+N_LOOP_RUNS = 100
+POOL_WORKERS = max(2, os.cpu_count() or 1)
+
+
+def make_inputs(n_portfolios: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(DEFAULT_START_DATE, periods=N_MONTHS, freq='ME').strftime(DATE_FORMAT)
+    assets = [f"A{i:04d}" for i in range(N_ASSETS)]
+    returns = 0.8 * rng.normal(0.005, 0.04, size=(N_MONTHS, 1)) + rng.normal(0.002, 0.05, size=(N_MONTHS, N_ASSETS))
+    prices = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates, columns=assets)
+    # Assets get their first price on different dates
+    for i, start in enumerate(rng.integers(0, N_MONTHS // 3, size=N_ASSETS)):
+        prices.iloc[:start, i] = np.nan
+    prices = prices.melt(ignore_index=False, var_name='asset_id', value_name='asset_price').dropna()
+    prices = prices.rename_axis('date').reset_index()[['asset_id', 'date', 'asset_price']]
+
+    allocation = pd.DataFrame([
+        (f"PF_{p:04d}", asset, weight)
+        for p in range(n_portfolios)
+        for asset, weight in zip(rng.choice(assets, size=ASSETS_PER_PORTFOLIO, replace=False),
+                                 rng.dirichlet(np.ones(ASSETS_PER_PORTFOLIO)))
+    ], columns=['portfolio_id', 'asset_id', 'asset_weight'])
+    return prices, allocation
+
+
+def loop_run(returns, target, start, frequency, threshold, cost_bps):
+    w, values = target.copy(), [1.0]
+    rebalances, traded, kept = 0, 0.0, 1.0
+    for t in range(start + 1, len(returns)):
+        gross = w @ returns[t]
+        w = w * (1 + returns[t]) / (1 + gross)
+        trade = 0.0
+        if frequency > 0 and (t - start) % frequency == 0 and np.abs(target - w).max() > threshold:
+            trade = np.abs(target - w).sum()
+            w = target.copy()
+            rebalances += 1
+        values.append(values[-1] * (1 + gross) * (1 - trade * cost_bps / 1e4))
+        traded += trade
+        kept *= 1 - trade * cost_bps / 1e4
+
+    value = pd.Series(values)
+    r = value.pct_change().dropna()
+    years = len(r) / RISK_PERIODS_PER_YEAR
+    return {
+        'total_return': value.iloc[-1] - 1,
+        'annual_return': value.iloc[-1] ** (1 / years) - 1,
+        'volatility': r.std() * np.sqrt(RISK_PERIODS_PER_YEAR),
+        'sharpe': (r.mean() - RISK_FREE_RATE / RISK_PERIODS_PER_YEAR) / r.std() * np.sqrt(RISK_PERIODS_PER_YEAR),
+        'max_drawdown': 1 - (value / value.cummax()).min(),
+        'rebalances': rebalances,
+        'turnover': traded / years,
+        'costs': 1 - kept,
+    }
+
+
+def run() -> pd.DataFrame:
+
+    results = []
+    for n_portfolios in CASES:
+        prices, allocation = make_inputs(n_portfolios)
+        engine = BacktestEngine(prices, allocation)
+
+        t0 = time.perf_counter()
+        in_process = engine.sweep(n_workers=1)
+        in_process_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pooled = engine.sweep(n_workers=POOL_WORKERS)
+        pool_s = time.perf_counter() - t0
+
+        sample = in_process.sample(min(N_LOOP_RUNS, len(in_process)), random_state=0)
+        t0 = time.perf_counter()
+        reference = pd.DataFrame([
+            loop_run(engine.returns, engine.targets[code], engine.starts[code], run.frequency, run.threshold, run.cost_bps)
+            for code, run in zip(engine.portfolio_ids.get_indexer(sample['portfolio_id']), sample.itertuples())
+        ], index=sample.index)
+        loop_s = (time.perf_counter() - t0) * len(in_process) / len(sample)
+
+        # Rebalancing every period for free holds the allocation's weights, as calc_portfolio_price does
+        static = PortfolioReturnsEngine(prices, allocation).portfolio_returns_frame()
+        static_growth = static.groupby('portfolio_id')['pct_return'].apply(lambda r: np.prod(1 + r) - 1)
+        monthly = in_process.query('frequency == 1 and threshold == 0 and cost_bps == 0').set_index('portfolio_id')
+
+        results.append({
+            'portfolios': n_portfolios,
+            'runs': len(in_process),
+            'loop_s (extrapolated)': loop_s,
+            'engine in-process_s': in_process_s,
+            'pool workers': POOL_WORKERS,
+            'engine pool_s': pool_s,
+            'pool == in-process': bool(np.allclose(pooled[BACKTEST_SUMMARY], in_process[BACKTEST_SUMMARY], equal_nan=True)),
+            'max_rel_diff vs loop': float(np.nanmax(
+                np.abs(sample[BACKTEST_SUMMARY] - reference) / np.maximum(np.abs(reference), 1))),
+            'max_diff vs static weights': float(np.abs(monthly['total_return'] - static_growth.reindex(monthly.index)).max()),
+        })
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 250)
+    print(run().to_string(index=False, float_format=lambda v: f"{v:.4g}"))
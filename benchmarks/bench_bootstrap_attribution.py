@@ -0,0 +1,58 @@
+"""
+Block bootstrap significance of return attribution coefficients: a loop refitting RidgeCV on
+every resample vs. calc_bootstrap_attribution (resample statistics gathered from the full sample,
+batched eigendecompositions per chunk, optionally in a process pool). Coefficients of the
+resamples must match.
+
+Run from the project root:  python -m benchmarks.bench_bootstrap_attribution
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import RidgeCV
+
+from common.constants import *
+from calculations.calc_attribution import block_bootstrap_indices, calc_bootstrap_attribution, _fit_resamples
+from benchmarks.bench_rolling_attribution import make_inputs
+
+CASES = [(20, 120), (200, 36), (1500, 36), (1500, 120)]  # (features, periods)
+
+
+def ridgecv_loop(X, y, indices):
+    return np.array([RidgeCV(alphas=ATTRIBUTION_ALPHAS).fit(X[rows], y[rows]).coef_ for rows in indices])
+
+
+def run(n_resamples: int = ATTRIBUTION_BOOTSTRAP_RESAMPLES) -> pd.DataFrame:
+
+    n_pool = os.cpu_count() or 1
+    results = []
+    for n_features, n_periods in CASES:
+        X, y = make_inputs(n_features)
+        X, y = X.iloc[-n_periods:], y.iloc[-n_periods:]
+        X_values, y_values = X.to_numpy(), y.to_numpy()
+        indices = block_bootstrap_indices(n_periods, n_resamples)
+
+        t0 = time.perf_counter()
+        reference = ridgecv_loop(X_values, y_values, indices)
+        loop_s = time.perf_counter() - t0
+
+        row = {'features': n_features, 'periods': n_periods, 'resamples': n_resamples, 'RidgeCV loop_s': loop_s}
+        for n_workers in sorted({1, n_pool}):
+            t0 = time.perf_counter()
+            calc_bootstrap_attribution(X, y, n_resamples=n_resamples, n_workers=n_workers)
+            row[f"batched ({n_workers} workers)_s"] = time.perf_counter() - t0
+
+        coefficients, _ = _fit_resamples(X_values, y_values, indices, ATTRIBUTION_ALPHAS)
+        row['max_abs_diff'] = float(np.abs(coefficients - reference).max())
+        results.append(row)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 250)
+    n_resamples = int(sys.argv[1]) if len(sys.argv) > 1 else ATTRIBUTION_BOOTSTRAP_RESAMPLES
+    print(run(n_resamples).to_string(index=False, float_format=lambda v: f"{v:.4g}"))
@@ -0,0 +1,111 @@
+"""
+Peak memory (tracemalloc) and wall time of preparing the attribution design matrix: the previous
+inline pandas code (pivot, pct_change, dropna, concat, bfill/ffill, replace) vs. the in-place
+CleaningPipeline on the precomputed changes (feature store), on the full factor panel. Also times
+computing the features at ingestion and appending one month incrementally.
+
+Run from the project root:  python -m benchmarks.bench_cleaning
+"""
+import time
+import warnings
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from calculations.calc_attribution import prepare_predictors
+from preprocessing.cleaning import CleaningPipeline
+from preprocessing.feature_engineering import compute_features, feature_panel, read_feature_definitions
+from benchmarks.bench_columnar_store import make_factor_data
+
+N_REGIONS = [265, 1000]  # x 8 factors x 294 months
+
+
+def make_panel(n_regions: int, seed: int = 0) -> tuple:
+    data = make_factor_data(8, n_regions, 294, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    macro_data = data['factor_data'].merge(data['factors'], on='factor_id').merge(data['regions'], on='region_id')
+    macro_data['value'] = np.exp(macro_data['value'] * 0.05)
+    # Gaps, whole missing series and zero levels (infinite changes), as in the WorldBank data
+    macro_data.loc[rng.random(len(macro_data)) < 0.05, 'value'] = np.nan
+    macro_data.loc[macro_data['region_id'].isin(data['regions']['region_id'].iloc[::50]), 'value'] = np.nan
+    macro_data.loc[rng.random(len(macro_data)) < 0.001, 'value'] = 0.0
+
+    dates = sorted(macro_data['date'].unique())
+    pf_tbl = pd.DataFrame({'date': dates, 'pct_return': rng.normal(0, 0.03, size=len(dates))})
+    return pf_tbl, macro_data
+
+
+def inline_prepare(pf_tbl, macro_data):
+    # The X/y preparation as it was inlined in the Analysis page
+    macro_data['key'] = macro_data['factor_name'].astype(str) + '|' + macro_data['region_name'].astype(str)
+    y = pf_tbl['pct_return'].reset_index(drop=True)
+    X = macro_data.pivot(index='date', columns='key', values='value').reset_index(drop=True).pct_change()
+    X = X.dropna(how='all', axis=1)
+    Xy = pd.concat([X, y], axis=1)
+    Xy = Xy.dropna(subset='pct_return').reset_index(drop=True)
+    Xy = Xy.bfill(axis=0).ffill(axis=0)
+    Xy = Xy.replace({np.inf: 999, -np.inf: -999})
+    return Xy.iloc[:, :-1], Xy.iloc[:, -1]
+
+
+def compute_changes(macro_data):
+    # Done once at ingestion (see FeatureStore), not on every page interaction
+    features = compute_features(macro_data, {'pct_change': read_feature_definitions()['pct_change']})
+    names = macro_data.drop_duplicates(subset=['factor_id', 'region_id'])[['factor_id', 'region_id', 'factor_name', 'region_name']]
+    return feature_panel(features.merge(names, on=['factor_id', 'region_id']), 'pct_change')
+
+
+def pipeline_prepare(pf_tbl, factor_changes):
+    y = pf_tbl.set_index('date')['pct_return'].dropna()
+    return prepare_predictors(factor_changes, y.index), y
+
+
+def measure(func, *args) -> tuple:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def run() -> pd.DataFrame:
+
+    warnings.simplefilter('ignore', FutureWarning)  # pct_change's deprecated fill_method in the inline code
+
+    results = []
+    for n_regions in N_REGIONS:
+        pf_tbl, macro_data = make_panel(n_regions)
+
+        (X_inline, _), inline_s, inline_mb = measure(inline_prepare, pf_tbl, macro_data.copy())
+        factor_changes, features_s, features_mb = measure(compute_changes, macro_data)
+        (X_pipeline, _), pipeline_s, pipeline_mb = measure(pipeline_prepare, pf_tbl, factor_changes)
+        diff = float(np.abs(X_inline.to_numpy() - X_pipeline.to_numpy()).max())
+        results += [
+            {'series': X_inline.shape[1], 'step': 'design matrix, inline pandas', 'seconds': inline_s, 'peak_MiB': inline_mb},
+            {'series': factor_changes.shape[1], 'step': 'pct_change feature (ingestion)', 'seconds': features_s, 'peak_MiB': features_mb},
+            {'series': X_pipeline.shape[1], 'step': 'design matrix, CleaningPipeline', 'seconds': pipeline_s, 'peak_MiB': pipeline_mb,
+             'max_abs_diff': diff},
+        ]
+
+        # Cleaning alone on the pivoted panel: float64 vs float32, full history vs one new month
+        levels = macro_data.pivot_table(index='date', columns=['factor_name', 'region_name'], values='value', dropna=False)
+        for dtype in [np.float64, np.float32]:
+            pipeline = CleaningPipeline(pct_change=True, dtype=dtype)
+            _, fit_s, fit_mb = measure(pipeline.fit_transform, levels.iloc[:-1], True)
+            _, update_s, update_mb = measure(pipeline.transform, levels.iloc[-1:], True)
+            results += [
+                {'series': levels.shape[1], 'step': f"fit_transform {np.dtype(dtype).name}", 'seconds': fit_s, 'peak_MiB': fit_mb},
+                {'series': levels.shape[1], 'step': f"transform 1 new month {np.dtype(dtype).name}", 'seconds': update_s, 'peak_MiB': update_mb},
+            ]
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 200)
+    print(run().round(4).to_string(index=False))
@@ -0,0 +1,133 @@
+"""
+Load latency of factor_data slices: full SQLite JOIN + pandas filtering (current dashboard path)
+vs. filtered SQL vs. the partitioned columnar store.
+
+Run from the project root:  python -m benchmarks.bench_columnar_store
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from db.setup import DataBase
+from db.columnar_store import ColumnarStore
+from db.queries import read_factor_data
+
+N_REPEATS = 5
+
+
+def make_factor_data(n_factors: int, n_regions: int, n_months: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    factor_ids = [f"F{i:03d}" for i in range(n_factors)]
+    region_ids = [f"R{i:03d}" for i in range(n_regions)]
+    dates = pd.date_range(DEFAULT_START_DATE, periods=n_months, freq='ME').strftime(DATE_FORMAT)
+
+    index = pd.MultiIndex.from_product([factor_ids, region_ids, dates], names=['factor_id', 'region_id', 'date'])
+    factor_data = index.to_frame(index=False)
+    factor_data['value'] = rng.normal(size=len(factor_data))
+
+    return {
+        'factors': pd.DataFrame({'factor_id': factor_ids, 'factor_name': [f"Factor {i}" for i in factor_ids]}),
+        'regions': pd.DataFrame({'region_id': region_ids, 'region_name': [f"Region {i}" for i in region_ids]}),
+        'factor_data': factor_data,
+    }
+
+
+def timeit(func) -> float:
+    timings = []
+    for _ in range(N_REPEATS):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings))
+
+
+def current_path(conn, factor_name=None, region_name=None, start=None, end=None):
+    # Reproduces the dashboard queries before the columnar store: full JOIN, then filtering in pandas
+    macro_data = pd.read_sql_query((
+        f"SELECT factor_data.factor_id, factors.factor_name, factor_data.region_id, regions.region_name, factor_data.date, factor_data.value "
+        f"FROM factor_data "
+        f"INNER JOIN factors ON factor_data.factor_id = factors.factor_id "
+        f"INNER JOIN regions ON factor_data.region_id = regions.region_id "
+        f"{'' if factor_name is None else f'''WHERE factors.factor_name = '{factor_name}' '''}"
+    ), conn)
+    if region_name is not None:
+        macro_data = macro_data[macro_data['region_name'] == region_name]
+    if start is not None:
+        macro_data = macro_data[(macro_data['date'] >= start) & (macro_data['date'] <= end)]
+    return macro_data.reset_index(drop=True)
+
+
+def run(n_factors: int = 8, n_regions: int = 265, n_months: int = 294) -> pd.DataFrame:
+
+    data = make_factor_data(n_factors, n_regions, n_months)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = 'bench.db'
+        cwd = os.getcwd()
+        os.makedirs(os.path.join(tmp, 'db'))
+        os.makedirs(os.path.join(tmp, 'config'))
+        with open(os.path.join(cwd, 'config', 'database_schema.json')) as src, \
+                open(os.path.join(tmp, 'config', 'database_schema.json'), 'w') as dst:
+            dst.write(src.read())
+
+        os.chdir(tmp)
+        try:
+            DataBase(db_name=db_name)
+            store = ColumnarStore(root=os.path.join(tmp, 'columnar'))
+            with sqlite3.connect(f"db/{db_name}") as conn:
+                for table, df in data.items():
+                    df.to_sql(table, conn, if_exists='append', index=False)
+            store.upsert('factor_data', data['factor_data'])
+
+            sizes = {
+                'sqlite_mb': os.path.getsize(f"db/{db_name}") / 2**20,
+                'columnar_mb': sum(
+                    os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(store.root) for f in files
+                ) / 2**20,
+            }
+
+            factor_id, region_id = 'F000', 'R010'
+            factor_name, region_name = f"Factor {factor_id}", f"Region {region_id}"
+            start, end = '2010-01', '2012-12'
+
+            with sqlite3.connect(f"db/{db_name}") as conn:
+                cases = {
+                    'one factor/region (macro tab)': (
+                        lambda: current_path(conn, factor_name=factor_name, region_name=region_name),
+                        lambda: read_factor_data(conn, [factor_id], [region_id], use_columnar=False),
+                        lambda: read_factor_data(conn, [factor_id], [region_id], use_columnar=True, store=store),
+                    ),
+                    'all factors, 3y window (attribution tab)': (
+                        lambda: current_path(conn, start=start, end=end),
+                        lambda: read_factor_data(conn, start=start, end=end, use_columnar=False),
+                        lambda: read_factor_data(conn, start=start, end=end, use_columnar=True, store=store),
+                    ),
+                }
+
+                for case, (current, sql_pushdown, columnar) in cases.items():
+                    results.append({
+                        'case': case,
+                        'rows_in_table': len(data['factor_data']),
+                        'rows_returned': len(columnar()),
+                        'current_read_sql_s': timeit(current),
+                        'sql_pushdown_s': timeit(sql_pushdown),
+                        'columnar_s': timeit(columnar),
+                        **sizes,
+                    })
+        finally:
+            os.chdir(cwd)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    pd.set_option('display.width', 200)
+    print(run(n_regions=int(265 * scale)).round(4).to_string(index=False))
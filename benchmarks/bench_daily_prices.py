@@ -0,0 +1,155 @@
+"""
+Daily price storage at scale: 25 years of synthetic daily closes for hundreds of tickers, ingested
+into asset_prices_daily, then read by the dashboard's price/returns/risk path at daily, weekly and
+monthly frequency (aggregated on read, see preprocessing/resampling.py) - from SQLite and from the
+columnar store, uncached (first view after an update) and from the cache of aggregated prices.
+
+Run from the project root:  python -m benchmarks.bench_daily_prices
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.fetchers import FixtureFetcher
+from db.data_ingestion import ingest_ticker_data, bulk_insert
+from db.queries import read_asset_prices, read_asset_allocation
+from calculations.calc_portfolio import PortfolioReturnsEngine
+from calculations.calc_risk import RiskMetricsEngine
+from preprocessing.resampling import window_periods
+from benchmarks.bench_factor_storage import folder_size
+
+N_YEARS = 25
+CASES = [100, 300]  # tickers
+N_PORTFOLIOS = 20
+ASSETS_PER_PORTFOLIO = 15
+FREQUENCIES = ['daily', 'weekly', 'monthly']
+
+
+def write_fixtures(path: str, n_tickers: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(DEFAULT_START_DATE, periods=N_YEARS * 261)
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    returns = 0.7 * rng.normal(0.0003, 0.01, size=(len(dates), 1)) + rng.normal(0.0001, 0.012, size=(len(dates), n_tickers))
+    closes = 100 * np.exp(np.cumsum(returns, axis=0))
+
+    os.makedirs(path)
+    for i, ticker in enumerate(tickers):
+        # Tickers are listed on different dates
+        first = rng.integers(0, len(dates) // 4)
+        pd.DataFrame({'date': dates[first:].strftime('%Y-%m-%d'), 'close': closes[first:, i]}).to_csv(
+            os.path.join(path, f"{ticker}.csv"), index=False)
+    pd.DataFrame({'asset_id': tickers, 'asset_name': [f"Asset {t}" for t in tickers]}).to_csv(
+        os.path.join(path, 'assets.csv'), index=False)
+
+    allocation = pd.DataFrame([
+        (f"PF_{p:02d}", asset, 1 / ASSETS_PER_PORTFOLIO)
+        for p in range(N_PORTFOLIOS)
+        for asset in rng.choice(tickers, size=ASSETS_PER_PORTFOLIO, replace=False)
+    ], columns=['portfolio_id', 'asset_id', 'asset_weight'])
+    return tickers, dates, allocation
+
+
+def dashboard_path(conn, frequency: str, use_columnar: bool) -> dict:
+    # What the Analysis page computes on a view: prices of the allocated assets, returns of all portfolios,
+    # risk metrics over the default windows (in months), latest and rolling
+    timings = {}
+    t0 = time.perf_counter()
+    allocation = read_asset_allocation(conn)
+    prices = read_asset_prices(conn, allocation['asset_id'].unique().tolist(), use_columnar=use_columnar,
+                               frequency=frequency, price_frequency='daily')
+    timings['read_s'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    engine = PortfolioReturnsEngine(prices, allocation)
+    pct, _ = engine.portfolio_returns()
+    timings['returns_s'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    returns = pd.DataFrame(np.where(engine.active_dates(), pct, np.nan), index=engine.dates, columns=engine.portfolio_ids)
+    windows = tuple(window_periods(months, frequency) for months in RISK_WINDOWS)
+    risk = RiskMetricsEngine(returns, periods_per_year=ANALYSIS_FREQUENCIES[frequency])
+    risk.summary(windows)
+    timings['risk summary_s'] = time.perf_counter() - t0
+
+    # Rolling metrics at as many window ends as a chart series shows
+    t0 = time.perf_counter()
+    step = -(-len(risk.index) // CHART_MAX_POINTS_PER_SERIES)
+    risk.rolling_frame(windows, ends=np.arange(len(risk.index) - 1, -1, -step)[::-1])
+    timings['rolling risk_s'] = time.perf_counter() - t0
+    return {'price_rows': len(prices), 'periods': len(engine.dates), **timings}
+
+
+def run(cases: list = CASES) -> pd.DataFrame:
+
+    cwd = os.getcwd()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(cwd, 'config'), os.path.join(tmp, 'config'))
+        os.makedirs(os.path.join(tmp, 'db'))
+
+        os.chdir(tmp)
+        try:
+            for n_tickers in cases:
+                fixtures = os.path.join(tmp, f"fixtures_{n_tickers}")
+                tickers, dates, allocation = write_fixtures(fixtures, n_tickers)
+                end = (dates[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+                DataBase(full_rebuild=True)
+                t0 = time.perf_counter()
+                ingest_ticker_data(tickers, fetcher=FixtureFetcher(fixtures), frequency='daily',
+                                   start=DEFAULT_START_DATE, end=end)
+                ingestion_s = time.perf_counter() - t0
+
+                with db_connection() as conn:
+                    bulk_insert(conn, 'asset_allocation', allocation)
+                    bulk_insert(conn, 'portfolios', pd.DataFrame({'portfolio_id': allocation['portfolio_id'].unique()}))
+                    conn.commit()
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    stored_rows = conn.execute("SELECT COUNT(*) FROM asset_prices_daily").fetchone()[0]
+
+                    # Ingesting again finds every ticker up to date and fetches nothing
+                    t0 = time.perf_counter()
+                    ingest_ticker_data(tickers, fetcher=FixtureFetcher(fixtures), frequency='daily',
+                                       start=DEFAULT_START_DATE, end=end)
+                    update_s = time.perf_counter() - t0
+
+                    for frequency in FREQUENCIES:
+                        for use_columnar in [False, True]:
+                            CACHE.clear()
+                            timings = dashboard_path(conn, frequency, use_columnar)
+                            # Views after the first read the aggregated prices from the cache
+                            cached = dashboard_path(conn, frequency, use_columnar)
+                            results.append({
+                                'tickers': n_tickers,
+                                'stored_rows': stored_rows,
+                                'sqlite_mb': os.path.getsize(f"db/{DB_NAME}") / 2**20,
+                                'columnar_mb': folder_size(os.path.join(COLUMNAR_STORE_PATH, 'asset_prices_daily')) / 2**20,
+                                'ingestion_s': ingestion_s,
+                                'no-op update_s': update_s,
+                                'frequency': frequency,
+                                'store': 'columnar' if use_columnar else 'sqlite',
+                                **timings,
+                                'cached read_s': cached['read_s'],
+                            })
+                close_db_connections()
+        finally:
+            os.chdir(cwd)
+            CACHE.clear()
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 250)
+    cases = [int(n) for n in sys.argv[1:]] or CASES
+    print(run(cases).to_string(index=False, float_format=lambda v: f"{v:.4g}"))
@@ -0,0 +1,157 @@
+"""
+Database rebuilds through the download cache (db/download_cache.py) vs. downloading every ticker
+again: a simulated market data provider (the synthetic price fixtures behind a fixed latency per
+request and per ticker) serves a full rebuild without the cache, with a cold cache, with a warm
+cache and in offline replay mode (the provider unreachable), then an incremental update replayed
+offline from the cached full ranges. Prices must come out identical in every case.
+
+Run from the project root:  python -m benchmarks.bench_download_cache
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import pandas as pd
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.fetchers import PriceFetcher, FixtureFetcher, CachingFetcher
+from db.download_cache import DownloadCache
+from db.data_ingestion import ingest_ticker_data
+from db.queries import read_asset_prices
+from benchmarks.synthetic_data import tickers as make_tickers, write_price_fixtures
+from benchmarks.bench_factor_storage import folder_size
+
+CASES = [50, 200]  # tickers
+REQUEST_LATENCY_S = 0.5
+TICKER_LATENCY_S = 0.02
+
+
+class RemoteFetcher(PriceFetcher):
+
+    def __init__(self, fetcher: PriceFetcher, reachable: bool = True) -> None:
+        # Stands in for Yahoo Finance: every call pays a round trip, every ticker a transfer
+        self.fetcher = fetcher
+        self.reachable = reachable
+        self.requests = 0
+
+    def call(self, method, arg, n_tickers: int):
+        if not self.reachable:
+            raise ConnectionError("Market data provider unreachable")
+        self.requests += 1
+        time.sleep(REQUEST_LATENCY_S + TICKER_LATENCY_S * n_tickers)
+        return method(arg)
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        return self.call(self.fetcher.fetch_prices, date_ranges, len(date_ranges))
+
+    def fetch_names(self, tickers: list) -> dict:
+        return self.call(self.fetcher.fetch_names, tickers, len(tickers))
+
+
+class TimedFetcher(PriceFetcher):
+
+    def __init__(self, fetcher: PriceFetcher) -> None:
+        # Time spent fetching, apart from the rest of the ingestion
+        self.fetcher = fetcher
+        self.seconds = 0.0
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        t0 = time.perf_counter()
+        data = self.fetcher.fetch_prices(date_ranges)
+        self.seconds += time.perf_counter() - t0
+        return data
+
+    def fetch_names(self, tickers: list) -> dict:
+        t0 = time.perf_counter()
+        names = self.fetcher.fetch_names(tickers)
+        self.seconds += time.perf_counter() - t0
+        return names
+
+
+def ingest(tickers: list, fetcher: PriceFetcher, **kwargs) -> tuple:
+    fetcher = TimedFetcher(fetcher)
+    t0 = time.perf_counter()
+    ingest_ticker_data(tickers, fetcher=fetcher, **kwargs)
+    seconds = time.perf_counter() - t0
+    with db_connection() as conn:
+        prices = read_asset_prices(conn, use_columnar=False).sort_values(['asset_id', 'date'], ignore_index=True)
+    return seconds, fetcher.seconds, prices
+
+
+def rebuild(tickers: list, fetcher: PriceFetcher, **kwargs) -> tuple:
+    DataBase(full_rebuild=True)
+    CACHE.clear()
+    return ingest(tickers, fetcher, **kwargs)
+
+
+def run(cases: list = CASES) -> pd.DataFrame:
+
+    cwd = os.getcwd()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(cwd, 'config'), os.path.join(tmp, 'config'))
+        os.makedirs(os.path.join(tmp, 'db'))
+
+        os.chdir(tmp)
+        try:
+            for n_tickers in cases:
+                fixtures = os.path.join(tmp, f"fixtures_{n_tickers}")
+                tickers = make_tickers(n_tickers)
+                write_price_fixtures(fixtures, tickers, DEFAULT_START_DATE, DEFAULT_END_DATE)
+                cache = DownloadCache(root=os.path.join(tmp, f"downloads_{n_tickers}"))
+
+                rows = []
+
+                def result(case, remote, seconds, fetch_seconds, prices):
+                    rows.append({
+                        'tickers': n_tickers,
+                        'case': case,
+                        'ingestion_s': seconds,
+                        'fetch_s': fetch_seconds,
+                        'provider requests': remote.requests,
+                        'cache_mb': cache.size() / 2**20,
+                        'raw_mb': folder_size(fixtures) / 2**20,
+                        'same prices': reference.equals(prices),
+                    })
+
+                remote = RemoteFetcher(FixtureFetcher(fixtures))
+                seconds, fetch_seconds, reference = rebuild(tickers, remote)
+                result('no cache', remote, seconds, fetch_seconds, reference)
+
+                for case in ['cold cache', 'warm cache']:
+                    remote = RemoteFetcher(FixtureFetcher(fixtures))
+                    result(case, remote, *rebuild(tickers, CachingFetcher(remote, cache)))
+
+                remote = RemoteFetcher(FixtureFetcher(fixtures), reachable=False)
+                result('offline replay', remote, *rebuild(tickers, CachingFetcher(remote, cache, mode='offline')))
+
+                # Prices up to a year earlier, then the missing months: the update's ranges are served by the
+                # cached full ranges
+                remote = RemoteFetcher(FixtureFetcher(fixtures), reachable=False)
+                offline = CachingFetcher(remote, cache, mode='offline')
+                early_end = (pd.Timestamp(DEFAULT_END_DATE) - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
+                rebuild(tickers, offline, end=early_end)
+                result('offline incremental update', remote, *ingest(tickers, offline))
+
+                t0 = time.perf_counter()
+                DownloadCache(root=cache.root, max_bytes=cache.size() // 2).evict()
+                evict_s = time.perf_counter() - t0
+                results += [{**row, 'evict half_s': evict_s} for row in rows]
+                close_db_connections()
+        finally:
+            os.chdir(cwd)
+            CACHE.clear()
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 250)
+    cases = [int(n) for n in sys.argv[1:]] or CASES
+    print(run(cases).to_string(index=False, float_format=lambda v: f"{v:.4g}"))
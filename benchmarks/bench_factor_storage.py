@@ -0,0 +1,87 @@
+"""
+Storing factor_data at monthly frequency (annual values interpolated at ingestion) vs. at native
+annual frequency (interpolated on read, see preprocessing/interpolation.py), on the bundled
+data/*.zip archives: database size (SQLite file and columnar copy), ingestion time, and the latency
+of the dashboard's factor reads - uncached and, for annual storage, from the per-slice cache.
+
+Run from the project root:  python -m benchmarks.bench_factor_storage
+"""
+import os
+import time
+import shutil
+import tempfile
+import pandas as pd
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.data_ingestion import ingest_macroeconomic_data
+from db.queries import read_factor_data
+from benchmarks.bench_columnar_store import timeit
+
+
+def folder_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def uncached(func):
+    def wrapper():
+        CACHE.clear()
+        return func()
+    return wrapper
+
+
+def run() -> pd.DataFrame:
+
+    cwd = os.getcwd()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for folder in ['config', 'data']:
+            shutil.copytree(os.path.join(cwd, folder), os.path.join(tmp, folder))
+        os.makedirs(os.path.join(tmp, 'db'))
+
+        os.chdir(tmp)
+        try:
+            for frequency in FACTOR_DATA_FREQUENCIES:
+                DataBase(full_rebuild=True)
+                t0 = time.perf_counter()
+                ingest_macroeconomic_data(n_workers=1, frequency=frequency)
+                ingestion_s = time.perf_counter() - t0
+
+                with db_connection() as conn:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    stored_rows = conn.execute("SELECT COUNT(*) FROM factor_data").fetchone()[0]
+                    factor_id, region_id = conn.execute("SELECT factor_id, region_id FROM factor_data LIMIT 1").fetchone()
+
+                    cases = {
+                        'one factor/region (macro tab)': lambda: read_factor_data(conn, [factor_id], [region_id], frequency=frequency),
+                        'all factors, 3y window': lambda: read_factor_data(conn, start='2010-01', end='2012-12', frequency=frequency),
+                        'all factors, full history': lambda: read_factor_data(conn, frequency=frequency),
+                    }
+                    for case, read in cases.items():
+                        results.append({
+                            'frequency': frequency,
+                            'case': case,
+                            'stored_rows': stored_rows,
+                            'sqlite_mb': os.path.getsize(f"db/{DB_NAME}") / 2**20,
+                            'columnar_mb': folder_size(os.path.join(COLUMNAR_STORE_PATH, 'factor_data')) / 2**20,
+                            'ingestion_s': ingestion_s,
+                            'rows_returned': len(read()),
+                            'read_s': timeit(uncached(read)),
+                            # Only annual storage caches the interpolated slice in read_factor_data itself
+                            'cached_read_s': timeit(read) if frequency == 'annual' else None,
+                        })
+                close_db_connections()
+        finally:
+            os.chdir(cwd)
+            CACHE.clear()
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 200)
+    print(run().round(4).to_string(index=False))
@@ -0,0 +1,67 @@
+"""
+Timing of the WorldBank ingestion ("Set up database") on the bundled data/*.zip archives:
+archive parsing alone (in-process vs. process pool) and the full ingest_macroeconomic_data call.
+
+Run from the project root:  python -m benchmarks.bench_macro_ingestion
+"""
+import os
+import time
+import shutil
+import tempfile
+import itertools
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from common.constants import *
+from db.setup import DataBase
+from db.data_ingestion import ingest_macroeconomic_data, parse_worldbank_archive, read_selected_indicators
+
+
+def time_parsing(zip_paths, n_workers):
+    selected_indicators = read_selected_indicators()
+    args = (itertools.repeat(selected_indicators), itertools.repeat([]))
+
+    t0 = time.perf_counter()
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(parse_worldbank_archive, zip_paths, *args))
+    else:
+        results = list(map(parse_worldbank_archive, zip_paths, *args))
+    elapsed = time.perf_counter() - t0
+
+    return elapsed, sum(len(r['factor_data']) for r in results)
+
+
+def run() -> pd.DataFrame:
+
+    cwd = os.getcwd()
+    zip_paths = sorted([os.path.join(cwd, 'data', file) for file in os.listdir('data') if file.endswith('.zip')])
+    n_pool = min(len(zip_paths), os.cpu_count() or 1)
+    results = []
+
+    for n_workers in sorted({1, n_pool}):
+        elapsed, n_rows = time_parsing(zip_paths, n_workers)
+        results.append({'stage': 'parse archives', 'workers': n_workers, 'rows': n_rows, 'seconds': elapsed})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for folder in ['config', 'data']:
+            shutil.copytree(os.path.join(cwd, folder), os.path.join(tmp, folder))
+        os.makedirs(os.path.join(tmp, 'db'))
+
+        os.chdir(tmp)
+        try:
+            for n_workers in sorted({1, n_pool}):
+                DataBase(full_rebuild=True)
+                t0 = time.perf_counter()
+                ingest_macroeconomic_data(n_workers=n_workers)
+                elapsed = time.perf_counter() - t0
+                results.append({'stage': 'ingest_macroeconomic_data', 'workers': n_workers, 'rows': None, 'seconds': elapsed})
+        finally:
+            os.chdir(cwd)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    print(run().round(3).to_string(index=False))
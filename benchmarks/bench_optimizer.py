@@ -0,0 +1,117 @@
+"""
+Portfolio optimization of many portfolios: a loop solving each portfolio with scipy's SLSQP vs.
+PortfolioOptimizer solving all of them at once (one covariance product per iteration), and the
+next period's re-optimization (the lookback window one period later) started cold (equal weights)
+vs. warm (from the previous optimum).
+The shrinkage covariance is checked against sklearn's ledoit_wolf.
+
+Run from the project root:  python -m benchmarks.bench_optimizer
+"""
+import time
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from sklearn.covariance import ledoit_wolf
+
+from common.constants import *
+from calculations.calc_optimizer import shrinkage_covariance, PortfolioOptimizer, OPTIMIZATION_MODES
+
+N_PERIODS = OPTIMIZER_LOOKBACK + 1
+CASES = [(50, 10), (250, 50), (250, 200)]  # (assets in the universe, portfolios)
+ASSETS_PER_PORTFOLIO = 15
+
+
+def make_inputs(n_assets: int, n_portfolios: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.005, 0.04, size=N_PERIODS)
+    returns = pd.DataFrame(
+        market[:, None] * rng.uniform(0.3, 1.5, size=n_assets) + rng.normal(0.003, 0.03, size=(N_PERIODS, n_assets)),
+        columns=[f"A{i:04d}" for i in range(n_assets)])
+    mask = np.zeros((n_portfolios, n_assets), dtype=bool)
+    for p in range(n_portfolios):
+        mask[p, rng.choice(n_assets, size=ASSETS_PER_PORTFOLIO, replace=False)] = True
+    return returns, mask
+
+
+def slsqp_loop(mode, covariance, mean, mask):
+    weights = np.zeros(mask.shape)
+    for p in range(len(mask)):
+        held = np.flatnonzero(mask[p])
+        C, mu = covariance[np.ix_(held, held)], mean[held]
+        objective = {
+            'min_variance': lambda w: w @ C @ w,
+            'risk_parity': lambda w: ((w * (C @ w) / (w @ C @ w) - 1 / len(w)) ** 2).sum(),
+            'max_sharpe': lambda w: -(w @ mu) / np.sqrt(w @ C @ w),
+        }[mode]
+        result = minimize(objective, np.full(len(held), 1 / len(held)), method='SLSQP', bounds=[(0, 1)] * len(held),
+                          constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1}], options={'ftol': 1e-12, 'maxiter': 500})
+        weights[p, held] = result.x
+    return weights
+
+
+def objective_value(mode, covariance, mean, W):
+    variance = np.einsum('pi,ij,pj->p', W, covariance, W)
+    if mode == 'min_variance':
+        return variance
+    if mode == 'max_sharpe':
+        return -(W @ mean) / np.sqrt(variance)
+    contributions = W * (W @ covariance) / variance[:, None]
+    held = W > 0
+    return np.where(held, (contributions - 1 / held.sum(axis=1, keepdims=True)) ** 2, 0).sum(axis=1)
+
+
+def run() -> pd.DataFrame:
+
+    results = []
+    for n_assets, n_portfolios in CASES:
+        returns, mask = make_inputs(n_assets, n_portfolios)
+
+        t0 = time.perf_counter()
+        covariance, mean, shrinkage = shrinkage_covariance(returns.iloc[:-1])
+        covariance_s = time.perf_counter() - t0
+        reference_cov, reference_shrinkage = ledoit_wolf(returns.iloc[:-1].to_numpy())
+        covariance_diff = float(np.abs(covariance.to_numpy() - reference_cov).max())
+
+        optimizer = PortfolioOptimizer(covariance, mean)
+        next_optimizer = PortfolioOptimizer(*shrinkage_covariance(returns.iloc[1:])[:2])
+        for mode in OPTIMIZATION_MODES:
+            t0 = time.perf_counter()
+            reference = slsqp_loop(mode, optimizer.covariance, optimizer.mean, mask)
+            loop_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            weights = optimizer.optimize(mode, mask)
+            batch_s = time.perf_counter() - t0
+            cold_iterations = optimizer.iterations
+
+            # One period later: cold start vs. warm start from the previous optimum
+            next_optimizer.optimize(mode, mask)
+            next_cold_iterations = next_optimizer.iterations
+            t0 = time.perf_counter()
+            next_optimizer.optimize(mode, mask, initial=weights)
+            warm_s = time.perf_counter() - t0
+
+            results.append({
+                'assets': n_assets,
+                'portfolios': n_portfolios,
+                'mode': mode,
+                'covariance_s': covariance_s,
+                'covariance_max_diff_vs_sklearn': covariance_diff,
+                'SLSQP loop_s': loop_s,
+                'batch_s': batch_s,
+                'iterations': cold_iterations,
+                'next: cold iterations': next_cold_iterations,
+                'next: warm iterations': next_optimizer.iterations,
+                'next: warm_s': warm_s,
+                # Negative: the batch solution is better than SLSQP's
+                'max_objective_gap': float((objective_value(mode, optimizer.covariance, optimizer.mean, weights)
+                                            - objective_value(mode, optimizer.covariance, optimizer.mean, reference)).max()),
+            })
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 250)
+    print(run().to_string(index=False, float_format=lambda v: f"{v:.3g}"))
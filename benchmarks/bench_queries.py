@@ -0,0 +1,121 @@
+"""
+Latency of the dashboard SQL queries as factor_data grows: plain connections on tables with
+primary keys only vs. pooled, tuned connections (common/utils.py) with the secondary indexes
+declared in config/database_schema.json.
+
+Run from the project root:  python -m benchmarks.bench_queries
+"""
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+
+from common.constants import *
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.data_ingestion import bulk_insert
+from db.queries import get_factor_ids, get_region_ids, read_factor_data, read_portfolio_asset_prices
+from benchmarks.bench_columnar_store import make_factor_data, timeit
+
+N_REGIONS = [50, 265, 1000]  # x 8 factors x 294 months
+
+
+def make_portfolio_data(n_assets: int = 50, n_portfolios: int = 10, n_months: int = 294) -> dict:
+    asset_ids = [f"A{i:03d}" for i in range(n_assets)]
+    dates = pd.date_range(DEFAULT_START_DATE, periods=n_months, freq='ME').strftime(DATE_FORMAT)
+
+    prices = pd.MultiIndex.from_product([asset_ids, dates], names=['asset_id', 'date']).to_frame(index=False)
+    prices['asset_price'] = 100.0
+
+    allocation = pd.DataFrame({
+        'portfolio_id': [f"PF_{i % n_portfolios:02d}" for i in range(n_assets)],
+        'asset_id': asset_ids,
+        'asset_weight': 1.0,
+    })
+    return {'asset_prices': prices, 'asset_allocation': allocation}
+
+
+def connect_and_list_names(db_name, pooled):
+    # One Streamlit rerun before the pool: connect, query, close
+    if pooled:
+        with db_connection(db_name) as conn:
+            return pd.read_sql_query("SELECT DISTINCT factor_name FROM factors", conn)
+    with sqlite3.connect(f"db/{db_name}") as conn:
+        names = pd.read_sql_query("SELECT DISTINCT factor_name FROM factors", conn)
+    conn.close()
+    return names
+
+
+def dashboard_queries(conn) -> dict:
+    start, end = '2010-01', '2012-12'
+    return {
+        'distinct factor/region names': lambda: (
+            pd.read_sql_query("SELECT DISTINCT factor_name FROM factors", conn),
+            pd.read_sql_query("SELECT DISTINCT region_name FROM regions", conn),
+        ),
+        'factor/region slice by name': lambda: read_factor_data(
+            conn,
+            factor_ids=get_factor_ids(conn, ['Factor F000']),
+            region_ids=get_region_ids(conn, ['Region R010']),
+            use_columnar=False,
+        ),
+        'all factors, 3y window': lambda: read_factor_data(conn, start=start, end=end, use_columnar=False),
+        'portfolio allocation JOIN prices': lambda: read_portfolio_asset_prices(conn, ['PF_03'], use_columnar=False),
+    }
+
+
+def run() -> pd.DataFrame:
+
+    results = []
+    cwd = os.getcwd()
+
+    for n_regions in N_REGIONS:
+        data = {**make_factor_data(8, n_regions, 294), **make_portfolio_data()}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'db'))
+            os.makedirs(os.path.join(tmp, 'config'))
+            with open(os.path.join(cwd, 'config', 'database_schema.json')) as src, \
+                    open(os.path.join(tmp, 'config', 'database_schema.json'), 'w') as dst:
+                dst.write(src.read())
+
+            os.chdir(tmp)
+            try:
+                for db_name in ['plain.db', 'tuned.db']:
+                    DataBase(db_name=db_name, full_rebuild=True)
+                    with db_connection(db_name) as conn:
+                        for table, df in data.items():
+                            bulk_insert(conn, table, df)
+                        if db_name == 'plain.db':
+                            for (index,) in conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'").fetchall():
+                                conn.execute(f"DROP INDEX {index}")
+                            conn.execute("PRAGMA journal_mode=DELETE")
+                        conn.execute("ANALYZE")
+                    close_db_connections(db_name)
+
+                with sqlite3.connect('db/plain.db') as plain_conn, db_connection('tuned.db') as tuned_conn:
+                    plain_queries, tuned_queries = dashboard_queries(plain_conn), dashboard_queries(tuned_conn)
+                    for query in plain_queries:
+                        results.append({
+                            'factor_data_rows': len(data['factor_data']),
+                            'query': query,
+                            'plain_s': timeit(plain_queries[query]),
+                            'pooled_indexed_s': timeit(tuned_queries[query]),
+                        })
+                results.append({
+                    'factor_data_rows': len(data['factor_data']),
+                    'query': 'connect + factor names',
+                    'plain_s': timeit(lambda: connect_and_list_names('plain.db', pooled=False)),
+                    'pooled_indexed_s': timeit(lambda: connect_and_list_names('tuned.db', pooled=True)),
+                })
+                close_db_connections('tuned.db')
+            finally:
+                os.chdir(cwd)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 200)
+    print(run().round(4).to_string(index=False))
@@ -0,0 +1,61 @@
+"""
+Cost of sending long price histories to the browser: px.line on every point (SVG traces) vs.
+line_figure (server-side downsampling, WebGL beyond CHART_WEBGL_MIN_POINTS), on synthetic daily
+prices. Payload is the figure JSON that st.plotly_chart serializes.
+
+Run from the project root:  python -m benchmarks.bench_rendering
+"""
+import time
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from common.constants import *
+from dashboard.rendering import line_figure
+from benchmarks.synthetic_data import tickers
+
+N_ASSETS = [5, 20, 100]
+N_DAYS = 6000  # about 24 years of business days
+
+
+def make_prices(n_assets: int, n_days: int = N_DAYS, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(DEFAULT_START_DATE, periods=n_days).strftime('%Y-%m-%d')
+    closes = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, size=(n_days, n_assets)), axis=0))
+    prices = pd.DataFrame(closes, index=pd.Index(dates, name='date'), columns=pd.Index(tickers(n_assets), name='asset_id'))
+    return prices.melt(ignore_index=False, value_name='asset_price').reset_index()
+
+
+def measure(build, prices) -> dict:
+    t0 = time.perf_counter()
+    fig = build(prices)
+    build_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    payload = fig.to_json(validate=False)
+    return {
+        'points_sent': sum(len(trace.x) for trace in fig.data),
+        'trace_type': type(fig.data[0]).__name__,
+        'build_s': build_s,
+        'serialize_s': time.perf_counter() - t0,
+        'payload_MB': len(payload) / 2**20,
+    }
+
+
+def run() -> pd.DataFrame:
+    builders = {
+        'px.line': lambda df: px.line(df, x='date', y='asset_price', color='asset_id', log_y=True),
+        'line_figure (lttb)': lambda df: line_figure(df, x='date', y='asset_price', color='asset_id', log_y=True, method='lttb'),
+        'line_figure (minmax)': lambda df: line_figure(df, x='date', y='asset_price', color='asset_id', log_y=True, method='minmax'),
+    }
+    results = []
+    for n_assets in N_ASSETS:
+        prices = make_prices(n_assets)
+        for path, build in builders.items():
+            results.append({'assets': n_assets, 'points': len(prices), 'path': path, **measure(build, prices)})
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 200)
+    print(run().round(3).to_string(index=False))
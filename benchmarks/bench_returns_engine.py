@@ -0,0 +1,111 @@
+"""
+Portfolio returns for many portfolios: the previous pivot/melt/groupby path (one call per
+portfolio, as the Analysis page did) vs. PortfolioReturnsEngine (all portfolios in one matrix
+product). The legacy path is timed on a sample of portfolios and extrapolated linearly.
+
+Run from the project root:  python -m benchmarks.bench_returns_engine
+"""
+import time
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from calculations.calc_portfolio import PortfolioReturnsEngine
+
+N_MONTHS = 300
+N_HOLDINGS = 50
+N_LEGACY_SAMPLE = 10
+CASES = [(1000, 100), (2000, 200), (5000, 500)]  # (assets, portfolios)
+
+
+def make_portfolios(n_assets: int, n_portfolios: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    asset_ids = np.array([f"A{i:05d}" for i in range(n_assets)])
+    dates = pd.date_range(DEFAULT_START_DATE, periods=N_MONTHS, freq='ME').strftime(DATE_FORMAT)
+
+    returns = rng.normal(0.005, 0.05, size=(N_MONTHS, n_assets))
+    price_matrix = 100 * np.exp(np.cumsum(np.log1p(returns), axis=0))
+    prices = pd.DataFrame({
+        'asset_id': np.tile(asset_ids, N_MONTHS),
+        'date': np.repeat(dates, n_assets),
+        'asset_price': price_matrix.ravel(),
+    })
+
+    holdings = [rng.choice(n_assets, size=N_HOLDINGS, replace=False) for _ in range(n_portfolios)]
+    allocation = pd.DataFrame({
+        'portfolio_id': np.repeat([f"PF_{i:04d}" for i in range(n_portfolios)], N_HOLDINGS),
+        'asset_id': asset_ids[np.concatenate(holdings)],
+        'asset_weight': 1 / N_HOLDINGS,
+    })
+    return prices, allocation
+
+
+def legacy_portfolio_returns(assets_tbl):
+    # calc_portfolio_price + calc_portfolio_returns before the engine
+    assets_tbl_pivot = assets_tbl.pivot(index=['portfolio_id', 'date', 'asset_weight'], columns='asset_id', values='asset_price')
+    asset_pct_return = assets_tbl_pivot.pct_change().melt(ignore_index=False, var_name='asset_id', value_name='asset_pct_return')
+    asset_log_return = np.log(assets_tbl_pivot / assets_tbl_pivot.shift(1)).melt(ignore_index=False, var_name='asset_id', value_name='asset_log_return')
+    asset_pct_return = asset_pct_return.set_index('asset_id', append=True)
+    asset_log_return = asset_log_return.set_index('asset_id', append=True)
+    assets_tbl = pd.concat([asset_pct_return, asset_log_return], ignore_index=False, axis=1).reset_index()
+    assets_tbl['weighted_pct_return'] = assets_tbl['asset_weight'] * assets_tbl['asset_pct_return']
+    assets_tbl['weighted_log_return'] = assets_tbl['asset_weight'] * assets_tbl['asset_log_return']
+
+    pf_tbl = assets_tbl.groupby(['portfolio_id', 'date'])[['weighted_pct_return', 'weighted_log_return']].sum().reset_index()
+    return pf_tbl.rename(columns={'weighted_pct_return': 'pct_return', 'weighted_log_return': 'log_return'})
+
+
+def run() -> pd.DataFrame:
+
+    results = []
+    for n_assets, n_portfolios in CASES:
+        prices, allocation = make_portfolios(n_assets, n_portfolios)
+        sample = allocation['portfolio_id'].unique()[:N_LEGACY_SAMPLE]
+
+        t0 = time.perf_counter()
+        legacy = []
+        for pf_id in sample:
+            assets_tbl = allocation[allocation['portfolio_id'] == pf_id].merge(prices, on='asset_id')
+            legacy.append(legacy_portfolio_returns(assets_tbl))
+        legacy_s = (time.perf_counter() - t0) * n_portfolios / len(sample)
+
+        t0 = time.perf_counter()
+        engine = PortfolioReturnsEngine(prices, allocation)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pct, log = engine.portfolio_returns()
+        matmul_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pf_tbl = engine.portfolio_returns_frame()
+        frame_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        engine.asset_returns_frame(sample)
+        assets_frame_s = (time.perf_counter() - t0) * n_portfolios / len(sample)
+
+        # Same results as the legacy path
+        legacy = pd.concat(legacy, ignore_index=True)
+        check = pf_tbl[pf_tbl['portfolio_id'].isin(sample)].reset_index(drop=True)
+        max_abs_diff = float(np.abs(check['pct_return'].to_numpy() - legacy['pct_return'].to_numpy()).max())
+
+        results.append({
+            'assets': n_assets,
+            'portfolios': n_portfolios,
+            'legacy_s (extrapolated)': legacy_s,
+            'engine build_s': build_s,
+            'engine matmul_s': matmul_s,
+            'engine long pf_tbl_s': frame_s,
+            'engine long assets_tbl_s (extrapolated)': assets_frame_s,
+            'speedup (build+matmul)': legacy_s / (build_s + matmul_s),
+            'max_abs_diff': max_abs_diff,
+        })
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 250)
+    print(run().round(4).to_string(index=False))
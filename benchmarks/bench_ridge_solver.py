@@ -0,0 +1,60 @@
+"""
+Return attribution for many portfolios on one date window: a RidgeCV fit per portfolio vs.
+RidgeSolver (one SVD of the predictors, then all targets at once or one target per cached solve).
+
+Run from the project root:  python -m benchmarks.bench_ridge_solver
+"""
+import time
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import RidgeCV
+
+from common.constants import *
+from calculations.calc_correlations import RidgeSolver
+
+N_FEATURES = 1535
+CASES = [(36, 1), (36, 100), (36, 500), (120, 100), (288, 100)]  # (months in window, portfolios)
+
+
+def run() -> pd.DataFrame:
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n_months, n_portfolios in CASES:
+        X = pd.DataFrame(rng.normal(size=(n_months, N_FEATURES)))
+        Y = pd.DataFrame(rng.normal(0, 0.03, size=(n_months, n_portfolios)))
+
+        t0 = time.perf_counter()
+        reference = np.array([RidgeCV(alphas=ATTRIBUTION_ALPHAS).fit(X.values, Y[pf].values).coef_ for pf in Y])
+        loop_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        solver = RidgeSolver(X)
+        decompose_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        coefficients, _ = solver.fit(Y)
+        batch_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        solver.fit(Y[0])
+        one_target_s = time.perf_counter() - t0
+
+        results.append({
+            'months': n_months,
+            'portfolios': n_portfolios,
+            'RidgeCV per portfolio_s': loop_s,
+            'SVD_s': decompose_s,
+            'all portfolios_s': batch_s,
+            'one portfolio (cached SVD)_s': one_target_s,
+            'speedup': loop_s / (decompose_s + batch_s),
+            'max_abs_diff': float(np.abs(coefficients.to_numpy().T - reference).max()),
+        })
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 200)
+    print(run().round(5).to_string(index=False))
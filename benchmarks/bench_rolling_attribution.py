@@ -0,0 +1,62 @@
+"""
+Return attribution over all rolling windows: a loop refitting RidgeCV on every window vs.
+calc_rolling_attribution (incremental Gram/covariance updates, optionally in a process pool).
+
+Run from the project root:  python -m benchmarks.bench_rolling_attribution
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import RidgeCV
+
+from common.constants import *
+from calculations.calc_attribution import calc_rolling_attribution
+
+N_MONTHS = 294
+CASES = [(20, 36), (200, 36), (1500, 36), (1500, 120)]  # (features, window)
+
+
+def make_inputs(n_features: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(DEFAULT_START_DATE, periods=N_MONTHS, freq='ME').strftime(DATE_FORMAT)
+    X = pd.DataFrame(rng.normal(size=(N_MONTHS, n_features)), index=dates, columns=[f"F{i:04d}" for i in range(n_features)])
+    y = pd.Series(X.to_numpy()[:, :5] @ rng.normal(size=5) * 0.01 + rng.normal(0, 0.03, size=N_MONTHS), index=dates)
+    return X, y
+
+
+def ridgecv_loop(X, y, window):
+    coefs = []
+    for end in range(window, len(y) + 1):
+        model = RidgeCV(alphas=ATTRIBUTION_ALPHAS).fit(X.values[end - window:end], y.values[end - window:end])
+        coefs.append(model.coef_)
+    return np.array(coefs)
+
+
+def run() -> pd.DataFrame:
+
+    n_pool = os.cpu_count() or 1
+    results = []
+    for n_features, window in CASES:
+        X, y = make_inputs(n_features)
+
+        t0 = time.perf_counter()
+        reference = ridgecv_loop(X, y, window)
+        loop_s = time.perf_counter() - t0
+
+        row = {'features': n_features, 'window': window, 'windows': len(reference), 'RidgeCV loop_s': loop_s}
+        for n_workers in sorted({1, n_pool}):
+            t0 = time.perf_counter()
+            coefficients, _ = calc_rolling_attribution(X, y, window=window, n_workers=n_workers)
+            row[f"incremental ({n_workers} workers)_s"] = time.perf_counter() - t0
+
+        row['max_abs_diff'] = float(np.abs(coefficients.to_numpy() - reference).max())
+        results.append(row)
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    pd.set_option('display.width', 200)
+    print(run().round(4).to_string(index=False))
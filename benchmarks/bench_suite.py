@@ -0,0 +1,196 @@
+"""
+Offline benchmark suite on synthetic data (see benchmarks/synthetic_data.py): the pipeline from
+ingestion to attribution is run on generated WorldBank archives and price fixtures (through
+FixtureFetcher - no Yahoo Finance calls), scaling one dimension at a time (tickers, portfolios,
+factors, regions, months) around a base size. Wall time (the fastest of a few runs) and peak
+traced memory are recorded per stage, in separate runs so that tracing does not inflate the timings.
+
+Writes the results and their scaling curves to benchmarks/results/ and compares them to the
+stored baseline: a stage that became slower or uses more memory than the baseline by more than
+the tolerance is flagged, and the run exits with status 1.
+
+Run from the project root:  python -m benchmarks.bench_suite [--dimensions months regions] [--save-baseline]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import pandas as pd
+import plotly.express as px
+
+from common.constants import *
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.fetchers import FixtureFetcher
+from db.data_ingestion import ingest_macroeconomic_data, ingest_ticker_data, replace_table_rows
+from db.queries import read_portfolio_asset_prices
+from calculations.calc_portfolio import PortfolioReturnsEngine, calc_portfolio_price
+from calculations.calc_attribution import prepare_predictors
+from calculations.calc_correlations import RollingCorrelationEngine, calc_primary_coefficients
+from preprocessing.feature_engineering import read_feature_panel
+from benchmarks.synthetic_data import build_project
+
+BASE_SCALE = {'tickers': 20, 'portfolios': 5, 'factors': 8, 'regions': 50, 'months': 120}
+SCALES = {
+    'tickers': [10, 40, 160],
+    'portfolios': [1, 20, 100],
+    'factors': [4, 16, 64],
+    'regions': [25, 100, 265],
+    'months': [60, 120, 288],
+}
+CORRELATION_WINDOW = 6
+TIMING_RUNS = 3
+
+RESULTS_PATH = 'benchmarks/results'
+BASELINE_PATH = 'benchmarks/baseline.json'
+# A stage regresses if it is slower / uses more memory than the baseline by this share and by more than
+# the absolute floors (short stages are too noisy to compare on ratios alone)
+REGRESSION_TOLERANCE = 0.25
+MIN_SECONDS_DELTA = 0.05
+MIN_MIB_DELTA = 2.0
+
+
+class StageRecorder:
+
+    def __init__(self, trace_memory: bool) -> None:
+        """
+        Runs pipeline stages and records either their wall time or their peak traced memory
+        """
+        self.trace_memory = trace_memory
+        self.records = {}
+
+    def run(self, stage: str, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+            result = func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.records[stage] = peak / 2**20
+        else:
+            t0 = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.records[stage] = time.perf_counter() - t0
+        return result
+
+
+def run_pipeline(scale: dict, trace_memory: bool = False) -> dict:
+    """
+    Builds a synthetic project of the given size in a temporary folder and runs the pipeline on it
+
+    :param scale: Size of every dimension (keys of BASE_SCALE)
+    :param trace_memory: Record peak traced memory (MiB) instead of wall time (seconds)
+    :return: {stage: seconds or MiB}
+    """
+    cwd = os.getcwd()
+    recorder = StageRecorder(trace_memory)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        project = build_project(tmp, scale['tickers'], scale['portfolios'], scale['factors'], scale['regions'],
+                                scale['months'], source_root=cwd)
+        os.chdir(tmp)
+        try:
+            DataBase(full_rebuild=True)
+
+            # Single worker: memory of worker processes is not traced
+            recorder.run('ingest_macroeconomic_data', ingest_macroeconomic_data, n_workers=1)
+            recorder.run('ingest_ticker_data', ingest_ticker_data, project['tickers'],
+                         fetcher=FixtureFetcher(project['fixtures_path']), start=project['start'])
+
+            with db_connection() as conn:
+                replace_table_rows(conn, 'portfolios', project['portfolios'])
+                replace_table_rows(conn, 'asset_allocation', project['asset_allocation'])
+                portfolio_ids = project['portfolios']['portfolio_id'].tolist()
+                assets_tbl = recorder.run('read_portfolio_asset_prices', read_portfolio_asset_prices, conn, portfolio_ids)
+                factor_changes = recorder.run('read_feature_panel', read_feature_panel, conn, 'pct_change')
+
+            recorder.run('calc_portfolio_price', calc_portfolio_price, assets_tbl)
+
+            engine = PortfolioReturnsEngine.from_portfolio_prices(assets_tbl)
+            pf_tbl = engine.portfolio_returns_frame(portfolio_ids[:1])
+            y = pf_tbl.set_index('date')['pct_return'].dropna()
+            factor_returns = factor_changes.replace([float('inf'), float('-inf')], float('nan'))
+
+            recorder.run('rolling correlation', lambda: RollingCorrelationEngine(y, factor_returns).rolling_corr(CORRELATION_WINDOW))
+            recorder.run('calc_primary_coefficients', lambda: calc_primary_coefficients(prepare_predictors(factor_changes, y.index), y))
+        finally:
+            os.chdir(cwd)
+            close_db_connections()
+
+    return recorder.records
+
+
+def run(dimensions: list = None) -> pd.DataFrame:
+    """
+    :param dimensions: Dimensions to scale (all of SCALES if None)
+    :return: One row per dimension, size and stage with columns seconds and peak_MiB
+    """
+    results = []
+    for dimension in (list(SCALES) if dimensions is None else dimensions):
+        for size in SCALES[dimension]:
+            scale = {**BASE_SCALE, dimension: size}
+            timings = pd.DataFrame([run_pipeline(scale) for _ in range(TIMING_RUNS)])
+            seconds = timings.min().to_dict()
+            peak_mib = run_pipeline(scale, trace_memory=True)
+            for stage in seconds:
+                results.append({'dimension': dimension, 'size': size, 'stage': stage,
+                                'seconds': seconds[stage], 'peak_MiB': peak_mib[stage]})
+            print(f"{dimension}={size}: {sum(seconds.values()):.2f}s", file=sys.stderr)
+
+    return pd.DataFrame(results)
+
+
+def write_scaling_curves(results: pd.DataFrame, path: str = RESULTS_PATH) -> None:
+    os.makedirs(path, exist_ok=True)
+    results.to_csv(os.path.join(path, 'bench_suite.csv'), index=False)
+    for metric in ['seconds', 'peak_MiB']:
+        fig = px.line(results, x='size', y=metric, color='stage', facet_col='dimension', facet_col_wrap=3,
+                      markers=True, log_x=True, log_y=True)
+        fig.update_xaxes(matches=None)
+        fig.write_html(os.path.join(path, f"scaling_{metric}.html"))
+
+
+def compare_to_baseline(results: pd.DataFrame, baseline: pd.DataFrame, tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    """
+    :return: Rows of results that regressed against the baseline (same dimension, size and stage),
+        with the baseline values and their ratios
+    """
+    merged = results.merge(baseline, on=['dimension', 'size', 'stage'], suffixes=('', '_baseline'))
+    merged['seconds_ratio'] = merged['seconds'] / merged['seconds_baseline']
+    merged['peak_MiB_ratio'] = merged['peak_MiB'] / merged['peak_MiB_baseline']
+
+    slower = (merged['seconds_ratio'] > 1 + tolerance) & (merged['seconds'] - merged['seconds_baseline'] > MIN_SECONDS_DELTA)
+    larger = (merged['peak_MiB_ratio'] > 1 + tolerance) & (merged['peak_MiB'] - merged['peak_MiB_baseline'] > MIN_MIB_DELTA)
+    return merged[slower | larger].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Offline benchmark suite on synthetic data')
+    parser.add_argument('--dimensions', nargs='+', choices=list(SCALES), help='dimensions to scale (default: all)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file to compare to / save')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    pd.set_option('display.width', 200)
+    results = run(args.dimensions)
+    print(results.round(4).to_string(index=False))
+    write_scaling_curves(results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results.to_dict(orient='records'), f, indent=1)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, pd.DataFrame(json.load(f)), args.tolerance)
+        if len(regressions) > 0:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            print(regressions.round(3).to_string(index=False))
+            sys.exit(1)
+        print(f"\nNo regression against {args.baseline}")
+    else:
+        print(f"\nNo baseline at {args.baseline} - store one with --save-baseline")
@@ -0,0 +1,188 @@
+"""
+Synthetic inputs for offline benchmarks: WorldBank-shaped indicator archives, daily price
+fixtures (read by FixtureFetcher) and portfolio allocations. Every dimension - tickers,
+portfolios, factors, regions and months - is set independently.
+"""
+import io
+import os
+import shutil
+import zipfile
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+
+# Last month with factor data in the bundled archives (WorldBank data is annual, up to the last full year)
+SYNTHETIC_LAST_FACTOR_MONTH = '2023-12'
+
+
+def indicator_codes(n_factors: int) -> list:
+    return [f"SYN.F{i:04d}" for i in range(n_factors)]
+
+
+def region_codes(n_regions: int) -> list:
+    # Three upper-case letters, like WorldBank country codes
+    letters = [chr(ord('A') + i) for i in range(26)]
+    return [letters[i // 676 % 26] + letters[i // 26 % 26] + letters[i % 26] for i in range(n_regions)]
+
+
+def tickers(n_tickers: int) -> list:
+    return [f"SYN{i:04d}" for i in range(n_tickers)]
+
+
+def _csv_line(values) -> str:
+    return ','.join(f'"{value}"' for value in values) + ',\r\n'
+
+
+def write_worldbank_archive(path: str, factors: list, regions: list, years: list, seed: int = 0,
+                            missing_share: float = 0.05) -> None:
+    """
+    Writes a zip laid out like a WorldBank indicator category download: the indicator data CSV
+    (preamble, one row per country and indicator, one column per year), plus the indicator and
+    country metadata CSVs.
+
+    :param path: Path of the zip file
+    :param factors: Indicator codes
+    :param regions: Country codes
+    :param years: Calendar years (columns of the data CSV)
+    :param seed: Random seed of the values
+    :param missing_share: Share of empty (missing) yearly values
+    """
+    rng = np.random.default_rng(seed)
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    # Positive random walks (levels), with a few gaps
+    levels = 100 * np.exp(np.cumsum(rng.normal(0.02, 0.1, size=(len(factors) * len(regions), len(years))), axis=1))
+    levels[rng.random(levels.shape) < missing_share] = np.nan
+
+    data = io.StringIO()
+    data.write('\ufeff' + _csv_line(['Data Source', 'World Development Indicators']) + '\r\n')
+    data.write(_csv_line(['Last Updated Date', '2024-10-24']) + '\r\n')
+    data.write(_csv_line(['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code'] + years))
+    row = 0
+    for factor in factors:
+        for region in regions:
+            values = ['' if np.isnan(v) else f"{v:.6g}" for v in levels[row]]
+            data.write(_csv_line([f"Country {region}", region, f"Indicator {factor}", factor] + values))
+            row += 1
+
+    indicator_metadata = pd.DataFrame({
+        'INDICATOR_CODE': factors,
+        'INDICATOR_NAME': [f"Indicator {factor}" for factor in factors],
+        'SOURCE_NOTE': '',
+        'SOURCE_ORGANIZATION': 'Synthetic',
+    })
+    country_metadata = pd.DataFrame({
+        'Country Code': regions,
+        'Region': '',
+        'IncomeGroup': '',
+        'SpecialNotes': '',
+        'TableName': [f"Country {region}" for region in regions],
+    })
+
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(f"Metadata_Indicator_{name}.csv", indicator_metadata.to_csv(index=False))
+        z.writestr(f"{name}.csv", data.getvalue())
+        z.writestr(f"Metadata_Country_{name}.csv", country_metadata.to_csv(index=False))
+
+
+def write_selected_indicators(path: str, factors: list) -> None:
+    """
+    Writes the indicator selection (config/selected_macroeconomic_indicators.csv) with every factor selected
+    """
+    pd.DataFrame({
+        'INDICATOR_CODE': factors,
+        'INDICATOR_NAME': [f"Indicator {factor}" for factor in factors],
+        'SOURCE_NOTE': '',
+        'SOURCE_ORGANIZATION': 'Synthetic',
+        'Selected for analysis (Y/N)': 'Y',
+    }).to_csv(path, index=False)
+
+
+def write_price_fixtures(path: str, asset_ids: list, start: str, end: str, seed: int = 0) -> None:
+    """
+    Writes daily closes (geometric random walks on business days) in the layout read by FixtureFetcher
+
+    :param path: Fixture folder
+    :param asset_ids: Tickers
+    :param start: First day, formatted '%Y-%m-%d'
+    :param end: Last day, formatted '%Y-%m-%d'
+    :param seed: Random seed of the prices
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    dates = pd.bdate_range(start, end)
+
+    closes = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, size=(len(dates), len(asset_ids))), axis=0))
+    for i, ticker in enumerate(asset_ids):
+        pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'close': closes[:, i]}).to_csv(
+            os.path.join(path, f"{ticker}.csv"), index=False)
+
+    pd.DataFrame({'asset_id': asset_ids, 'asset_name': [f"Asset {ticker}" for ticker in asset_ids]}).to_csv(
+        os.path.join(path, 'assets.csv'), index=False)
+
+
+def make_allocation(asset_ids: list, n_portfolios: int, assets_per_portfolio: int = 10, seed: int = 0) -> tuple:
+    """
+    :return: (portfolios, asset_allocation) tables; every portfolio holds a random subset of the assets
+        with random weights summing to 1
+    """
+    rng = np.random.default_rng(seed)
+    portfolio_ids = [f"PF_{i + 1:04d}" for i in range(n_portfolios)]
+    n_assets = min(assets_per_portfolio, len(asset_ids))
+
+    allocation = []
+    for pf_id in portfolio_ids:
+        weights = rng.random(n_assets)
+        allocation.append(pd.DataFrame({
+            'portfolio_id': pf_id,
+            'asset_id': rng.choice(asset_ids, size=n_assets, replace=False),
+            'asset_weight': weights / weights.sum(),
+        }))
+
+    portfolios = pd.DataFrame({'portfolio_id': portfolio_ids, 'portfolio_name': [f"Portfolio {pf_id}" for pf_id in portfolio_ids]})
+    return portfolios, pd.concat(allocation, ignore_index=True)
+
+
+def build_project(root: str, n_tickers: int, n_portfolios: int, n_factors: int, n_regions: int, n_months: int,
+                  n_archives: int = 3, seed: int = 0, source_root: str = None) -> dict:
+    """
+    Lays out a project folder (config/, data/, db/ and a price fixture folder) to run the ingestion
+    and the calculations on, from the project root as the working directory.
+
+    Prices cover the n_months months up to DEFAULT_END_DATE. Factor series are yearly values covering the
+    n_months months up to SYNTHETIC_LAST_FACTOR_MONTH; ingestion keeps the months between
+    DEFAULT_START_DATE and DEFAULT_END_DATE, as for the real archives.
+
+    :param root: Folder to create the project in
+    :param n_archives: Number of indicator archives the factors are spread over
+    :param source_root: Project to copy the configuration from (defaults to the working directory)
+    :return: {'tickers', 'portfolios', 'asset_allocation', 'fixtures_path', 'start'}
+    """
+    source_root = os.getcwd() if source_root is None else source_root
+    for folder in ['config', 'data', 'db']:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    for file in ['database_schema.json', os.path.basename(FEATURE_DEFINITIONS_PATH)]:
+        shutil.copy(os.path.join(source_root, 'config', file), os.path.join(root, 'config', file))
+
+    factors, regions = indicator_codes(n_factors), region_codes(n_regions)
+    last_year = int(SYNTHETIC_LAST_FACTOR_MONTH[:4])
+    years = list(range(last_year - int(np.ceil(n_months / 12)), last_year + 1))
+    for i, archive_factors in enumerate(np.array_split(factors, min(n_archives, n_factors))):
+        write_worldbank_archive(os.path.join(root, 'data', f"API_SYN{i}_DS2_en_csv_v2.zip"),
+                                list(archive_factors), regions, years, seed=seed + i)
+    write_selected_indicators(os.path.join(root, 'config', 'selected_macroeconomic_indicators.csv'), factors)
+
+    asset_ids = tickers(n_tickers)
+    start = (pd.Timestamp(DEFAULT_END_DATE) - pd.DateOffset(months=n_months) + pd.offsets.MonthBegin()).strftime('%Y-%m-%d')
+    fixtures_path = os.path.join(root, 'fixtures')
+    write_price_fixtures(fixtures_path, asset_ids, start, DEFAULT_END_DATE, seed=seed)
+
+    portfolios, asset_allocation = make_allocation(asset_ids, n_portfolios, seed=seed)
+    return {
+        'tickers': asset_ids,
+        'portfolios': portfolios,
+        'asset_allocation': asset_allocation,
+        'fixtures_path': fixtures_path,
+        'start': start,
+    }
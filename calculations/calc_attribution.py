@@ -0,0 +1,352 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from common.constants import *
+from preprocessing.cleaning import CleaningPipeline
+
+
+def prepare_predictors(factor_changes, dates):
+    """
+    Predictor variables for return attribution: period-over-period changes of every factor/region
+    series on the given dates. Series without any data are dropped, gaps are back-/forward-filled
+    and infinite changes capped at +/-999 (see CleaningPipeline).
+
+    :param factor_changes: Changes of every series indexed by date, with (factor_name, region_name)
+        columns, i.e. the precomputed pct_change feature (see read_feature_panel)
+    :param dates: Dates (rows) of the predictor matrix, i.e. the dates with a target value
+    :return: DataFrame indexed by date with one column per 'factor_name|region_name'
+    """
+
+    keys = (factor_changes.columns.get_level_values(0).astype(str) + '|' +
+            factor_changes.columns.get_level_values(1).astype(str)).to_numpy()
+    order = np.argsort(keys, kind='stable')
+
+    rows = factor_changes.index.get_indexer(dates)
+    changes = factor_changes.to_numpy(dtype=float)
+    X = np.where((rows >= 0)[:, None], changes[rows][:, order], np.nan)
+    X = pd.DataFrame(X, index=pd.Index(dates, name='date'), columns=pd.Index(keys[order], name='key'), copy=False)
+
+    return CleaningPipeline(fill='bfill_ffill', inf='cap', inf_value=999).fit_transform(X)
+
+
+def prepare_attribution_inputs(pf_tbl, factor_changes):
+    """
+    Predictor and target variables for return attribution, aligned by date (see prepare_predictors)
+
+    :param pf_tbl: Portfolio returns (columns date, pct_return)
+    :param factor_changes: Changes of every factor/region series (see prepare_predictors)
+    :return: (X, y) indexed by date
+    """
+
+    y = pf_tbl.set_index('date')['pct_return'].dropna()
+    X = prepare_predictors(factor_changes, y.index)
+
+    return X, y.rename('pct_return')
+
+
+def _select_alpha(eigvals, Q, QT_y, alphas, intercept_dim):
+    """
+    Leave-one-out selection of the ridge penalty from one eigendecomposition of the (centered)
+    Gram matrix, as in RidgeCV: the LOO residuals are c / diag(G^-1) for every alpha at once.
+    """
+    W = 1.0 / (eigvals[:, None] + alphas[None, :])
+    W[intercept_dim] = 0  # the intercept is not penalized
+    C = Q @ (W * QT_y[:, None])
+    G_inverse_diag = (Q ** 2) @ W
+    scores = -np.mean((C / G_inverse_diag) ** 2, axis=0)
+    best = int(np.argmax(scores))  # first of equal scores, like RidgeCV
+    return best, C[:, best]
+
+
+class _SlidingRidge:
+
+    def __init__(self, X: np.ndarray, y: np.ndarray, alphas: np.ndarray) -> None:
+        """
+        Ridge fits (with intercept and LOO choice of alpha) on a window [start, end) of rows that
+        only moves forward. Sufficient statistics are updated as rows enter or leave the window
+        instead of being recomputed:
+         - 'gram' (window <= features): the window's X X^T, one new row/column per added row
+         - 'covariance' (window > features): X^T X and X^T y, one rank-1 update per row
+        """
+        self.X, self.y, self.alphas = X, y, alphas
+        self.mode = None
+        self.start = self.end = 0
+        self.col_sums = np.zeros(X.shape[1])
+        self.y_sum = 0.0
+
+    def reset(self, mode: str, start: int) -> None:
+        self.mode, self.start, self.end = mode, start, start
+        self.col_sums[:] = 0
+        self.y_sum = 0.0
+        if mode == 'gram':
+            self.K = np.zeros((0, 0))
+        else:
+            self.XtX = np.zeros((self.X.shape[1], self.X.shape[1]))
+            self.Xty = np.zeros(self.X.shape[1])
+
+    def move(self, start: int, end: int) -> None:
+        X, y = self.X, self.y
+
+        # Rows leaving the window
+        if start > self.start:
+            removed = slice(self.start, min(start, self.end))
+            self.col_sums -= X[removed].sum(axis=0)
+            self.y_sum -= y[removed].sum()
+            if self.mode == 'gram':
+                self.K = self.K[start - self.start:, start - self.start:]
+            else:
+                self.XtX -= X[removed].T @ X[removed]
+                self.Xty -= X[removed].T @ y[removed]
+            self.start = start
+            self.end = max(self.end, start)
+
+        # Rows entering the window
+        if end > self.end:
+            added = slice(self.end, end)
+            self.col_sums += X[added].sum(axis=0)
+            self.y_sum += y[added].sum()
+            if self.mode == 'gram':
+                cross = X[self.start:end] @ X[added].T
+                n_old = self.end - self.start
+                K = np.empty((end - self.start, end - self.start))
+                K[:n_old, :n_old] = self.K
+                K[:, n_old:] = cross
+                K[n_old:, :] = cross.T
+                self.K = K
+            else:
+                self.XtX += X[added].T @ X[added]
+                self.Xty += X[added].T @ y[added]
+            self.end = end
+
+    def fit(self) -> tuple:
+        """
+        :return: (coefficients, selected alpha) for the current window
+        """
+        n = self.end - self.start
+        X_mean, y_mean = self.col_sums / n, self.y_sum / n
+        X_win, y_win = self.X[self.start:self.end], self.y[self.start:self.end]
+
+        if self.mode == 'gram':
+            # Centered Gram matrix from the raw one, plus the constant column modelling the intercept
+            row_means = self.K.mean(axis=1)
+            K = self.K - row_means[:, None] - row_means[None, :] + row_means.mean() + 1.0
+            eigvals, Q = np.linalg.eigh(K)
+            intercept_dim = int(np.argmax(np.abs(Q.sum(axis=0))))
+            best, c = _select_alpha(eigvals, Q, Q.T @ (y_win - y_mean), self.alphas, intercept_dim)
+            return c @ X_win - c.sum() * X_mean, self.alphas[best]
+
+        # Centered covariance, then LOO residuals through the hat matrix diagonal
+        XtX = self.XtX - n * np.outer(X_mean, X_mean)
+        Xty = self.Xty - n * X_mean * y_mean
+        eigvals, V = np.linalg.eigh(XtX)
+        W = 1.0 / (eigvals[:, None] + self.alphas[None, :])
+        coefs = V @ (W * (V.T @ Xty)[:, None])
+        XV = (X_win - X_mean) @ V
+        hat_diag = 1.0 / n + (XV ** 2) @ W
+        residuals = (y_win - y_mean)[:, None] - (X_win - X_mean) @ coefs
+        scores = -np.mean((residuals / (1 - hat_diag)) ** 2, axis=0)
+        best = int(np.argmax(scores))
+        return coefs[:, best], self.alphas[best]
+
+
+def _fit_windows(X, y, starts, ends, alphas):
+    """
+    Fits consecutive windows with one sliding state (one task of the process pool)
+    """
+    ridge = _SlidingRidge(X, y, np.asarray(alphas, dtype=float))
+    mode = 'gram' if max(e - s for s, e in zip(starts, ends)) <= X.shape[1] else 'covariance'
+    ridge.reset(mode, starts[0])
+
+    coefs, selected_alphas = np.empty((len(starts), X.shape[1])), np.empty(len(starts))
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        ridge.move(start, end)
+        coefs[i], selected_alphas[i] = ridge.fit()
+    return coefs, selected_alphas
+
+
+def calc_rolling_attribution(X, y, window=DEFAULT_ATTRIBUTION_WINDOW, expanding=False, min_periods=None,
+                             alphas=ATTRIBUTION_ALPHAS, n_workers=ATTRIBUTION_WORKERS):
+    """
+    Return attribution over all time windows: one ridge regression (L2 penalty chosen by
+    leave-one-out CV, as in calc_primary_coefficients) per window, each window
+    updated incrementally from the previous one. Consecutive windows are split into chunks
+    fitted in a process pool.
+
+    :param X: Predictor variables indexed by date (see prepare_attribution_inputs)
+    :param y: Target variable indexed by date
+    :param window: Number of periods per window (rolling mode)
+    :param expanding: Use expanding windows starting at the first period instead of rolling ones
+    :param min_periods: Length of the first expanding window (defaults to window)
+    :param alphas: Candidate penalties
+    :param n_workers: Number of worker processes (defaults to the CPU count); 1 fits in-process
+    :return: (coefficients, alphas) - DataFrame of coefficients per window end date x feature,
+        and the penalty selected for each window
+    """
+    X_values, y_values = X.to_numpy(dtype=float), y.to_numpy(dtype=float)
+    n = len(y_values)
+    first_end = window if min_periods is None else min_periods
+
+    ends = np.arange(first_end, n + 1)
+    starts = np.zeros_like(ends) if expanding else ends - window
+    if len(ends) == 0:
+        return pd.DataFrame(columns=X.columns, dtype=float), pd.Series(dtype=float)
+
+    n_workers = min(len(ends), n_workers or os.cpu_count() or 1)
+    chunks = np.array_split(np.arange(len(ends)), n_workers)
+    args = [(X_values, y_values, starts[chunk].tolist(), ends[chunk].tolist(), alphas) for chunk in chunks]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_fit_windows, *zip(*args)))
+    else:
+        results = [_fit_windows(*a) for a in args]
+
+    index = pd.Index(y.index[ends - 1], name='date')
+    coefficients = pd.DataFrame(np.concatenate([r[0] for r in results]), index=index, columns=X.columns)
+    selected_alphas = pd.Series(np.concatenate([r[1] for r in results]), index=index, name='alpha')
+
+    return coefficients, selected_alphas
+
+
+def block_bootstrap_indices(n, n_resamples, block_length=None, seed=0):
+    """
+    Row indices of moving block bootstrap resamples: each resample concatenates blocks of
+    consecutive periods starting at random rows, cut to n rows, so that the autocorrelation of
+    returns and factor changes within a block is kept.
+
+    :param n: Number of periods
+    :param n_resamples: Number of resamples
+    :param block_length: Periods per block (defaults to n^(1/3), rounded)
+    :param seed: Random seed
+    :return: Array of shape (n_resamples, n)
+    """
+    block_length = max(1, round(n ** (1 / 3))) if block_length is None else min(block_length, n)
+    n_blocks = -(-n // block_length)
+    starts = np.random.default_rng(seed).integers(0, n - block_length + 1, size=(n_resamples, n_blocks))
+    return (starts[:, :, None] + np.arange(block_length)).reshape(n_resamples, -1)[:, :n]
+
+
+def _fit_resamples(X, y, indices, alphas):
+    """
+    Ridge fits (with intercept and LOO choice of alpha, as in _SlidingRidge) on a chunk of bootstrap
+    resamples at once (one task of the process pool). A resample only repeats rows of X, so its
+    statistics are gathered from the full sample's instead of being recomputed:
+     - 'gram' (periods <= features): the resample's X X^T is a submatrix of the full X X^T
+     - 'covariance' (periods > features): X^T X and X^T y weigh every row by its count in the resample
+    The eigendecompositions of all resamples of the chunk run as one batched call.
+
+    :return: (coefficients, selected alphas) - arrays of shape (resamples, features) and (resamples,)
+    """
+    alphas = np.asarray(alphas, dtype=float)
+    n_resamples, n = indices.shape
+    rows = np.arange(n_resamples)
+    flat = (rows[:, None] * len(y) + indices).ravel()
+    counts = np.bincount(flat, minlength=n_resamples * len(y)).reshape(n_resamples, len(y))
+
+    if n <= X.shape[1]:
+        # Centered Gram matrices, plus the constant column modelling the intercept
+        K = (X @ X.T)[indices[:, :, None], indices[:, None, :]]
+        row_means = K.mean(axis=2)
+        K = K - row_means[:, :, None] - row_means[:, None, :] + row_means.mean(axis=1)[:, None, None] + 1.0
+        eigvals, Q = np.linalg.eigh(K)
+        intercept_dims = np.argmax(np.abs(Q.sum(axis=1)), axis=1)
+
+        y_resampled = y[indices]
+        QT_y = ((y_resampled - y_resampled.mean(axis=1, keepdims=True))[:, None, :] @ Q)[:, 0]
+        W = 1.0 / (eigvals[:, :, None] + alphas)
+        W[rows, intercept_dims] = 0  # the intercept is not penalized
+        C = Q @ (W * QT_y[:, :, None])
+        G_inverse_diag = (Q ** 2) @ W
+        best = np.argmax(-np.mean((C / G_inverse_diag) ** 2, axis=1), axis=1)  # first of equal scores
+
+        # Dual coefficients summed onto the rows of X they weigh: coef = c @ X_resampled - sum(c) * X_mean
+        c = C[rows, :, best]
+        weights = np.bincount(flat, weights=c.ravel(), minlength=n_resamples * len(y)).reshape(n_resamples, len(y))
+        weights -= c.sum(axis=1)[:, None] * counts / n
+        return weights @ X, alphas[best]
+
+    # Centered covariances, then LOO residuals through the hat matrix diagonal (rows weighed by their counts)
+    X_means, y_means = counts @ X / n, counts @ y / n
+    XtX = (X.T * counts[:, None, :]) @ X - n * X_means[:, :, None] * X_means[:, None, :]
+    Xty = (counts * y) @ X - n * X_means * y_means[:, None]
+    eigvals, V = np.linalg.eigh(XtX)
+    W = 1.0 / (eigvals[:, :, None] + alphas)
+    coefs = V @ (W * (Xty[:, None, :] @ V).transpose(0, 2, 1))
+    X_centered = X[None, :, :] - X_means[:, None, :]
+    hat_diag = 1.0 / n + ((X_centered @ V) ** 2) @ W
+    residuals = (y[None, :] - y_means[:, None])[:, :, None] - X_centered @ coefs
+    scores = -np.einsum('rn,rna->ra', counts, (residuals / (1 - hat_diag)) ** 2) / n
+    best = np.argmax(scores, axis=1)
+    return coefs[rows, :, best], alphas[best]
+
+
+def calc_bootstrap_attribution(X, y, pca=None, n_resamples=ATTRIBUTION_BOOTSTRAP_RESAMPLES,
+                               block_length=ATTRIBUTION_BOOTSTRAP_BLOCK_LENGTH, level=ATTRIBUTION_BOOTSTRAP_LEVEL,
+                               alphas=ATTRIBUTION_ALPHAS, chunk_size=ATTRIBUTION_BOOTSTRAP_CHUNK,
+                               n_workers=ATTRIBUTION_WORKERS, seed=0):
+    """
+    Significance of the return attribution coefficients (see calc_primary_coefficients) by block
+    bootstrap: the same ridge regression is fitted on resamples of the periods, all index sets drawn
+    up front (see block_bootstrap_indices) and solved in batches of chunk_size resamples, which bounds
+    memory. Chunks are fitted in a process pool.
+
+    :param X: Predictor variables indexed by date
+    :param y: Target variable indexed by date
+    :param pca: Fitted FactorPCA - if given, the regressions run on its component scores and the
+        coefficients are mapped back to the columns of X
+    :param n_resamples: Number of bootstrap resamples
+    :param block_length: Periods per block (None = n^(1/3))
+    :param level: Confidence level of the intervals
+    :param alphas: Candidate penalties
+    :param chunk_size: Resamples fitted at once
+    :param n_workers: Number of worker processes (defaults to the CPU count); 1 fits in-process
+    :param seed: Random seed of the resamples
+    :return: DataFrame indexed by Feature with the percentile interval of each coefficient (CI low,
+        CI high), the share of resamples in which it is positive and its median rank by absolute
+        coefficient across resamples (1 = most influential)
+    """
+    regressors = X if pca is None else pca.transform(X)
+    X_values, y_values = regressors.to_numpy(dtype=float), y.to_numpy(dtype=float)
+    indices = block_bootstrap_indices(len(y_values), n_resamples, block_length, seed)
+
+    chunks = np.array_split(indices, -(-n_resamples // chunk_size))
+    n_workers = min(len(chunks), n_workers or os.cpu_count() or 1)
+    args = [(X_values, y_values, chunk, alphas) for chunk in chunks]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_fit_resamples, *zip(*args)))
+    else:
+        results = [_fit_resamples(*a) for a in args]
+
+    coefficients = np.concatenate([r[0] for r in results])
+    if pca is not None:
+        coefficients = pca.inverse_coefficients(coefficients.T).to_numpy().T
+
+    ranks = np.empty(coefficients.shape)
+    order = np.argsort(-np.abs(coefficients), axis=1)
+    np.put_along_axis(ranks, order, np.arange(1, coefficients.shape[1] + 1, dtype=float)[None, :], axis=1)
+    low, high = np.quantile(coefficients, [(1 - level) / 2, (1 + level) / 2], axis=0)
+
+    return pd.DataFrame({
+        'CI low': low,
+        'CI high': high,
+        'Positive share': (coefficients > 0).mean(axis=0),
+        'Median rank': np.median(ranks, axis=0),
+    }, index=pd.Index(X.columns, name='Feature'))
+
+
+def rank_attribution(coefficients, top_k=None):
+    """
+    :param coefficients: Coefficient time series as returned by calc_rolling_attribution
+    :param top_k: Number of features to keep (all if None)
+    :return: Features ordered by mean absolute coefficient, with their mean coefficient
+    """
+
+    ranking = pd.DataFrame({
+        'Feature': coefficients.columns,
+        'Mean |coefficient|': coefficients.abs().mean().to_numpy(),
+        'Mean coefficient': coefficients.mean().to_numpy(),
+    }).sort_values(by='Mean |coefficient|', ascending=False).reset_index(drop=True)
+
+    return ranking if top_k is None else ranking.head(top_k)
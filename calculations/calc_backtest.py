@@ -0,0 +1,170 @@
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from common.constants import *
+from calculations.calc_portfolio import PortfolioReturnsEngine
+
+BACKTEST_PARAMETERS = ['frequency', 'threshold', 'cost_bps']
+BACKTEST_SUMMARY = ['total_return', 'annual_return', 'volatility', 'sharpe', 'max_drawdown', 'rebalances', 'turnover',
+                    'costs']
+
+
+def _simulate_runs(returns, assets, targets, starts, frequency, threshold, cost_bps, periods_per_year, risk_free):
+    """
+    Simulates a chunk of runs period by period (one task of the process pool), every run a row of the
+    weight matrix. Only running statistics are kept, not the paths.
+
+    :param returns: Period returns of the assets, dates x assets (0 where undefined)
+    :param assets: Columns of returns held by every run, runs x holdings (padded with a column of zeros)
+    :param targets: Target weights of every run, runs x holdings
+    :param starts: Row of the first date of every run (invested at its target weights)
+    :param frequency: Periods between rebalancing checks of every run (0: never)
+    :param threshold: Largest weight deviation from target a run tolerates at a check
+    :param cost_bps: Transaction costs of every run, in basis points of the traded value
+    :param periods_per_year: Used to annualize
+    :param risk_free: Risk-free return per period
+    :return: {column of BACKTEST_SUMMARY: array over runs}
+    """
+    n_runs = len(targets)
+    W = targets.copy()
+    log_value, peak, drawdown = np.zeros(n_runs), np.zeros(n_runs), np.zeros(n_runs)
+    n, s, ss = np.zeros(n_runs), np.zeros(n_runs), np.zeros(n_runs)
+    rebalances, traded, log_cost = np.zeros(n_runs), np.zeros(n_runs), np.zeros(n_runs)
+    cost_rate = cost_bps / 1e4
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for t in range(1, len(returns)):
+            active = starts < t
+            growth = 1 + returns[t][assets]
+            gross = (W * growth).sum(axis=1)
+            # Weights drift with the returns of their assets
+            W = np.where(active[:, None], W * growth / gross[:, None], W)
+
+            check = active & (frequency > 0) & ((t - starts) % np.maximum(frequency, 1) == 0)
+            deviation = np.abs(targets - W)
+            rebalance = check & (deviation.max(axis=1) > threshold)
+            trade = np.where(rebalance, deviation.sum(axis=1), 0.0)
+            W = np.where(rebalance[:, None], targets, W)
+
+            r = np.where(active, gross * (1 - trade * cost_rate) - 1, 0.0)
+            n += active
+            s += r
+            ss += r * r
+            log_value += np.log1p(r)
+            peak = np.maximum(peak, log_value)
+            drawdown = np.maximum(drawdown, peak - log_value)
+            rebalances += rebalance
+            traded += trade
+            log_cost -= np.log1p(-trade * cost_rate)
+
+        years = n / periods_per_year
+        std = np.sqrt(np.maximum(ss - s * s / n, 0.0) / (n - 1))
+        summary = {
+            'total_return': np.expm1(log_value),
+            'annual_return': np.expm1(log_value / years),
+            'volatility': std * np.sqrt(periods_per_year),
+            'sharpe': np.where(std > 0, (s / n - risk_free) / std * np.sqrt(periods_per_year), np.nan),
+            'max_drawdown': -np.expm1(-drawdown),
+            'rebalances': rebalances,
+            'turnover': traded / years,
+            'costs': -np.expm1(-log_cost),
+        }
+    # Runs with less than two periods have no statistics
+    return {column: np.where(n >= 2, values, np.nan) for column, values in summary.items()}
+
+
+class BacktestEngine:
+
+    def __init__(self, prices: pd.DataFrame, allocation: pd.DataFrame,
+                 periods_per_year: int = RISK_PERIODS_PER_YEAR, risk_free_rate: float = RISK_FREE_RATE) -> None:
+        """
+        Backtests of portfolios under rebalancing rules. Unlike calc_portfolio_price, which applies
+        the allocation's weights to every period (i.e. rebalances to them every period for free),
+        the weights of a run drift with the returns of their assets and are only reset to their
+        targets at rebalancing checks, paying transaction costs on the traded value.
+
+        A run is a portfolio and one set of BACKTEST_PARAMETERS: a rebalancing check every frequency
+        periods after the portfolio's first date (0: buy and hold), where the portfolio is rebalanced
+        if a weight deviates from its target by more than threshold (0: always), at cost_bps basis
+        points of the traded value (the sum of absolute weight changes). All runs are simulated at
+        once, period by period, as one matrix of the weights of their holdings; sweeps are split into chunks
+        simulated in a process pool, and each run is reduced to a summary row.
+
+        Target weights are the allocation's weights scaled to sum to 1. Like PortfolioReturnsEngine,
+        a portfolio starts on the first date one of its assets has a price and an asset without a
+        return in a period (e.g. before its first price) keeps its value.
+
+        :param prices: Columns asset_id, date, asset_price (one row per asset and date)
+        :param allocation: Columns portfolio_id, asset_id, asset_weight
+        :param periods_per_year: Used to annualize returns, volatility, Sharpe ratios and turnover
+        :param risk_free_rate: Annual risk-free rate of the Sharpe ratios
+        """
+        engine = PortfolioReturnsEngine(prices, allocation)
+        pct_returns, _ = engine.asset_returns()
+        self.dates, self.asset_ids, self.portfolio_ids = engine.dates, engine.asset_ids, engine.portfolio_ids
+        self.periods_per_year = periods_per_year
+        self.risk_free = risk_free_rate / periods_per_year
+
+        self.returns = np.where(np.isfinite(pct_returns), pct_returns, 0.0)
+        total = engine.weight_matrix.sum(axis=1, keepdims=True)
+        self.targets = np.divide(engine.weight_matrix, total, out=np.zeros(engine.weight_matrix.shape), where=total != 0)
+        # Compact holdings: the columns of the assets each portfolio holds (padded with a column of zeros) and their weights
+        n_holdings = int((self.targets != 0).sum(axis=1).max(initial=0))
+        columns = np.argsort(self.targets == 0, axis=1, kind='stable')[:, :n_holdings]
+        self.holding_targets = np.take_along_axis(self.targets, columns, axis=1)
+        self.holding_assets = np.where(self.holding_targets != 0, columns, len(self.asset_ids))
+        # Portfolios without prices or weights never start
+        active = engine.active_dates()
+        self.starts = np.where(active.any(axis=0) & (total[:, 0] != 0), active.argmax(axis=0), len(self.dates))
+
+    def run(self, runs: pd.DataFrame, n_workers: int = BACKTEST_WORKERS) -> pd.DataFrame:
+        """
+        :param runs: Columns portfolio_id and BACKTEST_PARAMETERS, one row per run
+        :param n_workers: Number of worker processes (defaults to the CPU count); 1 simulates in-process
+        :return: runs with one column per BACKTEST_SUMMARY statistic (NaN for unknown portfolios): total and
+            annualized return, annualized volatility and Sharpe ratio, max drawdown, number of rebalancings,
+            traded value per year and share of the value lost to transaction costs
+        """
+        runs = runs.reset_index(drop=True)
+        codes = self.portfolio_ids.get_indexer(runs['portfolio_id'])
+        order = np.flatnonzero(codes >= 0)
+
+        parameters = {column: runs[column].to_numpy(dtype=float) for column in BACKTEST_PARAMETERS}
+        n_workers = max(1, min(len(order), n_workers or os.cpu_count() or 1))
+        n_chunks = max(n_workers, -(-len(order) // BACKTEST_CHUNK_RUNS))
+        chunks = [chunk for chunk in np.array_split(order, n_chunks) if len(chunk) > 0]
+        returns = np.column_stack([self.returns, np.zeros(len(self.dates))])
+        args = [(returns, self.holding_assets[codes[chunk]], self.holding_targets[codes[chunk]], self.starts[codes[chunk]],
+                 *[parameters[column][chunk] for column in BACKTEST_PARAMETERS],
+                 self.periods_per_year, self.risk_free) for chunk in chunks]
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                results = list(pool.map(_simulate_runs, *zip(*args)))
+        else:
+            results = [_simulate_runs(*a) for a in args]
+
+        summary = pd.DataFrame(np.nan, index=runs.index, columns=BACKTEST_SUMMARY)
+        for chunk, result in zip(chunks, results):
+            summary.iloc[chunk] = np.column_stack([result[column] for column in BACKTEST_SUMMARY])
+        return pd.concat([runs, summary], axis=1)
+
+    def sweep(self, portfolio_ids: list = None, frequencies: tuple = BACKTEST_FREQUENCIES,
+              thresholds: tuple = BACKTEST_THRESHOLDS, cost_bps: tuple = BACKTEST_COST_BPS,
+              n_workers: int = BACKTEST_WORKERS) -> pd.DataFrame:
+        """
+        Backtests every combination of the given portfolios and parameters (see run)
+
+        :param portfolio_ids: Portfolios to backtest (all if None)
+        :param frequencies: Periods between rebalancing checks (0: buy and hold)
+        :param thresholds: Largest tolerated deviation of a weight from its target
+        :param cost_bps: Transaction costs, in basis points of the traded value
+        :param n_workers: Number of worker processes (defaults to the CPU count); 1 simulates in-process
+        :return: DataFrame with columns portfolio_id, BACKTEST_PARAMETERS and BACKTEST_SUMMARY, one row per run
+        """
+        portfolio_ids = self.portfolio_ids if portfolio_ids is None else portfolio_ids
+        runs = pd.DataFrame(list(itertools.product(portfolio_ids, frequencies, thresholds, cost_bps)),
+                            columns=['portfolio_id'] + BACKTEST_PARAMETERS)
+        return self.run(runs, n_workers)
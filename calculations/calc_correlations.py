@@ -1,23 +1,166 @@
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import RidgeCV
 
-def calc_primary_coefficients(X, y):
+from common.constants import *
+
+
+class RidgeSolver:
+
+    def __init__(self, X, alphas=ATTRIBUTION_ALPHAS) -> None:
+        """
+        Ridge regression (with intercept) of many targets on one predictor matrix. The thin SVD
+        of the centered predictors is computed once; fitting a target is then a few matrix-vector
+        products, and the penalty is chosen per target by efficient leave-one-out CV over the
+        whole alpha grid - the same selection RidgeCV makes, without refitting.
+
+        :param X: Predictor variables (DataFrame, one row per period)
+        :param alphas: Candidate penalties
+        """
+        self.columns = X.columns
+        self.alphas = np.asarray(alphas, dtype=float)
+
+        X_values = X.to_numpy(dtype=float)
+        self.X_mean = X_values.mean(axis=0)
+        self.U, s, self.Vt = np.linalg.svd(X_values - self.X_mean, full_matrices=False)
+
+        # Shrinkage factors per singular value and alpha, and the leave-one-out hat diagonal
+        s2 = s[:, None] ** 2
+        self.coef_factors = s[:, None] / (s2 + self.alphas[None, :])
+        self.fit_factors = s2 / (s2 + self.alphas[None, :])
+        self.hat_diag = 1.0 / len(X_values) + (self.U ** 2) @ self.fit_factors
+
+    def fit(self, Y) -> tuple:
+        """
+        :param Y: Targets, one column per target (DataFrame) or a single target (Series)
+        :return: (coefficients, alphas) - DataFrame of coefficients (features x targets) and the
+            penalty selected for each target
+        """
+        Y_frame = Y.to_frame() if isinstance(Y, pd.Series) else Y
+        Y_values = Y_frame.to_numpy(dtype=float)
+        Y_centered = Y_values - Y_values.mean(axis=0)
+
+        UtY = self.U.T @ Y_centered  # components x targets
+
+        # Leave-one-out residuals for every alpha and target: (y - y_hat) / (1 - h)
+        fitted = np.einsum('nk,ka,kt->nat', self.U, self.fit_factors, UtY)
+        loo_errors = ((Y_centered[:, None, :] - fitted) / (1 - self.hat_diag[:, :, None])) ** 2
+        best = np.argmax(-loo_errors.mean(axis=0), axis=0)  # first of equal scores, like RidgeCV
+
+        coefficients = self.Vt.T @ (self.coef_factors[:, best] * UtY)
+        return (
+            pd.DataFrame(coefficients, index=self.columns, columns=Y_frame.columns),
+            pd.Series(self.alphas[best], index=Y_frame.columns, name='alpha'),
+        )
+
+
+def calc_primary_coefficients(X, y, solver=None, pca=None):
     """
     Gets highest contributing variables using L2 regularization
+
+    :param X: Predictor variables
+    :param y: Target variable
+    :param solver: RidgeSolver already decomposing the regressors (e.g. cached for the date window); built if None
+    :param pca: Fitted FactorPCA - if given, the regression runs on its component scores (a solver passed
+        along must then decompose those scores) and the coefficients are mapped back to the columns of X
+    :return: DataFrame with columns Feature, Coefficient
     """
 
-    print(X.isna().sum().sum())
-    print(X.shape)
-    print(y.shape)
+    regressors = X if pca is None else pca.transform(X)
+    solver = RidgeSolver(regressors) if solver is None else solver
+    coefficients, _ = solver.fit(y.rename('Coefficient'))
+
+    if pca is not None:
+        coefficients = pca.inverse_coefficients(coefficients['Coefficient']).rename('Coefficient').to_frame()
+
+    return coefficients.rename_axis('Feature').reset_index()
+
 
-    model = RidgeCV()
-    model.fit(X.values, y.values)
+class RollingCorrelationEngine:
 
-    coefficients = pd.DataFrame({'Feature': X.columns, 'Coefficient': model.coef_})
+    def __init__(self, y, X) -> None:
+        """
+        Rolling correlations between one series and many others, for any window. Running sums
+        of x, y, x^2, y^2 and xy are accumulated once; the correlation over a window is then
+        the difference of two rows of these sums, so every series and every window costs
+        O(dates) instead of a separate pandas rolling().corr() per pair.
 
-    print(model.coef_.sum())
-    print(model.coef_)
+        Like Series.rolling(window).corr, a window with a missing value in either series
+        gives NaN, as does a window in which either series is constant.
+
+        :param y: Target series (e.g. portfolio returns), indexed by date
+        :param X: DataFrame of series to correlate with y, indexed by date
+        """
+        X = X.reindex(y.index)
+        self.index = y.index
+        self.columns = X.columns
+
+        y_values = y.to_numpy(dtype=float)[:, None]
+        X_values = X.to_numpy(dtype=float)
+        valid = np.isfinite(X_values) & np.isfinite(y_values)
+
+        # Centering first keeps the differences of running sums accurate
+        y_values = np.where(valid, y_values - np.nanmean(y_values), 0.0)
+        X_values = np.where(valid, X_values - np.nanmean(np.where(valid, X_values, np.nan), axis=0), 0.0)
+
+        def running_sum(values):
+            return np.concatenate([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+
+        self.n = running_sum(valid.astype(float))
+        self.sx = running_sum(X_values)
+        self.sy = running_sum(y_values)
+        self.sxx = running_sum(X_values * X_values)
+        self.syy = running_sum(y_values * y_values)
+        self.sxy = running_sum(X_values * y_values)
+
+    def rolling_corr(self, window: int) -> pd.DataFrame:
+        """
+        :param window: Number of periods in the rolling window
+        :return: DataFrame of rolling correlations, indexed like y with one column per series of X
+        """
+        corr = np.full((len(self.index), len(self.columns)), np.nan)
+        if window > len(self.index):
+            return pd.DataFrame(corr, index=self.index, columns=self.columns)
+
+        def window_sum(cumulative):
+            return cumulative[window:] - cumulative[:-window]
+
+        n, sx, sy = window_sum(self.n), window_sum(self.sx), window_sum(self.sy)
+        sxx, syy, sxy = window_sum(self.sxx), window_sum(self.syy), window_sum(self.sxy)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var_x = sxx - sx * sx / n
+            var_y = syy - sy * sy / n
+            cov = sxy - sx * sy / n
+            r = np.clip(cov / np.sqrt(var_x * var_y), -1, 1)
+
+        # Incomplete windows and (numerically) constant series have no correlation
+        undefined = (n < window) | (var_x <= 1e-12 * sxx) | (var_y <= 1e-12 * syy)
+        corr[window - 1:] = np.where(undefined, np.nan, r)
+
+        return pd.DataFrame(corr, index=self.index, columns=self.columns)
+
+
+def rank_correlations(corr, top_k=None, min_windows=None):
+    """
+    Ranks series by the strength of their rolling correlation with the target
+
+    :param corr: Rolling correlations as returned by RollingCorrelationEngine.rolling_corr
+    :param top_k: Number of series to keep (all if None)
+    :param min_windows: Series with fewer defined windows are left out, so that short series do not
+        rank high by chance (defaults to half the windows of the longest series)
+    :return: DataFrame with one row per series, strongest mean absolute correlation first
+    """
 
-    return coefficients
+    ranking = pd.DataFrame({
+        'mean_abs_corr': corr.abs().mean(),
+        'mean_corr': corr.mean(),
+        'std_corr': corr.std(),
+        'n_windows': corr.count(),
+    })
+    if min_windows is None:
+        min_windows = ranking['n_windows'].max() / 2
+    ranking = ranking[ranking['n_windows'].ge(max(min_windows, 1))].sort_values(by='mean_abs_corr', ascending=False)
+    if top_k is not None:
+        ranking = ranking.head(top_k)
 
+    return ranking.reset_index()
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+
+OPTIMIZATION_MODES = ('min_variance', 'risk_parity', 'max_sharpe')
+
+
+def shrinkage_covariance(returns: pd.DataFrame, min_periods: int = OPTIMIZER_MIN_PERIODS) -> tuple:
+    """
+    Ledoit-Wolf covariance of asset returns: the sample covariance shrunk towards a scaled identity
+    by the intensity minimizing the expected squared error (the estimate sklearn.covariance.ledoit_wolf
+    makes), so that it stays well conditioned when assets are many relative to periods. Missing
+    returns are set to the asset's mean (they add nothing to its co-movements); assets with fewer
+    than min_periods returns are left out.
+
+    :param returns: Period returns, dates x assets
+    :param min_periods: Returns an asset needs in the window
+    :return: (covariance, mean returns, shrinkage intensity) - covariance as a DataFrame over the assets kept
+    """
+    returns = returns.loc[:, returns.notna().sum() >= min_periods]
+    values = returns.to_numpy(dtype=float)
+    mean = np.nanmean(values, axis=0) if values.size > 0 else np.zeros(values.shape[1])
+    X = np.where(np.isnan(values), 0.0, values - mean)
+    n_samples, n_features = X.shape
+    if n_features == 0 or n_samples == 0:
+        return pd.DataFrame(index=returns.columns, columns=returns.columns, dtype=float), pd.Series(mean, index=returns.columns), 0.0
+
+    sample = X.T @ X / n_samples
+    mu = np.trace(sample) / n_features
+    X2 = X ** 2
+    beta = ((X2.T @ X2).sum() / n_samples - (sample ** 2).sum()) / (n_features * n_samples)
+    delta = ((sample ** 2).sum() - 2 * mu * np.trace(sample) + n_features * mu ** 2) / n_features
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    covariance = (1 - shrinkage) * sample + shrinkage * mu * np.eye(n_features)
+    return (
+        pd.DataFrame(covariance, index=returns.columns, columns=returns.columns),
+        pd.Series(mean, index=returns.columns),
+        float(shrinkage),
+    )
+
+
+def project_to_simplex(V: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Euclidean projection of every row of V onto the long-only, fully invested weights of the assets
+    in the same row of mask (the others get 0)
+
+    :param V: Candidate weights, portfolios x assets
+    :param mask: Boolean portfolios x assets, True for the assets a portfolio may hold
+    """
+    n_assets = V.shape[1]
+    V = np.where(mask, V, -np.inf)
+    U = -np.sort(-V, axis=1)
+    held = np.isfinite(U)
+    css = np.cumsum(np.where(held, U, 0.0), axis=1) - 1
+    rho = np.maximum(((U - css / np.arange(1, n_assets + 1) > 0) & held).sum(axis=1) - 1, 0)
+    theta = css[np.arange(len(V)), rho] / (rho + 1)
+    return np.where(mask, np.maximum(V - theta[:, None], 0.0), 0.0)
+
+
+class PortfolioOptimizer:
+
+    def __init__(self, covariance: pd.DataFrame, mean: pd.Series = None, risk_free: float = 0.0,
+                 max_iterations: int = OPTIMIZER_MAX_ITERATIONS, tolerance: float = OPTIMIZER_TOLERANCE) -> None:
+        """
+        Long-only, fully invested weights for a batch of portfolios drawn from one asset universe.
+        Every portfolio is a row of a portfolios x assets weight matrix (assets it does not hold
+        stay at 0), so each iteration moves all portfolios at once with one product by the shared
+        covariance matrix. Solvers start from the given weights (e.g. the current allocation):
+        after small changes they are close to the solution and converge in a few iterations.
+
+        :param covariance: Covariance of asset returns (e.g. from shrinkage_covariance)
+        :param mean: Mean period returns of the assets (needed for max_sharpe)
+        :param risk_free: Risk-free return per period
+        :param max_iterations: Iteration limit of the solvers
+        :param tolerance: Largest weight change (or risk contribution error for risk parity) at convergence
+        """
+        self.assets = covariance.index
+        self.covariance = covariance.to_numpy(dtype=float)
+        self.mean = np.zeros(len(self.assets)) if mean is None else mean.reindex(self.assets).to_numpy(dtype=float)
+        self.risk_free = risk_free
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.iterations = 0
+
+    def _variance(self, W: np.ndarray) -> np.ndarray:
+        return ((W @ self.covariance) * W).sum(axis=1)
+
+    def _lipschitz(self, mask: np.ndarray) -> np.ndarray:
+        # Lipschitz constant of the variance gradient of each portfolio: twice the largest eigenvalue of the covariance
+        # of its assets, bounded by the largest absolute row sum (Gershgorin) - far below that of the whole universe
+        row_sums = mask.astype(float) @ np.abs(self.covariance)
+        return np.maximum(2 * np.where(mask, row_sums, 0.0).max(axis=1, initial=0), 1e-300)
+
+    def _start(self, mask: np.ndarray, initial: np.ndarray = None) -> np.ndarray:
+        # Equal weights where no (positive) starting weights are given
+        initial = np.where(mask, 1.0, 0.0) if initial is None else np.where(mask, np.nan_to_num(initial), 0.0)
+        initial = np.where((initial.sum(axis=1) > 0)[:, None], initial, np.where(mask, 1.0, 0.0))
+        return project_to_simplex(initial / np.maximum(initial.sum(axis=1, keepdims=True), 1e-300), mask)
+
+    def min_variance(self, mask: np.ndarray, initial: np.ndarray = None) -> np.ndarray:
+        """
+        Minimum variance weights, by accelerated projected gradient descent (FISTA)
+
+        :param mask: Boolean portfolios x assets, True for the assets a portfolio holds
+        :param initial: Starting weights, portfolios x assets
+        :return: Weights, portfolios x assets
+        """
+        W = self._start(mask, initial)
+        step = (1 / self._lipschitz(mask))[:, None]
+        Y, t = W.copy(), np.ones(len(W))
+        for self.iterations in range(1, self.max_iterations + 1):
+            W_next = project_to_simplex(Y - step * (2 * Y @ self.covariance), mask)
+            # Momentum restarts for the portfolios it stopped helping (adaptive restart)
+            restart = ((Y - W_next) * (W_next - W)).sum(axis=1) > 0
+            t = np.where(restart, 1.0, t)
+            t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+            Y = W_next + np.where(restart, 0.0, (t - 1) / t_next)[:, None] * (W_next - W)
+            change = np.abs(W_next - W).max(initial=0)
+            W, t = W_next, t_next
+            if change < self.tolerance:
+                break
+        return W
+
+    def risk_parity(self, mask: np.ndarray, initial: np.ndarray = None) -> np.ndarray:
+        """
+        Equal risk contribution weights, by cyclical coordinate descent on
+        min 1/2 y'Cy - sum(b log y) (b: equal budgets of the assets held), normalized to sum to 1.
+        Each coordinate step is solved exactly, for all portfolios at once.
+
+        :param mask: Boolean portfolios x assets, True for the assets a portfolio holds
+        :param initial: Starting weights, portfolios x assets
+        :return: Weights, portfolios x assets
+        """
+        W = self._start(mask, initial)
+        budget = np.where(mask, 1.0, 0.0) / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        # At the solution y'Cy = sum(b) = 1: scaling the start accordingly keeps a good start good
+        Y = W / np.sqrt(np.maximum(self._variance(W), 1e-300))[:, None]
+        CY = Y @ self.covariance
+        diagonal = np.diag(self.covariance)
+        held_assets = np.flatnonzero(mask.any(axis=0))
+
+        for self.iterations in range(1, self.max_iterations + 1):
+            for i in held_assets:
+                c = CY[:, i] - diagonal[i] * Y[:, i]
+                y = np.where(mask[:, i], (-c + np.sqrt(c * c + 4 * diagonal[i] * budget[:, i])) / (2 * diagonal[i]), 0.0)
+                CY += np.outer(y - Y[:, i], self.covariance[i])
+                Y[:, i] = y
+            contributions = Y * CY / np.maximum((Y * CY).sum(axis=1, keepdims=True), 1e-300)
+            if np.abs(np.where(mask, contributions - budget, 0.0)).max(initial=0) < self.tolerance:
+                break
+        return Y / np.maximum(Y.sum(axis=1, keepdims=True), 1e-300)
+
+    def max_sharpe(self, mask: np.ndarray, initial: np.ndarray = None) -> np.ndarray:
+        """
+        Maximum Sharpe ratio weights, by projected gradient ascent with a step size per portfolio:
+        the Barzilai-Borwein (spectral) step after an improvement, half the step otherwise.
+        Portfolios none of whose assets has a mean return above the risk-free rate get their
+        minimum variance weights.
+
+        :param mask: Boolean portfolios x assets, True for the assets a portfolio holds
+        :param initial: Starting weights, portfolios x assets
+        :return: Weights, portfolios x assets
+        """
+        excess = self.mean - self.risk_free
+        feasible = (mask & (excess > 0)).any(axis=1)
+
+        def sharpe_and_gradient(W):
+            CW = W @ self.covariance
+            sigma = np.sqrt(np.maximum((W * CW).sum(axis=1), 1e-300))
+            S = (W @ excess) / sigma
+            return S, excess / sigma[:, None] - (S / sigma ** 2)[:, None] * CW
+
+        W = self._start(mask, initial)
+        S, gradient = sharpe_and_gradient(W)
+        lipschitz = self._lipschitz(mask)
+        step = 1 / lipschitz
+        for self.iterations in range(1, self.max_iterations + 1):
+            candidate = project_to_simplex(W + step[:, None] * gradient, mask)
+            S_candidate, gradient_candidate = sharpe_and_gradient(candidate)
+            improved = S_candidate > S
+            s = candidate - W
+            sy = (s * (gradient_candidate - gradient)).sum(axis=1)
+            spectral = np.where(sy < 0, (s * s).sum(axis=1) / np.where(sy < 0, -sy, 1.0), step * 2)
+            change = np.where(improved, np.abs(s).max(axis=1), 0.0)
+
+            W = np.where(improved[:, None], candidate, W)
+            S = np.where(improved, S_candidate, S)
+            gradient = np.where(improved[:, None], gradient_candidate, gradient)
+            step = np.where(improved, spectral, step / 2)
+            # Done: improvements no longer move the weights, or no step is small enough to improve
+            done = np.where(improved, change < self.tolerance, step * lipschitz < self.tolerance)
+            if done.all():
+                break
+
+        if not feasible.all():
+            W[~feasible] = self.min_variance(mask[~feasible], W[~feasible])
+        return W
+
+    def optimize(self, mode: str, mask: np.ndarray, initial: np.ndarray = None) -> np.ndarray:
+        """
+        :param mode: One of OPTIMIZATION_MODES
+        :param mask: Boolean portfolios x assets, True for the assets a portfolio holds
+        :param initial: Starting weights, portfolios x assets
+        :return: Weights, portfolios x assets
+        """
+        if mode not in OPTIMIZATION_MODES:
+            raise ValueError(f"Unknown optimization mode {mode}, expected one of {OPTIMIZATION_MODES}")
+        return getattr(self, mode)(mask, initial)
@@ -1,27 +1,154 @@
 import numpy as np
 import pandas as pd
 
-def calc_portfolio_price(assets_tbl):
-    """
 
-    :param assets_tbl:
-    :return:
-    """
+class PortfolioReturnsEngine:
+
+    def __init__(self, prices: pd.DataFrame, allocation: pd.DataFrame) -> None:
+        """
+        Returns of many portfolios at once. Prices are laid out once as a dense date x asset
+        matrix and weights as a portfolio x asset matrix, so the weighted returns of every
+        portfolio come out of a single matrix product instead of a pivot/melt/groupby per portfolio.
+
+        Semantics follow calc_portfolio_price/calc_portfolio_returns: missing prices are carried
+        forward, an asset without a (finite) return in a period contributes nothing to the
+        portfolio (so the first period of a portfolio has a return of 0) and a portfolio only
+        has rows from the first date on which one of its assets has a price.
+
+        :param prices: Columns asset_id, date, asset_price (one row per asset and date)
+        :param allocation: Columns portfolio_id, asset_id, asset_weight
+        """
+        prices = prices.drop_duplicates(subset=['asset_id', 'date'], keep='last')
+        allocation = allocation[allocation['asset_id'].isin(prices['asset_id'])]
+
+        date_codes, self.dates = pd.factorize(prices['date'], sort=True)
+        asset_codes, self.asset_ids = pd.factorize(prices['asset_id'], sort=True)
+        portfolio_codes, self.portfolio_ids = pd.factorize(allocation['portfolio_id'], sort=True)
+        allocation_asset_codes = self.asset_ids.get_indexer(allocation['asset_id'])
+
+        # Dense matrices: dates x assets (prices) and portfolios x assets (weights, holdings)
+        self.price_matrix = np.full((len(self.dates), len(self.asset_ids)), np.nan)
+        self.price_matrix[date_codes, asset_codes] = prices['asset_price'].to_numpy(dtype=float)
+
+        self.weight_matrix = np.zeros((len(self.portfolio_ids), len(self.asset_ids)))
+        self.weight_matrix[portfolio_codes, allocation_asset_codes] = allocation['asset_weight'].to_numpy(dtype=float)
+        self.holding_matrix = np.zeros(self.weight_matrix.shape, dtype=bool)
+        self.holding_matrix[portfolio_codes, allocation_asset_codes] = True
+
+        self._asset_returns = None
+
+    @classmethod
+    def from_portfolio_prices(cls, assets_tbl: pd.DataFrame) -> 'PortfolioReturnsEngine':
+        """
+        :param assets_tbl: Long table as returned by read_portfolio_asset_prices
+            (portfolio_id, asset_id, asset_weight, date, asset_price)
+        """
+        prices = assets_tbl[['asset_id', 'date', 'asset_price']]
+        allocation = assets_tbl[['portfolio_id', 'asset_id', 'asset_weight']].drop_duplicates(
+            subset=['portfolio_id', 'asset_id'], keep='last')
+        return cls(prices, allocation)
+
+    def asset_returns(self) -> tuple:
+        """
+        :return: (pct returns, log returns) of every asset, both dates x assets; NaN where undefined
+        """
+        if self._asset_returns is None:
+            filled = pd.DataFrame(self.price_matrix).ffill().to_numpy()
+            ratio = np.full(filled.shape, np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio[1:] = filled[1:] / filled[:-1]
+                self._asset_returns = (ratio - 1, np.log(ratio))
+        return self._asset_returns
 
-    assets_tbl_pivot = assets_tbl.pivot(index=['portfolio_id', 'date', 'asset_weight'], columns='asset_id', values='asset_price')
-    # assets_tbl['weighted_price'] = assets_tbl['asset_weight'] * assets_tbl['asset_price']
-    asset_pct_return = assets_tbl_pivot.pct_change().melt(ignore_index=False, var_name='asset_id', value_name='asset_pct_return')
-    asset_log_return = np.log(assets_tbl_pivot / assets_tbl_pivot.shift(1)).melt(ignore_index=False, var_name='asset_id', value_name='asset_log_return')
+    def active_dates(self) -> np.ndarray:
+        """
+        :return: Boolean dates x portfolios matrix, True from the first date a holding has a price
+        """
+        has_price = ~np.isnan(self.price_matrix)
+        any_price = (has_price.astype(np.float32) @ self.holding_matrix.T.astype(np.float32)) > 0
+        return np.logical_or.accumulate(any_price, axis=0)
 
-    asset_pct_return = asset_pct_return.set_index('asset_id', append=True)
-    asset_log_return = asset_log_return.set_index('asset_id', append=True)
+    def portfolio_returns(self) -> tuple:
+        """
+        Weighted returns of all portfolios, as one matrix product per return type
 
-    assets_tbl = pd.concat([asset_pct_return, asset_log_return], ignore_index=False, axis=1).reset_index()
+        :return: (pct returns, log returns), both dates x portfolios
+        """
+        pct_returns, log_returns = self.asset_returns()
+        pct = np.where(np.isfinite(pct_returns), pct_returns, 0.0) @ self.weight_matrix.T
+        log = np.where(np.isfinite(log_returns), log_returns, 0.0) @ self.weight_matrix.T
+        return pct, log
 
-    assets_tbl['weighted_pct_return'] = assets_tbl['asset_weight'] * assets_tbl['asset_pct_return']
-    assets_tbl['weighted_log_return'] = assets_tbl['asset_weight'] * assets_tbl['asset_log_return']
+    def _portfolio_codes(self, portfolio_ids: list = None) -> np.ndarray:
+        if portfolio_ids is None:
+            return np.arange(len(self.portfolio_ids))
+        codes = self.portfolio_ids.get_indexer(list(portfolio_ids))
+        return codes[codes >= 0]
+
+    def portfolio_returns_frame(self, portfolio_ids: list = None) -> pd.DataFrame:
+        """
+        Long-format portfolio returns, as produced by calc_portfolio_returns
+
+        :param portfolio_ids: Portfolios to include (all if None)
+        :return: DataFrame with columns portfolio_id, date, pct_return, log_return
+        """
+        codes = self._portfolio_codes(portfolio_ids)
+        pct, log = self.portfolio_returns()
+        active = self.active_dates()[:, codes]
+        pf_idx, date_idx = np.nonzero(active.T)  # ordered by portfolio, then date
+
+        return pd.DataFrame({
+            'portfolio_id': self.portfolio_ids[codes][pf_idx],
+            'date': self.dates[date_idx],
+            'pct_return': pct[date_idx, codes[pf_idx]],
+            'log_return': log[date_idx, codes[pf_idx]],
+        })
+
+    def asset_returns_frame(self, portfolio_ids: list = None) -> pd.DataFrame:
+        """
+        Long-format weighted asset returns, as produced by calc_portfolio_price
+
+        :param portfolio_ids: Portfolios to include (all if None)
+        :return: DataFrame with columns portfolio_id, date, asset_weight, asset_id, asset_pct_return,
+            asset_log_return, weighted_pct_return, weighted_log_return
+        """
+        codes = self._portfolio_codes(portfolio_ids)
+        pct_returns, log_returns = self.asset_returns()
+        active = self.active_dates()
+
+        frames = []
+        for code in codes:
+            asset_idx = np.flatnonzero(self.holding_matrix[code])
+            date_idx = np.flatnonzero(active[:, code])
+            d, a = np.repeat(date_idx, len(asset_idx)), np.tile(asset_idx, len(date_idx))
+            weights = self.weight_matrix[code, a]
+            frames.append(pd.DataFrame({
+                'portfolio_id': self.portfolio_ids[code],
+                'date': self.dates[d],
+                'asset_weight': weights,
+                'asset_id': self.asset_ids[a],
+                'asset_pct_return': pct_returns[d, a],
+                'asset_log_return': log_returns[d, a],
+                'weighted_pct_return': weights * pct_returns[d, a],
+                'weighted_log_return': weights * log_returns[d, a],
+            }))
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=[
+                'portfolio_id', 'date', 'asset_weight', 'asset_id', 'asset_pct_return',
+                'asset_log_return', 'weighted_pct_return', 'weighted_log_return'])
+        return pd.concat(frames, ignore_index=True)
+
+
+def calc_portfolio_price(assets_tbl):
+    """
+    Weighted period-over-period returns of each asset held by each portfolio
+
+    :param assets_tbl: Long table as returned by read_portfolio_asset_prices
+    :return: Long table of asset returns (see PortfolioReturnsEngine.asset_returns_frame)
+    """
 
-    return assets_tbl
+    return PortfolioReturnsEngine.from_portfolio_prices(assets_tbl).asset_returns_frame()
 
 
 def calc_portfolio_returns(assets_tbl):
@@ -37,4 +164,4 @@ def calc_portfolio_returns(assets_tbl):
     # pf_tbl['pct_return'] = pf_tbl['price'].pct_change()
     # pf_tbl['log_return'] = np.log(pf_tbl['price'] / pf_tbl['price'].shift(1))
 
-    return pf_tbl
\ No newline at end of file
+    return pf_tbl
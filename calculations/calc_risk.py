@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from common.constants import *
+
+RISK_METRICS = ['volatility', 'max_drawdown', 'sharpe', 'sortino', 'var', 'cvar', 'beta']
+
+
+def _running_sum(values: np.ndarray) -> np.ndarray:
+    return np.concatenate([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+
+
+def _window_rows(n_rows: int, n_series: int, window: int):
+    # Row blocks of the strided passes, so that a block holds about RISK_BLOCK_SIZE values whatever the window
+    step = max(1, RISK_BLOCK_SIZE // max(1, n_series * (window + 1)))
+    for start in range(0, n_rows, step):
+        yield slice(start, min(start + step, n_rows))
+
+
+class RiskMetricsEngine:
+
+    def __init__(self, returns: pd.DataFrame, benchmark: pd.Series = None,
+                 periods_per_year: int = RISK_PERIODS_PER_YEAR, risk_free_rate: float = RISK_FREE_RATE,
+                 level: float = RISK_VAR_LEVEL) -> None:
+        """
+        Risk metrics of many portfolios over rolling windows, from one returns matrix. Like
+        RollingCorrelationEngine, the moments behind volatility, Sharpe/Sortino ratios and beta are
+        running sums accumulated once, so that any window is the difference of two rows for every
+        portfolio at once. Drawdowns and historical VaR/CVaR, which depend on the order of the
+        returns in a window, come from strided (sliding_window_view) windows processed in blocks
+        of rows.
+
+        A window is defined once it holds min_periods returns (all of them by default); missing
+        returns (e.g. before a portfolio's first price) are left out.
+
+        :param returns: Period returns (pct), dates x portfolios
+        :param benchmark: Period returns (pct) of the benchmark, indexed by date (beta is NaN without one)
+        :param periods_per_year: Used to annualize volatility, Sharpe and Sortino ratios and the risk-free rate
+        :param risk_free_rate: Annual risk-free rate
+        :param level: Confidence level of the historical VaR/CVaR (e.g. 0.95: loss exceeded in 5% of periods)
+        """
+        self.index = returns.index
+        self.columns = returns.columns
+        self.periods_per_year = periods_per_year
+        self.risk_free = risk_free_rate / periods_per_year
+        self.level = level
+
+        R = returns.to_numpy(dtype=float)
+        self.returns = np.where(np.isfinite(R), R, np.nan)
+        self.valid = ~np.isnan(self.returns)
+
+        # Centering first keeps the differences of running sums accurate
+        self.center = np.where(self.valid, self.returns, 0.0).sum(axis=0) / np.maximum(self.valid.sum(axis=0), 1)
+        centered = np.where(self.valid, self.returns - self.center, 0.0)
+        self.n = _running_sum(self.valid.astype(float))
+        self.s = _running_sum(centered)
+        self.ss = _running_sum(centered * centered)
+        self.downside = _running_sum(np.where(self.valid, np.minimum(self.returns - self.risk_free, 0.0), 0.0) ** 2)
+        self.log_wealth = _running_sum(np.where(self.valid, np.log1p(np.where(self.valid, self.returns, 0.0)), 0.0))
+
+        if benchmark is None:
+            benchmark = pd.Series(np.nan, index=self.index)
+        b = benchmark.reindex(self.index).to_numpy(dtype=float)[:, None]
+        b_valid = np.isfinite(b)
+        paired = self.valid & b_valid
+        b_centered = np.where(paired, b - np.where(b_valid, b, 0.0).sum() / max(b_valid.sum(), 1), 0.0)
+        r_centered = np.where(paired, centered, 0.0)
+        self.n_paired = _running_sum(paired.astype(float))
+        self.sb = _running_sum(b_centered)
+        self.sr = _running_sum(r_centered)
+        self.sbb = _running_sum(b_centered * b_centered)
+        self.srb = _running_sum(r_centered * b_centered)
+
+    def _window_sum(self, cumulative: np.ndarray, window: int, ends: np.ndarray) -> np.ndarray:
+        out = np.full((len(ends), len(self.columns)), np.nan)
+        full = ends >= window - 1
+        out[full] = cumulative[ends[full] + 1] - cumulative[ends[full] + 1 - window]
+        return out
+
+    def _max_drawdown(self, window: int, ends: np.ndarray) -> np.ndarray:
+        # Largest fall of the wealth index from its running peak within the window (which starts at the wealth
+        # before the window's first return); log wealth turns the ratio to the peak into a difference
+        drawdown = np.full((len(ends), len(self.columns)), np.nan)
+        paths = sliding_window_view(self.log_wealth, window + 1, axis=0)  # rows x portfolios x (window + 1)
+        full = np.flatnonzero(ends >= window - 1)
+
+        for rows in _window_rows(len(full), len(self.columns), window):
+            path = paths[ends[full[rows]] - (window - 1)]
+            drawdown[full[rows]] = (np.maximum.accumulate(path, axis=2) - path).max(axis=2)
+        return 1 - np.exp(-drawdown)
+
+    def _var_cvar(self, window: int, ends: np.ndarray) -> tuple:
+        # Historical VaR: the (1 - level) quantile of returns (linear interpolation, like np.quantile), as a loss;
+        # CVaR: the average loss of the returns at or below it
+        tail = 1 - self.level
+        var = np.full((len(ends), len(self.columns)), np.nan)
+        cvar = np.full((len(ends), len(self.columns)), np.nan)
+        windows = sliding_window_view(self.returns, window, axis=0)
+        full = np.flatnonzero(ends >= window - 1)
+
+        for rows in _window_rows(len(full), len(self.columns), window):
+            block = np.sort(windows[ends[full[rows]] - (window - 1)], axis=2)  # missing returns sort last
+            count = (~np.isnan(block)).sum(axis=2)
+            position = tail * np.maximum(count - 1, 0)
+            lo = np.floor(position).astype(int)
+            hi = np.minimum(lo + 1, np.maximum(count - 1, 0))
+            low = np.take_along_axis(block, lo[..., None], axis=2)[..., 0]
+            high = np.take_along_axis(block, hi[..., None], axis=2)[..., 0]
+            quantile = low + (position - lo) * (high - low)
+            tail_mean = np.take_along_axis(np.cumsum(np.nan_to_num(block), axis=2), lo[..., None], axis=2)[..., 0] / (lo + 1)
+
+            var[full[rows]], cvar[full[rows]] = -quantile, -tail_mean
+        return var, cvar
+
+    def rolling(self, window: int, min_periods: int = None, ends: np.ndarray = None) -> dict:
+        """
+        :param window: Number of periods in the rolling window
+        :param min_periods: Returns a window needs for its metrics to be defined (defaults to window, at least 2)
+        :param ends: Rows (positions in the index) of the last dates of the windows to evaluate (all dates if None),
+            e.g. only the latest for a summary; the strided passes only visit those windows
+        :return: {metric: ends x portfolios array} for every metric of RISK_METRICS; NaN where undefined
+        """
+        min_periods = max(window if min_periods is None else min_periods, 2)
+        ends = np.arange(len(self.index)) if ends is None else np.asarray(ends, dtype=int)
+        empty = np.full((len(ends), len(self.columns)), np.nan)
+        if window > len(self.index):
+            return {metric: empty.copy() for metric in RISK_METRICS}
+
+        n, s, ss = self._window_sum(self.n, window, ends), self._window_sum(self.s, window, ends), self._window_sum(self.ss, window, ends)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = s / n + self.center
+            squares = ss - s * s / n
+            std = np.sqrt(np.maximum(squares, 0.0) / (n - 1))
+            # (Numerically) constant returns have no defined ratios
+            flat = squares <= 1e-12 * ss
+            excess_mean = mean - self.risk_free
+            # Windows without returns below the risk-free rate have no Sortino ratio (rather than an infinite one)
+            downside_squares = self._window_sum(self.downside, window, ends)
+            downside = np.sqrt(np.maximum(downside_squares, 0.0) / n)
+            no_downside = downside_squares <= 1e-12 * self.downside[ends + 1]
+            annual = np.sqrt(self.periods_per_year)
+
+            n_b = self._window_sum(self.n_paired, window, ends)
+            sb, sr = self._window_sum(self.sb, window, ends), self._window_sum(self.sr, window, ends)
+            cov = self._window_sum(self.srb, window, ends) - sr * sb / n_b
+            var_b = self._window_sum(self.sbb, window, ends) - sb * sb / n_b
+            beta = np.where(var_b > 1e-12 * self._window_sum(self.sbb, window, ends), cov / var_b, np.nan)
+
+            metrics = {
+                'volatility': std * annual,
+                'max_drawdown': self._max_drawdown(window, ends),
+                'sharpe': np.where(flat, np.nan, excess_mean / std * annual),
+                'sortino': np.where(no_downside, np.nan, excess_mean / downside * annual),
+            }
+        metrics['var'], metrics['cvar'] = self._var_cvar(window, ends)
+        metrics['beta'] = np.where(n_b >= min_periods, beta, np.nan)
+
+        undefined = ~(n >= min_periods)
+        return {metric: np.where(undefined, np.nan, values) for metric, values in metrics.items()}
+
+    def rolling_frame(self, windows: tuple = RISK_WINDOWS, ends: np.ndarray = None) -> pd.DataFrame:
+        """
+        :param windows: Rolling windows (periods)
+        :param ends: Rows of the last dates of the windows to evaluate (all dates if None), see rolling
+        :return: Long DataFrame with columns portfolio_id, window, date and one column per metric of RISK_METRICS,
+            rows where every metric is undefined left out
+        """
+        ends = np.arange(len(self.index)) if ends is None else np.asarray(ends, dtype=int)
+        frames = []
+        for window in windows:
+            metrics = self.rolling(window, ends=ends)
+            values = np.stack([metrics[metric] for metric in RISK_METRICS], axis=-1)  # ends x portfolios x metrics
+            date_idx, pf_idx = np.nonzero(~np.isnan(values).all(axis=-1))
+            frame = pd.DataFrame(values[date_idx, pf_idx], columns=RISK_METRICS)
+            frame.insert(0, 'portfolio_id', np.asarray(self.columns)[pf_idx])
+            frame.insert(1, 'window', window)
+            frame.insert(2, 'date', np.asarray(self.index)[ends[date_idx]])
+            frames.append(frame)
+        if len(frames) == 0:
+            return pd.DataFrame(columns=['portfolio_id', 'window', 'date'] + RISK_METRICS)
+        return pd.concat(frames, ignore_index=True).sort_values(['portfolio_id', 'window', 'date'], ignore_index=True)
+
+    def summary(self, windows: tuple = RISK_WINDOWS) -> pd.DataFrame:
+        """
+        Latest value of every metric per portfolio and window, plus the metrics over each portfolio's full history
+
+        :param windows: Rolling windows (periods)
+        :return: DataFrame with columns portfolio_id, window (label: number of periods, or 'full' for the full
+            history), date (last date of the window) and one column per metric of RISK_METRICS
+        """
+        columns = ['portfolio_id', 'window', 'date'] + RISK_METRICS
+        if len(self.index) == 0:
+            return pd.DataFrame(columns=columns)
+
+        # Only the latest window of every length is evaluated
+        last = len(self.index) - 1
+        frames = []
+        for window, metrics in [(window, self.rolling(window, ends=[last])) for window in windows] + \
+                [('full', self.rolling(len(self.index), 2, ends=[last]))]:
+            frame = pd.DataFrame({metric: metrics[metric][0] for metric in RISK_METRICS})
+            frame.insert(0, 'portfolio_id', np.asarray(self.columns))
+            frame.insert(1, 'window', str(window))
+            frame.insert(2, 'date', self.index[last])
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True).sort_values('portfolio_id', kind='stable', ignore_index=True)
@@ -0,0 +1,184 @@
+import os
+import sys
+import sqlite3
+import logging
+import threading
+import functools
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+from common.constants import *
+
+
+def db_version_path(db_name: str = None) -> str:
+    return f"db/{DB_NAME if db_name is None else db_name}.version"
+
+
+def get_db_version(db_name: str = None) -> int:
+    """
+    Returns the version counter of the database. This is a small side-car file next to the
+    database, so it can be checked on every Streamlit rerun without querying SQLite.
+
+    :param db_name: File name of the database
+    :return: Current version (0 if it was never bumped)
+    """
+    try:
+        with open(db_version_path(db_name), 'r') as file:
+            return int(file.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_db_version(db_name: str = None) -> int:
+    """
+    Increments the version counter of the database. Must be called after every write that
+    changes data read by the dashboard, so that cached results are recomputed.
+
+    :param db_name: File name of the database
+    :return: New version
+    """
+    version = get_db_version(db_name) + 1
+    path = db_version_path(db_name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(str(version))
+    os.replace(tmp_path, path)
+    return version
+
+
+# Object (string) columns longer than this are sized from an evenly spaced sample of this many values
+SIZEOF_SAMPLE = 1000
+
+
+def _sizeof_objects(values: np.ndarray) -> int:
+    # Deep size of an object array; measuring every Python object of a long column costs more than computing it
+    if len(values) <= SIZEOF_SAMPLE:
+        return sum(sys.getsizeof(v) for v in values)
+    sample = values[np.linspace(0, len(values) - 1, SIZEOF_SAMPLE).astype(int)]
+    return int(len(values) * sum(sys.getsizeof(v) for v in sample) / SIZEOF_SAMPLE)
+
+
+def sizeof(value) -> int:
+    """
+    Approximate memory footprint of a cached value, in bytes
+    """
+    if isinstance(value, pd.DataFrame):
+        size = int(value.memory_usage(index=False, deep=False).sum()) + sizeof(value.index)
+        return size + sum(_sizeof_objects(value.iloc[:, i].to_numpy()) for i in np.flatnonzero(value.dtypes == object))
+    if isinstance(value, (pd.Series, pd.Index)) and value.dtype == object and not isinstance(value, pd.MultiIndex):
+        return int(value.memory_usage(deep=False)) + _sizeof_objects(np.asarray(value, dtype=object))
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class VersionedCache:
+
+    def __init__(self, max_bytes: int = None) -> None:
+        """
+        LRU cache of query and calculation results, bounded by an approximate memory budget.
+        All entries belong to one database version: as soon as a different version is
+        observed the cache is emptied. Cached values are shared between reruns and sessions,
+        so callers must treat them as read-only.
+
+        :param max_bytes: Memory budget; least recently used entries are evicted beyond it
+        """
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def sync_version(self, version: int) -> None:
+        with self.lock:
+            if version != self.version:
+                if self.version is not None:
+                    logging.info(f"Database version {self.version} -> {version}: clearing cache")
+                self.clear()
+                self.version = version
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None, False
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0], True
+
+    def put(self, key, value) -> None:
+        size = sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                logging.info(f"Cache: not storing {key[0]} ({size} bytes exceeds budget)")
+                return
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get_or_compute(self, key, func, db_name: str = None):
+        """
+        Returns the cached value for key under the current database version, computing and
+        storing it with func() on a miss.
+
+        :param key: Hashable key; its first element names the cached quantity
+        :param func: Callable without arguments producing the value
+        :param db_name: File name of the database whose version scopes the entry
+        """
+        self.sync_version(get_db_version(db_name))
+        value, found = self.get(key)
+        if not found:
+            value = func()
+            self.put(key, value)
+        return value
+
+
+# Module-level instance: imported modules survive Streamlit reruns, so this is shared by all pages and sessions
+CACHE = VersionedCache()
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    return value
+
+
+def versioned_cache(namespace: str):
+    """
+    Decorator caching a function's result in CACHE under the current database version.
+    Connection arguments are left out of the key; lists/arrays are converted to tuples.
+
+    :param namespace: Unique name of the cached quantity (first element of the key)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key_args = tuple(_freeze(a) for a in args if not isinstance(a, sqlite3.Connection))
+            key_kwargs = tuple(
+                (k, _freeze(v)) for k, v in sorted(kwargs.items()) if not isinstance(v, sqlite3.Connection)
+            )
+            return CACHE.get_or_compute((namespace, key_args, key_kwargs), lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
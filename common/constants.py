@@ -15,4 +15,119 @@ DEFAULT_RET_ATTR_END_DATE_DT = dt.strptime('2012-12-31', '%Y-%m-%d')
 DATE_FORMAT = '%Y-%m'
 
 DEFAULT_PORTFOLIO_ID = 'PF_01'
-DEFAULT_PORTFOLIO_NAME = 'Portfolio_01'
\ No newline at end of file
+DEFAULT_PORTFOLIO_NAME = 'Portfolio_01'
+
+# Optional columnar (Parquet) copy of the large long tables; SQLite remains the catalog
+COLUMNAR_STORE_ENABLED = True
+COLUMNAR_STORE_PATH = 'db/columnar'
+
+# In-process cache of query/calculation results, invalidated whenever the database version is bumped
+CACHE_MAX_BYTES = 512 * 2**20
+
+# WorldBank archive ingestion: worker processes (None = one per archive, up to the CPU count) and raw bytes per CSV block
+MACRO_INGESTION_WORKERS = None
+MACRO_CSV_CHUNKSIZE = 4 * 2**20
+
+# Frequency factor_data is stored at: 'monthly' (annual values interpolated to month ends at ingestion) or 'annual'
+# (native yearly observations, interpolated to month ends on read - see preprocessing/interpolation.py)
+FACTOR_DATA_FREQUENCY = 'monthly'
+FACTOR_DATA_FREQUENCIES = ('monthly', 'annual')
+
+# Maximum number of concurrent requests to the market data provider
+FETCH_MAX_WORKERS = 8
+
+# SQLite connection pool and tuning (see common/utils.py)
+SQLITE_POOL_SIZE = 8
+SQLITE_CACHE_SIZE_KB = 64 * 1024
+SQLITE_MMAP_SIZE = 256 * 2**20
+SQLITE_BUSY_TIMEOUT_MS = 30000
+
+# Return attribution: ridge penalties searched by leave-one-out CV (the RidgeCV defaults), rolling window length
+# in months and worker processes for rolling/expanding attribution (None = CPU count, 1 = in-process)
+ATTRIBUTION_ALPHAS = (0.1, 1.0, 10.0)
+DEFAULT_ATTRIBUTION_WINDOW = 36
+ATTRIBUTION_WORKERS = None
+
+# Factor-space compression for return attribution (see preprocessing/decomposition.py): default number of
+# principal components, folder of the persisted components and size beyond which the least recently used are deleted
+DEFAULT_PCA_COMPONENTS = 10
+DECOMPOSITION_PATH = 'db/decomposition'
+DECOMPOSITION_MAX_BYTES = 64 * 2**20
+
+# Derived factor features computed at ingestion (see preprocessing/feature_engineering.py)
+FEATURE_DEFINITIONS_PATH = 'config/feature_definitions.json'
+
+# Timing instrumentation (see common/instrumentation.py): JSON-lines log of timed sections, rotated beyond its size
+# limit; whether sections also record peak traced memory (tracemalloc); folder of captured profiles
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_LOG_PATH = 'db/instrumentation.jsonl'
+INSTRUMENTATION_LOG_MAX_BYTES = 8 * 2**20
+INSTRUMENTATION_TRACE_MEMORY = False
+PROFILES_PATH = 'db/profiles'
+
+# Chart and table rendering (see dashboard/rendering.py): line series longer than CHART_MAX_POINTS_PER_SERIES are
+# downsampled server-side ('lttb' keeps the visual shape, 'minmax' keeps every bucket's extremes); charts with more
+# points than CHART_WEBGL_MIN_POINTS are drawn with WebGL; tables longer than TABLE_PAGE_SIZE rows are paginated
+CHART_MAX_POINTS_PER_SERIES = 1000
+CHART_DOWNSAMPLING = 'lttb'
+CHART_WEBGL_MIN_POINTS = 5000
+TABLE_PAGE_SIZE = 500
+
+# Background jobs (see db/jobs.py): SQLite file of the job tables, kept apart from DB_NAME since re-creating the
+# database deletes it, and how often (seconds) the dashboard polls the status of a running job
+JOBS_DB_NAME = 'jobs.db'
+JOB_POLL_SECONDS = 1.0
+
+# Risk metrics (see calculations/calc_risk.py): rolling windows (periods), periods per year used for annualizing, annual
+# risk-free rate of the Sharpe/Sortino ratios, confidence level of historical VaR/CVaR, default benchmark of beta, and
+# values held in memory at once by the strided window passes (drawdown, VaR/CVaR)
+RISK_WINDOWS = (12, 36, 60)
+RISK_PERIODS_PER_YEAR = 12
+RISK_FREE_RATE = 0.0
+RISK_VAR_LEVEL = 0.95
+RISK_BENCHMARK = '^GSPC'
+RISK_BLOCK_SIZE = 2**24
+
+# Portfolio optimization (see calculations/calc_optimizer.py): rebalancing modes offered by the Asset Allocation page
+# ('normalize' only rescales the weights to sum to 1), periods of returns the covariance is estimated on (ending at the
+# latest price), returns an asset needs in that window, and solver iteration limit and tolerance
+REBALANCING_MODES = ('normalize', 'min_variance', 'risk_parity', 'max_sharpe')
+OPTIMIZER_LOOKBACK = 60
+OPTIMIZER_MIN_PERIODS = 24
+OPTIMIZER_MAX_ITERATIONS = 2000
+OPTIMIZER_TOLERANCE = 1e-8
+
+# Backtesting (see calculations/calc_backtest.py): parameters swept by default - periods between rebalancing checks
+# (0 = buy and hold), largest deviation of a weight from its target tolerated at a check (0 = always rebalance) and
+# transaction costs in basis points of the traded value - worker processes (None = CPU count, 1 = in-process) and
+# runs simulated per task
+BACKTEST_FREQUENCIES = (0, 1, 3, 6, 12)
+BACKTEST_THRESHOLDS = (0.0, 0.01, 0.02, 0.05, 0.1)
+BACKTEST_COST_BPS = (0, 5, 10, 25, 50)
+BACKTEST_WORKERS = None
+BACKTEST_CHUNK_RUNS = 2048
+
+# Price storage (see ingest_ticker_data): 'monthly' stores month averages of the daily closes in asset_prices, 'daily'
+# keeps the daily closes in asset_prices_daily (dates as YYYYMMDD integers); other frequencies are aggregated on read.
+# Analysis frequencies (see preprocessing/resampling.py), finest first, with their periods per year
+PRICE_FREQUENCY = 'monthly'
+PRICE_FREQUENCIES = ('monthly', 'daily')
+ANALYSIS_FREQUENCIES = {'daily': 252, 'weekly': 52, 'monthly': 12, 'quarterly': 4, 'annual': 1}
+
+# Cache of raw market data downloads (see db/download_cache.py): folder of the compressed responses, mode ('on' reads
+# through the cache, 'offline' replays cached responses only and never calls Yahoo Finance, 'off' bypasses it; the
+# DOWNLOAD_CACHE_MODE environment variable takes precedence), age in seconds beyond which a cached response is
+# downloaded again when online (None = never) and size beyond which the least recently used responses are evicted
+DOWNLOAD_CACHE_PATH = 'db/downloads'
+DOWNLOAD_CACHE_MODE = 'on'
+DOWNLOAD_CACHE_MODES = ('on', 'offline', 'off')
+DOWNLOAD_CACHE_TTL_SECONDS = 7 * 86400
+DOWNLOAD_CACHE_MAX_BYTES = 256 * 2**20
+
+# Bootstrap significance of return attribution (see calc_bootstrap_attribution): resamples, periods per block of the
+# moving block bootstrap (None = cube root of the number of periods), confidence level of the coefficient intervals
+# and resamples fitted at once by one batched solve
+ATTRIBUTION_BOOTSTRAP_RESAMPLES = 1000
+ATTRIBUTION_BOOTSTRAP_BLOCK_LENGTH = None
+ATTRIBUTION_BOOTSTRAP_LEVEL = 0.95
+ATTRIBUTION_BOOTSTRAP_CHUNK = 64
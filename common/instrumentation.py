@@ -0,0 +1,284 @@
+import io
+import os
+import json
+import time
+import uuid
+import pstats
+import logging
+import cProfile
+import threading
+import functools
+import contextlib
+import tracemalloc
+import pandas as pd
+from datetime import datetime as dt
+
+try:
+    import pyinstrument
+except ImportError:  # pyinstrument is optional - cProfile is always available
+    pyinstrument = None
+
+from common.constants import *
+
+# Session state key through which the Diagnostics page asks for the next page run to be profiled
+PROFILE_REQUEST_KEY = 'diagnostics.profile_next_run'
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_trace_memory = False
+
+
+def available_profilers() -> list:
+    return ['cProfile'] + (['pyinstrument'] if pyinstrument is not None else [])
+
+
+def set_memory_tracing(enabled: bool) -> None:
+    """
+    Starts or stops recording the peak traced memory of timed sections (and tracemalloc with it).
+    Tracing slows allocations down, so it is off by default. A tracemalloc session started
+    elsewhere (e.g. by a benchmark) is left alone: its peaks are not reset by timed sections.
+    """
+    global _trace_memory
+    if enabled and not _trace_memory:
+        tracemalloc.start()
+    elif not enabled and _trace_memory:
+        tracemalloc.stop()
+    _trace_memory = enabled
+
+
+def is_memory_tracing() -> bool:
+    return _trace_memory and tracemalloc.is_tracing()
+
+
+def _write_record(record: dict, path: str = None) -> None:
+    # One JSON object per line; the log is moved to <path>.1 once it exceeds its size limit.
+    # Nothing is written if the folder does not exist (e.g. before the database was set up).
+    path = INSTRUMENTATION_LOG_PATH if path is None else path
+    if not os.path.isdir(os.path.dirname(path) or '.'):
+        return
+    with _log_lock:
+        try:
+            if os.path.isfile(path) and os.path.getsize(path) > INSTRUMENTATION_LOG_MAX_BYTES:
+                os.replace(path, f"{path}.1")
+            with open(path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logging.warning(f"Could not write timing record to {path}: {e}")
+
+
+@contextlib.contextmanager
+def timed(name: str, category: str = 'section'):
+    """
+    Times a block (context manager) or every call of a function (decorator) and appends a record
+    to the JSON-lines log at INSTRUMENTATION_LOG_PATH: time, category, name, seconds, peak traced
+    memory above the start (MiB, only while memory tracing is on - see set_memory_tracing), enclosing
+    section and the id of the outermost section (one page run or ingestion call).
+
+    Yields a dictionary: fields the block adds to it are saved with the record (e.g. the payload
+    size of a chart).
+
+    :param name: Name of the section
+    :param category: Kind of section, e.g. 'page', 'section', 'chart', 'ingestion', 'query'
+    """
+    fields = {}
+    if not INSTRUMENTATION_ENABLED:
+        yield fields
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    span = {'name': name, 'run': parent['run'] if parent else uuid.uuid4().hex[:12], 'peak': 0}
+
+    tracing = is_memory_tracing()
+    if tracing:
+        # The peak so far belongs to the enclosing section; each section then measures its own
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent['peak'] = max(parent['peak'], peak)
+        tracemalloc.reset_peak()
+        span['start_memory'] = span['peak'] = current
+
+    stack.append(span)
+    error = None
+    t0 = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        stack.pop()
+
+        peak_mib = None
+        if tracing and is_memory_tracing():
+            span['peak'] = max(span['peak'], tracemalloc.get_traced_memory()[1])
+            peak_mib = (span['peak'] - span['start_memory']) / 2**20
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], span['peak'])
+            tracemalloc.reset_peak()
+
+        _write_record({
+            'time': dt.now().isoformat(timespec='milliseconds'),
+            'category': category,
+            'name': name,
+            'seconds': round(seconds, 6),
+            'peak_MiB': None if peak_mib is None else round(peak_mib, 3),
+            'parent': None if parent is None else parent['name'],
+            'run': span['run'],
+            'pid': os.getpid(),
+            'error': error,
+            **fields,
+        })
+
+
+def instrumented(category: str, name: str = None):
+    """
+    Decorator timing every call of a function (see timed), named after the function unless a name is given
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name or func.__qualname__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def capture_profile(name: str, profiler: str = 'cProfile', path: str = None):
+    """
+    Profiles a block and saves the result under PROFILES_PATH: a text report for every profiler,
+    plus the raw stats (.prof, cProfile) or an interactive report (.html, pyinstrument)
+
+    :param name: Name of the profiled block (e.g. the page), part of the file names
+    :param profiler: 'cProfile' or 'pyinstrument' (see available_profilers)
+    :param path: Folder to save to (defaults to PROFILES_PATH)
+    :return: Yields a dictionary that holds the paths of the saved files once the block is left
+    """
+    if profiler not in available_profilers():
+        raise ValueError(f"Unknown or unavailable profiler {profiler}, expected one of {available_profilers()}")
+
+    path = PROFILES_PATH if path is None else path
+    os.makedirs(path, exist_ok=True)
+    stem = os.path.join(path, f"{dt.now().strftime('%Y%m%d_%H%M%S')}_{name.replace(' ', '_')}_{profiler}")
+    files = {}
+
+    if profiler == 'pyinstrument':
+        profile = pyinstrument.Profiler()
+        profile.start()
+        try:
+            yield files
+        finally:
+            profile.stop()
+            files['html'] = f"{stem}.html"
+            files['txt'] = f"{stem}.txt"
+            with open(files['html'], 'w') as f:
+                f.write(profile.output_html())
+            with open(files['txt'], 'w') as f:
+                f.write(profile.output_text(unicode=True, color=False))
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield files
+    finally:
+        profile.disable()
+        files['prof'] = f"{stem}.prof"
+        files['txt'] = f"{stem}.txt"
+        profile.dump_stats(files['prof'])
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(60)
+        with open(files['txt'], 'w') as f:
+            f.write(report.getvalue())
+
+
+@contextlib.contextmanager
+def page_run(page: str, session_state):
+    """
+    Times one run of a dashboard page, and profiles it if the Diagnostics page asked for the
+    next page run to be profiled (the request is used up)
+
+    :param page: Name of the page
+    :param session_state: Streamlit session state of the run
+    """
+    profiler = session_state.pop(PROFILE_REQUEST_KEY, None)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(timed(page, 'page'))
+        if profiler is not None:
+            stack.enter_context(capture_profile(page, profiler))
+        yield
+
+
+def read_timings(path: str = None) -> pd.DataFrame:
+    """
+    :param path: Timing log (defaults to INSTRUMENTATION_LOG_PATH); its rotated part is read as well
+    :return: One row per timed section, oldest first
+    """
+    path = INSTRUMENTATION_LOG_PATH if path is None else path
+    records = []
+    for file_path in [f"{path}.1", path]:
+        if os.path.isfile(file_path):
+            with open(file_path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:  # partially written line
+                        continue
+
+    columns = ['time', 'category', 'name', 'seconds', 'peak_MiB', 'parent', 'run', 'pid', 'error']
+    timings = pd.DataFrame(records)
+    # Fields added by timed blocks (see timed) come after the common ones
+    timings = timings.reindex(columns=columns + [col for col in timings.columns if col not in columns])
+    timings['time'] = pd.to_datetime(timings['time'])
+    return timings
+
+
+def summarize_timings(timings: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param timings: As returned by read_timings
+    :return: Call count and time statistics per category and section name, slowest (by p95) first,
+        with the largest payload sent to the browser by charts and tables
+    """
+    summary = timings.groupby(['category', 'name'])['seconds'].agg(
+        calls='count', total_s='sum', mean_s='mean', p50_s='median',
+        p95_s=lambda s: s.quantile(0.95), max_s='max', last_s='last',
+    )
+    summary['max_peak_MiB'] = timings.groupby(['category', 'name'])['peak_MiB'].max()
+    if 'payload_bytes' in timings.columns:
+        summary['max_payload_kB'] = timings.groupby(['category', 'name'])['payload_bytes'].max() / 1000
+    return summary.sort_values('p95_s', ascending=False).reset_index()
+
+
+def list_profiles(path: str = None) -> pd.DataFrame:
+    """
+    :return: Captured profiles (see capture_profile), newest first, with the paths of their files
+    """
+    path = PROFILES_PATH if path is None else path
+    files = sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    profiles = {}
+    for file in files:
+        stem, extension = os.path.splitext(file)
+        profiles.setdefault(stem, {'profile': stem})[extension.lstrip('.')] = os.path.join(path, file)
+    return pd.DataFrame(list(profiles.values()), columns=['profile', 'txt', 'prof', 'html']).iloc[::-1].reset_index(drop=True)
+
+
+def clear_diagnostics(log_path: str = None, profiles_path: str = None) -> None:
+    """
+    Deletes the timing log and all captured profiles
+    """
+    log_path = INSTRUMENTATION_LOG_PATH if log_path is None else log_path
+    for file_path in [log_path, f"{log_path}.1"]:
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+    profiles_path = PROFILES_PATH if profiles_path is None else profiles_path
+    for file in (os.listdir(profiles_path) if os.path.isdir(profiles_path) else []):
+        os.remove(os.path.join(profiles_path, file))
+
+
+if INSTRUMENTATION_TRACE_MEMORY:
+    set_memory_tracing(True)
@@ -0,0 +1,116 @@
+import os
+import queue
+import sqlite3
+import logging
+import threading
+import contextlib
+
+from common.constants import *
+
+
+def db_path(db_name: str = None) -> str:
+    return f"db/{DB_NAME if db_name is None else db_name}"
+
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """
+    Applies the connection-level tuning shared by the whole application: write-ahead logging
+    (readers no longer block on the ingestion writer), a larger page cache and memory-mapped I/O.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class ConnectionPool:
+
+    def __init__(self, path: str, max_idle: int = None) -> None:
+        """
+        Pool of configured connections to one database file. Connections are created on demand,
+        handed out to one caller (thread) at a time and kept for reuse when given back, so
+        Streamlit reruns and ingestion steps do not pay for connecting and re-tuning each time.
+
+        :param path: Path of the database file
+        :param max_idle: Number of idle connections kept open
+        """
+        self.path = path
+        self.idle = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE if max_idle is None else max_idle)
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            return configure_connection(conn)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name: str = None) -> ConnectionPool:
+    path = db_path(db_name)
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+
+@contextlib.contextmanager
+def db_connection(db_name: str = None):
+    """
+    Context manager handing out a pooled connection to the database. The transaction is
+    committed when the block exits normally and rolled back if it raises.
+
+    :param db_name: File name of the database (defaults to DB_NAME)
+    """
+    pool = get_pool(db_name)
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+
+def close_db_connections(db_name: str = None) -> None:
+    """
+    Closes all idle pooled connections to the database, e.g. before its file is deleted
+    """
+    with _pools_lock:
+        pool = _pools.pop(db_path(db_name), None)
+    if pool is not None:
+        pool.close()
+        logging.info(f"Closed pooled connections to {pool.path}")
+
+
+def remove_db_files(db_name: str = None) -> None:
+    """
+    Deletes the database file together with its write-ahead log and shared-memory files
+    """
+    close_db_connections(db_name)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.isfile(f"{db_path(db_name)}{suffix}"):
+            os.remove(f"{db_path(db_name)}{suffix}")
@@ -9,8 +9,8 @@ if PROJ_PATH not in sys.path: sys.path.append(PROJ_PATH)
 os.chdir(PROJ_PATH)
 
 from common.constants import *
-from db.setup import DataBase
-from db.data_ingestion import ingest_all_data
+from db.jobs import JOBS
+from dashboard.job_status import show_job_status, is_job_active
 
 class DashboardHome:
 
@@ -33,12 +33,13 @@ class DashboardHome:
         return os.path.isfile(self.db_path)
 
     @staticmethod
-    def perform_db_init_operations():
-        DataBase()
-        ingest_all_data()
+    def perform_db_init_operations(full_rebuild=False):
+        # Runs in the background (see db/jobs.py); its progress is shown below the buttons
+        JOBS.submit('database', full_rebuild=full_rebuild)
 
     def show_header(self) -> None:
         st.title('Portfolio Evaluation Tool')
+        job_active = is_job_active(('database',))
         if self.if_db_exists():
             st.write(
                 f"#### You have a database available "
@@ -46,11 +47,19 @@ class DashboardHome:
                 f"To begin, select a section from the sidebar on the left."
             )
             st.divider()
-            st.write('*(alternatively, you can start creating your database again from scratch)*')
-            st.button("Re-create database", type='secondary', on_click=self.perform_db_init_operations)
+            st.write('*(alternatively, you can update your database - only sources that changed are re-ingested - or create it again from scratch)*')
+            cols = st.columns(6)
+            with cols[0]:
+                st.button("Update database", type='secondary', on_click=self.perform_db_init_operations,
+                          disabled=job_active)
+            with cols[1]:
+                st.button("Re-create database", type='secondary', on_click=self.perform_db_init_operations,
+                          kwargs={'full_rebuild': True}, disabled=job_active)
         else:
             st.write("#### Seems like you don't have a database yet. Click the button below to set it up.")
-            st.button("Set up database", type='primary', on_click=self.perform_db_init_operations)
+            st.button("Set up database", type='primary', on_click=self.perform_db_init_operations,
+                      disabled=job_active)
+        show_job_status(('database',))
         st.divider()
 
 
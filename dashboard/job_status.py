@@ -0,0 +1,72 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime as dt
+
+from common.constants import *
+from db.jobs import JOBS, ACTIVE_JOB_STATUSES, RESUMABLE_JOB_STATUSES
+
+
+def show_stage(stage: dict) -> None:
+    if stage['status'] == 'pending':
+        st.caption(f"{stage['stage']}: pending")
+        return
+
+    text = f"{stage['stage']}: {stage['status']}"
+    fraction = 1.0 if stage['status'] == 'succeeded' else 0.0
+    if pd.notna(stage['total']) and stage['total'] > 0:
+        fraction = max(fraction, min(stage['done'] / stage['total'], 1.0))
+        text += f" - {stage['done']:.0f}/{stage['total']:.0f} {stage['unit']}"
+        if pd.notna(stage['per_second']) and stage['done'] > 0:
+            text += f" ({stage['per_second']:.2f} {stage['unit']}/s)"
+    if pd.notna(stage['elapsed_s']):
+        text += f", {stage['elapsed_s']:.1f} s"
+    st.progress(fraction, text=text)
+
+
+def show_job(job_id: str, key: str) -> None:
+    job = JOBS.get_job(job_id)
+    started = '' if pd.isna(job['started']) else f", started {dt.fromtimestamp(job['started']).strftime('%Y/%m/%d at %H:%M:%S')}"
+    cancelling = ' (cancelling)' if job['cancel_requested'] and job['status'] == 'running' else ''
+    st.write(f"**Background job: {job['kind']}** - {job['status']}{cancelling}{started}")
+
+    for stage in JOBS.get_stages(job_id).to_dict('records'):
+        show_stage(stage)
+    if pd.notna(job['error']):
+        st.error(job['error'])
+
+    if job['status'] in ACTIVE_JOB_STATUSES:
+        if st.button("Cancel", key=f"{key}.cancel.{job_id}", disabled=bool(job['cancel_requested'])):
+            JOBS.cancel(job_id)
+    elif job['status'] in RESUMABLE_JOB_STATUSES:
+        if st.button("Resume", key=f"{key}.resume.{job_id}"):
+            JOBS.resume(job_id)
+            st.rerun()
+
+
+def show_job_status(kinds: tuple = None, key: str = 'jobs') -> None:
+    """
+    Shows the latest background job of the given kinds (see db/jobs.py): the progress and throughput
+    of each stage, a button to cancel it while it is queued or running and one to resume it once it
+    failed, was cancelled or was interrupted. While the job is active its status is polled every
+    JOB_POLL_SECONDS (a fragment rerun); once it ends the whole page reruns to show the new data.
+
+    :param kinds: Kinds of jobs (all if None)
+    :param key: Prefix of the widget keys (must be unique on the page)
+    """
+    job = JOBS.latest_job(kinds)
+    if job is None:
+        return
+    active = job['status'] in ACTIVE_JOB_STATUSES
+
+    @st.fragment(run_every=JOB_POLL_SECONDS if active else None)
+    def job_status():
+        if active and JOBS.get_job(job['job_id'])['status'] not in ACTIVE_JOB_STATUSES:
+            st.rerun()
+        show_job(job['job_id'], key)
+
+    job_status()
+
+
+def is_job_active(kinds: tuple = None) -> bool:
+    job = JOBS.latest_job(kinds)
+    return job is not None and job['status'] in ACTIVE_JOB_STATUSES
@@ -6,7 +6,31 @@ import sqlite3
 import plotly.express as px
 
 from common.constants import *
-from db.data_ingestion import ingest_ticker_data, rebalance_asset_weights, update_portfolio_and_weights
+from db.data_ingestion import apply_allocation_edits
+from db.jobs import JOBS
+from db.queries import read_priced_asset_ids
+from common.utils import db_connection
+from common.cache import versioned_cache
+from common.instrumentation import instrumented, page_run
+from dashboard.rendering import show_chart
+from dashboard.job_status import show_job_status
+
+
+# Cached loaders - results are reused across reruns until the database version is bumped
+
+# Tables shown on the page - price tables (daily closes can run into millions of rows) are only checked for the
+# assets they cover
+PAGE_TABLES = ['asset_allocation', 'portfolios', 'assets']
+
+
+@versioned_cache('asset_alloc.priced_asset_ids')
+def load_priced_asset_ids(conn):
+    return read_priced_asset_ids(conn)
+
+
+@versioned_cache('asset_alloc.table')
+def load_table(conn, table_name):
+    return pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
 
 
 # Retrieve and show current state of the portfolio and assets
@@ -18,8 +42,10 @@ class DashboardAssetAlloc:
         self.db_path = f"db/{DB_NAME}"
         self.tables = {}
         self.edited_tables = {}
+        self.assets_price_unavailable = []
         self.set_page_config()
-        self.show_all()
+        with page_run('Asset Allocation', st.session_state):
+            self.show_all()
         st.divider()
 
     @staticmethod
@@ -32,14 +58,14 @@ class DashboardAssetAlloc:
 
     def show_all(self):
 
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection() as conn:
             self.conn = conn
 
             st.title("Asset Allocation")
             st.write('#### Edits can be made directly to the tables below. ')
             st.divider()
 
-            # Get a full list of tables from the DB, then read them into a dictionary (class attr)
+            # Read the tables of the page into a dictionary (class attr)
             self.extract_all_db_tables()
 
             # Split the page into 2 columns
@@ -60,13 +86,9 @@ class DashboardAssetAlloc:
     def extract_all_db_tables(self):
 
         conn = self.conn
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        for table in tables:
-            table_name = table[0]
-            df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-            self.tables[table_name] = df
+        for table_name in PAGE_TABLES:
+            self.tables[table_name] = load_table(conn, table_name)
+        self.priced_asset_ids = load_priced_asset_ids(conn)
 
     def display_warnings(self):
 
@@ -74,19 +96,20 @@ class DashboardAssetAlloc:
         if self.edited_tables['asset_allocation'].groupby('portfolio_id')['asset_weight'].sum().ne(1).any():
             st.warning("Portfolio weights require rebalancing!")
 
-        assets_price_unavailable = list(
+        self.assets_price_unavailable = sorted(
             set(self.edited_tables['asset_allocation']['asset_id'].dropna().values)
             -
-            set(self.tables['asset_prices']['asset_id'].values)
+            set(self.priced_asset_ids)
         )
 
         # If there are assets provided for which price data hasn't yet been loaded into the DB
-        if len(assets_price_unavailable) > 0:
+        if len(self.assets_price_unavailable) > 0:
             st.warning(
                 f"Database needs to be updated with prices of new assets: "
-                f"{', '.join(assets_price_unavailable)}"
+                f"{', '.join(self.assets_price_unavailable)}"
             )
 
+    @instrumented('section')
     def expose_db(self):
 
         # Show asset allocation table - make it editable
@@ -102,30 +125,41 @@ class DashboardAssetAlloc:
         st.subheader(f"Table: {tbl} (editable)")
         self.edited_tables[tbl] = st.data_editor(self.tables[tbl], num_rows='dynamic')
 
+        # 'normalize' only rescales the weights; the other modes optimize them (see calculations/calc_optimizer.py)
+        self.rebalancing = st.selectbox(
+            "Rebalancing mode", REBALANCING_MODES,
+            format_func={'normalize': 'Normalize', 'min_variance': 'Minimum variance', 'risk_parity': 'Risk parity',
+                         'max_sharpe': 'Maximum Sharpe ratio'}.get,
+        )
         button_msg = 'Update Database and Rebalance Weights'
         button_clicked = st.button(button_msg, type='primary')
 
-        # Add a reference table for asset tickers and names
+        # Prices of added assets are loaded, and weights optimized, in the background
+        show_job_status(('allocation',))
+
+        # Add a reference table for asset tickers and names (read-only)
         tbl = 'assets'
         st.subheader(f"Reference table: {tbl}")
         st.write("_(asset_id refers to trading ticker)_")
-        self.edited_tables[tbl] = st.data_editor(self.tables[tbl])
+        st.dataframe(self.tables[tbl])
 
         return button_clicked
 
+    @instrumented('section')
     def commit_edited_tables_to_db(self):
-        for k, df in self.edited_tables.items():
-            df.to_sql(k, self.conn, index=False, if_exists='replace')
-
-        # Ingestion of new ticker data is always the first thing to do
-        ingest_ticker_data(self.edited_tables['asset_allocation']['asset_id'].values)
+        # Only added/changed/deleted rows are written, and only the affected portfolios are rebalanced
+        allocation_changes = apply_allocation_edits(self.conn, self.edited_tables)
 
-        # Update all table based on changes made mainly to asset_allocation
-        update_portfolio_and_weights()
+        # Load prices of the assets that were added or still have none, then optimize the weights of all portfolios
+        # unless they are only normalized (in the background, see db/jobs.py)
+        tickers = sorted(set(allocation_changes['asset_id']) | set(self.assets_price_unavailable))
+        if len(tickers) > 0 or self.rebalancing != 'normalize':
+            JOBS.submit('allocation', tickers=tickers, rebalancing=self.rebalancing)
 
         # Refresh page
         st.rerun()
 
+    @instrumented('section')
     def show_portfolio_visualization(self):
         st.subheader('Portfolio overview')
 
@@ -138,7 +172,7 @@ class DashboardAssetAlloc:
                 title=k
             )
 
-            st.plotly_chart(fig)
+            show_chart(fig, 'portfolio weights')
 
         st.write("_(market trends and macro variables in the next section)_")
 
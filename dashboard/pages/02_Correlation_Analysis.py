@@ -8,8 +8,170 @@ import plotly.express as px
 from datetime import datetime as dt
 
 from common.constants import *
-from calculations.calc_portfolio import calc_portfolio_price, calc_portfolio_returns
-from calculations.calc_correlations import calc_primary_coefficients
+from calculations.calc_portfolio import PortfolioReturnsEngine
+from calculations.calc_risk import RiskMetricsEngine, RISK_METRICS
+from calculations.calc_attribution import prepare_predictors, prepare_attribution_inputs, calc_rolling_attribution, \
+    calc_bootstrap_attribution, rank_attribution
+from calculations.calc_correlations import calc_primary_coefficients, RollingCorrelationEngine, RidgeSolver, \
+    rank_correlations
+from preprocessing.decomposition import load_or_fit_pca
+from preprocessing.feature_engineering import read_feature_panel
+from preprocessing.resampling import compound_returns, window_periods
+from db.queries import get_factor_ids, get_region_ids, read_factor_data, read_portfolio_asset_prices, \
+    read_asset_allocation, read_asset_prices, read_priced_asset_ids, price_frequencies
+from common.utils import db_connection
+from dashboard.rendering import line_figure, show_chart, show_table
+from common.cache import versioned_cache
+from common.instrumentation import instrumented, page_run
+
+
+# Cached loaders - results are reused across reruns until the database version is bumped
+
+@versioned_cache('analysis.portfolio_ids')
+def load_portfolio_ids(conn):
+    return pd.read_sql_query("SELECT DISTINCT portfolio_id FROM portfolios", conn).iloc[:, 0].values
+
+
+@versioned_cache('analysis.catalog_names')
+def load_catalog_names(conn, table, column):
+    return pd.read_sql_query(f"SELECT DISTINCT {column} FROM {table}", conn).iloc[:, 0].values
+
+
+@versioned_cache('analysis.priced_asset_ids')
+def load_priced_asset_ids(conn):
+    return read_priced_asset_ids(conn)
+
+
+@versioned_cache('analysis.returns_engine')
+def load_returns_engine(conn, frequency='monthly'):
+    # Returns of all portfolios are computed together; switching portfolios only slices the result
+    allocation = read_asset_allocation(conn)
+    prices = read_asset_prices(conn, asset_ids=allocation['asset_id'].unique().tolist(), frequency=frequency)
+    return PortfolioReturnsEngine(prices, allocation)
+
+
+@versioned_cache('analysis.portfolio_returns')
+def load_portfolio_returns(conn, pf_id, frequency='monthly'):
+    engine = load_returns_engine(conn, frequency)
+    prices_tbl = read_portfolio_asset_prices(conn, [pf_id], frequency=frequency)
+    assets_tbl = engine.asset_returns_frame([pf_id])
+    pf_tbl = engine.portfolio_returns_frame([pf_id])
+    return prices_tbl, assets_tbl, pf_tbl
+
+
+@versioned_cache('analysis.risk_engine')
+def load_risk_engine(conn, benchmark, frequency='monthly'):
+    # Risk metrics of all portfolios come from one returns matrix; switching portfolios only slices the result
+    engine = load_returns_engine(conn, frequency)
+    pct, _ = engine.portfolio_returns()
+    returns = pd.DataFrame(np.where(engine.active_dates(), pct, np.nan), index=engine.dates, columns=engine.portfolio_ids)
+
+    prices = read_asset_prices(conn, asset_ids=[benchmark], frequency=frequency).set_index('date')['asset_price']
+    benchmark_returns = prices.reindex(prices.index.union(engine.dates)).ffill().pct_change(fill_method=None)
+    return RiskMetricsEngine(returns, benchmark_returns, periods_per_year=ANALYSIS_FREQUENCIES[frequency])
+
+
+def risk_windows(frequency):
+    # RISK_WINDOWS are read as months, whatever the frequency: {periods: months}
+    return {window_periods(months, frequency): months for months in RISK_WINDOWS}
+
+
+@versioned_cache('analysis.risk_summary')
+def load_risk_summary(conn, benchmark, frequency='monthly'):
+    windows = risk_windows(frequency)
+    summary = load_risk_engine(conn, benchmark, frequency).summary(tuple(windows))
+    return summary.assign(window=summary['window'].replace({str(periods): str(months) for periods, months in windows.items()}))
+
+
+@versioned_cache('analysis.rolling_risk')
+def load_rolling_risk(conn, benchmark, frequency='monthly'):
+    windows = risk_windows(frequency)
+    engine = load_risk_engine(conn, benchmark, frequency)
+    # Long (e.g. daily) histories are evaluated at evenly spaced window ends, as many as a chart series shows
+    step = -(-len(engine.index) // CHART_MAX_POINTS_PER_SERIES)
+    rolling = engine.rolling_frame(tuple(windows), ends=np.arange(len(engine.index) - 1, -1, -step)[::-1])
+    return rolling.assign(window=rolling['window'].map(windows))
+
+
+@versioned_cache('analysis.factor_region_data')
+def load_factor_region_data(conn, factor_name, region_name):
+    # Only the selected factor/region slice is read (pushed down to the columnar store or SQL query)
+    return read_factor_data(
+        conn,
+        factor_ids=get_factor_ids(conn, [factor_name]),
+        region_ids=get_region_ids(conn, [region_name]),
+    )
+
+
+@versioned_cache('analysis.factor_changes')
+def load_factor_changes(conn, start=None, end=None):
+    # Changes are precomputed at ingestion (feature store), only the date window is read
+    return read_feature_panel(conn, 'pct_change', start=start, end=end)
+
+
+@versioned_cache('analysis.factor_returns')
+def load_factor_returns(conn, frequency='monthly'):
+    # Changes from/to zero are undefined rather than infinite; monthly changes are compounded to coarser periods
+    return compound_returns(load_factor_changes(conn).replace([np.inf, -np.inf], np.nan), frequency)
+
+
+@versioned_cache('analysis.correlation_engine')
+def load_correlation_engine(conn, pf_id, frequency='monthly'):
+    _, _, pf_tbl = load_portfolio_returns(conn, pf_id, frequency)
+    return RollingCorrelationEngine(pf_tbl.set_index('date')['pct_return'], load_factor_returns(conn, frequency))
+
+
+@versioned_cache('analysis.rolling_correlations')
+def load_rolling_correlations(conn, pf_id, window, frequency='monthly'):
+    # Correlations with every factor/region series, computed once per window
+    return load_correlation_engine(conn, pf_id, frequency).rolling_corr(window)
+
+
+@versioned_cache('analysis.correlation_ranking')
+def load_correlation_ranking(conn, pf_id, window, frequency='monthly'):
+    return rank_correlations(load_rolling_correlations(conn, pf_id, window, frequency))
+
+
+@versioned_cache('analysis.ridge_solver')
+def load_ridge_solver(conn, start, end, dates, n_components=0, frequency='monthly'):
+    # Predictors depend only on the date window, so all portfolios on the window share one decomposition.
+    X = prepare_predictors(compound_returns(load_factor_changes(conn, start, end), frequency), list(dates))
+    if n_components == 0:
+        return X, None, RidgeSolver(X)
+
+    # Compressed mode: regress on the leading principal components of the factor panel
+    pca = load_or_fit_pca(X, n_components)
+    return X, pca, RidgeSolver(pca.transform(X))
+
+
+@versioned_cache('analysis.return_attribution')
+def load_return_attribution(conn, pf_id, start, end, n_components=0, frequency='monthly'):
+
+    _, _, pf_tbl = load_portfolio_returns(conn, pf_id, frequency)
+    pf_tbl = pf_tbl[(pf_tbl['date'] >= start) & (pf_tbl['date'] <= end)]
+    y = pf_tbl.set_index('date')['pct_return'].dropna()
+
+    X, pca, solver = load_ridge_solver(conn, start, end, y.index, n_components, frequency)
+    coefficients = calc_primary_coefficients(X, y, solver=solver, pca=pca)
+
+    return X, y, coefficients, pca
+
+
+@versioned_cache('analysis.bootstrap_attribution')
+def load_bootstrap_attribution(conn, pf_id, start, end, n_components=0, frequency='monthly',
+                               n_resamples=ATTRIBUTION_BOOTSTRAP_RESAMPLES):
+    X, y, _, pca = load_return_attribution(conn, pf_id, start, end, n_components, frequency)
+    # Fitted in-process, like load_rolling_attribution
+    return calc_bootstrap_attribution(X, y, pca=pca, n_resamples=n_resamples, n_workers=1)
+
+
+@versioned_cache('analysis.rolling_attribution')
+def load_rolling_attribution(conn, pf_id, window, expanding, frequency='monthly'):
+    _, _, pf_tbl = load_portfolio_returns(conn, pf_id, frequency)
+    X, y = prepare_attribution_inputs(pf_tbl, compound_returns(load_factor_changes(conn), frequency))
+    # Fitted in-process: forking a worker pool from the Streamlit server would copy the whole app
+    return calc_rolling_attribution(X, y, window=window, expanding=expanding, n_workers=1)
+
 
 class DashboardAnalysis:
 
@@ -19,7 +181,8 @@ class DashboardAnalysis:
         self.pf_id_selected = None
 
         self.set_page_config()
-        self.show_all()
+        with page_run('Analysis', st.session_state):
+            self.show_all()
 
     @staticmethod
     def set_page_config() -> None:
@@ -34,59 +197,61 @@ class DashboardAnalysis:
         st.title("Analysis")
         st.write('#### Select a portfolio, then flip through the tabs for analyses. ')
 
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection() as conn:
             self.conn = conn
             self.add_portfolio_dropdown()
 
             # Spit dashboard page into tabs
-            tabs = st.tabs(['Market Trends', 'Macro-economic Indicators', 'Return attribution'])
+            tabs = st.tabs(['Market Trends', 'Risk metrics', 'Macro-economic Indicators', 'Return attribution'])
 
             with tabs[0]:
                 self.show_market_trends()
 
             with tabs[1]:
-                self.show_macro_indicators()
+                self.show_risk_metrics()
 
             with tabs[2]:
+                self.show_macro_indicators()
+
+            with tabs[3]:
                 self.show_return_attribution()
 
     def add_portfolio_dropdown(self):
 
         conn = self.conn
-        pf_ids = pd.read_sql_query("SELECT DISTINCT portfolio_id FROM portfolios", conn)
-        pf_ids = pf_ids.iloc[:, 0].values
+        pf_ids = load_portfolio_ids(conn)
 
         cols = st.columns(4)  # This is only to control dropdown size
         with cols[0]:
             self.pf_id_selected = st.selectbox("Pick the portfolio whose returns are to be analyzed", pf_ids)
+        with cols[1]:
+            # Prices are aggregated to the selected frequency on read (see read_asset_prices)
+            frequencies = price_frequencies()
+            self.frequency = st.selectbox("Frequency of prices and returns", frequencies, index=frequencies.index('monthly'))
 
+        # Macroeconomic factors are monthly series, so correlations and attribution use monthly or coarser periods
+        self.macro_frequency = max(self.frequency, 'monthly', key=list(ANALYSIS_FREQUENCIES).index)
+
+    @instrumented('section')
     def show_market_trends(self):
 
         conn = self.conn
 
-        assets_tbl = pd.read_sql_query((
-            f"SELECT asset_allocation.portfolio_id, asset_allocation.asset_id, asset_allocation.asset_weight, asset_prices.date, asset_prices.asset_price "
-            f"FROM asset_allocation JOIN asset_prices ON asset_allocation.asset_id = asset_prices.asset_id "
-            f"WHERE asset_allocation.portfolio_id = '{self.pf_id_selected}'"
-        ), conn)
+        assets_tbl, self.assets_tbl, self.pf_tbl = load_portfolio_returns(conn, self.pf_id_selected, self.frequency)
 
-        # Chart 1
-        fig = px.line(
+        # Chart 1 - long price histories are downsampled before they are sent to the browser
+        fig = line_figure(
             assets_tbl, x='date', y='asset_price',
             color='asset_id',
             title='Individual Index Price Trends (log scale; non-homogeneous currencies)',
             # color_discrete_sequence='yellow',
             log_y=True,
         )
-        st.plotly_chart(fig)
+        show_chart(fig, 'asset prices')
 
         # Table to support chart 1
         assets_tbl_pivot = assets_tbl.pivot(index='date', columns='asset_id', values='asset_price').reset_index()
-        st.dataframe(assets_tbl_pivot)
-
-        # Calcs to support chart 2
-        self.assets_tbl = calc_portfolio_price(assets_tbl)
-        self.pf_tbl = calc_portfolio_returns(self.assets_tbl)
+        show_table(assets_tbl_pivot, 'asset price history')
 
         # Chart 2
         # fig = px.line(
@@ -98,25 +263,57 @@ class DashboardAnalysis:
         # st.plotly_chart(fig)
 
         # Chart 3
-        fig = px.line(
+        fig = line_figure(
             self.pf_tbl, x='date', y='log_return',
             title='Portfolio Log Returns (period-over-period)',
             # color_discrete_sequence='yellow',
             # log_y=True,
         )
-        st.plotly_chart(fig)
+        show_chart(fig, 'portfolio log returns')
         st.caption('Asset returns are weight-averaged at each time period based on weights provided (see below)')
 
         # Table to support charts 2 and 3
-        st.dataframe(self.assets_tbl)
-        st.dataframe(self.pf_tbl)
+        show_table(self.assets_tbl, 'asset returns')
+        show_table(self.pf_tbl, 'portfolio returns')
+
+    @instrumented('section')
+    def show_risk_metrics(self):
 
+        conn = self.conn
+
+        asset_ids = load_priced_asset_ids(conn)
+        cols = st.columns(4)
+        with cols[0]:
+            benchmark = st.selectbox('Benchmark (for beta)', asset_ids,
+                                     index=asset_ids.index(RISK_BENCHMARK) if RISK_BENCHMARK in asset_ids else 0)
+
+        st.write(f"#### Risk metrics of all portfolios")
+        summary = load_risk_summary(conn, benchmark, self.frequency)
+        show_table(summary.round(4), 'risk summary')
+        st.caption(f"Latest {', '.join(str(w) for w in RISK_WINDOWS)}-month rolling windows ({self.frequency} returns) and the full history of each portfolio. "
+                   f"Volatility, Sharpe and Sortino ratios are annualized (risk-free rate {RISK_FREE_RATE:.1%}); "
+                   f"max drawdown, VaR and CVaR ({RISK_VAR_LEVEL:.0%} historical) are fractions of the portfolio value.")
+
+        st.divider()
+
+        st.write(f"#### Rolling risk metrics of the selected portfolio")
+        cols = st.columns(4)
+        with cols[0]:
+            metric = st.selectbox('Metric', RISK_METRICS, format_func=lambda m: m.replace('_', ' '))
+
+        rolling = load_rolling_risk(conn, benchmark, self.frequency)
+        rolling = rolling[rolling['portfolio_id'] == self.pf_id_selected].astype({'window': str})
+        fig = line_figure(rolling, x='date', y=metric, color='window',
+                          title=f"Rolling {metric.replace('_', ' ')} ({self.pf_id_selected})")
+        show_chart(fig, 'rolling risk')
+
+    @instrumented('section')
     def show_macro_indicators(self):
 
         conn = self.conn
 
-        factor_names = pd.read_sql_query("SELECT DISTINCT factor_name FROM factors", conn).iloc[:, 0].values
-        region_names = pd.read_sql_query("SELECT DISTINCT region_name FROM regions", conn).iloc[:, 0].values
+        factor_names = load_catalog_names(conn, 'factors', 'factor_name')
+        region_names = load_catalog_names(conn, 'regions', 'region_name')
 
         cols = st.columns(2) 
         with cols[0]:
@@ -124,16 +321,7 @@ class DashboardAnalysis:
         with cols[1]:
             self.region_selected = st.selectbox("Select a region corresponding to the macroeconomic indicator", region_names)
 
-        macro_data = pd.read_sql_query((
-            f"SELECT factor_data.factor_id, factors.factor_name, factor_data.region_id, regions.region_name, factor_data.date, factor_data.value "
-            f"FROM factor_data "
-            f"INNER JOIN factors ON factor_data.factor_id = factors.factor_id "
-            f"INNER JOIN regions ON factor_data.region_id = regions.region_id "
-            f"WHERE factors.factor_name = '{self.factor_selected}'; "
-        ), conn)
-
-        c = macro_data['region_name'] == self.region_selected
-        macro_data = macro_data[c].reset_index(drop=True)
+        macro_data = load_factor_region_data(conn, self.factor_selected, self.region_selected)
 
         with st.expander('Preview of macroeconomic data'):
             st.dataframe(macro_data.head(10))
@@ -142,27 +330,55 @@ class DashboardAnalysis:
         with cols[0]:
             window = st.slider('Select rolling window (number of months)', min_value=1, max_value=60, value=6)
 
-        data1 = self.pf_tbl['pct_return'].rolling(window)
-        data2 = macro_data['value'].pct_change()
-        # data2 = np.log(macro_data['value'] / macro_data['value'].shift(1))
-
-        corr = data1.corr(data2)
-        corr.index = self.pf_tbl['date']
+        # Read from the correlations of all factor/region series for this window (computed once, then cached)
+        periods = window_periods(window, self.macro_frequency)
+        all_corr = load_rolling_correlations(conn, self.pf_id_selected, periods, self.macro_frequency)
+        if (self.factor_selected, self.region_selected) in all_corr.columns:
+            corr = all_corr[(self.factor_selected, self.region_selected)].rename('corr')
+        else:
+            corr = pd.Series(np.nan, index=all_corr.index, name='corr')
 
         st.write(f"#### Rolling window correlation between portfolio returns and selected macroeconomic indicator")
-        fig = px.line(corr)
+        fig = line_figure(corr)
         fig.update_layout(yaxis_range = [-1,1])
-        st.plotly_chart(fig)
-        st.write(f"**Average correlation:** {corr.mean().round(2)}")
-        st.write(f"**Variability (stdev) of correlation:** {corr.std().round(2)}")
+        show_chart(fig, 'rolling correlation')
+        st.write(f"**Average correlation:** {np.round(corr.mean(), 2)}")
+        st.write(f"**Variability (stdev) of correlation:** {np.round(corr.std(), 2)}")
         st.caption('A pct change correlation is used instead of log to reduce instances of division by zero errors')
+        if self.macro_frequency != self.frequency:
+            st.caption(f"Correlations use {self.macro_frequency} returns, the frequency of the macroeconomic data")
+
+        st.divider()
+
+        st.write(f"#### Strongest rolling correlations across all macroeconomic indicators and regions")
+        cols = st.columns(2)
+        with cols[0]:
+            top_k = st.slider('Number of indicators to show', min_value=5, max_value=50, value=20)
 
+        ranking = load_correlation_ranking(conn, self.pf_id_selected, periods, self.macro_frequency).head(top_k)
+        labels = ranking['factor_name'] + ' | ' + ranking['region_name']
+        top_corr = all_corr[list(zip(ranking['factor_name'], ranking['region_name']))]
+
+        fig = px.imshow(
+            top_corr.T.to_numpy(), x=top_corr.index, y=labels, zmin=-1, zmax=1,
+            color_continuous_scale='RdBu', aspect='auto',
+            labels={'x': 'date', 'y': '', 'color': 'corr'},
+        )
+        fig.update_layout(height=max(400, 20 * top_k))
+        show_chart(fig, 'strongest correlations')
+        st.caption(f"Ranked by mean absolute {window}-month ({periods} {self.macro_frequency} periods) rolling correlation "
+                   f"with portfolio returns")
+        st.dataframe(ranking.round(3))
+
+    @instrumented('section')
     def show_return_attribution(self):
 
         conn = self.conn
 
-        st.write('Return attributions are computationally expensive to compute all together for all possible time windows. ')
         st.write('We use an L2 regularization approach to identify most contributing factors in a given window, using specific start and end date inputs at a time. ')
+        st.write('Attributions over all rolling or expanding windows are shown further below. ')
+        if self.macro_frequency != self.frequency:
+            st.caption(f"Regressions use {self.macro_frequency} returns, the frequency of the macroeconomic data")
 
         cols = st.columns(2)
         with cols[0]:
@@ -172,58 +388,85 @@ class DashboardAnalysis:
             end = st.date_input('End Date', min_value=DEFAULT_START_DATE_DT, max_value=DEFAULT_END_DATE_DT,
                 value=DEFAULT_RET_ATTR_END_DATE_DT)
 
-        macro_data = pd.read_sql_query((
-            f"SELECT factors.factor_name, regions.region_name, factor_data.date, factor_data.value "
-            f"FROM factor_data "
-            f"INNER JOIN factors ON factor_data.factor_id = factors.factor_id "
-            f"INNER JOIN regions ON factor_data.region_id = regions.region_id "
-        ), conn)
-
-        macro_data['key'] = macro_data['factor_name'] + '|' + macro_data['region_name']
-        macro_dt = pd.to_datetime(macro_data['date'], format=DATE_FORMAT).dt.date
-        c1 = macro_dt >= start
-        c2 = macro_dt <= end
-        macro_data = macro_data[c1 & c2].reset_index(drop=True)
-
-        pf_dt = pd.to_datetime(self.pf_tbl['date'], format=DATE_FORMAT).dt.date
-        c1 = pf_dt >= start
-        c2 = pf_dt <= end
-
-        # Preprocess the predictor and target variables
-        y = self.pf_tbl[c1 & c2]['pct_return'].reset_index(drop=True)
-        X = macro_data.pivot(index='date', columns='key', values='value').reset_index(drop=True).pct_change()
-        X = X.dropna(how='all', axis=1)
-        Xy = pd.concat([X, y], axis=1)
-        Xy = Xy.dropna(subset='pct_return').reset_index(drop=True)
-        Xy = Xy.bfill(axis=0).ffill(axis=0)
-        Xy = Xy.replace({np.inf: 999, -np.inf:-999})
-
-        y = Xy.iloc[:,-1]
-        X = Xy.iloc[:,:-1]
+        cols = st.columns(2)
+        with cols[0]:
+            compress = st.checkbox('Compress factors to their principal components before the regression')
+        with cols[1]:
+            n_components = st.slider('Number of principal components', min_value=1, max_value=50,
+                value=DEFAULT_PCA_COMPONENTS, disabled=not compress)
+
+        cols = st.columns(2)
+        with cols[0]:
+            bootstrap = st.checkbox('Bootstrap confidence intervals of the coefficients')
+        with cols[1]:
+            n_resamples = st.select_slider('Number of bootstrap resamples', options=[100, 250, 500, 1000, 2000],
+                value=ATTRIBUTION_BOOTSTRAP_RESAMPLES, disabled=not bootstrap)
+
+        args = (conn, self.pf_id_selected, start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT),
+                n_components if compress else 0, self.macro_frequency)
+        X, y, coefficients, pca = load_return_attribution(*args)
+
+        if pca is not None:
+            st.caption(f"{len(pca.components)} components explain {pca.explained_variance_ratio.sum():.0%} of the variance "
+                       f"of the {X.shape[1]} standardized factor series; coefficients are mapped back to the factors")
 
         st.write('Predictor variables sample input: ')
         st.write(X.iloc[:5, 50:55])
         st.write('Target variable sample input: ')
         st.write(y.iloc[:5])
 
-        coefficients = calc_primary_coefficients(X, y)
-
         st.divider()
 
         pos = coefficients[coefficients['Coefficient'].ge(0)].sort_values(by='Coefficient', ascending=False).reset_index(drop=True)
         neg = coefficients[coefficients['Coefficient'].lt(0)].sort_values(by='Coefficient', ascending=True).reset_index(drop=True)
 
+        if bootstrap:
+            # Intervals and stability of every coefficient over block bootstrap resamples of the periods
+            intervals = load_bootstrap_attribution(*args, n_resamples=n_resamples)
+            pos = pos.join(intervals, on='Feature').rename(columns={'Positive share': 'Same sign share'})
+            neg = neg.join(intervals, on='Feature').rename(columns={'Positive share': 'Same sign share'})
+            neg['Same sign share'] = 1 - neg['Same sign share']
+
         st.write(f"#### Outcome: Key contributing factors (in order from highest to lowest influence on portfolio return) ")
+        if bootstrap:
+            st.caption(f"{ATTRIBUTION_BOOTSTRAP_LEVEL:.0%} intervals over {n_resamples} block bootstrap resamples of the "
+                       f"periods; the same sign share is the share of resamples agreeing with the sign of the coefficient, "
+                       f"the median rank that of its absolute value among all factors (1 = most influential)")
 
         cols = st.columns(2)
 
         with cols[0]:
             st.write('Positively influencing factors: ')
-            st.dataframe(pos)
+            show_table(pos, 'positive coefficients')
 
         with cols[1]:
             st.write('Negatively influencing factors: ')
-            st.dataframe(neg)
+            show_table(neg, 'negative coefficients')
+
+        st.divider()
+
+        st.write(f"#### Factor influence over time")
+        st.write('The same regression, fitted on every rolling (fixed length) or expanding (growing from the first month) window. ')
+
+        cols = st.columns(3)
+        with cols[0]:
+            window = st.slider('Window length (number of months)', min_value=12, max_value=120, value=DEFAULT_ATTRIBUTION_WINDOW)
+        with cols[1]:
+            mode = st.radio('Window type', ['Rolling', 'Expanding'], horizontal=True)
+        with cols[2]:
+            top_k = st.slider('Number of factors to plot', min_value=1, max_value=20, value=5)
+
+        rolling_coefficients, _ = load_rolling_attribution(conn, self.pf_id_selected, window_periods(window, self.macro_frequency),
+                                                           mode == 'Expanding', self.macro_frequency)
+        ranking = rank_attribution(rolling_coefficients, top_k)
+
+        fig = line_figure(
+            rolling_coefficients[ranking['Feature']],
+            title='Coefficients of the most influential factors (by mean absolute coefficient), per window end date',
+        )
+        fig.update_layout(legend=dict(orientation='h', yanchor='top', y=-0.2), height=600)
+        show_chart(fig, 'rolling attribution')
+        st.dataframe(ranking)
 
 
 
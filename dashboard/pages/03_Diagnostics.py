@@ -0,0 +1,131 @@
+import os
+import streamlit as st
+import plotly.express as px
+
+from common.constants import *
+from common.cache import CACHE
+from common.instrumentation import PROFILE_REQUEST_KEY, available_profilers, is_memory_tracing, set_memory_tracing, \
+    read_timings, summarize_timings, list_profiles, clear_diagnostics
+
+
+class DashboardDiagnostics:
+
+    def __init__(self) -> None:
+        self.timings = None
+        self.set_page_config()
+        self.show_all()
+
+    @staticmethod
+    def set_page_config() -> None:
+        st.set_page_config(
+            layout="wide",
+            page_title="Dashboard - by Jaidev Ashok",
+            page_icon=":chart_with_upwards_trend:"
+        )
+
+    def show_all(self):
+
+        st.title("Diagnostics")
+        st.write('#### Timings of page sections, ingestion stages and queries, and profiles of single page runs. ')
+        st.divider()
+
+        self.timings = read_timings()
+        self.show_controls()
+
+        if len(self.timings) == 0:
+            st.write('No timings recorded yet - open one of the other pages or update the database first.')
+        else:
+            tabs = st.tabs(['Summary', 'Last page runs', 'Over time'])
+            with tabs[0]:
+                self.show_summary()
+            with tabs[1]:
+                self.show_last_runs()
+            with tabs[2]:
+                self.show_history()
+
+        st.divider()
+        self.show_profiles()
+
+    def show_controls(self):
+
+        cols = st.columns(4)
+        with cols[0]:
+            trace_memory = st.toggle('Record peak memory of timed sections', value=is_memory_tracing(),
+                                     help='Uses tracemalloc, which slows the application down while it is on')
+            if trace_memory != is_memory_tracing():
+                set_memory_tracing(trace_memory)
+        with cols[1]:
+            profiler = st.selectbox('Profiler', available_profilers())
+        with cols[2]:
+            if st.button('Profile the next page run'):
+                st.session_state[PROFILE_REQUEST_KEY] = profiler
+            if PROFILE_REQUEST_KEY in st.session_state:
+                st.caption(f"Open (or interact with) another page: its next run is profiled with {st.session_state[PROFILE_REQUEST_KEY]}")
+        with cols[3]:
+            if st.button('Clear timings and profiles'):
+                clear_diagnostics()
+                self.timings = read_timings()
+
+        st.caption(
+            f"Cache: {len(CACHE.entries)} entries, {CACHE.total_bytes / 2**20:.1f} MiB of {CACHE.max_bytes / 2**20:.0f} MiB, "
+            f"{CACHE.hits} hits / {CACHE.misses} misses since start"
+        )
+
+    def show_summary(self):
+
+        categories = sorted(self.timings['category'].unique())
+        selected = st.multiselect('Categories', categories, default=categories)
+        summary = summarize_timings(self.timings[self.timings['category'].isin(selected)])
+        st.dataframe(summary.round(4), hide_index=True)
+
+    def show_last_runs(self):
+
+        # One run = the outermost timed section (a page run or an ingestion call) and everything nested in it
+        runs = self.timings.groupby('run').agg(time=('time', 'max'), name=('name', 'last'), seconds=('seconds', 'last'))
+        runs = runs.sort_values('time', ascending=False).head(20)
+        labels = {run: f"{row['time']:%H:%M:%S} {row['name']} ({row['seconds']:.2f}s)" for run, row in runs.iterrows()}
+
+        run = st.selectbox('Run', list(labels), format_func=labels.get)
+        spans = self.timings[self.timings['run'] == run]
+
+        fig = px.bar(
+            spans.iloc[::-1], x='seconds', y='name', color='category', orientation='h',
+            title='Sections of the run (nested sections are included in their parent)',
+            hover_data=['parent', 'peak_MiB'],
+        )
+        fig.update_layout(height=max(300, 28 * len(spans)))
+        st.plotly_chart(fig)
+        st.dataframe(spans[['time', 'category', 'name', 'parent', 'seconds', 'peak_MiB', 'error']], hide_index=True)
+
+    def show_history(self):
+
+        cols = st.columns(4)
+        with cols[0]:
+            category = st.selectbox('Category', sorted(self.timings['category'].unique()))
+        timings = self.timings[self.timings['category'] == category]
+
+        fig = px.scatter(timings, x='time', y='seconds', color='name', log_y=True,
+                         title=f"Duration of each {category} over time")
+        st.plotly_chart(fig)
+
+    def show_profiles(self):
+
+        st.write('#### Captured profiles')
+        profiles = list_profiles()
+        if len(profiles) == 0:
+            st.write("None yet - use 'Profile the next page run' above.")
+            return
+
+        profile = st.selectbox('Profile', profiles['profile'])
+        files = profiles.set_index('profile').loc[profile]
+
+        for extension, mime in [('prof', 'application/octet-stream'), ('html', 'text/html')]:
+            if isinstance(files[extension], str) and os.path.isfile(files[extension]):
+                with open(files[extension], 'rb') as f:
+                    st.download_button(f"Download .{extension}", f.read(), file_name=os.path.basename(files[extension]), mime=mime)
+        if isinstance(files['txt'], str) and os.path.isfile(files['txt']):
+            with open(files['txt']) as f:
+                st.code(f.read(), language=None)
+
+
+DashboardDiagnostics()
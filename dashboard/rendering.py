@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+
+from common.constants import *
+from common.instrumentation import timed, is_memory_tracing
+
+DOWNSAMPLING_METHODS = ('lttb', 'minmax')
+
+# JSON bytes per point (x label and y value) of a line chart, as measured on the dashboard's charts
+_JSON_BYTES_PER_POINT = 32
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: picks n_out points of a series that keep its visual shape. The
+    first and last points are kept; every bucket of the points in between contributes the point
+    forming the largest triangle with the point picked in the previous bucket and the average of
+    the next bucket. Series of the same length are processed together, one bucket at a time.
+
+    :param x: Sorted x values (numeric), one row per series (or a single series)
+    :param y: y values, same shape as x
+    :param n_out: Number of points to keep
+    :return: Positions of the kept points, ascending, one row per series (or a single series)
+    """
+    single = x.ndim == 1
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    n_series, n = x.shape
+    if n_out >= n or n_out < 3:
+        selected = np.tile(np.arange(n), (n_series, 1))
+        return selected[0] if single else selected
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(edges)
+    sum_x = np.hstack([np.zeros((n_series, 1)), np.cumsum(x, axis=1)])
+    sum_y = np.hstack([np.zeros((n_series, 1)), np.cumsum(y, axis=1)])
+    next_x = np.hstack([((sum_x[:, edges[1:]] - sum_x[:, edges[:-1]]) / counts)[:, 1:], x[:, -1:]])
+    next_y = np.hstack([((sum_y[:, edges[1:]] - sum_y[:, edges[:-1]]) / counts)[:, 1:], y[:, -1:]])
+
+    rows = np.arange(n_series)
+    selected = np.empty((n_series, n_out), dtype=int)
+    selected[:, 0], selected[:, -1] = 0, n - 1
+    a = np.zeros(n_series, dtype=int)
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        xa, ya = x[rows, a][:, None], y[rows, a][:, None]
+        area = np.abs((xa - next_x[:, i:i + 1]) * (y[:, lo:hi] - ya) - (xa - x[:, lo:hi]) * (next_y[:, i:i + 1] - ya))
+        a = lo + np.argmax(area, axis=1)
+        selected[:, i + 1] = a
+    return selected[0] if single else selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Keeps the minimum and the maximum of each of n_out // 2 equally sized buckets (plus the first
+    and last points), so that no spike disappears from the chart.
+
+    :param y: y values, sorted by x
+    :param n_out: Number of points to keep (at most)
+    :return: Positions of the kept points, ascending
+    """
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    starts = np.linspace(0, n, n_out // 2 + 1).astype(int)[:-1]
+    buckets = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    order = np.lexsort((y, buckets))
+    bucket_starts = np.r_[0, np.flatnonzero(np.diff(buckets[order])) + 1]
+    bucket_ends = np.r_[bucket_starts[1:], n] - 1
+    return np.unique(np.r_[0, order[bucket_starts], order[bucket_ends], n - 1])
+
+
+def _numeric_x(x: pd.Series) -> np.ndarray:
+    # Dates (e.g. DATE_FORMAT strings) become nanoseconds; anything else not numeric falls back to positions
+    if pd.api.types.is_numeric_dtype(x):
+        return x.to_numpy(dtype=float)
+    try:
+        return pd.to_datetime(x).to_numpy(dtype='datetime64[ns]').astype('int64').astype(float)
+    except (ValueError, TypeError):
+        return np.arange(len(x), dtype=float)
+
+
+def downsample(data: pd.DataFrame, x: str, y: str, color: str = None, max_points: int = None,
+               method: str = None, log_y: bool = False) -> pd.DataFrame:
+    """
+    Downsamples every series (one per value of color) of a long frame to about max_points
+    points. Shorter series are kept whole; rows with a missing y are dropped from downsampled
+    series only.
+
+    :param data: Long data, one row per point
+    :param x: Column of the x values
+    :param y: Column of the y values
+    :param color: Column identifying the series (a single series if None)
+    :param max_points: Points per series (defaults to CHART_MAX_POINTS_PER_SERIES)
+    :param method: One of DOWNSAMPLING_METHODS (defaults to CHART_DOWNSAMPLING)
+    :param log_y: Pick the points on log(y), as they appear on a log axis
+    :return: The kept rows of data
+    """
+    max_points = CHART_MAX_POINTS_PER_SERIES if max_points is None else max_points
+    method = CHART_DOWNSAMPLING if method is None else method
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unknown downsampling method {method}, expected one of {DOWNSAMPLING_METHODS}")
+
+    groups = [np.arange(len(data))] if color is None else list(data.groupby(color, sort=False, observed=True).indices.values())
+    if all(len(rows) <= max_points for rows in groups):
+        return data
+
+    x_values, y_values = _numeric_x(data[x]), data[y].to_numpy(dtype=float)
+    if log_y:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y_values = np.log(y_values)
+
+    kept, by_length = [], {}
+    for rows in groups:
+        if len(rows) <= max_points:
+            kept.append(rows)
+            continue
+        rows = rows[np.isfinite(y_values[rows])]
+        rows = rows[np.argsort(x_values[rows], kind='stable')]
+        if method == 'lttb':
+            by_length.setdefault(len(rows), []).append(rows)
+        else:
+            kept.append(rows[minmax_indices(y_values[rows], max_points)])
+
+    # Series of equal length (e.g. assets sharing a calendar) go through LTTB together
+    for rows in by_length.values():
+        rows = np.vstack(rows)
+        kept.append(np.take_along_axis(rows, lttb_indices(x_values[rows], y_values[rows], max_points), axis=1).ravel())
+    return data.iloc[np.sort(np.concatenate(kept))]
+
+
+def line_figure(data, x: str = None, y: str = None, color: str = None, max_points: int = None,
+                method: str = None, **kwargs):
+    """
+    px.line for large data: series are downsampled server-side (see downsample) and drawn with
+    WebGL beyond CHART_WEBGL_MIN_POINTS points. Wide data (a Series or a DataFrame without x/y)
+    is plotted like px.line does, one line per column against the index.
+
+    :param data: Long DataFrame, or wide Series/DataFrame
+    :param kwargs: Passed on to px.line (title, log_y, labels, ...)
+    :return: Plotly figure
+    """
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    if x is None and y is None:
+        x = data.index.name or 'index'
+        color = data.columns.name or 'variable'
+        data = data.reset_index(names=x).melt(id_vars=x, var_name=color, value_name='value')
+        y = 'value'
+
+    data = downsample(data, x, y, color, max_points, method, log_y=kwargs.get('log_y', False))
+    render_mode = 'webgl' if len(data) > CHART_WEBGL_MIN_POINTS else 'svg'
+
+    return px.line(data, x=x, y=y, color=color, render_mode=render_mode, **kwargs)
+
+
+def show_chart(fig, name: str) -> None:
+    """
+    st.plotly_chart, logging the time spent to send the chart and its payload size (see timed).
+    Render time in the browser is not visible from here. Serializing the figure just to measure it
+    would double the cost of sending it, so the payload is estimated from the points sent, and
+    only measured exactly while memory tracing is on (see set_memory_tracing).
+
+    :param fig: Plotly figure
+    :param name: Name of the chart in the timing log
+    """
+    with timed(name, 'chart') as fields:
+        if INSTRUMENTATION_ENABLED:
+            points = sum(len(trace.x) for trace in fig.data if getattr(trace, 'x', None) is not None)
+            if points > 0:
+                fields['points_sent'] = points
+            if is_memory_tracing():
+                fields['payload_bytes'] = len(fig.to_json(validate=False))
+            else:
+                fields['payload_bytes'] = points * _JSON_BYTES_PER_POINT
+        st.plotly_chart(fig)
+
+
+def show_table(df: pd.DataFrame, name: str, page_size: int = None, **kwargs) -> None:
+    """
+    st.dataframe for large tables: beyond page_size rows only the selected page is sent to the
+    browser. Logs the time spent and the size of the rows sent (see timed).
+
+    :param df: Table to show
+    :param name: Name of the table, also used as the key of the page selector (must be unique on the page)
+    :param page_size: Rows per page (defaults to TABLE_PAGE_SIZE)
+    :param kwargs: Passed on to st.dataframe
+    """
+    page_size = TABLE_PAGE_SIZE if page_size is None else page_size
+
+    with timed(name, 'table') as fields:
+        page = df
+        if len(df) > page_size:
+            n_pages = -(-len(df) // page_size)
+            cols = st.columns(4)
+            with cols[0]:
+                i = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"table_page.{name}")
+            page = df.iloc[(i - 1) * page_size:i * page_size]
+            st.caption(f"Rows {(i - 1) * page_size + 1}-{(i - 1) * page_size + len(page)} of {len(df)}")
+
+        fields.update(rows=len(df), rows_sent=len(page), payload_bytes=int(page.memory_usage(deep=True).sum()))
+        st.dataframe(page, **kwargs)
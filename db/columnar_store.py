@@ -0,0 +1,222 @@
+import os
+import shutil
+import uuid
+import urllib.parse
+import logging
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:  # pyarrow is optional - the SQLite tables remain the source of truth
+    pa = None
+
+logging.basicConfig(
+    # filename='app.log', # Log to this file
+    level=logging.INFO, # Set the logging level format
+    format='%(asctime)s %(name)s [%(levelname)s]: %(message)s'
+)
+
+from common.constants import *
+
+# Layout of each table kept in the columnar store. Every table is hive-partitioned by its
+# main key and (if year_partitions) by calendar year, so a reader asking for a handful of factors
+# over a date window only opens the files of those factors/years.
+COLUMNAR_TABLES = {
+    'factor_data': {
+        'key': 'factor_id',
+        'columns': ['factor_id', 'region_id', 'date', 'value'],
+        'primary_key': ['factor_id', 'region_id', 'date'],
+        'dictionary_columns': ['region_id'],
+        'year_partitions': True,
+    },
+    'asset_prices': {
+        'key': 'asset_id',
+        'columns': ['asset_id', 'date', 'asset_price'],
+        'primary_key': ['asset_id', 'date'],
+        'dictionary_columns': [],
+        'year_partitions': True,
+    },
+    # Daily closes, dates as YYYYMMDD integers (see PRICE_FREQUENCY). Readers want whole histories, and
+    # a file per asset and year (thousands of small files) would make every scan slower
+    'asset_prices_daily': {
+        'key': 'asset_id',
+        'columns': ['asset_id', 'date', 'asset_price'],
+        'primary_key': ['asset_id', 'date'],
+        'dictionary_columns': [],
+        'year_partitions': False,
+    },
+    # Derived features (see preprocessing/feature_engineering.py); columns follow the declared features
+    'factor_features': {
+        'key': 'factor_id',
+        'columns': None,
+        'primary_key': ['factor_id', 'region_id', 'date'],
+        'dictionary_columns': ['region_id'],
+        'year_partitions': True,
+    },
+}
+
+
+def is_columnar_store_available() -> bool:
+    return COLUMNAR_STORE_ENABLED and pa is not None
+
+
+class ColumnarStore:
+
+    def __init__(self, root: str = None) -> None:
+        """
+        Parquet-backed copy of the large long tables (see COLUMNAR_TABLES), partitioned by
+        key and year. The SQLite database stays the catalog for names and for everything else.
+
+        :param root: Folder holding one sub-folder (dataset) per table
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required for the columnar store")
+
+        self.root = COLUMNAR_STORE_PATH if root is None else root
+
+    def table_path(self, table: str) -> str:
+        return os.path.join(self.root, table)
+
+    def exists(self, table: str) -> bool:
+        return os.path.isdir(self.table_path(table)) and len(os.listdir(self.table_path(table))) > 0
+
+    def clear(self, table: str = None) -> None:
+        """
+        Removes one table (or the whole store if no table is provided) from disk
+
+        :param table: Name of the table to remove
+        """
+        path = self.root if table is None else self.table_path(table)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+    def delete(self, table: str, keys: list) -> None:
+        """
+        Removes all partitions of the given keys (factor_id / asset_id) from a table
+
+        :param table: One of COLUMNAR_TABLES
+        :param keys: Values of the partition key to remove
+        """
+        key = COLUMNAR_TABLES[table]['key']
+        for value in keys:
+            path = os.path.join(self.table_path(table), f"{key}={urllib.parse.quote(str(value), safe='')}")
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def columns(self, table: str) -> list:
+        """
+        Columns stored in a table (without the year partition field)
+        """
+        if not self.exists(table):
+            return []
+        return [name for name in self.dataset(table).schema.names if name != 'year']
+
+    @staticmethod
+    def partitioning(table: str, dictionaries: str = None):
+        key = COLUMNAR_TABLES[table]['key']
+        fields = [(key, pa.string())] + ([('year', pa.int16())] if COLUMNAR_TABLES[table]['year_partitions'] else [])
+        schema = pa.schema(fields)
+        return ds.partitioning(schema, flavor='hive', dictionaries=dictionaries)
+
+    def dataset(self, table: str):
+        file_format = ds.ParquetFileFormat(
+            read_options=ds.ParquetReadOptions(dictionary_columns=COLUMNAR_TABLES[table]['dictionary_columns'])
+        )
+        return ds.dataset(self.table_path(table), format=file_format, partitioning=self.partitioning(table, dictionaries='infer'))
+
+    def upsert(self, table: str, df: pd.DataFrame) -> None:
+        """
+        Writes rows into the store. Partitions (key, year - or only key) touched by df are rewritten
+        in full, with rows of df taking precedence over rows already stored under the same primary key.
+
+        :param table: One of COLUMNAR_TABLES
+        :param df: Rows to write, with the same columns as the SQLite table (any columns for a
+            table without a fixed column list)
+        """
+        if len(df) == 0:
+            return
+
+        info = COLUMNAR_TABLES[table]
+        key = info['key']
+        partitions = [key, 'year'] if info['year_partitions'] else [key]
+
+        df = df[info['columns'] or list(df.columns)].copy()
+        if info['year_partitions']:
+            df['year'] = df['date'].str[:4].astype('int16')
+
+        if self.exists(table):
+            years = df['year'].unique().tolist() if info['year_partitions'] else None
+            existing = self.read(table, keys=df[key].unique().tolist(), years=years)
+            if len(existing) > 0:
+                existing = existing.astype({col: str for col in [key] + info['dictionary_columns']})
+                if info['year_partitions']:
+                    existing['year'] = existing['date'].str[:4].astype('int16')
+                df = pd.concat([existing[df.columns], df], ignore_index=True)
+                df = df.drop_duplicates(subset=info['primary_key'], keep='last')
+
+        df = df.sort_values(info['primary_key']).reset_index(drop=True)
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        for col in info['dictionary_columns']:
+            i = arrow_table.schema.get_field_index(col)
+            arrow_table = arrow_table.set_column(i, col, pc.dictionary_encode(arrow_table[col]))
+
+        ds.write_dataset(
+            arrow_table,
+            self.table_path(table),
+            format='parquet',
+            partitioning=self.partitioning(table),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='delete_matching',
+            # Default limit is 1024 partitions per write, i.e. fewer than 100 tickers over 11 years
+            max_partitions=max(1024, len(df.drop_duplicates(subset=partitions))),
+        )
+        logging.info(f"Columnar store: wrote {len(df)} rows to {table}")
+
+    def read(self, table: str, keys: list = None, years: list = None, start: str = None, end: str = None,
+             filters: dict = None, columns: list = None) -> pd.DataFrame:
+        """
+        Reads a slice of a table. All conditions are pushed down to the dataset scan, so only
+        the matching partitions and row groups are decoded. Dictionary-encoded columns are
+        returned as pandas categoricals.
+
+        :param table: One of COLUMNAR_TABLES
+        :param keys: Values of the partition key (factor_id / asset_id) to keep
+        :param years: Calendar years to keep (tables partitioned by year only)
+        :param start: First date to keep (inclusive, formatted like the table's dates)
+        :param end: Last date to keep (inclusive, formatted like the table's dates)
+        :param filters: Additional {column: list of values} conditions
+        :param columns: Columns to return (defaults to all table columns)
+        :return: DataFrame holding the requested slice
+        """
+        info = COLUMNAR_TABLES[table]
+        columns = info['columns'] if columns is None else columns
+
+        if not self.exists(table):
+            return pd.DataFrame(columns=columns)
+        if columns is None:
+            columns = self.columns(table)
+
+        expr = None
+        conditions = []
+        if keys is not None:
+            conditions.append(ds.field(info['key']).isin(list(keys)))
+        if years is not None:
+            conditions.append(ds.field('year').isin([int(y) for y in years]))
+        # The year partition field lets the scan skip whole files
+        if start is not None:
+            if info['year_partitions']:
+                conditions.append(ds.field('year') >= int(start[:4]))
+            conditions.append(ds.field('date') >= start)
+        if end is not None:
+            if info['year_partitions']:
+                conditions.append(ds.field('year') <= int(end[:4]))
+            conditions.append(ds.field('date') <= end)
+        for col, values in (filters or {}).items():
+            conditions.append(ds.field(col).isin(list(values)))
+        for condition in conditions:
+            expr = condition if expr is None else expr & condition
+
+        arrow_table = self.dataset(table).to_table(columns=columns, filter=expr)
+        return arrow_table.to_pandas()
@@ -1,11 +1,25 @@
+import io
 import os
+import re
+import json
+import hashlib
 import sqlite3
-import yfinance as yf
 import zipfile
+import numpy as np
 import pandas as pd
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from db.setup import DataBase
+from db.columnar_store import ColumnarStore, is_columnar_store_available
+from db.fetchers import get_default_fetcher
+from db.queries import read_asset_allocation, read_asset_prices, PRICE_TABLES
+from common.cache import bump_db_version, versioned_cache
+from common.utils import db_connection
+from common.instrumentation import instrumented, timed
+from preprocessing.feature_engineering import FeatureStore, read_feature_definitions
+from calculations.calc_portfolio import PortfolioReturnsEngine
+from calculations.calc_optimizer import shrinkage_covariance, PortfolioOptimizer
 
 logging.basicConfig(
     # filename='app.log', # Log to this file
@@ -16,160 +30,570 @@ logging.basicConfig(
 from common.constants import *
 
 
-def ingest_ticker_data(tickers=DEFAULT_TICKERS, **kwargs):
-
+def write_to_columnar_store(table, df):
+    """
+    Mirrors rows written to a SQLite long table into the columnar store (if enabled)
+    """
+    if is_columnar_store_available():
+        ColumnarStore().upsert(table, df)
+
+
+def bulk_insert(conn, table, df, conflict=None):
+    """
+    Inserts all rows of df into table with a single executemany call. The caller is
+    responsible for committing, so that several tables can be written in one transaction.
+
+    :param conn: Open connection to the database
+    :param table: Target table
+    :param df: Rows to insert - columns must be named after the table columns
+    :param conflict: Optional conflict resolution, e.g. 'IGNORE' or 'REPLACE'
+    """
+    if len(df) == 0:
+        return
+
+    columns = list(df.columns)
+    sql_cmd = (
+        f"INSERT{'' if conflict is None else f' OR {conflict}'} INTO {table} "
+        f"({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    )
+    # SQLite stores bound NaN floats as NULL, so plain Python lists can be handed over without conversion
+    conn.executemany(sql_cmd, zip(*[df[col].tolist() for col in columns]))
+
+def replace_table_rows(conn, table, df):
+    """
+    Replaces the content of table with the rows of df. Unlike DataFrame.to_sql(if_exists='replace'),
+    the table definition (primary key, constraints, indexes) is kept; rows violating it raise
+    sqlite3.IntegrityError, and the caller's transaction is left to be rolled back.
+    """
+    conn.execute(f"DELETE FROM {table}")
+    bulk_insert(conn, table, df)
+
+def get_primary_key(conn, table):
+    info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5] > 0]
+
+def diff_table_rows(before, after, primary_key):
+    """
+    Row-level difference between two versions of a table, matched on the primary key. Rows of
+    after with an incomplete key are left out and, as with INSERT OR IGNORE, the first of
+    duplicated keys wins.
+
+    :param before: Current rows (e.g. as stored)
+    :param after: New rows (e.g. as edited), with the same columns
+    :param primary_key: Key columns
+    :return: (upserts, deletes): rows of after that are new or changed, and keys of before missing from after
+    """
+    after = after.dropna(subset=primary_key).drop_duplicates(subset=primary_key, keep='first')
+    merged = after.merge(before, on=primary_key, how='outer', suffixes=('', '__before'), indicator=True)
+
+    changed = merged['_merge'].eq('left_only').to_numpy()
+    for col in [col for col in after.columns if col not in primary_key]:
+        new, old = merged[col], merged[f"{col}__before"]
+        changed |= merged['_merge'].eq('both').to_numpy() & ~(new.eq(old) | (new.isna() & old.isna())).to_numpy()
+
+    upserts = merged.loc[changed, list(after.columns)].reset_index(drop=True)
+    deletes = merged.loc[merged['_merge'].eq('right_only'), primary_key].reset_index(drop=True)
+    return upserts, deletes
+
+def apply_table_diff(conn, table, upserts, deletes, primary_key):
+    """
+    Writes a row-level difference (see diff_table_rows): deletes by primary key, then upserts. The
+    caller is responsible for committing.
+    """
+    if len(deletes) > 0:
+        conditions = ' AND '.join(f"{col} = ?" for col in primary_key)
+        conn.executemany(f"DELETE FROM {table} WHERE {conditions}", deletes[primary_key].itertuples(index=False, name=None))
+    bulk_insert(conn, table, upserts, conflict='REPLACE')
+
+def get_ticker_date_ranges(conn, tickers, start, end, frequency='monthly'):
+    """
+    Works out which dates still need to be fetched for each ticker: the full range for
+    tickers without prices, otherwise from the first day of the last stored month (so that
+    month's average is completed) - or the day after the last stored close - up to end.
+    Tickers that are already up to date are left out.
+
+    :param frequency: Frequency prices are stored at, one of PRICE_FREQUENCIES
+    :return: {ticker: (start, end)}
+    """
+    last_dates = pd.read_sql_query(f"SELECT asset_id, MAX(date) AS date FROM {PRICE_TABLES[frequency]} GROUP BY asset_id", conn)
+    last_dates = last_dates.set_index('asset_id')['date'].to_dict()
+    end_month = end[:7]
+    # Last business day before end (which is excluded from fetching)
+    end_day = int(np.busday_offset(np.datetime64(end) - 1, 0, roll='backward').astype(str).replace('-', ''))
+
+    date_ranges = {}
+    for ticker in tickers:
+        last_date = last_dates.get(ticker)
+        if last_date is None:
+            date_ranges[ticker] = (start, end)
+        elif frequency == 'daily' and last_date < end_day:
+            next_day = (pd.Timestamp(str(last_date)) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            date_ranges[ticker] = (max(next_day, start), end)
+        elif frequency == 'monthly' and last_date < end_month:
+            date_ranges[ticker] = (f"{max(last_date, start[:7])}-01", end)
+    return date_ranges
+
+@instrumented('ingestion')
+def ingest_ticker_data(tickers=DEFAULT_TICKERS, fetcher=None, progress=None, frequency=None, **kwargs):
+    """
+    Loads closing prices: monthly averages into asset_prices, or daily closes into
+    asset_prices_daily (see PRICE_FREQUENCY). Only the missing date range of each ticker is
+    fetched (all tickers in one round of batched/concurrent requests) and upserted.
+
+    :param tickers: Tickers to load
+    :param fetcher: PriceFetcher to use (defaults to get_default_fetcher())
+    :param progress: Called as progress(done, total, unit) with the number of tickers loaded (see db/jobs.py)
+    :param frequency: Frequency to store prices at, one of PRICE_FREQUENCIES (defaults to PRICE_FREQUENCY)
+    :param kwargs: start / end dates, formatted '%Y-%m-%d'
+    """
     start = kwargs.get('start', DEFAULT_START_DATE)
     end = kwargs.get('end', DEFAULT_END_DATE)
+    fetcher = get_default_fetcher() if fetcher is None else fetcher
+    frequency = PRICE_FREQUENCY if frequency is None else frequency
+    if frequency not in PRICE_FREQUENCIES:
+        raise ValueError(f"Unknown price frequency {frequency}, expected one of {PRICE_FREQUENCIES}")
+    table = PRICE_TABLES[frequency]
+
+    tickers = list(dict.fromkeys([ticker for ticker in tickers if isinstance(ticker, str) and ticker != '']))
+
+    with db_connection() as conn:
+        date_ranges = get_ticker_date_ranges(conn, tickers, start, end, frequency)
+        known_assets = pd.read_sql_query("SELECT asset_id FROM assets WHERE asset_name <> ''", conn)['asset_id'].tolist()
+
+    logging.info(f"Loading tickers: {', '.join(date_ranges)}")
+    if progress is not None:
+        progress(0, len(date_ranges), 'tickers')
+    if len(date_ranges) == 0:
+        return
+
+    with timed('fetch prices', 'ingestion'):
+        data = fetcher.fetch_prices(date_ranges)
+        names = fetcher.fetch_names([ticker for ticker in date_ranges if ticker not in known_assets])
+
+    if len(data) > 0:
+        if frequency == 'daily':
+            data.index = (data.index.year * 10000 + data.index.month * 100 + data.index.day).rename('date')
+        else:
+            data = data.resample('ME').mean()
+            data.index = data.index.strftime(DATE_FORMAT).rename('date')
+        to_ingest = data.melt(ignore_index=False, var_name='asset_id', value_name='asset_price').dropna().reset_index()
+        to_ingest = to_ingest[['asset_id', 'date', 'asset_price']]
+    else:
+        to_ingest = pd.DataFrame(columns=['asset_id', 'date', 'asset_price'])
 
-    with sqlite3.connect(f"db/{DB_NAME}") as conn:
-
-        existing_tickers = pd.read_sql_query("SELECT DISTINCT asset_id FROM asset_prices", conn).iloc[:, 0].values
-        tickers = [ticker for ticker in tickers if ticker not in existing_tickers]
-        logging.info(f"Loading tickers: {', '.join(tickers)}")
-
-        for ticker in tickers:
-            data = yf.download(ticker, start=start, end=end)
-            data = data.resample('ME').mean()['Close']
-            to_ingest = pd.DataFrame(columns=['asset_id', 'date', 'asset_price'])
-            to_ingest['date'] = data.index.strftime(DATE_FORMAT)
-            to_ingest['asset_price'] = data.values
-            to_ingest['asset_id'] = ticker
-
-            try:
-                ticker_name = yf.Ticker(ticker).info['longName']
-            except:
-                ticker_name = ''
+    asset_info = pd.DataFrame(list(names.items()), columns=['asset_id', 'asset_name'])
 
-            asset_info = pd.DataFrame(
-                [[ticker, ticker_name]],
-                columns=['asset_id', 'asset_name'])
+    with db_connection() as conn:
+        bulk_insert(conn, table, to_ingest, conflict='REPLACE')
+        bulk_insert(conn, 'assets', asset_info, conflict='REPLACE')
+        conn.commit()
+    logging.info(f"Upserted {len(to_ingest)} price rows for {to_ingest['asset_id'].nunique()} tickers into {table}")
 
-            to_ingest.to_sql('asset_prices', conn, if_exists='append', index=False)
-            asset_info.to_sql('assets', conn, if_exists='append', index=False)
+    write_to_columnar_store(table, to_ingest)
 
-def ingest_macroeconomic_data():
+    bump_db_version()
+    if progress is not None:
+        progress(len(date_ranges), len(date_ranges), 'tickers')
 
+def read_selected_indicators() -> list:
     selected_indicators = pd.read_csv('config/selected_macroeconomic_indicators.csv')
     c = selected_indicators['Selected for analysis (Y/N)'].eq('Y')
-    selected_indicators = selected_indicators[c]['INDICATOR_CODE'].dropna().tolist()
+    return selected_indicators[c]['INDICATOR_CODE'].dropna().tolist()
+
+def stream_indicator_rows(f, indicators, chunksize=MACRO_CSV_CHUNKSIZE):
+    """
+    Streams a WorldBank indicator data CSV in blocks of raw bytes. Within each block, only
+    the lines mentioning one of the requested indicator codes are cut out and parsed, so rows
+    of other indicators are never turned into DataFrames.
+
+    :param f: Binary file object of the indicator data CSV
+    :param indicators: Indicator codes to keep
+    :param chunksize: Number of raw bytes scanned per block
+    :return: Generator of DataFrames (same columns as the CSV)
+    """
+    if len(indicators) == 0:
+        return
+
+    pattern = re.compile(b'|'.join(re.escape(f'"{code}"'.encode()) for code in indicators))
+
+    for _ in range(4):  # "Data Source" / "Last Updated Date" preamble
+        f.readline()
+    header = f.readline()
+
+    remainder = b''
+    while True:
+        block = f.read(chunksize)
+        data = remainder + block
+        if len(block) > 0:
+            cut = data.rfind(b'\n') + 1
+            data, remainder = data[:cut], data[cut:]
+
+        # Expand every match of an indicator code to its enclosing line
+        lines, last_line_start = [], -1
+        for match in pattern.finditer(data):
+            line_start = data.rfind(b'\n', 0, match.start()) + 1
+            if line_start != last_line_start:
+                line_end = data.find(b'\n', match.end())
+                lines.append(data[line_start:len(data) if line_end < 0 else line_end + 1])
+                last_line_start = line_start
+
+        if len(lines) > 0:
+            df = pd.read_csv(io.BytesIO(header + b''.join(lines)))
+            yield df[df['Indicator Code'].isin(indicators)]
+
+        if len(block) == 0:
+            break
+
+def annual_to_monthly(df):
+    """
+    Melts WorldBank indicator data (one column per year) into the factor_data long format,
+    downscaling from yearly to monthly frequency by linear interpolation.
+
+    :param df: Indicator data, as read from the CSV
+    :return: DataFrame with columns factor_id, region_id, date, value
+    """
+    df = df.drop(columns=[col for col in df.columns if 'unnamed' in col.lower()])
+    df = df.rename(columns={'Country Code' : 'region_id', 'Indicator Code' : 'factor_id'})
+
+    id_vars = ['region_id', 'factor_id']
+    value_vars = list(df.columns[4:])
+    var_name = 'date'
+    value_name = 'value'
+
+    to_ingest = df[id_vars + value_vars].set_index(id_vars).T
+    to_ingest.index = pd.to_datetime(to_ingest.index, format='%Y') + pd.offsets.YearEnd()
+    to_ingest = to_ingest.resample('ME').interpolate(method='linear')
+
+    c1 = to_ingest.index >= DEFAULT_START_DATE
+    c2 = to_ingest.index <= DEFAULT_END_DATE
+    to_ingest = to_ingest[c1&c2]
+    to_ingest.index = to_ingest.index.strftime("%Y-%m")
+    to_ingest = to_ingest.T.reset_index()
+
+    to_ingest = to_ingest.melt(id_vars=id_vars, var_name=var_name, value_name=value_name)
+
+    return to_ingest[['factor_id', 'region_id', 'date', 'value']]
+
+def annual_observations(df):
+    """
+    Melts WorldBank indicator data (one column per year) into the factor_data long format at its
+    native yearly frequency, dated at year end. Kept are the years needed to interpolate the months
+    between DEFAULT_START_DATE and DEFAULT_END_DATE exactly as annual_to_monthly does (see
+    preprocessing/interpolation.py): from the last year end before the start up to the first year end
+    after the end, missing values included (they bound each series' months), plus the last valid
+    value before that range of each series.
+
+    :param df: Indicator data, as read from the CSV
+    :return: DataFrame with columns factor_id, region_id, date, value
+    """
+    df = df.drop(columns=[col for col in df.columns if 'unnamed' in col.lower()])
+    df = df.rename(columns={'Country Code' : 'region_id', 'Indicator Code' : 'factor_id'})
+
+    id_vars = ['region_id', 'factor_id']
+    to_ingest = df[id_vars + list(df.columns[4:])].melt(id_vars=id_vars, var_name='date', value_name='value')
+    to_ingest['date'] = to_ingest['date'].astype(str).str[:4] + '-12'
+
+    first = f"{int(DEFAULT_START_DATE[:4]) - (DEFAULT_START_DATE[5:7] != '12')}-12"
+    last = f"{DEFAULT_END_DATE[:4]}-12"
+    before = to_ingest[(to_ingest['date'] < first) & to_ingest['value'].notna()]
+    before = before.sort_values('date').drop_duplicates(subset=id_vars, keep='last')
+    to_ingest = pd.concat([before, to_ingest[(to_ingest['date'] >= first) & (to_ingest['date'] <= last)]])
+
+    return to_ingest[['factor_id', 'region_id', 'date', 'value']].reset_index(drop=True)
+
+def parse_worldbank_archive(zip_path, selected_indicators, loaded_factor_data, chunksize=MACRO_CSV_CHUNKSIZE,
+                            frequency=FACTOR_DATA_FREQUENCY):
+    """
+    Parses one WorldBank indicator category archive (e.g. "Economy & Growth"). Runs in a worker
+    process, so it only reads files and returns DataFrames - all database writes happen in
+    the parent process.
+
+    :param zip_path: Path to the zip file
+    :param selected_indicators: Indicator codes selected for analysis
+    :param loaded_factor_data: Indicator codes whose data is already in factor_data
+    :param chunksize: Number of raw bytes scanned per block of the indicator data CSV (see stream_indicator_rows)
+    :param frequency: Frequency factor_data is stored at, one of FACTOR_DATA_FREQUENCIES
+    :return: Dictionary of DataFrames for the factors, regions and factor_data tables, and the codes of
+        all indicators published in the archive (selected or not) under 'indicators'
+    """
+    result = {
+        'indicators': [],
+        'factors': pd.DataFrame(columns=['factor_id', 'factor_name']),
+        'regions': pd.DataFrame(columns=['region_id', 'region_name']),
+        'factor_data': pd.DataFrame(columns=['factor_id', 'region_id', 'date', 'value']),
+    }
+    to_load = [indicator for indicator in selected_indicators if indicator not in set(loaded_factor_data)]
+
+    with zipfile.ZipFile(zip_path, 'r') as z:
+
+        # There are 3 types of tables in the zip folder - they all need to be treated in a different way
+        for file in z.namelist():
+
+            with z.open(file) as f:
+
+                # Factor (Indicator) metadata
+                if 'metadata_indicator' in file.lower():
+                    df = pd.read_csv(f, usecols=['INDICATOR_CODE', 'INDICATOR_NAME'])
+                    result['indicators'] = df['INDICATOR_CODE'].dropna().tolist()
+                    df = df[df['INDICATOR_CODE'].isin(selected_indicators)]
+                    result['factors'] = pd.DataFrame({
+                        'factor_id': df['INDICATOR_CODE'].values,
+                        'factor_name': df['INDICATOR_NAME'].values,
+                    })
+
+                # Region (Country) metadata
+                elif 'metadata_country' in file.lower():
+                    df = pd.read_csv(f, usecols=['Country Code', 'TableName'])
+                    result['regions'] = pd.DataFrame({
+                        'region_id': df['Country Code'].values,
+                        'region_name': df['TableName'].values,
+                    })
+
+                # Factor data - this needs to be first melted and then (unless kept annual) downscaled from yearly to monthly frequency
+                else:
+                    chunks = list(stream_indicator_rows(f, to_load, chunksize))
+                    if len(chunks) > 0:
+                        melt = annual_observations if frequency == 'annual' else annual_to_monthly
+                        result['factor_data'] = melt(pd.concat(chunks, ignore_index=True))
+
+            logging.info(f"Parsed {file}")
+
+    return result
+
+def list_macro_archives():
+    # Each WorldBank indicator category (e.g. "Economy & Growth") is one zip file
+    return sorted([f"data/{file}" for file in os.listdir('data') if file.endswith('.zip')])
+
+@instrumented('ingestion')
+def ingest_macroeconomic_data(n_workers=MACRO_INGESTION_WORKERS, zip_paths=None, reload=False, update_features=True,
+                              frequency=None, progress=None):
+    """
+    Loads the selected WorldBank indicators from the data/*.zip archives. Archives are parsed
+    in a process pool (streaming each indicator CSV and dropping unselected or already loaded
+    indicators before parsing), then written by a single bulk writer in one transaction.
+
+    :param n_workers: Number of worker processes (defaults to one per archive, up to the CPU count);
+        1 parses the archives in the current process
+    :param zip_paths: Archives to ingest (defaults to all of list_macro_archives())
+    :param reload: Replace the data of indicators already loaded from these archives (used
+        when an archive or the selection changed) instead of skipping them; indicators of these
+        archives that are no longer selected are removed
+    :param update_features: Compute the derived features (see FeatureStore) of the written data
+    :param frequency: Frequency to store factor_data at, one of FACTOR_DATA_FREQUENCIES (defaults to
+        FACTOR_DATA_FREQUENCY); must be the frequency read_factor_data expects
+    :param progress: Called as progress(done, total, unit) with the number of archives parsed (see db/jobs.py);
+        an exception it raises (e.g. a cancelled job) stops the ingestion before anything is written
+    """
+    frequency = FACTOR_DATA_FREQUENCY if frequency is None else frequency
+    if frequency not in FACTOR_DATA_FREQUENCIES:
+        raise ValueError(f"Unknown factor data frequency {frequency}, expected one of {FACTOR_DATA_FREQUENCIES}")
+
+    selected_indicators = read_selected_indicators()
     logging.info(f"{len(selected_indicators)} indicators active: {selected_indicators}")
 
-    with (sqlite3.connect(f"db/{DB_NAME}") as conn):
-
-        # Iterate through each zip file representing WorldBank indicator category (e.g. "Economy & Growth")
-        for zip_file in [file for file in os.listdir('data') if file.endswith('.zip')]:
-
-            # Open the zip file
-            with zipfile.ZipFile(f"data/{zip_file}", 'r') as z:
-
-                # Get the list of files in the zip folder
-                file_list = z.namelist()
-
-                # Reorder file_list to parse in the sequence Indicator Metadata > Country Metadata > Indicator Data
-                file_list = (
-                    [file for file in file_list if 'metadata_indicator' in file.lower()]
-                    +
-                    [file for file in file_list if 'metadata_country' in file.lower()]
-                    +
-                    [file for file in file_list if 'metadata_indicator' not in file.lower() and 'metadata_country' not in file.lower()]
-                )
-
-                # Iterate through each file
-                for file in file_list:
-
-                    # Open the specific file
-                    with z.open(file) as f:
-
-                        # There are 3 types of tables in the zip folder - they all need to be treated in a different way
-
-                        # Factor (Indicator) metadata
-                        if 'metadata_indicator' in file.lower():
-                            df = pd.read_csv(f)
-                            logging.info(f"Loaded {file}")
-                            # logging.info(df.head())
-
-                            to_ingest = pd.DataFrame(columns=['factor_id', 'factor_name'])
-                            to_ingest['factor_id'] = df['INDICATOR_CODE'].values
-                            to_ingest['factor_name'] = df['INDICATOR_NAME'].values
-                            loaded_indicators = pd.read_sql_query("SELECT DISTINCT factor_id FROM factors", conn)['factor_id'].tolist()
-                            c1 = to_ingest['factor_id'].isin(selected_indicators)
-                            c2 = ~ to_ingest['factor_id'].isin(loaded_indicators)
-                            to_ingest = to_ingest[c1 & c2].reset_index(drop=True)
-
-                            # existing = pd.read_sql_query("SELECT * FROM factors", conn)
-                            # to_ingest = pd.concat([existing, to_ingest], ignore_index=True)
-                            # to_ingest = to_ingest.drop_duplicates().reset_index(drop=True)
-                            to_ingest.to_sql('factors', conn, if_exists='append', index=False)
-
-                        # Region (Country) metadata
-                        elif 'metadata_country' in file.lower():
-                            df = pd.read_csv(f)
-                            logging.info(f"Loaded {file}")
-
-                            to_ingest = pd.DataFrame(columns=['region_id', 'region_name'])
-                            to_ingest['region_id'] = df['Country Code'].values
-                            to_ingest['region_name'] = df['TableName'].values
-
-                            existing = pd.read_sql_query("SELECT * FROM regions", conn)
-                            to_ingest = pd.concat([existing, to_ingest], ignore_index=True)
-                            to_ingest = to_ingest.drop_duplicates().reset_index(drop=True)
-                            to_ingest.to_sql('regions', conn, if_exists='replace', index=False)
-
-                        # Factor data - this needs to be first melted and then downscaled from yearly to monthly frequency
-                        else:
-                            count=0
-                            df = pd.read_csv(f, skiprows=4)
-                            logging.info(f"Loaded {file}")
-
-                            df = df.drop(columns=[col for col in df.columns if 'unnamed' in col.lower()])
-                            df = df.rename(columns={'Country Code' : 'region_id', 'Indicator Code' : 'factor_id'})
-                            loaded_indicators = pd.read_sql_query("SELECT DISTINCT factor_id FROM factor_data", conn)[
-                                'factor_id'].tolist()
-                            c1 = df['factor_id'].isin(selected_indicators)
-                            c2 = ~ df['factor_id'].isin(loaded_indicators)
-                            df = df[c1 & c2].reset_index(drop=True)
-
-                            id_vars = ['region_id', 'factor_id']
-                            value_vars = list(df.columns[4:])
-                            var_name = 'date'
-                            value_name = 'value'
-
-                            to_ingest = df[id_vars + value_vars].set_index(id_vars).T
-                            to_ingest.index = pd.to_datetime(to_ingest.index, format='%Y') + pd.offsets.YearEnd()
-                            to_ingest = to_ingest.resample('ME').interpolate(method='linear')
-
-                            c1 = to_ingest.index >= DEFAULT_START_DATE
-                            c2 = to_ingest.index <= DEFAULT_END_DATE
-                            to_ingest = to_ingest[c1&c2]
-                            to_ingest.index = to_ingest.index.strftime("%Y-%m")
-                            to_ingest = to_ingest.T.reset_index()
-
-                            to_ingest = to_ingest.melt(id_vars=id_vars, var_name=var_name, value_name=value_name)
-
-                            to_ingest = to_ingest[['factor_id', 'region_id', 'date', 'value']]
-
-                            to_ingest.to_sql('factor_data', conn, if_exists='append', index=False)
+    zip_paths = list_macro_archives() if zip_paths is None else sorted(zip_paths)
+
+    with db_connection() as conn:
+        loaded_factors = pd.read_sql_query("SELECT DISTINCT factor_id FROM factors", conn)['factor_id'].tolist()
+        loaded_factor_data = pd.read_sql_query("SELECT DISTINCT factor_id FROM factor_data", conn)['factor_id'].tolist()
+    previously_loaded = set(loaded_factors) | set(loaded_factor_data)
+    if reload:
+        loaded_factors, loaded_factor_data = [], []
+
+    def report(done):
+        if progress is not None:
+            progress(done, len(zip_paths), 'archives')
+
+    n_workers = min(len(zip_paths), n_workers or os.cpu_count() or 1)
+    args = (selected_indicators, loaded_factor_data, MACRO_CSV_CHUNKSIZE, frequency)
+    with timed('parse archives', 'ingestion'):
+        report(0)
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                futures = [pool.submit(parse_worldbank_archive, zip_path, *args) for zip_path in zip_paths]
+                try:
+                    for done, _ in enumerate(as_completed(futures), start=1):
+                        report(done)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                results = [future.result() for future in futures]
+        else:
+            results = []
+            for zip_path in zip_paths:
+                results.append(parse_worldbank_archive(zip_path, *args))
+                report(len(results))
+
+    # An indicator can be published in several categories - the first archive (in name order) wins
+    factors = pd.concat([r['factors'] for r in results], ignore_index=True)
+    factors = factors[~factors['factor_id'].isin(loaded_factors)].drop_duplicates(subset='factor_id')
+
+    regions = pd.concat([r['regions'] for r in results], ignore_index=True).drop_duplicates(subset='region_id')
+
+    factor_data, written = [], set()
+    for r in results:
+        df = r['factor_data']
+        df = df[~df['factor_id'].isin(written)]
+        written.update(df['factor_id'].unique())
+        factor_data.append(df)
+    # Inserting in primary key order keeps B-tree page splits (and insert time) down
+    factor_data = pd.concat(factor_data, ignore_index=True)
+    factor_data = factor_data.sort_values(['factor_id', 'region_id', 'date']).reset_index(drop=True)
+
+    reloaded, deselected = [], []
+    if reload:
+        # Everything previously loaded from the reloaded archives goes, including indicators no longer selected
+        archived = set().union(*(r['indicators'] for r in results))
+        deselected = sorted((archived & previously_loaded) - set(selected_indicators))
+        reloaded = sorted(set(factor_data['factor_id'].unique()) | set(deselected))
+        logging.info(f"Reloading {len(reloaded)} indicators, {len(deselected)} of them no longer selected: {deselected}")
+
+    with timed('write factor tables', 'ingestion'), db_connection() as conn:
+        if len(reloaded) > 0:
+            conn.execute(f"DELETE FROM factor_data WHERE factor_id IN ({', '.join(['?'] * len(reloaded))})", reloaded)
+        if len(deselected) > 0:
+            conn.execute(f"DELETE FROM factors WHERE factor_id IN ({', '.join(['?'] * len(deselected))})", deselected)
+        bulk_insert(conn, 'factors', factors, conflict='REPLACE' if reload else None)
+        bulk_insert(conn, 'regions', regions, conflict='IGNORE')
+        bulk_insert(conn, 'factor_data', factor_data)
+        conn.commit()
+    logging.info(f"Loaded {len(factors)} factors, {len(regions)} regions, {len(factor_data)} factor data rows")
+
+    with timed('write columnar factor data', 'ingestion'):
+        if len(reloaded) > 0 and is_columnar_store_available():
+            ColumnarStore().delete('factor_data', reloaded)
+        write_to_columnar_store('factor_data', factor_data)
+
+    # Before the features are computed: in 'annual' mode they read the levels through the cache of interpolated
+    # factor data, which jobs share with the dashboard, and must not get a slice cached before this write
+    bump_db_version()
+
+    if update_features:
+        # Only the dates just written are computed (see FeatureStore.update)
+        feature_store = FeatureStore(frequency=frequency)
+        feature_store.delete(reloaded)
+        with db_connection() as conn:
+            feature_store.update(conn, factor_data)
+        bump_db_version()
 
     logging.info("Macro data loaded")
 
-def rebalance_asset_weights():
-    with sqlite3.connect(f"db/{DB_NAME}") as conn:
-        asset_allocation = pd.read_sql_query("SELECT * FROM asset_allocation", conn)
-        if len(asset_allocation) > 0:
-            asset_allocation['asset_weight'] = (
-                    asset_allocation['asset_weight'] /
-                    asset_allocation.groupby('portfolio_id')['asset_weight'].transform(func='sum')
-            )
-        asset_allocation.to_sql('asset_allocation', conn, index=False, if_exists='replace')
+def rebalance_portfolio_weights(conn, portfolio_ids=None):
+    """
+    Scales the asset weights of each portfolio to sum to 1 (portfolios whose weights sum to 0 are
+    left as they are). Only the weights that change are written; the caller is responsible for committing.
+
+    :param portfolio_ids: Portfolios to rebalance (all if None)
+    """
+    if portfolio_ids is not None and len(portfolio_ids) == 0:
+        return
+    asset_allocation = read_asset_allocation(conn, portfolio_ids)
+    total = asset_allocation.groupby('portfolio_id')['asset_weight'].transform(func='sum')
+    weights = (asset_allocation['asset_weight'] / total).where(total != 0, asset_allocation['asset_weight'])
+
+    changed = asset_allocation[weights.ne(asset_allocation['asset_weight'])].assign(asset_weight=weights)
+    conn.executemany(
+        "UPDATE asset_allocation SET asset_weight = ? WHERE portfolio_id = ? AND asset_id = ?",
+        changed[['asset_weight', 'portfolio_id', 'asset_id']].itertuples(index=False, name=None),
+    )
+
+def add_missing_portfolios(conn):
+    # Portfolios referenced by the allocation but missing from the portfolios table (names left empty)
+    conn.execute("INSERT OR IGNORE INTO portfolios (portfolio_id) SELECT DISTINCT portfolio_id FROM asset_allocation")
+
+@versioned_cache('optimizer.covariance')
+def load_asset_covariance(conn, lookback=OPTIMIZER_LOOKBACK):
+    """
+    Shrinkage covariance (see shrinkage_covariance) and mean of the returns of every asset with prices,
+    over the last lookback periods up to the latest price. It is estimated once for the whole asset
+    universe and shared by all portfolios; results are cached under the database version and shared,
+    so callers must not modify them.
+
+    :return: (covariance DataFrame, mean returns Series), over the assets with enough returns in the window
+    """
+    prices = read_asset_prices(conn)
+    engine = PortfolioReturnsEngine(prices, pd.DataFrame(columns=['portfolio_id', 'asset_id', 'asset_weight']))
+    pct_returns, _ = engine.asset_returns()
+    returns = pd.DataFrame(np.where(np.isfinite(pct_returns), pct_returns, np.nan), columns=engine.asset_ids)
+    covariance, mean, shrinkage = shrinkage_covariance(returns.iloc[-lookback:])
+    logging.info(f"Asset covariance: {len(covariance)} of {len(engine.asset_ids)} assets, shrinkage {shrinkage:.3f}")
+    return covariance, mean
+
+
+def optimize_portfolio_weights(conn, mode, portfolio_ids=None, lookback=OPTIMIZER_LOOKBACK):
+    """
+    Sets the asset weights of the portfolios to the long-only weights of the given optimization mode
+    (see PortfolioOptimizer), solved for all portfolios at once and started from their current
+    weights. Assets without enough returns in the lookback window get a weight of 0; portfolios none
+    of whose assets has enough are only rebalanced to sum to 1. Only the weights that change are
+    written; the caller is responsible for committing.
+
+    :param mode: One of OPTIMIZATION_MODES
+    :param portfolio_ids: Portfolios to optimize (all if None)
+    :param lookback: Periods of returns the covariance is estimated on
+    """
+    if portfolio_ids is not None and len(portfolio_ids) == 0:
+        return
+    covariance, mean = load_asset_covariance(conn, lookback)
+    asset_allocation = read_asset_allocation(conn, portfolio_ids)
+
+    portfolio_codes, portfolios = pd.factorize(asset_allocation['portfolio_id'], sort=True)
+    asset_codes = covariance.index.get_indexer(asset_allocation['asset_id'])
+    estimated = asset_codes >= 0
+    mask = np.zeros((len(portfolios), len(covariance)), dtype=bool)
+    mask[portfolio_codes[estimated], asset_codes[estimated]] = True
+    initial = np.zeros(mask.shape)
+    initial[portfolio_codes[estimated], asset_codes[estimated]] = asset_allocation['asset_weight'].to_numpy(dtype=float)[estimated]
+
+    optimizable = mask.any(axis=1)
+    if not optimizable.all():
+        logging.warning(f"Not enough returns to optimize {', '.join(map(str, portfolios[~optimizable]))}: rebalancing only")
+        rebalance_portfolio_weights(conn, list(portfolios[~optimizable]))
+    if (~estimated & optimizable[portfolio_codes]).any():
+        logging.warning(f"Not enough returns for {', '.join(sorted(set(asset_allocation.loc[~estimated, 'asset_id'])))}: weight set to 0")
+    if not optimizable.any():
+        return
+
+    optimizer = PortfolioOptimizer(covariance, mean, risk_free=RISK_FREE_RATE / RISK_PERIODS_PER_YEAR)
+    weights = optimizer.optimize(mode, mask[optimizable], initial[optimizable])
+    logging.info(f"{mode}: {optimizable.sum()} portfolios optimized in {optimizer.iterations} iterations")
+
+    optimized = np.zeros(mask.shape)
+    optimized[optimizable] = weights
+    new_weights = np.where(estimated, optimized[portfolio_codes, np.maximum(asset_codes, 0)], 0.0)
+    update = optimizable[portfolio_codes] & (new_weights != asset_allocation['asset_weight'].to_numpy())
+    changed = asset_allocation[update].assign(asset_weight=new_weights[update])
+    conn.executemany(
+        "UPDATE asset_allocation SET asset_weight = ? WHERE portfolio_id = ? AND asset_id = ?",
+        changed[['asset_weight', 'portfolio_id', 'asset_id']].itertuples(index=False, name=None),
+    )
+
+@instrumented('ingestion')
+def rebalance_asset_weights(portfolio_ids=None, mode='normalize'):
+    """
+    :param portfolio_ids: Portfolios to rebalance (all if None)
+    :param mode: One of REBALANCING_MODES: 'normalize' scales the weights to sum to 1, the others optimize them
+    """
+    if mode not in REBALANCING_MODES:
+        raise ValueError(f"Unknown rebalancing mode {mode}, expected one of {REBALANCING_MODES}")
+
+    with db_connection() as conn:
+        if mode == 'normalize':
+            rebalance_portfolio_weights(conn, portfolio_ids)
+        else:
+            optimize_portfolio_weights(conn, mode, portfolio_ids)
+
+    bump_db_version()
 
+@instrumented('ingestion')
 def update_portfolio_and_weights():
 
-    with sqlite3.connect(f"db/{DB_NAME}") as conn:
-        asset_allocation = pd.read_sql_query("SELECT * FROM asset_allocation", conn)
-        assets = pd.read_sql_query("SELECT DISTINCT asset_id FROM assets", conn)
-        portfolios = pd.read_sql_query("SELECT * FROM portfolios", conn)
+    with db_connection() as conn:
+        n_allocations = conn.execute("SELECT COUNT(*) FROM asset_allocation").fetchone()[0]
 
-        if len(asset_allocation) == 0:  # First time initialization -> resort to defaults
+        if n_allocations == 0:  # First time initialization -> resort to defaults
+            assets = pd.read_sql_query("SELECT DISTINCT asset_id FROM assets", conn)
             portfolios = pd.DataFrame(
                 [[DEFAULT_PORTFOLIO_ID, DEFAULT_PORTFOLIO_NAME]],
                 columns=['portfolio_id', 'portfolio_name'])
@@ -178,26 +602,189 @@ def update_portfolio_and_weights():
             asset_allocation['asset_id'] = assets['asset_id']
             asset_allocation['portfolio_id'] = DEFAULT_PORTFOLIO_ID
             asset_allocation['asset_weight'] = 1
-        else:
-            portfolios = pd.concat([portfolios, asset_allocation['portfolio_id'].to_frame()], ignore_index=True)
-            portfolios = portfolios.drop_duplicates(subset='portfolio_id').reset_index(drop=True)
-
-        portfolios.to_sql('portfolios', conn, if_exists='replace', index=False)
-        asset_allocation.to_sql('asset_allocation', conn, if_exists='replace', index=False)
-
-        rebalance_asset_weights()
-
-def ingest_all_data():
 
-    ingest_ticker_data()
-    ingest_macroeconomic_data()
+            replace_table_rows(conn, 'portfolios', portfolios)
+            replace_table_rows(conn, 'asset_allocation', asset_allocation)
+        else:
+            add_missing_portfolios(conn)
+
+        rebalance_portfolio_weights(conn)
+
+    bump_db_version()
+
+@instrumented('ingestion')
+def apply_allocation_edits(conn, edits):
+    """
+    Applies edits made in the Asset Allocation page as one transaction: the row-level difference of
+    each edited table against the database (see diff_table_rows) is deleted/upserted, portfolios
+    referenced by the allocation are added if missing, and only the portfolios whose allocation
+    changed are rebalanced. Unchanged rows are not written; without any change the database version
+    (and so the cache) is left as it is.
+
+    :param conn: Connection to the SQLite database
+    :param edits: {table: edited rows} for asset_allocation and/or portfolios
+    :return: asset_allocation rows that were added or changed (e.g. to load prices of new assets)
+    """
+    allocation_changes = pd.DataFrame(columns=['portfolio_id', 'asset_id', 'asset_weight'])
+    affected_portfolios = set()
+    n_changes = 0
+
+    for table, edited in edits.items():
+        if table == 'asset_allocation':
+            # Weights left empty are taken as 1 before rebalancing
+            edited = edited.assign(asset_weight=edited['asset_weight'].fillna(1))
+        primary_key = get_primary_key(conn, table)
+        upserts, deletes = diff_table_rows(pd.read_sql_query(f"SELECT * FROM {table}", conn), edited, primary_key)
+        apply_table_diff(conn, table, upserts, deletes, primary_key)
+        n_changes += len(upserts) + len(deletes)
+        logging.info(f"{table}: {len(upserts)} rows upserted, {len(deletes)} rows deleted")
+
+        if table == 'asset_allocation':
+            allocation_changes = upserts
+            affected_portfolios = set(upserts['portfolio_id']) | set(deletes['portfolio_id'])
+
+    if n_changes == 0:
+        return allocation_changes
+
+    add_missing_portfolios(conn)
+    rebalance_portfolio_weights(conn, sorted(affected_portfolios))
+    conn.commit()
+
+    bump_db_version()
+    return allocation_changes
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def values_fingerprint(*values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_ingestion_state(conn):
+    state = pd.read_sql_query("SELECT source, fingerprint FROM ingestion_state", conn)
+    return state.set_index('source')['fingerprint'].to_dict()
+
+def set_ingestion_state(conn, fingerprints):
+    state = pd.DataFrame(list(fingerprints.items()), columns=['source', 'fingerprint'])
+    state['updated_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    bulk_insert(conn, 'ingestion_state', state, conflict='REPLACE')
+    conn.commit()
+
+def allocated_tickers(conn):
+    allocated = pd.read_sql_query("SELECT DISTINCT asset_id FROM asset_allocation", conn)['asset_id'].tolist()
+    return list(dict.fromkeys(DEFAULT_TICKERS + [ticker for ticker in allocated if ticker is not None]))
+
+def macro_fingerprints():
+    selected_indicators = sorted(read_selected_indicators())
+    return {
+        f"macro:{os.path.basename(path)}": values_fingerprint(file_fingerprint(path), selected_indicators, FACTOR_DATA_FREQUENCY)
+        for path in list_macro_archives()
+    }
+
+def features_fingerprint():
+    return values_fingerprint(read_feature_definitions())
+
+@instrumented('ingestion')
+def ingest_changed_tickers(fetcher=None, progress=None):
+    """
+    Ingestion stage: loads prices if the ticker list (tickers + date range + storage frequency) changed since it was
+    last ingested
+
+    :param fetcher: PriceFetcher to use for ticker data
+    :param progress: See ingest_ticker_data
+    """
+    with db_connection() as conn:
+        tickers = allocated_tickers(conn)
+        fingerprint = values_fingerprint(sorted(tickers), DEFAULT_START_DATE, DEFAULT_END_DATE, PRICE_FREQUENCY)
+        changed = get_ingestion_state(conn).get('tickers') != fingerprint
+    logging.info(f"Tickers {'changed' if changed else 'up to date'}")
+
+    if changed:
+        ingest_ticker_data(tickers, fetcher=fetcher, progress=progress)
+        with db_connection() as conn:
+            set_ingestion_state(conn, {'tickers': fingerprint})
+
+@instrumented('ingestion')
+def ingest_changed_archives(progress=None):
+    """
+    Ingestion stage: loads the WorldBank archives whose fingerprint (file hash + selected indicators +
+    storage frequency, so that switching FACTOR_DATA_FREQUENCY reloads all of them) changed since
+    they were last ingested. Features are updated along, unless their definitions changed too (see
+    rebuild_changed_features).
+
+    :param progress: Called as progress(done, total, unit) with the number of archives parsed
+    """
+    fingerprints = macro_fingerprints()
+    with db_connection() as conn:
+        state = get_ingestion_state(conn)
+    changed = [source for source, fingerprint in fingerprints.items() if state.get(source) != fingerprint]
+    update_features = state.get('features') == features_fingerprint()
+    logging.info(f"Archives to ingest: {', '.join(changed) if changed else 'none (up to date)'}")
+
+    changed_archives = [f"data/{source.split(':', 1)[1]}" for source in changed]
+    # Archives seen before are re-parsed in full; new archives only add indicators not loaded yet
+    seen = [path for path in changed_archives if f"macro:{os.path.basename(path)}" in state]
+    new = [path for path in changed_archives if path not in seen]
+
+    if progress is not None:
+        progress(0, len(changed_archives), 'archives')
+    for offset, zip_paths, reload in [(0, seen, True), (len(seen), new, False)]:
+        if len(zip_paths) > 0:
+            ingest_macroeconomic_data(
+                zip_paths=zip_paths, reload=reload, update_features=update_features,
+                progress=None if progress is None else lambda done, total, unit: progress(offset + done, len(changed_archives), unit),
+            )
+            with db_connection() as conn:
+                set_ingestion_state(conn, {f"macro:{os.path.basename(path)}": fingerprints[f"macro:{os.path.basename(path)}"] for path in zip_paths})
+
+@instrumented('ingestion')
+def rebuild_changed_features(progress=None):
+    """
+    Ingestion stage: changed feature definitions recompute all features (once, after any macro data was loaded)
+
+    :param progress: Called as progress(done, total, unit) with the number of feature rebuilds
+    """
+    fingerprint = features_fingerprint()
+    with db_connection() as conn:
+        changed = get_ingestion_state(conn).get('features') != fingerprint
+    logging.info(f"Feature definitions {'changed' if changed else 'up to date'}")
+    if not changed:
+        return
+
+    if progress is not None:
+        progress(0, 1, 'rebuilds')
+    # Levels are read through the versioned cache (see ingest_macroeconomic_data): nothing cached before may be reused
+    bump_db_version()
+    with db_connection() as conn:
+        FeatureStore().rebuild(conn)
+        set_ingestion_state(conn, {'features': fingerprint})
+    bump_db_version()
+    if progress is not None:
+        progress(1, 1, 'rebuilds')
+
+@instrumented('ingestion')
+def ingest_all_data(fetcher=None):
+    """
+    Ingests every source whose input fingerprint changed since it was last ingested (all of
+    them on a freshly created database), stage by stage: the ticker list, each WorldBank archive
+    and the feature definitions. Each stage records the fingerprints of what it ingested as soon
+    as it completes (db/jobs.py runs the same stages as a resumable background job).
+
+    :param fetcher: PriceFetcher to use for ticker data
+    """
+    ingest_changed_tickers(fetcher=fetcher)
+    ingest_changed_archives()
+    rebuild_changed_features()
     update_portfolio_and_weights()
 
 
 if __name__ == '__main__':
 
     os.chdir("..")
-    DataBase()
+    DataBase(full_rebuild=True)
     ingest_ticker_data()
     ingest_macroeconomic_data()
     update_portfolio_and_weights()
@@ -0,0 +1,204 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import uuid
+import hashlib
+import logging
+import urllib.parse
+
+logging.basicConfig(
+    # filename='app.log', # Log to this file
+    level=logging.INFO, # Set the logging level format
+    format='%(asctime)s %(name)s [%(levelname)s]: %(message)s'
+)
+
+from common.constants import *
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    # Readers (and concurrent writers of the same entry) never see a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DownloadCache:
+
+    def __init__(self, root: str = None, ttl_seconds: float = DOWNLOAD_CACHE_TTL_SECONDS,
+                 max_bytes: int = DOWNLOAD_CACHE_MAX_BYTES) -> None:
+        """
+        Content-addressed store of raw market data responses on local disk. Every response is
+        gzip-compressed and stored once under the hash of its content (objects/), whatever the
+        requests it answers; requests - (kind, ticker, parameters), e.g. ('prices', '^GSPC',
+        (start, end, interval)) - point to it through small reference files (refs/<ticker>/), whose
+        modification time records the last use. Beyond max_bytes of objects, the least recently used
+        references are evicted along with the objects no longer referenced.
+
+        :param root: Cache folder (defaults to DOWNLOAD_CACHE_PATH)
+        :param ttl_seconds: Age beyond which get treats a response as stale (None = never)
+        :param max_bytes: Size of the stored objects beyond which evict removes entries
+        """
+        self.root = DOWNLOAD_CACHE_PATH if root is None else root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], f"{digest}.gz")
+
+    def ticker_path(self, ticker: str) -> str:
+        return os.path.join(self.root, 'refs', urllib.parse.quote(ticker, safe=''))
+
+    def ref_path(self, kind: str, ticker: str, params: tuple) -> str:
+        key = json.dumps([kind, ticker, list(params)])
+        return os.path.join(self.ticker_path(ticker), f"{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+    def is_fresh(self, ref: dict) -> bool:
+        return self.ttl_seconds is None or time.time() - ref['fetched_at'] <= self.ttl_seconds
+
+    def refs(self, kind: str, ticker: str) -> list:
+        """
+        :return: References of the cached responses to requests of a kind for a ticker, as dicts with keys kind,
+            ticker, params, object (content hash), size (compressed bytes) and fetched_at (epoch seconds)
+        """
+        path = self.ticker_path(ticker)
+        if not os.path.isdir(path):
+            return []
+        refs = []
+        for entry in os.scandir(path):
+            if entry.name.endswith('.json'):
+                ref = self._read_ref(entry.path)
+                if ref is not None and ref['kind'] == kind:
+                    refs.append(ref)
+        return refs
+
+    def get(self, kind: str, ticker: str, params: tuple, stale: bool = False) -> bytes:
+        """
+        :param stale: Also return responses older than the TTL (e.g. when replaying offline)
+        :return: Cached response to the request, or None if there is none (or only a stale one)
+        """
+        ref = self._read_ref(self.ref_path(kind, ticker, params))
+        if ref is None or not (stale or self.is_fresh(ref)):
+            return None
+        return self.read_object(ref)
+
+    def read_object(self, ref: dict) -> bytes:
+        """
+        :param ref: Reference to a cached response (see refs), marked as used
+        :return: Uncompressed response, or None if it was evicted in the meantime
+        """
+        try:
+            with open(self.object_path(ref['object']), 'rb') as f:
+                content = gzip.decompress(f.read())
+            os.utime(self.ref_path(ref['kind'], ref['ticker'], tuple(ref['params'])))
+        except FileNotFoundError:
+            return None
+        return content
+
+    def put(self, kind: str, ticker: str, params: tuple, content: bytes) -> None:
+        """
+        Stores the response to a request, replacing any previous response to the same request
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+        else:
+            # mtime=0: the same content always compresses to the same bytes
+            compressed = gzip.compress(content, compresslevel=6, mtime=0)
+            _write_atomic(path, compressed)
+            size = len(compressed)
+
+        ref = {'kind': kind, 'ticker': ticker, 'params': list(params), 'object': digest, 'size': size,
+               'fetched_at': time.time()}
+        os.makedirs(self.ticker_path(ticker), exist_ok=True)
+        _write_atomic(self.ref_path(kind, ticker, params), json.dumps(ref).encode())
+
+    def size(self) -> int:
+        """
+        :return: Compressed bytes of all stored objects
+        """
+        size = 0
+        for path in self._object_paths():
+            try:
+                size += os.path.getsize(path)
+            except FileNotFoundError:  # evicted by another process in the meantime
+                pass
+        return size
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used references until the objects they point to fit in max_bytes,
+        then every object no longer referenced. Does nothing (without reading any reference) while
+        the stored objects fit in max_bytes. Several processes may evict at once: files already
+        removed by another one are skipped.
+
+        :return: Number of references removed
+        """
+        if self.size() <= self.max_bytes:
+            return 0
+
+        refs = []
+        for root, _, files in os.walk(os.path.join(self.root, 'refs')):
+            for name in files:
+                path = os.path.join(root, name)
+                ref = self._read_ref(path)
+                try:
+                    if ref is not None:
+                        refs.append((os.path.getmtime(path), path, ref))
+                except FileNotFoundError:
+                    pass
+        refs.sort(key=lambda item: item[0])
+
+        sizes = {ref['object']: ref['size'] for _, _, ref in refs}
+        counts = {}
+        for _, _, ref in refs:
+            counts[ref['object']] = counts.get(ref['object'], 0) + 1
+        total = sum(sizes.values())
+
+        removed = 0
+        for _, path, ref in refs:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            removed += 1
+            counts[ref['object']] -= 1
+            if counts[ref['object']] == 0:
+                total -= sizes[ref['object']]
+
+        referenced = {digest for digest, count in counts.items() if count > 0}
+        for path in self._object_paths():
+            if os.path.basename(path)[:-len('.gz')] not in referenced:
+                _remove(path)
+        if removed > 0:
+            logging.info(f"Download cache: evicted {removed} responses, {total / 2**20:.1f} MiB kept")
+        return removed
+
+    def clear(self) -> None:
+        """
+        Removes every cached response
+        """
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+    def _object_paths(self) -> list:
+        return [os.path.join(root, name)
+                for root, _, files in os.walk(os.path.join(self.root, 'objects')) for name in files if name.endswith('.gz')]
+
+    @staticmethod
+    def _read_ref(path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
@@ -0,0 +1,239 @@
+import os
+import io
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(
+    # filename='app.log', # Log to this file
+    level=logging.INFO, # Set the logging level format
+    format='%(asctime)s %(name)s [%(levelname)s]: %(message)s'
+)
+
+from common.constants import *
+from db.download_cache import DownloadCache
+
+
+class PriceFetcher:
+    """
+    Source of daily closing prices and display names for tickers. Implementations must
+    fetch many tickers per call - ingest_ticker_data hands over every ticker it needs at once.
+    """
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        """
+        :param date_ranges: {ticker: (start, end)} - start inclusive, end exclusive, formatted '%Y-%m-%d'
+        :return: Daily closes, one column per ticker, indexed by date (DatetimeIndex)
+        """
+        raise NotImplementedError
+
+    def fetch_names(self, tickers: list) -> dict:
+        """
+        :param tickers: Tickers whose names are needed
+        :return: {ticker: name} - an empty string if the name is not available
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def group_by_range(date_ranges: dict) -> dict:
+        groups = {}
+        for ticker, date_range in date_ranges.items():
+            groups.setdefault(tuple(date_range), []).append(ticker)
+        return groups
+
+
+class YFinanceFetcher(PriceFetcher):
+
+    def __init__(self, max_workers: int = None) -> None:
+        """
+        Fetches from Yahoo Finance. All tickers sharing a date range are downloaded in one
+        batched yf.download call; names are looked up through a bounded thread pool.
+
+        :param max_workers: Maximum number of concurrent requests
+        """
+        self.max_workers = FETCH_MAX_WORKERS if max_workers is None else max_workers
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        import yfinance as yf
+
+        closes = []
+        for (start, end), tickers in self.group_by_range(date_ranges).items():
+            logging.info(f"Downloading {len(tickers)} tickers ({start} to {end}): {', '.join(tickers)}")
+            data = yf.download(tickers, start=start, end=end, threads=self.max_workers, progress=False)
+            if len(data) == 0:
+                continue
+            close = data['Close']
+            if isinstance(close, pd.Series):
+                close = close.to_frame(tickers[0])
+            closes.append(close[[ticker for ticker in tickers if ticker in close.columns]])
+
+        if len(closes) == 0:
+            return pd.DataFrame()
+        return pd.concat(closes, axis=1)
+
+    def fetch_names(self, tickers: list) -> dict:
+        import yfinance as yf
+
+        def fetch_name(ticker):
+            try:
+                return yf.Ticker(ticker).info['longName']
+            except Exception:  # no name, or a failed request - not KeyboardInterrupt and the like
+                return ''
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(zip(tickers, pool.map(fetch_name, tickers)))
+
+
+class FixtureFetcher(PriceFetcher):
+
+    def __init__(self, path: str) -> None:
+        """
+        Local stand-in for offline runs (benchmarks, tests, demos). Reads prices from
+        <path>/<ticker>.csv (columns: date, close) and names from <path>/assets.csv
+        (columns: asset_id, asset_name). Tickers without a file return no data, like an
+        unknown ticker on Yahoo Finance.
+
+        :param path: Folder holding the fixture files
+        """
+        self.path = path
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        closes = []
+        for ticker, (start, end) in date_ranges.items():
+            file_path = os.path.join(self.path, f"{ticker}.csv")
+            if not os.path.isfile(file_path):
+                continue
+            close = pd.read_csv(file_path, index_col='date', parse_dates=['date'])['close'].rename(ticker)
+            closes.append(close[(close.index >= start) & (close.index < end)])
+
+        if len(closes) == 0:
+            return pd.DataFrame()
+        return pd.concat(closes, axis=1)
+
+    def fetch_names(self, tickers: list) -> dict:
+        file_path = os.path.join(self.path, 'assets.csv')
+        names = pd.read_csv(file_path).set_index('asset_id')['asset_name'] if os.path.isfile(file_path) else {}
+        return {ticker: names.get(ticker, '') for ticker in tickers}
+
+
+def closes_to_bytes(close: pd.Series) -> bytes:
+    # Dates and closes as a structured NumPy array: exact floats, and several times faster to write and read than CSV
+    records = np.empty(len(close), dtype=[('date', 'M8[s]'), ('close', 'f8')])
+    records['date'], records['close'] = close.index.values, close.to_numpy(dtype=float)
+    buffer = io.BytesIO()
+    np.save(buffer, records, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def bytes_to_closes(content: bytes, ticker: str) -> pd.Series:
+    records = np.load(io.BytesIO(content), allow_pickle=False)
+    return pd.Series(records['close'], index=pd.DatetimeIndex(records['date'].astype('M8[ns]'), name='date'), name=ticker)
+
+
+class CachingFetcher(PriceFetcher):
+
+    def __init__(self, fetcher: PriceFetcher, cache: DownloadCache = None, mode: str = DOWNLOAD_CACHE_MODE,
+                 interval: str = '1d') -> None:
+        """
+        Serves the requests of another fetcher from a DownloadCache: the closes of a ticker over a
+        date range, and its name. A request is answered by the cached response to the same request
+        or, for prices, by the cached response to a request covering its range; only the others are
+        passed on to the fetcher (still in one call), and its responses are cached. Empty responses
+        (unknown tickers, failed downloads) are not cached.
+
+        :param fetcher: Fetcher to pass missing requests to
+        :param cache: Cache of responses (defaults to the one under DOWNLOAD_CACHE_PATH)
+        :param mode: 'on' (cached responses up to the cache's TTL, the fetcher for the rest) or 'offline' (cached
+            responses of any age only: the fetcher is never called, and missing requests return no data)
+        :param interval: Interval of the fetcher's prices, part of the cache key
+        """
+        if mode not in ('on', 'offline'):
+            raise ValueError(f"Unknown cache mode {mode}, expected 'on' or 'offline'")
+        self.fetcher = fetcher
+        self.cache = DownloadCache() if cache is None else cache
+        self.mode = mode
+        self.interval = interval
+
+    def cached_prices(self, ticker: str, start: str, end: str) -> pd.Series:
+        """
+        :return: Cached closes of the ticker from start (inclusive) to end (exclusive), or None if no cached
+            response covers the range
+        """
+        stale = self.mode == 'offline'
+        content = self.cache.get('prices', ticker, (start, end, self.interval), stale=stale)
+        if content is None:
+            covering = [ref for ref in self.cache.refs('prices', ticker)
+                        if ref['params'][0] <= start and ref['params'][1] >= end and ref['params'][2] == self.interval
+                        and (stale or self.cache.is_fresh(ref))]
+            # The most recently downloaded first
+            for ref in sorted(covering, key=lambda ref: -ref['fetched_at']):
+                content = self.cache.read_object(ref)
+                if content is not None:
+                    break
+        if content is None:
+            return None
+
+        close = bytes_to_closes(content, ticker)
+        return close[(close.index >= start) & (close.index < end)]
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        closes, missing = [], {}
+        for ticker, (start, end) in date_ranges.items():
+            close = self.cached_prices(ticker, start, end)
+            if close is None:
+                missing[ticker] = (start, end)
+            elif len(close) > 0:
+                closes.append(close)
+        logging.info(f"Download cache: {len(date_ranges) - len(missing)} of {len(date_ranges)} price requests cached")
+
+        if len(missing) > 0 and self.mode == 'offline':
+            logging.warning(f"Download cache: no cached prices for {', '.join(missing)} (offline)")
+        elif len(missing) > 0:
+            data = self.fetcher.fetch_prices(missing)
+            for ticker, (start, end) in missing.items():
+                if ticker not in data.columns or data[ticker].notna().sum() == 0:
+                    continue
+                close = data[ticker].dropna()
+                self.cache.put('prices', ticker, (start, end, self.interval), closes_to_bytes(close))
+                closes.append(close)
+            # Only reads the references once the cache outgrew its budget
+            self.cache.evict()
+
+        if len(closes) == 0:
+            return pd.DataFrame()
+        return pd.concat(closes, axis=1)
+
+    def fetch_names(self, tickers: list) -> dict:
+        stale = self.mode == 'offline'
+        names, missing = {}, []
+        for ticker in tickers:
+            content = self.cache.get('name', ticker, (), stale=stale)
+            if content is None:
+                missing.append(ticker)
+            else:
+                names[ticker] = content.decode()
+
+        if len(missing) > 0 and self.mode == 'offline':
+            names.update({ticker: '' for ticker in missing})
+        elif len(missing) > 0:
+            for ticker, name in self.fetcher.fetch_names(missing).items():
+                if name != '':
+                    self.cache.put('name', ticker, (), name.encode())
+                names[ticker] = name
+        return {ticker: names.get(ticker, '') for ticker in tickers}
+
+
+def get_default_fetcher() -> PriceFetcher:
+    """
+    Yahoo Finance through the download cache (see DOWNLOAD_CACHE_MODE, overridden by the DOWNLOAD_CACHE_MODE
+    environment variable), unless PRICE_FIXTURES_PATH is set (then the local fixtures are used)
+    """
+    fixtures_path = os.environ.get('PRICE_FIXTURES_PATH')
+    if fixtures_path is not None:
+        return FixtureFetcher(fixtures_path)
+
+    mode = os.environ.get('DOWNLOAD_CACHE_MODE', DOWNLOAD_CACHE_MODE)
+    if mode not in DOWNLOAD_CACHE_MODES:
+        raise ValueError(f"Unknown download cache mode {mode}, expected one of {DOWNLOAD_CACHE_MODES}")
+    return YFinanceFetcher() if mode == 'off' else CachingFetcher(YFinanceFetcher(), mode=mode)
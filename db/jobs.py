@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from common.constants import *
+from common.utils import db_connection
+from common.instrumentation import timed
+from db.setup import DataBase
+from db.data_ingestion import (ingest_ticker_data, ingest_changed_tickers, ingest_changed_archives,
+                               rebuild_changed_features, update_portfolio_and_weights, rebalance_asset_weights)
+
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+RESUMABLE_JOB_STATUSES = ('failed', 'cancelled', 'interrupted')
+
+JOB_TABLES = [
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+    "created REAL NOT NULL, started REAL, finished REAL, error TEXT, "
+    "cancel_requested INTEGER NOT NULL DEFAULT 0, pid INTEGER)",
+    "CREATE TABLE IF NOT EXISTS job_stages ("
+    "job_id TEXT NOT NULL, position INTEGER NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, "
+    "done REAL, total REAL, unit TEXT, started REAL, finished REAL, PRIMARY KEY (job_id, position))",
+]
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job, at its next progress report, once its cancellation was requested
+    """
+
+
+def database_job_stages(full_rebuild: bool = False) -> dict:
+    # Getting Started page: set up (or re-create) the database, then ingest every source that changed
+    return {
+        'set up database': lambda progress: DataBase(full_rebuild=full_rebuild),
+        'prices': lambda progress: ingest_changed_tickers(progress=progress),
+        'macro data': lambda progress: ingest_changed_archives(progress=progress),
+        'features': lambda progress: rebuild_changed_features(progress=progress),
+        'portfolios': lambda progress: update_portfolio_and_weights(),
+    }
+
+
+def allocation_job_stages(tickers: list, rebalancing: str = 'normalize') -> dict:
+    # Asset Allocation page: load the prices of added assets, then optimize the weights of all portfolios
+    # (weights are already normalized as edits are committed)
+    stages = {'prices': lambda progress: ingest_ticker_data(tickers, progress=progress)}
+    if rebalancing != 'normalize':
+        stages['optimize weights'] = lambda progress: rebalance_asset_weights(mode=rebalancing)
+    return stages
+
+
+# Kinds of jobs: builds the stages of a job (name -> callable taking a progress callback, in order) from its parameters
+JOB_KINDS = {
+    'database': database_job_stages,
+    'allocation': allocation_job_stages,
+}
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+class JobRunner:
+
+    def __init__(self, db_name: str = None) -> None:
+        """
+        Runs ingestion jobs in a background thread, one at a time (SQLite has a single writer), so
+        that the Streamlit session submitting them is not blocked. Jobs and the progress of their
+        stages are kept in SQLite, where any session can poll them. A job is a sequence of stages
+        (see JOB_KINDS) reporting progress as progress(done, total, unit); a requested cancellation
+        takes effect at the next report. A failed, cancelled or interrupted job (its process ended
+        while it ran) resumes at its first stage that did not complete.
+
+        :param db_name: File name of the job database (defaults to JOBS_DB_NAME)
+        """
+        self.db_name = JOBS_DB_NAME if db_name is None else db_name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job')
+        self.lock = threading.Lock()
+        self.ready = False
+
+    def set_up(self) -> None:
+        # Tables are created on first use; jobs left queued/running by a process that is gone are marked interrupted
+        with self.lock:
+            if self.ready:
+                return
+            with db_connection(self.db_name) as conn:
+                for sql_cmd in JOB_TABLES:
+                    conn.execute(sql_cmd)
+                active = conn.execute(
+                    f"SELECT job_id, pid FROM jobs WHERE status IN ({', '.join(['?'] * len(ACTIVE_JOB_STATUSES))})",
+                    ACTIVE_JOB_STATUSES).fetchall()
+                conn.executemany(
+                    "UPDATE jobs SET status = 'interrupted', finished = ? WHERE job_id = ?",
+                    [(time.time(), job_id) for job_id, pid in active if not _pid_alive(pid)])
+            self.ready = True
+
+    def submit(self, kind: str, **params) -> str:
+        """
+        Queues a job
+
+        :param kind: One of JOB_KINDS
+        :param params: Parameters of the job (JSON-serializable), see JOB_KINDS
+        :return: Id of the job
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind}, expected one of {list(JOB_KINDS)}")
+        stages = list(JOB_KINDS[kind](**params))
+        self.set_up()
+
+        job_id = uuid.uuid4().hex[:12]
+        with db_connection(self.db_name) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, params, status, created, pid) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), time.time(), os.getpid()))
+            conn.executemany(
+                "INSERT INTO job_stages (job_id, position, stage, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, position, stage) for position, stage in enumerate(stages)])
+        logging.info(f"Job {job_id} ({kind}) queued")
+
+        self.executor.submit(self.run, job_id)
+        return job_id
+
+    def cancel(self, job_id: str) -> None:
+        """
+        Cancels a queued job, or asks a running job to stop at its next progress report
+        """
+        self.set_up()
+        with db_connection(self.db_name) as conn:
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE job_id = ? AND status = 'queued'",
+                         (time.time(), job_id))
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,))
+
+    def resume(self, job_id: str) -> bool:
+        """
+        Queues a failed, cancelled or interrupted job again; its completed stages are skipped
+
+        :return: Whether the job was resumed
+        """
+        self.set_up()
+        with db_connection(self.db_name) as conn:
+            resumed = conn.execute(
+                f"UPDATE jobs SET status = 'queued', cancel_requested = 0, error = NULL, finished = NULL, pid = ? "
+                f"WHERE job_id = ? AND status IN ({', '.join(['?'] * len(RESUMABLE_JOB_STATUSES))})",
+                (os.getpid(), job_id, *RESUMABLE_JOB_STATUSES)).rowcount > 0
+        if resumed:
+            logging.info(f"Job {job_id} resumed")
+            self.executor.submit(self.run, job_id)
+        return resumed
+
+    def update_job(self, job_id: str, **fields) -> None:
+        with db_connection(self.db_name) as conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE job_id = ?",
+                         (*fields.values(), job_id))
+
+    def update_stage(self, job_id: str, position: int, **fields) -> None:
+        with db_connection(self.db_name) as conn:
+            conn.execute(f"UPDATE job_stages SET {', '.join(f'{k} = ?' for k in fields)} WHERE job_id = ? AND position = ?",
+                         (*fields.values(), job_id, position))
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with db_connection(self.db_name) as conn:
+            return bool(conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0])
+
+    def run(self, job_id: str) -> None:
+        """
+        Runs the stages of a queued job that did not complete yet (called in the worker thread)
+        """
+        job = self.get_job(job_id)
+        if job is None or job['status'] != 'queued':  # e.g. cancelled while queued
+            return
+        self.update_job(job_id, status='running', started=time.time(), pid=os.getpid())
+
+        position = None
+        try:
+            # Inside the try: a job of a kind no longer defined, or with bad parameters, fails instead of staying queued
+            if job['kind'] not in JOB_KINDS:
+                raise ValueError(f"Unknown job kind {job['kind']}, expected one of {list(JOB_KINDS)}")
+            stages = JOB_KINDS[job['kind']](**json.loads(job['params']))
+            completed = set(self.get_stages(job_id).query("status == 'succeeded'")['position'])
+            for position, (stage, func) in enumerate(stages.items()):
+                if position in completed:
+                    continue
+                if self.is_cancel_requested(job_id):
+                    raise JobCancelled()
+                self.update_stage(job_id, position, status='running', started=time.time(), finished=None,
+                                  done=None, total=None, unit=None)
+
+                def progress(done, total, unit, position=position):
+                    self.update_stage(job_id, position, done=done, total=total, unit=unit)
+                    if self.is_cancel_requested(job_id):
+                        raise JobCancelled()
+
+                with timed(f"{job['kind']}: {stage}", 'job'):
+                    func(progress)
+                self.update_stage(job_id, position, status='succeeded', finished=time.time())
+            status, error = 'succeeded', None
+        except JobCancelled:
+            status, error = 'cancelled', None
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed")
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+
+        if status != 'succeeded' and position is not None:
+            self.update_stage(job_id, position, status=status, finished=time.time())
+        self.update_job(job_id, status=status, finished=time.time(), error=error, cancel_requested=0)
+        logging.info(f"Job {job_id} ({job['kind']}) {status}")
+
+    def get_job(self, job_id: str):
+        """
+        :return: The job's row (dict), or None if there is no such job
+        """
+        self.set_up()
+        with db_connection(self.db_name) as conn:
+            job = pd.read_sql_query("SELECT * FROM jobs WHERE job_id = ?", conn, params=[job_id])
+        return None if len(job) == 0 else job.iloc[0].to_dict()
+
+    def get_stages(self, job_id: str) -> pd.DataFrame:
+        """
+        :return: The job's stages in order, with their progress, elapsed seconds and throughput (units per second)
+        """
+        self.set_up()
+        with db_connection(self.db_name) as conn:
+            stages = pd.read_sql_query("SELECT * FROM job_stages WHERE job_id = ? ORDER BY position", conn, params=[job_id])
+        stages = stages.astype({'done': float, 'total': float, 'started': float, 'finished': float})
+        stages['elapsed_s'] = stages['finished'].fillna(time.time()) - stages['started']
+        stages['per_second'] = stages['done'] / stages['elapsed_s'].where(stages['elapsed_s'] > 0)
+        return stages
+
+    def list_jobs(self, kinds: tuple = None, limit: int = 20) -> pd.DataFrame:
+        """
+        :param kinds: Kinds of jobs to list (all if None)
+        :param limit: Number of jobs, latest first
+        """
+        self.set_up()
+        kinds = list(JOB_KINDS) if kinds is None else list(kinds)
+        with db_connection(self.db_name) as conn:
+            return pd.read_sql_query(
+                f"SELECT * FROM jobs WHERE kind IN ({', '.join(['?'] * len(kinds))}) ORDER BY created DESC LIMIT ?",
+                conn, params=kinds + [limit])
+
+    def latest_job(self, kinds: tuple = None):
+        """
+        :return: The latest job of the given kinds (dict), or None
+        """
+        jobs = self.list_jobs(kinds, limit=1)
+        return None if len(jobs) == 0 else jobs.iloc[0].to_dict()
+
+
+# Module-level instance: imported modules survive Streamlit reruns, so this is shared by all pages and sessions
+JOBS = JobRunner()
@@ -0,0 +1,288 @@
+import sqlite3
+import pandas as pd
+
+from common.constants import *
+from db.columnar_store import ColumnarStore, is_columnar_store_available
+from common.cache import versioned_cache
+from common.instrumentation import instrumented
+from preprocessing.interpolation import interpolate_monthly
+from preprocessing.resampling import resample_prices
+
+# Table holding the prices of every storage frequency (see PRICE_FREQUENCY)
+PRICE_TABLES = {'monthly': 'asset_prices', 'daily': 'asset_prices_daily'}
+
+
+def _placeholders(values) -> str:
+    return ', '.join(['?'] * len(values))
+
+
+@instrumented('query')
+def get_factor_ids(conn: sqlite3.Connection, factor_names: list) -> list:
+    """
+    Looks up factor ids for the given factor names in the factors catalog
+    """
+    query = f"SELECT factor_id FROM factors WHERE factor_name IN ({_placeholders(factor_names)})"
+    return pd.read_sql_query(query, conn, params=list(factor_names))['factor_id'].tolist()
+
+
+@instrumented('query')
+def get_region_ids(conn: sqlite3.Connection, region_names: list) -> list:
+    """
+    Looks up region ids for the given region names in the regions catalog
+    """
+    query = f"SELECT region_id FROM regions WHERE region_name IN ({_placeholders(region_names)})"
+    return pd.read_sql_query(query, conn, params=list(region_names))['region_id'].tolist()
+
+
+@instrumented('query')
+def read_factor_data(conn: sqlite3.Connection, factor_ids: list = None, region_ids: list = None,
+                     start: str = None, end: str = None, use_columnar: bool = None,
+                     store: ColumnarStore = None, frequency: str = None) -> pd.DataFrame:
+    """
+    Reads a factor/region/date slice of monthly factor data, together with factor and region
+    names. Data stored at monthly frequency is read as is (see read_stored_factor_data); data
+    stored at native annual frequency is interpolated to month ends on read, and the result is
+    cached per slice (see read_interpolated_factor_data).
+
+    :param conn: Connection to the SQLite database (catalog)
+    :param factor_ids: Factors to keep (all if None)
+    :param region_ids: Regions to keep (all if None)
+    :param start: First date to keep (inclusive, formatted as DATE_FORMAT)
+    :param end: Last date to keep (inclusive, formatted as DATE_FORMAT)
+    :param use_columnar: Force (True) or bypass (False) the columnar store
+    :param store: Columnar store to read from (defaults to the one under COLUMNAR_STORE_PATH)
+    :param frequency: Frequency factor_data is stored at, one of FACTOR_DATA_FREQUENCIES (defaults to FACTOR_DATA_FREQUENCY)
+    :return: DataFrame with columns factor_id, factor_name, region_id, region_name, date, value
+    """
+    frequency = FACTOR_DATA_FREQUENCY if frequency is None else frequency
+    if frequency == 'annual':
+        return read_interpolated_factor_data(conn, factor_ids, region_ids, start, end, use_columnar, store)
+    return read_stored_factor_data(conn, factor_ids, region_ids, start, end, use_columnar, store)
+
+
+@versioned_cache('interpolated_factor_data')
+def read_interpolated_factor_data(conn: sqlite3.Connection, factor_ids: list = None, region_ids: list = None,
+                                  start: str = None, end: str = None, use_columnar: bool = None,
+                                  store: ColumnarStore = None) -> pd.DataFrame:
+    """
+    Reads the annual observations of a factor/region slice and interpolates them to month ends
+    (see interpolate_monthly). The full history of the slice is read, since months at the edges
+    of the date window are interpolated from observations outside of it. Results are cached
+    under the database version and shared, so callers must not modify them.
+
+    :return: DataFrame with columns factor_id, factor_name, region_id, region_name, date, value
+    """
+    observations = read_stored_factor_data(conn, factor_ids, region_ids, use_columnar=use_columnar, store=store)
+    return interpolate_monthly(observations, start, end)
+
+
+def read_stored_factor_data(conn: sqlite3.Connection, factor_ids: list = None, region_ids: list = None,
+                            start: str = None, end: str = None, use_columnar: bool = None,
+                            store: ColumnarStore = None) -> pd.DataFrame:
+    """
+    Reads a factor/region/date slice of factor_data as stored, together with factor and region names
+    from the SQLite catalog. If the columnar store is available the slice is read from Parquet
+    (ids and names come back dictionary-encoded, as pandas categoricals), otherwise the
+    filters are pushed into the SQL query.
+
+    :param conn: Connection to the SQLite database (catalog)
+    :param factor_ids: Factors to keep (all if None)
+    :param region_ids: Regions to keep (all if None)
+    :param start: First date to keep (inclusive, formatted as DATE_FORMAT)
+    :param end: Last date to keep (inclusive, formatted as DATE_FORMAT)
+    :param use_columnar: Force (True) or bypass (False) the columnar store
+    :param store: Columnar store to read from (defaults to the one under COLUMNAR_STORE_PATH)
+    :return: DataFrame with columns factor_id, factor_name, region_id, region_name, date, value
+    """
+    columns = ['factor_id', 'factor_name', 'region_id', 'region_name', 'date', 'value']
+    if use_columnar is None:
+        use_columnar = is_columnar_store_available() and ColumnarStore().exists('factor_data')
+
+    if use_columnar:
+        store = ColumnarStore() if store is None else store
+        filters = None if region_ids is None else {'region_id': region_ids}
+        data = store.read('factor_data', keys=factor_ids, start=start, end=end, filters=filters)
+
+        factors = pd.read_sql_query("SELECT factor_id, factor_name FROM factors", conn)
+        regions = pd.read_sql_query("SELECT region_id, region_name FROM regions", conn)
+        data['factor_name'] = data['factor_id'].map(factors.set_index('factor_id')['factor_name'])
+        data['region_name'] = data['region_id'].map(regions.set_index('region_id')['region_name'])
+
+        # Same semantics as the INNER JOINs of the SQL path
+        data = data.dropna(subset=['factor_name', 'region_name'])
+        data = data.sort_values(['factor_id', 'region_id', 'date'])
+        return data[columns].reset_index(drop=True)
+
+    conditions, params = [], []
+    if factor_ids is not None:
+        conditions.append(f"factor_data.factor_id IN ({_placeholders(factor_ids)})")
+        params += list(factor_ids)
+    if region_ids is not None:
+        conditions.append(f"factor_data.region_id IN ({_placeholders(region_ids)})")
+        params += list(region_ids)
+    if start is not None:
+        conditions.append("factor_data.date >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("factor_data.date <= ?")
+        params.append(end)
+
+    query = (
+        f"SELECT factor_data.factor_id, factors.factor_name, factor_data.region_id, regions.region_name, factor_data.date, factor_data.value "
+        f"FROM factor_data "
+        f"INNER JOIN factors ON factor_data.factor_id = factors.factor_id "
+        f"INNER JOIN regions ON factor_data.region_id = regions.region_id "
+        f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''}"
+    )
+    return pd.read_sql_query(query, conn, params=params)[columns]
+
+
+@instrumented('query')
+def read_portfolio_asset_prices(conn: sqlite3.Connection, portfolio_ids: list, use_columnar: bool = None,
+                                store: ColumnarStore = None, frequency: str = 'monthly',
+                                price_frequency: str = None) -> pd.DataFrame:
+    """
+    Reads allocations of the given portfolios together with the price history of their assets.
+
+    :param conn: Connection to the SQLite database (catalog)
+    :param portfolio_ids: Portfolios to keep
+    :param use_columnar: Force (True) or bypass (False) the columnar store
+    :param store: Columnar store to read from (defaults to the one under COLUMNAR_STORE_PATH)
+    :param frequency: Frequency of the prices, see read_asset_prices
+    :param price_frequency: Frequency prices are stored at, see read_asset_prices
+    :return: DataFrame with columns portfolio_id, asset_id, asset_weight, date, asset_price
+    """
+    columns = ['portfolio_id', 'asset_id', 'asset_weight', 'date', 'asset_price']
+    price_frequency = PRICE_FREQUENCY if price_frequency is None else price_frequency
+    if frequency != 'monthly' or price_frequency != 'monthly':
+        allocation = read_asset_allocation(conn, portfolio_ids)
+        prices = read_asset_prices(conn, allocation['asset_id'].unique().tolist(), use_columnar, store,
+                                   frequency, price_frequency)
+        data = allocation.merge(prices, on='asset_id', how='inner')
+        return data[columns].sort_values(['portfolio_id', 'asset_id', 'date']).reset_index(drop=True)
+
+    if use_columnar is None:
+        use_columnar = is_columnar_store_available() and ColumnarStore().exists('asset_prices')
+
+    if use_columnar:
+        allocation = pd.read_sql_query(
+            f"SELECT portfolio_id, asset_id, asset_weight FROM asset_allocation "
+            f"WHERE portfolio_id IN ({_placeholders(portfolio_ids)})",
+            conn, params=list(portfolio_ids))
+        store = ColumnarStore() if store is None else store
+        prices = store.read('asset_prices', keys=allocation['asset_id'].unique().tolist())
+        prices['asset_id'] = prices['asset_id'].astype(str)
+        data = allocation.merge(prices, on='asset_id', how='inner')
+        return data[columns].sort_values(['portfolio_id', 'asset_id', 'date']).reset_index(drop=True)
+
+    query = (
+        f"SELECT asset_allocation.portfolio_id, asset_allocation.asset_id, asset_allocation.asset_weight, asset_prices.date, asset_prices.asset_price "
+        f"FROM asset_allocation JOIN asset_prices ON asset_allocation.asset_id = asset_prices.asset_id "
+        f"WHERE asset_allocation.portfolio_id IN ({_placeholders(portfolio_ids)})"
+    )
+    return pd.read_sql_query(query, conn, params=list(portfolio_ids))[columns]
+
+
+@instrumented('query')
+def read_asset_allocation(conn: sqlite3.Connection, portfolio_ids: list = None) -> pd.DataFrame:
+    """
+    Reads the asset allocation of the given portfolios (all portfolios if None)
+
+    :return: DataFrame with columns portfolio_id, asset_id, asset_weight
+    """
+    query = "SELECT portfolio_id, asset_id, asset_weight FROM asset_allocation"
+    if portfolio_ids is None:
+        return pd.read_sql_query(query, conn)
+    query += f" WHERE portfolio_id IN ({_placeholders(portfolio_ids)})"
+    return pd.read_sql_query(query, conn, params=list(portfolio_ids))
+
+
+@instrumented('query')
+def read_asset_prices(conn: sqlite3.Connection, asset_ids: list = None, use_columnar: bool = None,
+                      store: ColumnarStore = None, frequency: str = 'monthly',
+                      price_frequency: str = None) -> pd.DataFrame:
+    """
+    Reads the price history of the given assets (all assets if None), once per asset - unlike
+    read_portfolio_asset_prices, prices are not repeated for every portfolio holding the asset.
+    Prices stored at the requested frequency are read as they are (see read_stored_asset_prices);
+    other frequencies are aggregated from the stored prices on read, and the result is cached
+    (see read_resampled_asset_prices).
+
+    :param conn: Connection to the SQLite database
+    :param asset_ids: Assets to keep (all if None)
+    :param use_columnar: Force (True) or bypass (False) the columnar store
+    :param store: Columnar store to read from (defaults to the one under COLUMNAR_STORE_PATH)
+    :param frequency: One of ANALYSIS_FREQUENCIES, no finer than the stored prices (see price_frequencies)
+    :param price_frequency: Frequency prices are stored at, one of PRICE_FREQUENCIES (defaults to PRICE_FREQUENCY)
+    :return: DataFrame with columns asset_id, date (see resample_prices), asset_price
+    """
+    price_frequency = PRICE_FREQUENCY if price_frequency is None else price_frequency
+    if frequency not in price_frequencies(price_frequency):
+        raise ValueError(f"Prices stored at {price_frequency} frequency cannot be read at {frequency} frequency, "
+                         f"expected one of {price_frequencies(price_frequency)}")
+    if frequency == price_frequency == 'monthly':
+        return read_stored_asset_prices(conn, asset_ids, use_columnar, store, price_frequency)
+    return read_resampled_asset_prices(conn, asset_ids, use_columnar, store, frequency, price_frequency)
+
+
+@versioned_cache('resampled_asset_prices')
+def read_resampled_asset_prices(conn: sqlite3.Connection, asset_ids: list = None, use_columnar: bool = None,
+                                store: ColumnarStore = None, frequency: str = 'monthly',
+                                price_frequency: str = None) -> pd.DataFrame:
+    """
+    Reads the stored prices of the given assets and aggregates them to the given frequency (see
+    resample_prices). Results are cached under the database version and shared, so callers must
+    not modify them.
+
+    :return: DataFrame with columns asset_id, date, asset_price
+    """
+    prices = read_stored_asset_prices(conn, asset_ids, use_columnar, store, price_frequency)
+    return resample_prices(prices, frequency)
+
+
+def read_stored_asset_prices(conn: sqlite3.Connection, asset_ids: list = None, use_columnar: bool = None,
+                             store: ColumnarStore = None, price_frequency: str = None) -> pd.DataFrame:
+    """
+    Reads the prices of the given assets (all assets if None) as stored: month averages formatted
+    as DATE_FORMAT, or daily closes with YYYYMMDD integer dates.
+
+    :param price_frequency: Frequency prices are stored at, one of PRICE_FREQUENCIES (defaults to PRICE_FREQUENCY)
+    :return: DataFrame with columns asset_id, date, asset_price
+    """
+    columns = ['asset_id', 'date', 'asset_price']
+    table = PRICE_TABLES[PRICE_FREQUENCY if price_frequency is None else price_frequency]
+    if use_columnar is None:
+        use_columnar = is_columnar_store_available() and ColumnarStore().exists(table)
+
+    if use_columnar:
+        store = ColumnarStore() if store is None else store
+        prices = store.read(table, keys=asset_ids)
+        prices['asset_id'] = prices['asset_id'].astype(str)
+        return prices[columns].sort_values(['asset_id', 'date']).reset_index(drop=True)
+
+    query = f"SELECT asset_id, date, asset_price FROM {table}"
+    if asset_ids is None:
+        return pd.read_sql_query(query, conn)[columns]
+    query += f" WHERE asset_id IN ({_placeholders(asset_ids)})"
+    return pd.read_sql_query(query, conn, params=list(asset_ids))[columns]
+
+
+@instrumented('query')
+def read_priced_asset_ids(conn: sqlite3.Connection, price_frequency: str = None) -> list:
+    """
+    :param price_frequency: Frequency prices are stored at, one of PRICE_FREQUENCIES (defaults to PRICE_FREQUENCY)
+    :return: Ids of the assets with at least one stored price
+    """
+    table = PRICE_TABLES[PRICE_FREQUENCY if price_frequency is None else price_frequency]
+    return pd.read_sql_query(f"SELECT DISTINCT asset_id FROM {table} ORDER BY asset_id", conn)['asset_id'].tolist()
+
+
+def price_frequencies(price_frequency: str = None) -> list:
+    """
+    :param price_frequency: Frequency prices are stored at, one of PRICE_FREQUENCIES (defaults to PRICE_FREQUENCY)
+    :return: Frequencies of ANALYSIS_FREQUENCIES prices can be read at, finest first: any for daily
+        closes, monthly or coarser for month averages
+    """
+    price_frequency = PRICE_FREQUENCY if price_frequency is None else price_frequency
+    frequencies = list(ANALYSIS_FREQUENCIES)
+    return frequencies[frequencies.index(price_frequency):]
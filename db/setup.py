@@ -10,28 +10,41 @@ logging.basicConfig(
 )
 
 from common.constants import *
+from db.columnar_store import ColumnarStore, is_columnar_store_available
+from common.cache import bump_db_version
+from preprocessing.decomposition import clear_saved_components
+from common.utils import db_connection, remove_db_files
 
 class DataBase:
 
-    def __init__(self, db_name: str = None) -> None:
+    def __init__(self, db_name: str = None, full_rebuild: bool = False) -> None:
         """
-        Creates a new database (file name: db_name) using the schema provided in
+        Brings the database (file name: db_name) in line with the schema provided in
         ./config/database_schema.json
 
-        In case this file name is already present, deletes the file
-        and re-creates it from scratch.
+        By default the live database is migrated in place (see migrate_tables), so the data
+        already ingested is kept. With full_rebuild, or if the file does not exist yet, the
+        file (and the columnar store mirroring its long tables) is deleted and re-created
+        from scratch.
 
         :param db_name: File name of the database to initialize
+        :param full_rebuild: Delete and re-create the database instead of migrating it
         """
         self.db_name = DB_NAME if db_name is None else db_name
         self.db_schema_path = 'config/database_schema.json'
         self.db_schema = None
 
-        if os.path.isfile(f"db/{self.db_name}"):
-            os.remove(f"db/{self.db_name}")
-        sqlite3.connect(f"db/{self.db_name}").close()
+        if full_rebuild or not os.path.isfile(f"db/{self.db_name}"):
+            remove_db_files(self.db_name)
+            if is_columnar_store_available():
+                ColumnarStore().clear()
+            clear_saved_components()
 
-        self.set_up_tables()
+            self.set_up_tables()
+        else:
+            self.migrate_tables()
+
+        bump_db_version(self.db_name)
 
     def load_schema(self) -> None:
         """
@@ -50,25 +63,124 @@ class DataBase:
 
         self.load_schema()
 
-        with sqlite3.connect(f"db/{self.db_name}") as conn:
+        with db_connection(self.db_name) as conn:
 
             cursor = conn.cursor()
 
             for table, schema in self.db_schema.items():
-                sql_cmd = self.create_sql_cmd(table, schema)
-                logging.info(sql_cmd)
-                cursor.execute(sql_cmd)
+                for sql_cmd in self.create_sql_cmd(table, schema):
+                    logging.info(sql_cmd)
+                    cursor.execute(sql_cmd)
 
             conn.commit()
 
+    def migrate_tables(self) -> list:
+        """
+        Diffs the declared schema against the live database and applies the difference:
+        missing tables are created, missing nullable columns are added with ALTER TABLE, and
+        tables whose columns, datatypes, constraints or primary key changed otherwise are
+        rebuilt (columns present in both versions are copied over). Declared indexes that are
+        missing are created. Tables that are not declared in the schema are left untouched.
+
+        All statements run in one transaction: if existing rows violate the declared constraints
+        (e.g. NULLs in a column declared NOT NULL, duplicates under a new primary key), nothing is
+        applied and sqlite3.IntegrityError is raised.
+
+        :return: List of migration statements that were applied
+        """
+
+        self.load_schema()
+        applied = []
+
+        with db_connection(self.db_name) as conn:
+
+            cursor = conn.cursor()
+            live_tables = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            live_indexes = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")]
+
+            for table, schema in self.db_schema.items():
+
+                if table not in live_tables:
+                    applied += self.create_sql_cmd(table, schema)
+                    continue
+
+                live_columns = {
+                    row[1]: {'datatype': row[2], 'nullable': not row[3], 'pk': row[5]}
+                    for row in cursor.execute(f"PRAGMA table_info({table})")
+                }
+                live_primary_key = [col for col, info in sorted(live_columns.items(), key=lambda c: c[1]['pk']) if info['pk']]
+                # Columns declared UNIQUE are backed by single-column indexes of origin 'u'
+                live_unique = set()
+                for _, index, _, origin, *_ in cursor.execute(f"PRAGMA index_list({table})").fetchall():
+                    index_columns = [row[2] for row in cursor.execute(f"PRAGMA index_info({index})")]
+                    if origin == 'u' and len(index_columns) == 1:
+                        live_unique.add(index_columns[0])
+
+                declared_columns = schema['columns']
+                added = [col for col in declared_columns if col not in live_columns]
+                changed = [
+                    col for col, info in declared_columns.items()
+                    if col in live_columns and (
+                        live_columns[col]['datatype'].upper() != info.get('datatype', 'BLOB').upper()
+                        or live_columns[col]['nullable'] != info.get('nullable', True)
+                        # (a single-column primary key is unique through its own index)
+                        or (col in live_unique) != info.get('unique', False) and live_primary_key != [col]
+                    )
+                ]
+                dropped = [col for col in live_columns if col not in declared_columns]
+                rebuild = (
+                    len(changed) > 0 or len(dropped) > 0
+                    or live_primary_key != (schema.get('primary_key') or [])
+                    or any(not declared_columns[col].get('nullable', True) or declared_columns[col].get('unique', False) for col in added)
+                )
+
+                if rebuild:
+                    # SQLite cannot alter constraints in place: copy into a table created from the declared schema
+                    common = [col for col in declared_columns if col in live_columns]
+                    create_table_cmd, *create_index_cmds = self.create_sql_cmd(table, schema)
+                    applied += [
+                        create_table_cmd.replace(f"CREATE TABLE {table}", f"CREATE TABLE {table}__migrated", 1),
+                        f"INSERT INTO {table}__migrated ({', '.join(common)}) SELECT {', '.join(common)} FROM {table}",
+                        f"DROP TABLE {table}",
+                        f"ALTER TABLE {table}__migrated RENAME TO {table}",
+                    ] + create_index_cmds
+                else:
+                    for col in added:
+                        applied.append(f"ALTER TABLE {table} ADD COLUMN {col} {declared_columns[col].get('datatype', 'BLOB')}")
+                    applied += [
+                        cmd for index, cmd in zip(schema.get('indexes', {}), self.create_sql_cmd(table, schema)[1:])
+                        if index not in live_indexes
+                    ]
+
+            # Explicit transaction, so that the DDL statements are rolled back too if a copy fails
+            cursor.execute("BEGIN")
+            try:
+                for sql_cmd in applied:
+                    logging.info(sql_cmd)
+                    cursor.execute(sql_cmd)
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                raise sqlite3.IntegrityError(
+                    f"Migration of {self.db_name} failed, existing rows violate the declared schema ({e}). "
+                    f"Fix the rows or re-create the database") from e
+
+            conn.commit()
+
+        if len(applied) == 0:
+            logging.info("Database schema is up to date")
+
+        return applied
+
     @staticmethod
     def create_sql_cmd(table, schema):
         """
-        Creates a
+        Creates the SQL commands setting up a table: CREATE TABLE (WITHOUT ROWID if the schema sets
+        "without_rowid", i.e. rows stored in primary key order with no separate key index), followed
+        by one CREATE INDEX per entry of the table's optional "indexes" section ({index name: [columns]})
 
         :param table:
         :param schema:
-        :return: String representation of SQL command
+        :return: List of SQL commands (as strings)
         """
 
         result = f"CREATE TABLE {table}"
@@ -100,12 +212,19 @@ class DataBase:
                 result = f"{result}, PRIMARY KEY ({', '.join(primary_key)})"
 
             result = f"{result})"
+            if schema.get('without_rowid', False):
+                result = f"{result} WITHOUT ROWID"
+
+        index_cmds = [
+            f"CREATE INDEX {index} ON {table} ({', '.join(columns)})"
+            for index, columns in schema.get('indexes', {}).items()
+        ]
 
-        return result
+        return [result] + index_cmds
 
 if __name__ == '__main__':
 
     os.chdir("..")
     # db_name = input(f'Initializing a database from scratch. Provide a name (if left blank: {DB_NAME}): ')
     # if db_name == '': db_name = DB_NAME
-    test_db = DataBase(db_name=DB_NAME)
+    test_db = DataBase(db_name=DB_NAME, full_rebuild=True)
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+FILL_POLICIES = (None, 'ffill', 'bfill_ffill', 'zero', 'mean')
+INF_POLICIES = ('cap', 'nan', 'keep')
+
+
+def ffill_inplace(values: np.ndarray, last_valid: np.ndarray = None) -> np.ndarray:
+    """
+    Forward-fills NaNs down the rows of a 2-d float array, in place
+
+    :param values: Array to fill (rows are periods, columns are series)
+    :param last_valid: Values preceding the first row (e.g. from an earlier block); NaN if unknown
+    :return: The filled array (same object)
+    """
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    if last_valid is not None:
+        first_missing = missing[0] & ~np.isnan(last_valid)
+        values[0, first_missing] = last_valid[first_missing]
+        missing[0, first_missing] = False
+
+    rows = np.where(missing, 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    cols = np.nonzero(missing)[1]
+    values[missing] = values[rows[missing], cols]
+    return values
+
+
+def bfill_inplace(values: np.ndarray) -> np.ndarray:
+    """
+    Back-fills NaNs up the rows of a 2-d float array, in place
+    """
+    ffill_inplace(values[::-1])
+    return values
+
+
+def pct_change_inplace(values: np.ndarray, last_level: np.ndarray = None) -> np.ndarray:
+    """
+    Replaces levels by period-over-period changes (like DataFrame.pct_change(fill_method=None)), in place
+
+    :param values: Levels, rows are consecutive periods
+    :param last_level: Levels of the period preceding the first row; the first row becomes NaN if None
+    :return: The array of changes (same object)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        first = values[0] / last_level - 1 if last_level is not None else np.nan
+        np.divide(values[1:], values[:-1], out=values[1:])
+        values[1:] -= 1
+        values[0] = first
+    return values
+
+
+class CleaningPipeline:
+
+    def __init__(self, pct_change: bool = False, fill: str = 'bfill_ffill', inf: str = 'cap',
+                 inf_value: float = 999.0, clip_quantiles: tuple = None, drop_empty: bool = True,
+                 dtype=None) -> None:
+        """
+        Cleans a block of time series (rows are periods, columns are series) for use as a design
+        matrix. Steps, in order: period-over-period changes, infinite values, missing values,
+        outlier clipping. Work is done in place on the float array behind the block wherever
+        possible. fit_transform keeps the state needed to clean later periods with transform,
+        so new months can be appended without reprocessing the history.
+
+        :param pct_change: Replace levels by period-over-period changes first
+        :param fill: Missing values: None (keep), 'ffill', 'bfill_ffill' (gaps take the next valid value,
+            trailing gaps the last one), 'zero' or 'mean' (fitted column means)
+        :param inf: Infinite values: 'cap' (to +/-inf_value, after filling), 'nan' (treated as missing)
+            or 'keep'
+        :param inf_value: Cap for the 'cap' policy
+        :param clip_quantiles: (lower, upper) quantiles fitted per column to clip outliers to, or None
+        :param drop_empty: Drop columns without any valid value in the fitted block
+        :param dtype: Float dtype of the output (np.float32 halves memory); the input's if None
+        """
+        if fill not in FILL_POLICIES:
+            raise ValueError(f"Unknown fill policy {fill}, expected one of {FILL_POLICIES}")
+        if inf not in INF_POLICIES:
+            raise ValueError(f"Unknown inf policy {inf}, expected one of {INF_POLICIES}")
+
+        self.pct_change = pct_change
+        self.fill = fill
+        self.inf = inf
+        self.inf_value = inf_value
+        self.clip_quantiles = clip_quantiles
+        self.drop_empty = drop_empty
+        self.dtype = dtype
+
+        # Fitted state
+        self.columns = None
+        self.keep = None
+        self.last_level = None
+        self.last_valid = None
+        self.means = None
+        self.clip_bounds = None
+
+    def _as_array(self, X, copy: bool) -> np.ndarray:
+        values = X.to_numpy() if isinstance(X, pd.DataFrame) else X
+        dtype = values.dtype if self.dtype is None else np.dtype(self.dtype)
+        if not np.issubdtype(dtype, np.floating):
+            dtype = np.dtype(np.float64)
+        return values.astype(dtype, copy=copy)
+
+    def _clean(self, values: np.ndarray, fitting: bool) -> np.ndarray:
+        if self.pct_change and len(values):
+            levels = values[-1].copy()
+            pct_change_inplace(values, None if fitting else self.last_level)
+            self.last_level = levels
+
+        if fitting and self.drop_empty:
+            # A column is empty if it has no value (infinite ones count) before filling
+            self.keep = ~np.isnan(values).all(axis=0)
+
+        infinite = np.isinf(values)
+        if self.inf == 'nan':
+            values[infinite] = np.nan
+
+        if fitting and self.fill == 'mean':
+            finite = np.isfinite(values)
+            self.means = np.where(finite, values, 0).sum(axis=0) / np.maximum(finite.sum(axis=0), 1)
+
+        if self.fill in ('ffill', 'bfill_ffill'):
+            # Gaps at the end of a block cannot be back-filled yet, so new periods are only forward-filled
+            if fitting and self.fill == 'bfill_ffill':
+                bfill_inplace(values)
+            ffill_inplace(values, None if fitting else self.last_valid)
+        elif self.fill == 'zero':
+            values[np.isnan(values)] = 0
+        elif self.fill == 'mean':
+            rows, cols = np.nonzero(np.isnan(values))
+            values[rows, cols] = self.means[cols]
+
+        if self.inf == 'cap':
+            # Filling can have copied infinite values into gaps
+            infinite = np.isinf(values) if self.fill in ('ffill', 'bfill_ffill') else infinite
+            values[infinite & (values > 0)] = self.inf_value
+            values[infinite & (values < 0)] = -self.inf_value
+
+        if self.clip_quantiles is not None:
+            if fitting:
+                finite = np.where(np.isfinite(values), values, np.nan)
+                self.clip_bounds = np.full((2, values.shape[1]), np.nan)
+                has_values = ~np.isnan(finite).all(axis=0)
+                self.clip_bounds[:, has_values] = np.nanquantile(finite[:, has_values], self.clip_quantiles, axis=0)
+            np.clip(values, self.clip_bounds[0], self.clip_bounds[1], out=values,
+                    where=~np.isnan(self.clip_bounds[0]))
+
+        if len(values):
+            last = values[-1]
+            if self.last_valid is None or fitting:
+                self.last_valid = last.copy()
+            else:
+                self.last_valid = np.where(np.isnan(last), self.last_valid, last)
+        return values
+
+    def _wrap(self, X, values: np.ndarray):
+        if self.keep is not None and not self.keep.all():
+            values = values[:, self.keep]
+        if isinstance(X, pd.DataFrame):
+            columns = self.columns if self.keep is None else self.columns[self.keep]
+            return pd.DataFrame(values, index=X.index, columns=columns, copy=False)
+        return values
+
+    def fit_transform(self, X, copy: bool = False):
+        """
+        Fits the pipeline on a block and returns it cleaned
+
+        :param X: DataFrame or 2-d array; cleaned in place unless copy is set or a dtype change is needed
+        :param copy: Leave X untouched
+        :return: Cleaned block, of the same type as X
+        """
+        values = self._as_array(X, copy)
+        self.columns = X.columns if isinstance(X, pd.DataFrame) else None
+
+        values = self._clean(values, fitting=True)
+        return self._wrap(X, values)
+
+    def transform(self, X, copy: bool = False):
+        """
+        Cleans the periods that follow the fitted block, using its state (last levels and values,
+        column means, clip bounds). Leading gaps are forward-filled from the fitted block.
+
+        :param X: New rows with the columns of the fitted block (before dropping empty ones)
+        :param copy: Leave X untouched
+        :return: Cleaned rows, of the same type as X
+        """
+        if self.last_valid is None:
+            raise RuntimeError('CleaningPipeline.transform called before fit_transform')
+        if isinstance(X, pd.DataFrame) and self.columns is not None:
+            X = X.reindex(columns=self.columns)
+
+        values = self._clean(self._as_array(X, copy), fitting=False)
+        return self._wrap(X, values)
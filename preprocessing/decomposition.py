@@ -0,0 +1,199 @@
+import os
+import shutil
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from sklearn.utils.extmath import randomized_svd
+
+from common.constants import *
+
+
+class FactorPCA:
+
+    def __init__(self, n_components: int = DEFAULT_PCA_COMPONENTS, standardize: bool = True,
+                 n_oversamples: int = 10, n_iter: int = 4, random_state: int = 0) -> None:
+        """
+        Compresses a factor panel (rows are periods, columns are factor/region series) to its
+        leading principal components, found by randomized truncated SVD. Regressions can then be
+        run on a few well-conditioned components instead of thousands of collinear series, and
+        their coefficients mapped back to the original series.
+
+        :param n_components: Number of components k (capped at the rank bound min(periods, series))
+        :param standardize: Scale every series to unit variance first, so that no series dominates
+            because of its units
+        :param n_oversamples: Extra random directions used by the randomized SVD
+        :param n_iter: Power iterations of the randomized SVD
+        :param random_state: Seed of the randomized SVD
+        """
+        self.n_components = n_components
+        self.standardize = standardize
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+        # Fitted state
+        self.columns = None
+        self.mean = None
+        self.scale = None
+        self.components = None
+        self.explained_variance_ratio = None
+
+    @property
+    def component_names(self) -> list:
+        return [f"PC{i + 1}" for i in range(len(self.components))]
+
+    def fit(self, X) -> 'FactorPCA':
+        """
+        :param X: Factor panel (DataFrame) without missing values, e.g. from prepare_predictors
+        """
+        values = X.to_numpy(dtype=float)
+        self.columns = X.columns
+        self.mean = values.mean(axis=0)
+        self.scale = values.std(axis=0) if self.standardize else np.ones(values.shape[1])
+        self.scale[self.scale == 0] = 1.0
+
+        centered = (values - self.mean) / self.scale
+        k = max(1, min(self.n_components, *centered.shape))
+        _, s, self.components = randomized_svd(
+            centered, k, n_oversamples=self.n_oversamples, n_iter=self.n_iter, random_state=self.random_state)
+
+        total_variance = (centered ** 2).sum()
+        self.explained_variance_ratio = s ** 2 / total_variance if total_variance > 0 else np.zeros(k)
+        return self
+
+    def transform(self, X) -> pd.DataFrame:
+        """
+        Projects periods onto the fitted components. New periods (e.g. months ingested after the
+        fit) are projected with the stored mean, scale and components, without refitting.
+
+        :param X: Factor panel with (at least) the fitted columns
+        :return: DataFrame of component scores, one row per period, columns PC1..PCk
+        """
+        values = X[self.columns].to_numpy(dtype=float) if isinstance(X, pd.DataFrame) else X
+        scores = ((values - self.mean) / self.scale) @ self.components.T
+        index = X.index if isinstance(X, pd.DataFrame) else None
+        return pd.DataFrame(scores, index=index, columns=self.component_names)
+
+    def fit_transform(self, X) -> pd.DataFrame:
+        return self.fit(X).transform(X)
+
+    def inverse_coefficients(self, component_coefficients):
+        """
+        Maps coefficients of a linear model on the component scores back to the original series:
+        y = sum_j g_j * PC_j = sum_i b_i * x_i + const, with b = components^T g / scale
+
+        :param component_coefficients: Coefficients per component (PC1..PCk), or several sets of them
+            mapped at once as the columns of a components x targets DataFrame or array
+        :return: Coefficients per original series - a Series, or a series x targets DataFrame
+        """
+        g = np.asarray(component_coefficients, dtype=float)
+        if g.ndim == 1:
+            return pd.Series((self.components.T @ g) / self.scale, index=self.columns)
+        columns = component_coefficients.columns if isinstance(component_coefficients, pd.DataFrame) else None
+        return pd.DataFrame((self.components.T @ g) / self.scale[:, None], index=self.columns, columns=columns)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path, columns=np.asarray(self.columns, dtype=str), columns_name=str(self.columns.name or ''),
+            mean=self.mean, scale=self.scale,
+            components=self.components, explained_variance_ratio=self.explained_variance_ratio,
+            n_components=self.n_components, standardize=self.standardize,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FactorPCA':
+        with np.load(path, allow_pickle=False) as data:
+            pca = cls(n_components=int(data['n_components']), standardize=bool(data['standardize']))
+            pca.columns = pd.Index(data['columns'], name=str(data['columns_name']) or None)
+            pca.mean, pca.scale = data['mean'], data['scale']
+            pca.components = data['components']
+            pca.explained_variance_ratio = data['explained_variance_ratio']
+        return pca
+
+
+def panel_fingerprint(X, n_components: int, standardize: bool = True) -> str:
+    """
+    Content hash of a factor panel and the decomposition settings (names the persisted components)
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X.to_numpy(dtype=float)).tobytes())
+    digest.update('\n'.join(map(str, X.columns)).encode())
+    digest.update('\n'.join(map(str, X.index)).encode())
+    digest.update(f"{n_components}|{standardize}".encode())
+    return digest.hexdigest()
+
+
+def load_or_fit_pca(X, n_components: int = DEFAULT_PCA_COMPONENTS, standardize: bool = True,
+                    path: str = None) -> FactorPCA:
+    """
+    Returns the decomposition of the panel, read from disk if the same panel was decomposed
+    before (e.g. by another process or before a restart), otherwise fitted and saved. Every
+    panel, component count and date window gets its own file, so saving evicts the least
+    recently used ones beyond DECOMPOSITION_MAX_BYTES (see evict_saved_components).
+
+    :param X: Factor panel
+    :param n_components: Number of components
+    :param standardize: See FactorPCA
+    :param path: Folder of the persisted components (defaults to DECOMPOSITION_PATH)
+    """
+    path = DECOMPOSITION_PATH if path is None else path
+    file_path = os.path.join(path, f"{panel_fingerprint(X, n_components, standardize)}.npz")
+
+    if os.path.isfile(file_path):
+        try:
+            pca = FactorPCA.load(file_path)
+            os.utime(file_path)  # marks the file as recently used
+            return pca
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read {file_path} ({e}), refitting")
+
+    pca = FactorPCA(n_components=n_components, standardize=standardize).fit(X)
+    pca.save(file_path)
+    evict_saved_components(path)
+    return pca
+
+
+def evict_saved_components(path: str = None, max_bytes: int = DECOMPOSITION_MAX_BYTES) -> int:
+    """
+    Deletes the least recently used persisted decompositions until the rest fit in max_bytes.
+    Files deleted in the meantime by another process are skipped.
+
+    :return: Number of files deleted
+    """
+    path = DECOMPOSITION_PATH if path is None else path
+    files = []
+    for entry in (os.scandir(path) if os.path.isdir(path) else []):
+        if entry.name.endswith('.npz'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, file_path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    if removed > 0:
+        logging.info(f"Evicted {removed} persisted decompositions, {total / 2**20:.1f} MiB kept")
+    return removed
+
+
+def clear_saved_components(path: str = None) -> None:
+    """
+    Deletes all persisted decompositions (e.g. when the database is re-created)
+    """
+    path = DECOMPOSITION_PATH if path is None else path
+    if os.path.isdir(path):
+        shutil.rmtree(path)
@@ -0,0 +1,238 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from db.columnar_store import ColumnarStore, is_columnar_store_available
+from db.queries import read_factor_data
+from common.instrumentation import instrumented
+
+FEATURE_TRANSFORMS = ('level', 'pct_change', 'log_change', 'rolling_mean', 'zscore')
+FEATURE_INPUTS = ('level', 'pct_change', 'log_change')
+FEATURE_COLUMNS = ['factor_id', 'region_id', 'date']
+
+
+def read_feature_definitions(path: str = FEATURE_DEFINITIONS_PATH) -> dict:
+    """
+    Reads and validates the declared features: {name: {transform, input, window, lag}}, where
+     - transform is one of FEATURE_TRANSFORMS
+     - input (rolling_mean / zscore only) is the series the window runs over: one of FEATURE_INPUTS,
+       'level' by default
+     - window is the number of periods of rolling_mean / zscore
+     - lag shifts the result by that many periods (0 by default)
+    """
+    with open(path) as f:
+        definitions = json.load(f)
+
+    for name, definition in definitions.items():
+        if definition.get('transform') not in FEATURE_TRANSFORMS:
+            raise ValueError(f"Feature {name}: unknown transform {definition.get('transform')}, expected one of {FEATURE_TRANSFORMS}")
+        if definition.get('input', 'level') not in FEATURE_INPUTS:
+            raise ValueError(f"Feature {name}: unknown input {definition.get('input')}, expected one of {FEATURE_INPUTS}")
+        if definition['transform'] in ('rolling_mean', 'zscore') and int(definition.get('window', 0)) < 1:
+            raise ValueError(f"Feature {name}: {definition['transform']} needs a window of at least 1 period")
+    return definitions
+
+
+def compute_features(factor_data: pd.DataFrame, definitions: dict = None) -> pd.DataFrame:
+    """
+    Computes declared features of every factor/region series. Series are scattered into one dense
+    date x series array of levels, forward-filled (changes across gaps are taken from the last
+    known level, like DataFrame.pct_change() with padding), and every transform is computed on
+    all series at once.
+
+    :param factor_data: Long factor levels with columns factor_id, region_id, date, value
+    :param definitions: Declared features (see read_feature_definitions); read from
+        FEATURE_DEFINITIONS_PATH if None
+    :return: DataFrame with columns factor_id, region_id, date and one column per feature, with
+        a row for every row of factor_data (series without any valid level are left out)
+    """
+    definitions = read_feature_definitions() if definitions is None else definitions
+
+    date_codes, dates = pd.factorize(factor_data['date'], sort=True)
+    factor_codes, factor_ids = pd.factorize(factor_data['factor_id'], sort=True)
+    region_codes, region_ids = pd.factorize(factor_data['region_id'], sort=True)
+    series, series_codes = np.unique(factor_codes * len(region_ids) + region_codes, return_inverse=True)
+
+    levels = np.full((len(dates), len(series)), np.nan)
+    levels[date_codes, series_codes] = factor_data['value'].to_numpy(dtype=float)
+    present = np.zeros(levels.shape, dtype=bool)
+    present[date_codes, series_codes] = True
+    # Series without any valid level are left out, like pivot_table(dropna=True)
+    present[:, np.isnan(levels).all(axis=0)] = False
+
+    padded = pd.DataFrame(levels, copy=False).ffill().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.full(padded.shape, np.nan)
+        ratios[1:] = padded[1:] / padded[:-1]
+        inputs = {
+            'level': padded,
+            'pct_change': ratios - 1,
+            'log_change': np.log(ratios),
+        }
+
+    # Output rows ordered by factor_id, region_id, date
+    out_series, out_dates = np.nonzero(present.T)
+    features = pd.DataFrame({
+        'factor_id': np.asarray(factor_ids)[series[out_series] // len(region_ids)],
+        'region_id': np.asarray(region_ids)[series[out_series] % len(region_ids)],
+        'date': np.asarray(dates)[out_dates],
+    })
+
+    for name, definition in definitions.items():
+        transform, window = definition['transform'], int(definition.get('window', 0))
+        if transform in FEATURE_INPUTS:
+            values = inputs[transform]
+        else:
+            # Windows with a missing or infinite value are NaN
+            x = inputs[definition.get('input', 'level')]
+            rolling = pd.DataFrame(np.where(np.isfinite(x), x, np.nan), copy=False).rolling(window)
+            mean = rolling.mean().to_numpy()
+            if transform == 'rolling_mean':
+                values = mean
+            else:
+                std = rolling.std().to_numpy()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values = np.where(std > 0, (x - mean) / std, np.nan)
+
+        lag = int(definition.get('lag', 0))
+        if lag > 0:
+            values = np.vstack([np.full((min(lag, len(values)), values.shape[1]), np.nan), values[:-lag]])
+
+        features[name] = values[out_dates, out_series]
+
+    return features
+
+
+def feature_panel(features: pd.DataFrame, feature: str) -> pd.DataFrame:
+    """
+    One feature of every factor/region series, side by side
+
+    :param features: Long features with factor and region names, as returned by FeatureStore.read
+    :param feature: Name of the feature
+    :return: DataFrame indexed by date with one column per (factor_name, region_name)
+    """
+    date_codes, dates = pd.factorize(features['date'], sort=True)
+    factor_codes, factor_names = pd.factorize(features['factor_name'], sort=True)
+    region_codes, region_names = pd.factorize(features['region_name'], sort=True)
+    series, series_codes = np.unique(factor_codes * len(region_names) + region_codes, return_inverse=True)
+
+    values = np.full((len(dates), len(series)), np.nan)
+    values[date_codes, series_codes] = features[feature].to_numpy(dtype=float)
+
+    columns = pd.MultiIndex.from_arrays(
+        [np.asarray(factor_names)[series // len(region_names)], np.asarray(region_names)[series % len(region_names)]],
+        names=['factor_name', 'region_name'],
+    )
+    return pd.DataFrame(values, index=pd.Index(np.asarray(dates), name='date'), columns=columns, copy=False)
+
+
+class FeatureStore:
+
+    def __init__(self, definitions: dict = None, store: ColumnarStore = None, frequency: str = None) -> None:
+        """
+        Derived features of the factor series (see read_feature_definitions), computed once at
+        ingestion and kept in the columnar store as table factor_features. Appended data only
+        writes its new dates. Without the columnar store (pyarrow missing or disabled) features
+        are computed on read instead.
+
+        :param definitions: Declared features; read from FEATURE_DEFINITIONS_PATH if None
+        :param store: Columnar store to use (defaults to the one under COLUMNAR_STORE_PATH)
+        :param frequency: Frequency factor_data is stored at (see read_factor_data)
+        """
+        self.definitions = read_feature_definitions() if definitions is None else definitions
+        self.store = store if store is not None or not is_columnar_store_available() else ColumnarStore()
+        self.frequency = frequency
+
+    def exists(self) -> bool:
+        return self.store is not None and self.store.exists('factor_features')
+
+    def is_materialized(self, features: list) -> bool:
+        return self.exists() and set(features) <= set(self.store.columns('factor_features'))
+
+    @instrumented('ingestion')
+    def rebuild(self, conn) -> None:
+        """
+        Recomputes the features of all factor data (e.g. after the declared features changed)
+        """
+        if self.store is None:
+            return
+        self.store.clear('factor_features')
+        features = compute_features(read_factor_data(conn, frequency=self.frequency), self.definitions)
+        # Ids come back from the columnar store as categoricals
+        self.store.upsert('factor_features', features.astype({'factor_id': str, 'region_id': str}))
+        logging.info(f"Feature store: rebuilt {len(self.definitions)} features")
+
+    @instrumented('ingestion')
+    def update(self, conn, factor_data: pd.DataFrame) -> None:
+        """
+        Computes features on the dates of newly written factor data. Only those dates are written;
+        the history of the touched factors is read so that windows, lags and changes across gaps
+        see the same levels as in a full rebuild.
+
+        :param conn: Connection to the SQLite database, already holding factor_data
+        :param factor_data: Rows just written to factor_data (columns factor_id, date), at the stored frequency
+        """
+        if self.store is None or len(factor_data) == 0:
+            return
+        if not self.exists():
+            return self.rebuild(conn)
+
+        first_new = factor_data['date'].min()
+        levels = read_factor_data(conn, factor_ids=factor_data['factor_id'].unique().tolist(), frequency=self.frequency)
+        features = compute_features(levels[['factor_id', 'region_id', 'date', 'value']], self.definitions)
+        features = features[features['date'] >= first_new]
+        self.store.upsert('factor_features', features.astype({'factor_id': str, 'region_id': str}))
+
+    def delete(self, factor_ids: list) -> None:
+        if self.exists():
+            self.store.delete('factor_features', factor_ids)
+
+    def read(self, conn, features: list = None, factor_ids: list = None, region_ids: list = None,
+             start: str = None, end: str = None) -> pd.DataFrame:
+        """
+        Reads a factor/region/date slice of the features, together with factor and region names
+
+        :param conn: Connection to the SQLite database (catalog)
+        :param features: Features to return (all declared ones if None)
+        :param factor_ids: Factors to keep (all if None)
+        :param region_ids: Regions to keep (all if None)
+        :param start: First date to keep (inclusive, formatted as DATE_FORMAT)
+        :param end: Last date to keep (inclusive, formatted as DATE_FORMAT)
+        :return: DataFrame with columns factor_id, factor_name, region_id, region_name, date and the features
+        """
+        features = list(self.definitions) if features is None else list(features)
+
+        if self.is_materialized(features):
+            filters = None if region_ids is None else {'region_id': region_ids}
+            data = self.store.read('factor_features', keys=factor_ids, start=start, end=end, filters=filters,
+                                   columns=FEATURE_COLUMNS + features)
+        else:
+            # Full history of the series, so that the slice holds the same values as the store
+            levels = read_factor_data(conn, factor_ids=factor_ids, region_ids=region_ids, frequency=self.frequency)
+            data = compute_features(levels, {name: self.definitions[name] for name in features})
+            data = data[(data['date'] >= (start or '')) & (data['date'] <= (end or '9999'))]
+
+        factors = pd.read_sql_query("SELECT factor_id, factor_name FROM factors", conn)
+        regions = pd.read_sql_query("SELECT region_id, region_name FROM regions", conn)
+        data['factor_name'] = data['factor_id'].map(factors.set_index('factor_id')['factor_name'])
+        data['region_name'] = data['region_id'].map(regions.set_index('region_id')['region_name'])
+
+        data = data.dropna(subset=['factor_name', 'region_name'])
+        data = data.sort_values(FEATURE_COLUMNS)
+        return data[['factor_id', 'factor_name', 'region_id', 'region_name', 'date'] + features].reset_index(drop=True)
+
+
+def read_feature_panel(conn, feature: str, start: str = None, end: str = None,
+                       feature_store: FeatureStore = None) -> pd.DataFrame:
+    """
+    :param conn: Connection to the SQLite database (catalog)
+    :param feature: Name of a declared feature
+    :param start: First date to keep (inclusive, formatted as DATE_FORMAT)
+    :param end: Last date to keep (inclusive, formatted as DATE_FORMAT)
+    :param feature_store: FeatureStore to read from (a default one if None)
+    :return: The feature of every factor/region series, see feature_panel
+    """
+    feature_store = FeatureStore() if feature_store is None else feature_store
+    return feature_panel(feature_store.read(conn, [feature], start=start, end=end), feature)
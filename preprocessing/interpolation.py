@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+
+# Gap between the month numbers of consecutive series when all series are laid out on one axis
+_SERIES_STRIDE = 2**20
+
+
+def month_number(dates: pd.Series) -> np.ndarray:
+    """
+    :param dates: Dates formatted as DATE_FORMAT ('%Y-%m')
+    :return: Months since year 0 (year * 12 + month - 1)
+    """
+    # Parsed once per distinct date
+    codes, unique = pd.factorize(dates)
+    unique = pd.Series(unique).astype(str)
+    return (unique.str[:4].astype(int) * 12 + unique.str[5:7].astype(int) - 1).to_numpy()[codes]
+
+
+def month_labels(months: np.ndarray) -> np.ndarray:
+    """
+    Inverse of month_number: dates formatted as DATE_FORMAT
+    """
+    unique, inverse = np.unique(months, return_inverse=True)
+    labels = np.array([f"{m // 12:04d}-{m % 12 + 1:02d}" for m in unique], dtype=object)
+    return labels[inverse]
+
+
+def interpolate_monthly(observations: pd.DataFrame, start: str = None, end: str = None) -> pd.DataFrame:
+    """
+    Interpolates factor series stored at native (annual) frequency to month ends, the same way
+    ingestion at monthly frequency does (resample('ME').interpolate): each series gets every month
+    between its first and last stored date, linear between valid values, NaN before the first valid
+    value and held at the last valid value after it. All series are interpolated by a single
+    np.interp call, laid out side by side on one axis.
+
+    :param observations: Stored rows with columns date and value; every other column identifies the
+        series (e.g. factor_id, region_id and their names) and is repeated on the interpolated rows
+    :param start: First month to return (inclusive, formatted as DATE_FORMAT); never before DEFAULT_START_DATE
+    :param end: Last month to return (inclusive, formatted as DATE_FORMAT); never after DEFAULT_END_DATE
+    :return: DataFrame with the columns of observations, one row per series and month, ordered by series and date
+    """
+    keys = [col for col in observations.columns if col not in ('date', 'value')]
+    if len(observations) == 0:
+        return observations.iloc[:0].reset_index(drop=True)
+
+    observations = observations.sort_values(keys + ['date'])
+    months = month_number(observations['date'])
+    values = observations['value'].to_numpy(dtype=float)
+    series = observations.groupby(keys, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    n_series = series.max() + 1
+
+    # Months covered by each series (rows are sorted by date within a series), clipped to the requested window
+    starts = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+    ends = np.r_[starts[1:], len(series)] - 1
+    lo = max(month_number(pd.Series([DEFAULT_START_DATE[:7], start or DEFAULT_START_DATE[:7]])))
+    hi = min(month_number(pd.Series([DEFAULT_END_DATE[:7], end or DEFAULT_END_DATE[:7]])))
+    first_month = np.maximum(months[starts], lo)
+    n_months = np.maximum(np.minimum(months[ends], hi) - first_month + 1, 0)
+
+    valid = ~np.isnan(values)
+    first_valid = np.full(n_series, np.inf)
+    last_valid = np.full(n_series, -np.inf)
+    np.minimum.at(first_valid, series[valid], months[valid])
+    np.maximum.at(last_valid, series[valid], months[valid])
+
+    out_series = np.repeat(np.arange(n_series), n_months)
+    offsets = np.arange(len(out_series)) - np.repeat(np.cumsum(n_months) - n_months, n_months)
+    out_months = first_month[out_series] + offsets
+
+    # Months after the last valid value take that value; months before the first one are NaN
+    query = out_series * _SERIES_STRIDE + np.minimum(out_months, last_valid[out_series])
+    if valid.any():
+        interpolated = np.interp(query, series[valid] * _SERIES_STRIDE + months[valid], values[valid])
+    else:
+        interpolated = np.full(len(query), np.nan)
+    interpolated[out_months < first_valid[out_series]] = np.nan
+
+    monthly = observations[keys].iloc[starts[out_series]].reset_index(drop=True)
+    monthly['date'] = month_labels(out_months)
+    monthly['value'] = interpolated
+    return monthly[list(observations.columns)]
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+
+# 1970-01-02, the first Friday after the epoch (weekly periods end on Fridays, like resample('W-FRI'))
+_FIRST_FRIDAY = 1
+
+
+def date_numbers(dates: pd.Series) -> np.ndarray:
+    """
+    :param dates: YYYYMMDD integers (daily prices) or dates formatted as DATE_FORMAT ('%Y-%m', taken as the month's first day)
+    :return: Days since 1970-01-01
+    """
+    # Parsed once per distinct date
+    codes, unique = pd.factorize(dates)
+    unique = pd.Series(unique)
+    if pd.api.types.is_integer_dtype(unique):
+        year, month, day = unique // 10000, unique // 100 % 100, unique % 100
+    else:
+        unique = unique.astype(str)
+        year, month, day = unique.str[:4].astype(int), unique.str[5:7].astype(int), 1
+    months = ((year - 1970) * 12 + month - 1).to_numpy().astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + np.asarray(day - 1, dtype='timedelta64[D]')
+    return days.astype(np.int64)[codes]
+
+
+def period_ends(days: np.ndarray, frequency: str) -> np.ndarray:
+    """
+    :param days: Days since 1970-01-01
+    :param frequency: One of ANALYSIS_FREQUENCIES
+    :return: Last day (since 1970-01-01) of the period of every day: the day itself, the week's Friday,
+        or the first day of the last month of the month, quarter or year (months are labelled by month)
+    """
+    if frequency == 'daily':
+        return days
+    if frequency == 'weekly':
+        return days + (_FIRST_FRIDAY - days) % 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    last_month = {'monthly': months, 'quarterly': months // 3 * 3 + 2, 'annual': months // 12 * 12 + 11}[frequency]
+    return last_month.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def period_labels(ends: np.ndarray, frequency: str) -> np.ndarray:
+    """
+    :param ends: Period ends, see period_ends
+    :param frequency: One of ANALYSIS_FREQUENCIES
+    :return: Dates of the periods: '%Y-%m-%d' for daily and weekly periods, DATE_FORMAT (of the last month) otherwise
+    """
+    unique, inverse = np.unique(ends, return_inverse=True)
+    date_format = '%Y-%m-%d' if frequency in ('daily', 'weekly') else DATE_FORMAT
+    labels = pd.to_datetime(unique.astype('datetime64[D]')).strftime(date_format).to_numpy(dtype=object)
+    return labels[inverse]
+
+
+def resample_prices(prices: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """
+    Average price of every asset over each period of the given frequency, as ingestion at monthly
+    frequency does (resample('ME').mean()) - so that monthly averages of daily closes match the stored
+    monthly prices. Stored monthly averages only resample to quarterly/annual periods (as averages of
+    the months). Rows of all assets are aggregated by one bincount over (asset, period) codes.
+
+    :param prices: Columns asset_id, date (YYYYMMDD integers or DATE_FORMAT), asset_price
+    :param frequency: One of ANALYSIS_FREQUENCIES
+    :return: DataFrame with columns asset_id, date (see period_labels), asset_price, ordered by asset and date
+    """
+    columns = ['asset_id', 'date', 'asset_price']
+    if frequency not in ANALYSIS_FREQUENCIES:
+        raise ValueError(f"Unknown frequency {frequency}, expected one of {list(ANALYSIS_FREQUENCIES)}")
+    prices = prices[prices['asset_price'].notna()]
+    if len(prices) == 0:
+        return pd.DataFrame(columns=columns)
+
+    asset_codes, assets = pd.factorize(prices['asset_id'], sort=True)
+    period_codes, periods = pd.factorize(period_ends(date_numbers(prices['date']), frequency), sort=True)
+    codes = asset_codes.astype(np.int64) * len(periods) + period_codes
+    totals = np.bincount(codes, weights=prices['asset_price'].to_numpy(dtype=float))
+    counts = np.bincount(codes)
+
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'asset_id': np.asarray(assets)[present // len(periods)],
+        'date': period_labels(np.asarray(periods)[present % len(periods)], frequency),
+        'asset_price': totals[present] / counts[present],
+    })
+
+
+def compound_returns(returns, frequency: str):
+    """
+    Compounds monthly returns (or changes) into the periods of a coarser frequency: the return of a
+    period is the product of (1 + monthly return) over its months, minus 1 - NaN if none of its months
+    has one. Monthly returns are returned as they are.
+
+    :param returns: Series or DataFrame of monthly returns, indexed by date (DATE_FORMAT)
+    :param frequency: 'monthly', 'quarterly' or 'annual'
+    :return: Same type, indexed by the DATE_FORMAT date of each period (its last month)
+    """
+    if frequency == 'monthly':
+        return returns
+    if frequency not in ('quarterly', 'annual'):
+        raise ValueError(f"Monthly returns compound into 'quarterly' or 'annual' periods, not {frequency}")
+
+    labels = period_labels(period_ends(date_numbers(pd.Series(returns.index)), frequency), frequency)
+    # Products rather than sums of logs: changes of factors with negative levels can fall below -1
+    growth = (1 + returns).groupby(labels).prod(min_count=1)
+    return (growth - 1).rename_axis(returns.index.name)
+
+
+def window_periods(months: int, frequency: str) -> int:
+    """
+    :param months: Window length in months
+    :param frequency: One of ANALYSIS_FREQUENCIES
+    :return: Number of periods of the frequency spanning about as long (at least 1)
+    """
+    return max(1, round(months * ANALYSIS_FREQUENCIES[frequency] / 12))
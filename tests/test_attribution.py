@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import RidgeCV
+
+from common.constants import *
+from calculations.calc_correlations import RidgeSolver, calc_primary_coefficients
+from calculations.calc_attribution import calc_rolling_attribution, block_bootstrap_indices, _fit_resamples, \
+    calc_bootstrap_attribution
+from preprocessing.decomposition import FactorPCA
+
+
+def make_inputs(n_periods, n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(DEFAULT_START_DATE, periods=n_periods, freq='ME').strftime(DATE_FORMAT)
+    X = pd.DataFrame(rng.normal(size=(n_periods, n_features)), index=dates, columns=[f"F{i:03d}" for i in range(n_features)])
+    y = pd.Series(X.to_numpy()[:, :3] @ rng.normal(size=3) * 0.01 + rng.normal(0, 0.03, size=n_periods), index=dates)
+    return X, y
+
+
+def ridgecv(X, y):
+    return RidgeCV(alphas=ATTRIBUTION_ALPHAS).fit(X, y)
+
+
+# Fewer periods than features and more
+@pytest.mark.parametrize('n_periods, n_features', [(36, 200), (120, 15)])
+def test_ridge_solver_matches_ridgecv(n_periods, n_features):
+    X, y = make_inputs(n_periods, n_features)
+    Y = pd.DataFrame({'a': y, 'b': y[::-1].to_numpy()}, index=y.index)
+
+    coefficients, alphas = RidgeSolver(X).fit(Y)
+
+    for target in Y.columns:
+        model = ridgecv(X.to_numpy(), Y[target].to_numpy())
+        np.testing.assert_allclose(coefficients[target].to_numpy(), model.coef_, atol=1e-10)
+        assert alphas[target] == model.alpha_
+
+
+def test_primary_coefficients_match_ridgecv():
+    X, y = make_inputs(36, 50)
+    coefficients = calc_primary_coefficients(X, y)
+    assert list(coefficients.columns) == ['Feature', 'Coefficient']
+    assert list(coefficients['Feature']) == list(X.columns)
+    np.testing.assert_allclose(coefficients['Coefficient'].to_numpy(), ridgecv(X.to_numpy(), y.to_numpy()).coef_, atol=1e-10)
+
+
+def test_cached_solver_gives_the_same_coefficients():
+    X, y = make_inputs(60, 30)
+    solver = RidgeSolver(X)
+    pd.testing.assert_frame_equal(calc_primary_coefficients(X, y, solver=solver), calc_primary_coefficients(X, y))
+
+
+@pytest.mark.parametrize('n_features, window, expanding', [(60, 24, False), (8, 24, False), (60, 24, True)])
+def test_rolling_attribution_matches_ridgecv_loop(n_features, window, expanding):
+    X, y = make_inputs(72, n_features)
+
+    coefficients, alphas = calc_rolling_attribution(X, y, window=window, expanding=expanding, n_workers=1)
+
+    assert len(coefficients) == len(y) - window + 1
+    for i, end in enumerate(range(window, len(y) + 1)):
+        start = 0 if expanding else end - window
+        model = ridgecv(X.to_numpy()[start:end], y.to_numpy()[start:end])
+        np.testing.assert_allclose(coefficients.iloc[i].to_numpy(), model.coef_, atol=1e-8)
+        assert alphas.iloc[i] == model.alpha_
+
+
+def test_rolling_attribution_does_not_depend_on_workers():
+    X, y = make_inputs(48, 20)
+
+    in_process = calc_rolling_attribution(X, y, window=12, n_workers=1)
+    pooled = calc_rolling_attribution(X, y, window=12, n_workers=2)
+
+    pd.testing.assert_frame_equal(in_process[0], pooled[0])
+    pd.testing.assert_series_equal(in_process[1], pooled[1])
+
+
+def test_block_bootstrap_indices_are_blocks_of_consecutive_periods():
+    indices = block_bootstrap_indices(40, 50, block_length=5, seed=1)
+
+    assert indices.shape == (50, 40)
+    assert indices.min() >= 0 and indices.max() < 40
+    blocks = indices.reshape(50, 8, 5)
+    assert (np.diff(blocks, axis=2) == 1).all()
+    np.testing.assert_array_equal(indices, block_bootstrap_indices(40, 50, block_length=5, seed=1))
+
+
+@pytest.mark.parametrize('n_periods, n_features', [(36, 200), (36, 10), (120, 40)])
+def test_bootstrap_fits_match_ridgecv_on_resamples(n_periods, n_features):
+    X, y = make_inputs(n_periods, n_features)
+    X_values, y_values = X.to_numpy(), y.to_numpy()
+    indices = block_bootstrap_indices(n_periods, 20, seed=2)
+
+    coefficients, alphas = _fit_resamples(X_values, y_values, indices, ATTRIBUTION_ALPHAS)
+
+    for rows, coefs, alpha in zip(indices, coefficients, alphas):
+        model = ridgecv(X_values[rows], y_values[rows])
+        np.testing.assert_allclose(coefs, model.coef_, atol=1e-10)
+        assert alpha == model.alpha_
+
+
+def test_bootstrap_attribution_does_not_depend_on_chunks():
+    X, y = make_inputs(36, 30)
+
+    intervals = calc_bootstrap_attribution(X, y, n_resamples=100, chunk_size=100, n_workers=1)
+    chunked = calc_bootstrap_attribution(X, y, n_resamples=100, chunk_size=7, n_workers=1)
+
+    pd.testing.assert_frame_equal(intervals, chunked)
+    assert list(intervals.index) == list(X.columns)
+    assert (intervals['CI low'] <= intervals['CI high']).all()
+    assert intervals['Positive share'].between(0, 1).all()
+    assert intervals['Median rank'].between(1, X.shape[1]).all()
+
+
+def test_bootstrap_attribution_on_components_maps_every_resample_back():
+    X, y = make_inputs(48, 40)
+    pca = FactorPCA(n_components=5).fit(X)
+    indices = block_bootstrap_indices(len(y), 50, seed=0)
+
+    intervals = calc_bootstrap_attribution(X, y, pca=pca, n_resamples=50, n_workers=1)
+
+    component_coefficients, _ = _fit_resamples(pca.transform(X).to_numpy(), y.to_numpy(), indices, ATTRIBUTION_ALPHAS)
+    coefficients = np.array([pca.inverse_coefficients(g).to_numpy() for g in component_coefficients])
+    np.testing.assert_allclose(intervals['CI low'].to_numpy(), np.quantile(coefficients, 0.025, axis=0), atol=1e-14)
+    np.testing.assert_allclose(intervals['CI high'].to_numpy(), np.quantile(coefficients, 0.975, axis=0), atol=1e-14)
+    np.testing.assert_array_equal(intervals['Positive share'].to_numpy(), (coefficients > 0).mean(axis=0))
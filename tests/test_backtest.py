@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.constants import *
+from calculations.calc_backtest import BacktestEngine, BACKTEST_PARAMETERS, BACKTEST_SUMMARY
+
+PERIODS_PER_YEAR = 12
+RISK_FREE_RATE = 0.02
+DATES = pd.date_range('2015-01-31', periods=48, freq='ME').strftime(DATE_FORMAT)
+
+
+@pytest.fixture
+def inputs():
+    rng = np.random.default_rng(0)
+    rows = []
+    for asset_id, drift in zip(['AAA', 'BBB', 'CCC', 'DDD'], [0.01, -0.005, 0.002, 0.02]):
+        prices = 100 * np.exp(np.cumsum(rng.normal(drift, 0.06, size=len(DATES))))
+        rows += [(asset_id, date, price) for date, price in zip(DATES, prices)]
+    prices = pd.DataFrame(rows, columns=['asset_id', 'date', 'asset_price'])
+    # DDD is listed late
+    prices = prices[(prices['asset_id'] != 'DDD') | (prices['date'] >= DATES[10])].reset_index(drop=True)
+
+    allocation = pd.DataFrame([
+        ('PF_1', 'AAA', 0.2), ('PF_1', 'BBB', 0.3), ('PF_1', 'CCC', 0.5),
+        ('PF_2', 'CCC', 2.0), ('PF_2', 'DDD', 2.0),  # weights are scaled to sum to 1
+        ('PF_3', 'DDD', 1.0),  # starts with its only asset
+    ], columns=['portfolio_id', 'asset_id', 'asset_weight'])
+    return prices, allocation
+
+
+def naive_backtest(prices, allocation, portfolio_id, frequency, threshold, cost_bps) -> dict:
+    # Value of every holding followed period by period, rebalanced with explicit trades
+    price_tbl = prices.pivot(index='date', columns='asset_id', values='asset_price').sort_index().ffill()
+    holdings = allocation[allocation['portfolio_id'] == portfolio_id].set_index('asset_id')['asset_weight']
+    targets = holdings / holdings.sum()
+    start = int(np.argmax(price_tbl[targets.index].notna().any(axis=1).to_numpy()))
+
+    values = targets.copy()
+    returns, wealth = [], [1.0]
+    rebalances, traded, kept = 0, 0.0, 1.0
+    for t in range(start + 1, len(price_tbl)):
+        for asset_id in values.index:
+            previous, current = price_tbl[asset_id].iloc[t - 1], price_tbl[asset_id].iloc[t]
+            if not np.isnan(previous) and not np.isnan(current):
+                values[asset_id] *= current / previous
+
+        weights = values / values.sum()
+        if frequency > 0 and (t - start) % frequency == 0 and (targets - weights).abs().max() > threshold:
+            trade = (targets - weights).abs().sum()
+            values = targets * values.sum() * (1 - trade * cost_bps / 1e4)
+            rebalances, traded, kept = rebalances + 1, traded + trade, kept * (1 - trade * cost_bps / 1e4)
+
+        returns.append(values.sum() / wealth[-1] - 1)
+        wealth.append(values.sum())
+
+    returns, wealth = np.array(returns), np.array(wealth)
+    years = len(returns) / PERIODS_PER_YEAR
+    std = returns.std(ddof=1)
+    return {
+        'total_return': wealth[-1] - 1,
+        'annual_return': wealth[-1] ** (1 / years) - 1,
+        'volatility': std * np.sqrt(PERIODS_PER_YEAR),
+        'sharpe': (returns.mean() - RISK_FREE_RATE / PERIODS_PER_YEAR) / std * np.sqrt(PERIODS_PER_YEAR),
+        'max_drawdown': (1 - wealth / np.maximum.accumulate(wealth)).max(),
+        'rebalances': rebalances,
+        'turnover': traded / years,
+        'costs': 1 - kept,
+    }
+
+
+def make_engine(prices, allocation) -> BacktestEngine:
+    return BacktestEngine(prices, allocation, periods_per_year=PERIODS_PER_YEAR, risk_free_rate=RISK_FREE_RATE)
+
+
+def test_sweep_matches_naive_loop(inputs):
+    prices, allocation = inputs
+
+    results = make_engine(prices, allocation).sweep(
+        frequencies=(0, 1, 3, 12), thresholds=(0.0, 0.05), cost_bps=(0.0, 25.0), n_workers=1)
+
+    assert len(results) == 3 * 4 * 2 * 2
+    for run in results.itertuples(index=False):
+        expected = naive_backtest(prices, allocation, run.portfolio_id, run.frequency, run.threshold, run.cost_bps)
+        for column in BACKTEST_SUMMARY:
+            assert getattr(run, column) == pytest.approx(expected[column], rel=1e-10, abs=1e-14), (run, column)
+    # Buy and hold never trades; rebalancing every period to zero tolerance always does
+    assert (results.loc[results['frequency'] == 0, ['rebalances', 'turnover', 'costs']] == 0).all().all()
+    monthly = results[(results['frequency'] == 1) & (results['threshold'] == 0) & (results['portfolio_id'] == 'PF_1')]
+    assert (monthly['rebalances'] == len(DATES) - 1).all()
+
+
+def test_results_do_not_depend_on_workers(inputs):
+    prices, allocation = inputs
+    engine = make_engine(prices, allocation)
+
+    in_process = engine.sweep(frequencies=(0, 1, 6), thresholds=(0.0, 0.1), cost_bps=(10.0,), n_workers=1)
+    pooled = engine.sweep(frequencies=(0, 1, 6), thresholds=(0.0, 0.1), cost_bps=(10.0,), n_workers=2)
+
+    pd.testing.assert_frame_equal(in_process, pooled)
+
+
+def test_unknown_portfolios_have_no_statistics(inputs):
+    prices, allocation = inputs
+    runs = pd.DataFrame({'portfolio_id': ['PF_1', 'UNKNOWN'], 'frequency': [1, 1], 'threshold': [0.0, 0.0], 'cost_bps': [0.0, 0.0]})
+
+    results = make_engine(prices, allocation).run(runs, n_workers=1)
+
+    assert list(results.columns) == ['portfolio_id'] + BACKTEST_PARAMETERS + BACKTEST_SUMMARY
+    assert results.loc[0, BACKTEST_SUMMARY].notna().all()
+    assert results.loc[1, BACKTEST_SUMMARY].isna().all()
@@ -0,0 +1,73 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.cache import CACHE, VersionedCache, versioned_cache, get_db_version, bump_db_version, sizeof
+
+
+@pytest.fixture
+def versions(tmp_path, monkeypatch):
+    # Version side-car files are written to db/ relative to the working directory
+    (tmp_path / 'db').mkdir()
+    monkeypatch.chdir(tmp_path)
+    CACHE.clear()
+    yield tmp_path
+    CACHE.clear()
+
+
+def test_cached_results_are_recomputed_after_bump_db_version(versions):
+    calls = []
+
+    @versioned_cache('test_square')
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    assert get_db_version() == 0
+    assert square(3) == 9 and square(3) == 9
+    assert square(4) == 16
+    assert calls == [3, 4]
+
+    assert bump_db_version() == 1
+    assert square(3) == 9
+    assert calls == [3, 4, 3]
+
+
+def test_version_is_tracked_per_database(versions):
+    cache = VersionedCache()
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+
+    assert cache.get_or_compute(('x',), compute, db_name='a.db') == 1
+    bump_db_version('b.db')
+    assert cache.get_or_compute(('x',), compute, db_name='a.db') == 1
+    bump_db_version('a.db')
+    assert cache.get_or_compute(('x',), compute, db_name='a.db') == 2
+
+
+def test_keys_ignore_connections_and_freeze_lists(versions):
+    calls = []
+
+    @versioned_cache('test_total')
+    def total(conn, values):
+        calls.append(values)
+        return sum(values)
+
+    conn_a, conn_b = sqlite3.connect(':memory:'), sqlite3.connect(':memory:')
+    assert total(conn_a, [1, 2]) == total(conn_b, np.array([1, 2])) == 3
+    assert len(calls) == 1
+    conn_a.close()
+    conn_b.close()
+
+
+def test_least_recently_used_entries_are_evicted_beyond_budget():
+    frame = pd.DataFrame(np.zeros((100, 4)))
+    cache = VersionedCache(max_bytes=int(2.5 * sizeof(frame)))
+    for key in 'abc':
+        cache.put(key, frame)
+        cache.get('a')
+
+    assert cache.get('a')[1] and cache.get('c')[1]
+    assert not cache.get('b')[1]
+    assert cache.total_bytes <= cache.max_bytes
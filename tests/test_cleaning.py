@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.cleaning import CleaningPipeline
+
+
+def make_levels(n_periods: int = 60, n_series: int = 5, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2015-01-31', periods=n_periods, freq='ME')
+    levels = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.05, size=(n_periods, n_series)), axis=0)),
+                          index=index, columns=[f"S{i}" for i in range(n_series)])
+    levels.iloc[:12, 1] = np.nan  # late start
+    levels.iloc[20:23, 2] = np.nan  # gap inside the first block
+    levels.iloc[38:44, 3] = np.nan  # gap across the end of the first block
+    levels.iloc[45, 0] = 0.0  # infinite change in the second block
+    levels.iloc[:, 4] = np.nan  # empty
+    return levels
+
+
+# Policies whose fitted state carries over exactly between blocks
+@pytest.mark.parametrize('kwargs', [
+    {'pct_change': True, 'fill': 'ffill', 'inf': 'cap'},
+    {'pct_change': True, 'fill': 'zero', 'inf': 'nan'},
+    {'pct_change': False, 'fill': 'ffill', 'inf': 'keep', 'dtype': np.float32},
+    {'pct_change': True, 'fill': None, 'inf': 'cap'},
+])
+def test_transform_continues_fit_transform(kwargs):
+    levels = make_levels()
+
+    full = CleaningPipeline(**kwargs).fit_transform(levels, copy=True)
+    pipeline = CleaningPipeline(**kwargs)
+    blocks = pd.concat([pipeline.fit_transform(levels.iloc[:40], copy=True),
+                        pipeline.transform(levels.iloc[40:50], copy=True),
+                        pipeline.transform(levels.iloc[50:], copy=True)])
+
+    assert 'S4' not in full.columns
+    pd.testing.assert_frame_equal(blocks, full)
+
+
+def test_fit_transform_matches_pandas():
+    levels = make_levels()
+
+    result = CleaningPipeline(pct_change=True, fill='bfill_ffill', inf='cap', inf_value=999.0).fit_transform(levels, copy=True)
+    expected = levels.pct_change(fill_method=None).replace([np.inf, -np.inf], [999.0, -999.0]).bfill().ffill()
+
+    pd.testing.assert_frame_equal(result, expected.dropna(axis=1, how='all'))
+
+
+def test_fitted_means_and_clip_bounds_apply_to_new_periods():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(100, 3))
+    X[rng.random(X.shape) < 0.1] = np.nan
+    pipeline = CleaningPipeline(fill='mean', clip_quantiles=(0.05, 0.95))
+
+    fitted = pipeline.fit_transform(X, copy=True)
+    new = pipeline.transform(np.array([[np.nan, 100.0, -100.0]]))
+
+    # Outliers are clipped after filling
+    means = np.nanmean(X, axis=0)
+    low, high = np.quantile(np.where(np.isnan(X), means, X), [0.05, 0.95], axis=0)
+    np.testing.assert_allclose(new[0], [np.clip(means[0], low[0], high[0]), high[1], low[2]])
+    assert ((fitted >= low - 1e-12) & (fitted <= high + 1e-12)).all()
+
+
+def test_transform_before_fit_and_unknown_policies_raise():
+    with pytest.raises(RuntimeError):
+        CleaningPipeline().transform(np.zeros((2, 2)))
+    with pytest.raises(ValueError):
+        CleaningPipeline(fill='interpolate')
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculations.calc_correlations import RollingCorrelationEngine, rank_correlations
+
+
+def make_series(n_periods: int = 120, n_series: int = 6, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2010-01-31', periods=n_periods, freq='ME')
+    y = pd.Series(rng.normal(0.01, 0.04, size=n_periods), index=index)
+    X = pd.DataFrame(rng.normal(0, 1, size=(n_periods, n_series)), index=index, columns=[f"S{i}" for i in range(n_series)])
+    X['S0'] += 20 * y  # strongly correlated
+    return y, X
+
+
+@pytest.mark.parametrize('window', [2, 12, 36, 120, 121])
+def test_rolling_corr_matches_pandas(window):
+    y, X = make_series()
+
+    result = RollingCorrelationEngine(y, X).rolling_corr(window)
+    expected = pd.DataFrame({col: X[col].rolling(window).corr(y) for col in X.columns})
+
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-9, atol=1e-12)
+
+
+def test_rolling_corr_with_missing_values_and_constant_series():
+    y, X = make_series()
+    y.iloc[40:43] = np.nan
+    X.iloc[:30, 1] = np.nan  # series starting late
+    X.iloc[70:75, 2] = np.nan  # gap
+    X.iloc[:, 3] = 1.5  # constant
+    X = X.drop(X.index[90:95])  # dates missing from X altogether
+
+    result = RollingCorrelationEngine(y, X).rolling_corr(12)
+    X = X.reindex(y.index)
+    expected = pd.DataFrame({col: X[col].rolling(12).corr(y) for col in X.columns})
+
+    # pandas returns +-inf from rounding noise for a constant series, where no correlation is defined
+    assert result['S3'].isna().all()
+    pd.testing.assert_frame_equal(result.drop(columns='S3'), expected.drop(columns='S3'), rtol=1e-9, atol=1e-12)
+
+
+def test_rank_correlations_orders_by_mean_absolute_correlation():
+    y, X = make_series()
+    X.iloc[:100, 5] = np.nan  # too few windows to be ranked
+
+    ranking = rank_correlations(RollingCorrelationEngine(y, X).rolling_corr(24), top_k=3)
+
+    assert len(ranking) == 3
+    assert ranking.iloc[0, 0] == 'S0'
+    assert 'S5' not in set(ranking.iloc[:, 0])
+    assert ranking['mean_abs_corr'].is_monotonic_decreasing
@@ -0,0 +1,143 @@
+import os
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.fetchers import FixtureFetcher
+from db.data_ingestion import diff_table_rows, apply_table_diff, bulk_insert, get_ticker_date_ranges, ingest_ticker_data
+from db.queries import read_stored_asset_prices
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KEY = ['portfolio_id', 'asset_id']
+
+
+def allocation(rows):
+    return pd.DataFrame(rows, columns=KEY + ['asset_weight'])
+
+
+def test_diff_table_rows_finds_new_changed_and_deleted_rows():
+    before = allocation([('P1', 'A', 0.5), ('P1', 'B', 0.5), ('P2', 'A', np.nan), ('P2', 'C', 1.0)])
+    after = allocation([('P1', 'A', 0.5), ('P1', 'B', 0.4), ('P2', 'A', np.nan), ('P3', 'D', 1.0)])
+
+    upserts, deletes = diff_table_rows(before, after, KEY)
+
+    assert sorted(upserts.itertuples(index=False, name=None)) == [('P1', 'B', 0.4), ('P3', 'D', 1.0)]
+    assert list(deletes.itertuples(index=False, name=None)) == [('P2', 'C')]
+
+
+def test_diff_table_rows_skips_incomplete_keys_and_keeps_first_duplicate():
+    before = allocation([('P1', 'A', 1.0)])
+    after = allocation([('P1', 'A', 1.0), ('P1', None, 0.3), ('P1', 'B', 0.2), ('P1', 'B', 0.8)])
+
+    upserts, deletes = diff_table_rows(before, after, KEY)
+
+    assert list(upserts.itertuples(index=False, name=None)) == [('P1', 'B', 0.2)]
+    assert len(deletes) == 0
+
+
+def test_diff_table_rows_of_identical_tables_is_empty():
+    rows = allocation([('P1', 'A', 0.25), ('P1', 'B', np.nan)])
+    upserts, deletes = diff_table_rows(rows, rows.copy(), KEY)
+    assert len(upserts) == 0 and len(deletes) == 0
+
+
+def test_applied_diff_turns_stored_rows_into_new_rows():
+    before = allocation([('P1', 'A', 0.5), ('P1', 'B', 0.5), ('P2', 'C', 1.0)])
+    after = allocation([('P1', 'A', 0.7), ('P1', 'B', 0.5), ('P3', 'D', 1.0)])
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE asset_allocation (portfolio_id TEXT, asset_id TEXT, asset_weight REAL, "
+                 "PRIMARY KEY (portfolio_id, asset_id))")
+    bulk_insert(conn, 'asset_allocation', before)
+
+    apply_table_diff(conn, 'asset_allocation', *diff_table_rows(before, after, KEY), KEY)
+
+    stored = pd.read_sql_query("SELECT * FROM asset_allocation ORDER BY portfolio_id, asset_id", conn)
+    pd.testing.assert_frame_equal(stored, after)
+    conn.close()
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # Empty project (config and db folders) as the working directory
+    shutil.copytree(os.path.join(PROJECT_ROOT, 'config'), tmp_path / 'config')
+    (tmp_path / 'db').mkdir()
+    monkeypatch.chdir(tmp_path)
+    DataBase(full_rebuild=True)
+    yield tmp_path
+    close_db_connections()
+    CACHE.clear()
+
+
+class RecordingFetcher(FixtureFetcher):
+    # Fixture prices, recording the date ranges requested
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.requests = []
+
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        self.requests.append(dict(date_ranges))
+        return super().fetch_prices(date_ranges)
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    path = tmp_path / 'fixtures'
+    path.mkdir()
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', '2021-12-31')
+    for ticker in ['AAA', 'BBB']:
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(dates))))
+        pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'close': closes}).to_csv(path / f"{ticker}.csv", index=False)
+    pd.DataFrame({'asset_id': ['AAA', 'BBB'], 'asset_name': ['Asset A', 'Asset B']}).to_csv(path / 'assets.csv', index=False)
+    return str(path)
+
+
+def test_refetch_ranges_start_at_the_last_stored_period(project):
+    with db_connection() as conn:
+        bulk_insert(conn, 'asset_prices', pd.DataFrame(
+            {'asset_id': ['AAA', 'AAA', 'BBB'], 'date': ['2021-02', '2021-03', '2021-05'], 'asset_price': [1.0, 1.0, 1.0]}))
+        bulk_insert(conn, 'asset_prices_daily', pd.DataFrame(
+            {'asset_id': ['AAA', 'BBB'], 'date': [20210315, 20210531], 'asset_price': [1.0, 1.0]}))
+
+        monthly = get_ticker_date_ranges(conn, ['AAA', 'BBB', 'NEW'], '2020-01-01', '2021-06-01', 'monthly')
+        daily = get_ticker_date_ranges(conn, ['AAA', 'BBB', 'NEW'], '2020-01-01', '2021-06-01', 'daily')
+
+    # The last stored month is fetched again, since its average may be partial; BBB's daily closes are up to date
+    assert monthly == {'AAA': ('2021-03-01', '2021-06-01'), 'BBB': ('2021-05-01', '2021-06-01'), 'NEW': ('2020-01-01', '2021-06-01')}
+    # 2021-05-31 is the last business day before end
+    assert daily == {'AAA': ('2021-03-16', '2021-06-01'), 'NEW': ('2020-01-01', '2021-06-01')}
+
+
+@pytest.mark.parametrize('frequency', ['monthly', 'daily'])
+def test_incremental_ingestion_matches_one_full_ingestion(project, fixtures, frequency):
+    fetcher = RecordingFetcher(fixtures)
+
+    def stored_prices():
+        with db_connection() as conn:
+            return read_stored_asset_prices(conn, use_columnar=False, price_frequency=frequency).sort_values(['asset_id', 'date'], ignore_index=True)
+
+    # The first ingestion ends in the middle of March, whose monthly average is then partial
+    ingest_ticker_data(['AAA', 'BBB'], fetcher=fetcher, frequency=frequency, start='2020-01-01', end='2021-03-16')
+    ingest_ticker_data(['AAA', 'BBB'], fetcher=fetcher, frequency=frequency, start='2020-01-01', end='2021-07-01')
+    ingest_ticker_data(['AAA', 'BBB'], fetcher=fetcher, frequency=frequency, start='2020-01-01', end='2021-07-01')
+    incremental = stored_prices()
+
+    DataBase(full_rebuild=True)
+    CACHE.clear()
+    ingest_ticker_data(['AAA', 'BBB'], fetcher=FixtureFetcher(fixtures), frequency=frequency, start='2020-01-01', end='2021-07-01')
+    full = stored_prices()
+
+    # Monthly prices recompute the last stored month; daily closes continue after the last one
+    if frequency == 'monthly':
+        assert fetcher.requests[1:] == [{'AAA': ('2021-03-01', '2021-07-01'), 'BBB': ('2021-03-01', '2021-07-01')},
+                                        {'AAA': ('2021-06-01', '2021-07-01'), 'BBB': ('2021-06-01', '2021-07-01')}]
+    else:
+        assert fetcher.requests[1:] == [{'AAA': ('2021-03-16', '2021-07-01'), 'BBB': ('2021-03-16', '2021-07-01')}]
+    pd.testing.assert_frame_equal(incremental, full)
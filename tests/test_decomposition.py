@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.decomposition import FactorPCA, load_or_fit_pca, evict_saved_components, panel_fingerprint
+
+
+def make_panel(n_periods: int = 80, n_series: int = 30, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(size=(n_periods, 3))
+    values = factors @ rng.normal(size=(3, n_series)) + 0.1 * rng.normal(size=(n_periods, n_series))
+    values *= rng.uniform(0.5, 20, size=n_series)  # different units
+    return pd.DataFrame(values, index=pd.date_range('2010-01-31', periods=n_periods, freq='ME'),
+                        columns=pd.Index([f"F{i:02d}" for i in range(n_series)], name='series'))
+
+
+def test_inverse_coefficients_reproduce_predictions():
+    X = make_panel()
+    pca = FactorPCA(n_components=5).fit(X)
+    scores = pca.transform(X)
+    g = np.random.default_rng(1).normal(size=scores.shape[1])
+
+    b = pca.inverse_coefficients(g)
+
+    assert list(b.index) == list(X.columns)
+    predictions = X.to_numpy() @ b.to_numpy()
+    np.testing.assert_allclose(predictions - predictions.mean(), scores.to_numpy() @ g, atol=1e-10)
+
+
+def test_inverse_coefficients_of_all_components_match_least_squares():
+    X = make_panel(n_series=8)
+    y = X.to_numpy() @ np.linspace(-1, 1, 8) + 3.0
+    pca = FactorPCA(n_components=8).fit(X)
+    scores = pca.transform(X).to_numpy()
+
+    g = np.linalg.lstsq(scores - scores.mean(axis=0), y - y.mean(), rcond=None)[0]
+
+    np.testing.assert_allclose(pca.inverse_coefficients(g).to_numpy(), np.linspace(-1, 1, 8), atol=1e-8)
+
+
+def test_inverse_coefficients_of_several_targets_at_once():
+    X = make_panel()
+    pca = FactorPCA(n_components=5).fit(X)
+    G = pd.DataFrame(np.random.default_rng(2).normal(size=(5, 3)), index=pca.component_names, columns=['a', 'b', 'c'])
+
+    B = pca.inverse_coefficients(G)
+
+    assert list(B.index) == list(X.columns) and list(B.columns) == ['a', 'b', 'c']
+    for target in G.columns:
+        np.testing.assert_allclose(B[target].to_numpy(), pca.inverse_coefficients(G[target]).to_numpy(), rtol=1e-14)
+    np.testing.assert_array_equal(pca.inverse_coefficients(G.to_numpy()).to_numpy(), B.to_numpy())
+
+
+def test_load_or_fit_pca_round_trip(tmp_path, monkeypatch):
+    X = make_panel()
+    fitted = load_or_fit_pca(X, n_components=4, path=str(tmp_path))
+    assert os.path.isfile(tmp_path / f"{panel_fingerprint(X, 4)}.npz")
+
+    def refit(self, X):
+        raise AssertionError('Decomposition refitted instead of loaded')
+    monkeypatch.setattr(FactorPCA, 'fit', refit)
+    loaded = load_or_fit_pca(X, n_components=4, path=str(tmp_path))
+
+    pd.testing.assert_index_equal(loaded.columns, fitted.columns)
+    for attribute in ['mean', 'scale', 'components', 'explained_variance_ratio']:
+        np.testing.assert_array_equal(getattr(loaded, attribute), getattr(fitted, attribute))
+    pd.testing.assert_frame_equal(loaded.transform(X), fitted.transform(X))
+
+
+def test_corrupt_file_is_refitted(tmp_path):
+    X = make_panel()
+    (tmp_path / f"{panel_fingerprint(X, 4)}.npz").write_bytes(b'not an archive')
+
+    pca = load_or_fit_pca(X, n_components=4, path=str(tmp_path))
+
+    assert FactorPCA.load(str(tmp_path / f"{panel_fingerprint(X, 4)}.npz")).components.shape == pca.components.shape
+
+
+def test_eviction_keeps_recently_used_decompositions(tmp_path):
+    panels = [make_panel(seed=seed) for seed in range(4)]
+    paths = []
+    for i, X in enumerate(panels):
+        load_or_fit_pca(X, n_components=4, path=str(tmp_path))
+        paths.append(tmp_path / f"{panel_fingerprint(X, 4)}.npz")
+        os.utime(paths[-1], (i, i))
+    load_or_fit_pca(panels[0], n_components=4, path=str(tmp_path))  # read again: most recently used
+    size = os.path.getsize(paths[0])
+
+    assert evict_saved_components(str(tmp_path), max_bytes=10 * size) == 0
+    assert evict_saved_components(str(tmp_path), max_bytes=2 * size) == 2
+
+    assert [path.exists() for path in paths] == [True, False, False, True]
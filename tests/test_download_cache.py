@@ -0,0 +1,156 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.download_cache import DownloadCache
+from db.fetchers import PriceFetcher, FixtureFetcher, CachingFetcher, get_default_fetcher
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICKERS = ['AAA', 'BBB', '^CCC']
+START, END = '2020-01-01', '2022-01-01'
+
+
+class UnreachableFetcher(PriceFetcher):
+    # Stands in for Yahoo Finance without network: any request fails the test
+    def fetch_prices(self, date_ranges: dict) -> pd.DataFrame:
+        raise AssertionError(f"Provider called for {list(date_ranges)}")
+
+    def fetch_names(self, tickers: list) -> dict:
+        raise AssertionError(f"Provider called for {tickers}")
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    path = tmp_path / 'fixtures'
+    path.mkdir()
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(START, END, inclusive='left')
+    for ticker in TICKERS:
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(dates))))
+        pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'close': closes}).to_csv(path / f"{ticker}.csv", index=False)
+    pd.DataFrame({'asset_id': TICKERS, 'asset_name': [f"Asset {t}" for t in TICKERS]}).to_csv(path / 'assets.csv', index=False)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DownloadCache(root=str(tmp_path / 'downloads'))
+
+
+def test_offline_replay_returns_the_downloaded_prices(fixtures, cache):
+    ranges = {ticker: (START, END) for ticker in TICKERS}
+    downloaded = CachingFetcher(FixtureFetcher(fixtures), cache).fetch_prices(ranges)
+    names = CachingFetcher(FixtureFetcher(fixtures), cache).fetch_names(TICKERS)
+
+    offline = CachingFetcher(UnreachableFetcher(), cache, mode='offline')
+
+    pd.testing.assert_frame_equal(offline.fetch_prices(ranges), downloaded)
+    pd.testing.assert_frame_equal(downloaded, FixtureFetcher(fixtures).fetch_prices(ranges), check_freq=False)
+    assert offline.fetch_names(TICKERS) == names == {t: f"Asset {t}" for t in TICKERS}
+
+
+def test_offline_replay_serves_sub_ranges_and_skips_missing_tickers(fixtures, cache):
+    CachingFetcher(FixtureFetcher(fixtures), cache).fetch_prices({ticker: (START, END) for ticker in TICKERS})
+    offline = CachingFetcher(UnreachableFetcher(), cache, mode='offline')
+
+    prices = offline.fetch_prices({'AAA': ('2021-03-01', '2021-06-01'), 'ZZZ': (START, END)})
+
+    expected = FixtureFetcher(fixtures).fetch_prices({'AAA': ('2021-03-01', '2021-06-01')})
+    assert list(prices.columns) == ['AAA']
+    np.testing.assert_array_equal(prices['AAA'].to_numpy(), expected['AAA'].to_numpy())
+    assert offline.fetch_names(['ZZZ']) == {'ZZZ': ''}
+
+
+def test_stale_responses_are_downloaded_again_online_only(fixtures, tmp_path):
+    root = str(tmp_path / 'downloads')
+    ranges = {'AAA': (START, END)}
+    CachingFetcher(FixtureFetcher(fixtures), DownloadCache(root=root)).fetch_prices(ranges)
+    expired = DownloadCache(root=root, ttl_seconds=-1)
+
+    assert expired.get('prices', 'AAA', (START, END, '1d')) is None
+    assert len(CachingFetcher(UnreachableFetcher(), expired, mode='offline').fetch_prices(ranges)) > 0
+    with pytest.raises(AssertionError, match='Provider called'):
+        CachingFetcher(UnreachableFetcher(), expired).fetch_prices(ranges)
+
+
+def test_identical_responses_are_stored_once(cache):
+    cache.put('prices', 'AAA', ('2020-01-01', '2021-01-01', '1d'), b'same content')
+    cache.put('prices', 'BBB', ('2020-01-01', '2021-01-01', '1d'), b'same content')
+
+    assert len(cache._object_paths()) == 1
+    assert cache.get('prices', 'BBB', ('2020-01-01', '2021-01-01', '1d')) == b'same content'
+
+
+def test_eviction_removes_least_recently_used_responses(cache):
+    for i in range(10):
+        cache.put('prices', f"T{i}", (START, END, '1d'), os.urandom(2000))
+        os.utime(cache.ref_path('prices', f"T{i}", (START, END, '1d')), (i, i))
+    assert cache.get('prices', 'T0', (START, END, '1d')) is not None  # used last
+
+    assert DownloadCache(root=cache.root, max_bytes=10**9).evict() == 0
+    budget = cache.size() // 2
+    removed = DownloadCache(root=cache.root, max_bytes=budget).evict()
+
+    assert removed > 0
+    assert cache.size() <= budget
+    assert cache.get('prices', 'T0', (START, END, '1d')) is not None
+    assert cache.get('prices', 'T1', (START, END, '1d')) is None
+
+
+def test_eviction_tolerates_files_removed_concurrently(cache, monkeypatch):
+    for i in range(5):
+        cache.put('prices', f"T{i}", (START, END, '1d'), os.urandom(2000))
+    small = DownloadCache(root=cache.root, max_bytes=1)
+
+    # Another process evicts everything between the listing and the removals
+    listed = small._object_paths()
+    monkeypatch.setattr(small, '_object_paths', lambda: listed)
+    shutil.rmtree(os.path.join(cache.root, 'objects'))
+
+    small.evict()
+
+
+def test_default_fetcher_mode_from_environment(monkeypatch):
+    monkeypatch.delenv('PRICE_FIXTURES_PATH', raising=False)
+    monkeypatch.setenv('DOWNLOAD_CACHE_MODE', 'offline')
+    fetcher = get_default_fetcher()
+    assert isinstance(fetcher, CachingFetcher) and fetcher.mode == 'offline'
+
+    monkeypatch.setenv('DOWNLOAD_CACHE_MODE', 'bogus')
+    with pytest.raises(ValueError):
+        get_default_fetcher()
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # Empty project (config and db folders) as the working directory
+    shutil.copytree(os.path.join(PROJECT_ROOT, 'config'), tmp_path / 'config')
+    (tmp_path / 'db').mkdir()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    close_db_connections()
+    CACHE.clear()
+
+
+def test_database_rebuild_runs_offline(project, fixtures, cache):
+    from db.setup import DataBase
+    from db.data_ingestion import ingest_ticker_data
+    from db.queries import read_asset_prices
+
+    def rebuild(fetcher):
+        DataBase(full_rebuild=True)
+        CACHE.clear()
+        ingest_ticker_data(TICKERS, fetcher=fetcher, start=START, end=END)
+        with db_connection() as conn:
+            return read_asset_prices(conn, use_columnar=False).sort_values(['asset_id', 'date'], ignore_index=True)
+
+    online = rebuild(CachingFetcher(FixtureFetcher(fixtures), cache))
+    offline = rebuild(CachingFetcher(UnreachableFetcher(), cache, mode='offline'))
+
+    assert set(online['asset_id']) == set(TICKERS)
+    pd.testing.assert_frame_equal(offline, online)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+from db.columnar_store import ColumnarStore
+from db.data_ingestion import bulk_insert, write_to_columnar_store
+from preprocessing.feature_engineering import FeatureStore, compute_features, read_feature_definitions
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATES = pd.date_range('2010-01-31', periods=60, freq='ME').strftime(DATE_FORMAT)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # Empty project (config and db folders) as the working directory
+    shutil.copytree(os.path.join(PROJECT_ROOT, 'config'), tmp_path / 'config')
+    (tmp_path / 'db').mkdir()
+    monkeypatch.chdir(tmp_path)
+    DataBase(full_rebuild=True)
+    yield tmp_path
+    close_db_connections()
+    CACHE.clear()
+
+
+def make_factor_data(seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frames = []
+    for factor_id in ['F1', 'F2']:
+        for region_id in ['R1', 'R2']:
+            frames.append(pd.DataFrame({
+                'factor_id': factor_id, 'region_id': region_id, 'date': DATES,
+                'value': 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=len(DATES)))),
+            }))
+    factor_data = pd.concat(frames, ignore_index=True)
+    # Gap across the split between the first and the second ingestion, and a series starting late
+    gap = (factor_data['factor_id'] == 'F1') & (factor_data['region_id'] == 'R2') & factor_data['date'].isin(DATES[38:43])
+    late = (factor_data['factor_id'] == 'F2') & (factor_data['region_id'] == 'R1') & (factor_data['date'] < DATES[45])
+    return factor_data[~gap & ~late].reset_index(drop=True)
+
+
+def ingest(conn, factor_data: pd.DataFrame, feature_store: FeatureStore) -> None:
+    bulk_insert(conn, 'factor_data', factor_data, conflict='REPLACE')
+    write_to_columnar_store('factor_data', factor_data)
+    feature_store.update(conn, factor_data)
+
+
+def test_update_matches_rebuild(project):
+    factor_data = make_factor_data()
+    first, second = factor_data[factor_data['date'] < DATES[40]], factor_data[factor_data['date'] >= DATES[40]]
+
+    with db_connection() as conn:
+        bulk_insert(conn, 'factors', pd.DataFrame({'factor_id': ['F1', 'F2'], 'factor_name': ['Factor 1', 'Factor 2']}))
+        bulk_insert(conn, 'regions', pd.DataFrame({'region_id': ['R1', 'R2'], 'region_name': ['Region 1', 'Region 2']}))
+
+        updated = FeatureStore(frequency='monthly')
+        ingest(conn, first, updated)
+        ingest(conn, second, updated)
+        incremental = updated.read(conn)
+
+        rebuilt = FeatureStore(store=ColumnarStore(root='db/rebuilt'), frequency='monthly')
+        rebuilt.rebuild(conn)
+        full = rebuilt.read(conn)
+
+        on_read = FeatureStore(store=ColumnarStore(root='db/empty'), frequency='monthly').read(conn)
+
+    assert len(incremental) == len(factor_data)
+    assert set(incremental.columns) >= set(read_feature_definitions())
+    pd.testing.assert_frame_equal(incremental, full, check_categorical=False, check_dtype=False)
+    pd.testing.assert_frame_equal(on_read, full, check_categorical=False, check_dtype=False)
+
+
+def test_compute_features_matches_pandas():
+    factor_data = make_factor_data()
+    definitions = read_feature_definitions(os.path.join(PROJECT_ROOT, FEATURE_DEFINITIONS_PATH))
+
+    features = compute_features(factor_data, definitions).set_index(['factor_id', 'region_id', 'date'])
+
+    levels = factor_data.pivot_table(index='date', columns=['factor_id', 'region_id'], values='value').ffill()
+    changes = levels.pct_change(fill_method=None)
+    expected = {
+        'pct_change': changes,
+        'log_change': np.log(levels / levels.shift(1)),
+        'pct_change_lag_1': changes.shift(1),
+        'pct_change_lag_12': changes.shift(12),
+        'pct_change_mean_12': changes.rolling(12).mean(),
+        'level_mean_12': levels.rolling(12).mean(),
+        'level_zscore_36': (levels - levels.rolling(36).mean()) / levels.rolling(36).std(),
+    }
+    for name, panel in expected.items():
+        long = panel.stack(['factor_id', 'region_id'], future_stack=True).reorder_levels([1, 2, 0]).sort_index()
+        result = features[name].sort_index()
+        np.testing.assert_allclose(result.to_numpy(), long.reindex(result.index).to_numpy(), rtol=1e-12, atol=1e-12, err_msg=name)
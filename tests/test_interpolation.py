@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from common.constants import *
+from db.data_ingestion import annual_to_monthly, annual_observations
+from preprocessing.interpolation import interpolate_monthly
+
+
+def worldbank_rows(seed=0):
+    # Indicator data as read from a WorldBank CSV: 4 descriptive columns, then one column per year
+    rng = np.random.default_rng(seed)
+    years = [str(year) for year in range(1995, 2026)]
+    values = 100 + np.cumsum(rng.normal(0, 5, size=(6, len(years))), axis=1)
+    values[1, :8] = np.nan     # starts late
+    values[2, -6:] = np.nan    # ends early
+    values[3, 10:14] = np.nan  # gap
+    values[4, :] = np.nan      # no data
+    values[5, ::3] = np.nan    # sparse
+    df = pd.DataFrame(values, columns=years)
+    df.insert(0, 'Country Name', [f"Region {i}" for i in range(6)])
+    df.insert(1, 'Country Code', [f"R{i}" for i in range(6)])
+    df.insert(2, 'Indicator Name', 'Indicator')
+    df.insert(3, 'Indicator Code', ['F1', 'F1', 'F1', 'F2', 'F2', 'F2'])
+    return df
+
+
+def test_interpolated_annual_observations_match_monthly_ingestion():
+    df = worldbank_rows()
+    keys = ['factor_id', 'region_id', 'date']
+
+    monthly = annual_to_monthly(df).sort_values(keys).reset_index(drop=True)
+    interpolated = interpolate_monthly(annual_observations(df)).sort_values(keys).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(interpolated[keys], monthly[keys], check_dtype=False)
+    np.testing.assert_allclose(interpolated['value'].to_numpy(dtype=float), monthly['value'].to_numpy(dtype=float),
+                               rtol=1e-12, equal_nan=True)
+
+
+def test_interpolate_monthly_window():
+    observations = annual_observations(worldbank_rows())
+
+    window = interpolate_monthly(observations, start='2010-03', end='2011-02')
+    full = interpolate_monthly(observations)
+
+    assert window['date'].min() == '2010-03' and window['date'].max() == '2011-02'
+    expected = full[(full['date'] >= '2010-03') & (full['date'] <= '2011-02')].reset_index(drop=True)
+    pd.testing.assert_frame_equal(window.reset_index(drop=True), expected)
@@ -0,0 +1,161 @@
+import os
+import json
+import sys
+import time
+import subprocess
+import threading
+import pytest
+
+from common.utils import db_connection, close_db_connections
+from db import jobs
+from db.jobs import JobRunner, JOB_KINDS
+
+JOB_DB = 'test_jobs.db'
+TIMEOUT_S = 10
+
+# Shared with the stub stages, which run in the runner's worker thread
+calls = []
+gates = {}
+failures = set()
+
+
+def stub_job_stages(n_stages: int = 3, name: str = 'job') -> dict:
+    # Stage i records its call, reports progress and waits while a gate (name, i) is closed
+    def stage(i):
+        def run(progress):
+            calls.append((name, i))
+            gate = gates.get((name, i))
+            while gate is not None and not gate.is_set():
+                progress(0, 1, 'steps')
+                time.sleep(0.01)
+            if (name, i) in failures:
+                raise RuntimeError(f"stage {i} failed")
+            progress(1, 1, 'steps')
+        return run
+    return {f"stage {i}": stage(i) for i in range(n_stages)}
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    (tmp_path / 'db').mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(JOB_KINDS, 'stub', stub_job_stages)
+    calls.clear()
+    gates.clear()
+    failures.clear()
+    runner = JobRunner(JOB_DB)
+    yield runner
+    for gate in gates.values():
+        gate.set()
+    runner.executor.shutdown(wait=True)
+    close_db_connections(JOB_DB)
+
+
+def wait_for(runner, job_id, statuses=('succeeded', 'failed', 'cancelled')) -> dict:
+    deadline = time.time() + TIMEOUT_S
+    while time.time() < deadline:
+        job = runner.get_job(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} still {job['status']}")
+
+
+def wait_for_call(call) -> None:
+    deadline = time.time() + TIMEOUT_S
+    while call not in calls:
+        assert time.time() < deadline, f"{call} never started"
+        time.sleep(0.01)
+
+
+def test_submitted_job_runs_all_stages(runner):
+    job_id = runner.submit('stub', n_stages=3)
+
+    job = wait_for(runner, job_id)
+    stages = runner.get_stages(job_id)
+
+    assert job['status'] == 'succeeded' and job['error'] is None
+    assert calls == [('job', 0), ('job', 1), ('job', 2)]
+    assert list(stages['stage']) == ['stage 0', 'stage 1', 'stage 2']
+    assert (stages['status'] == 'succeeded').all()
+    assert (stages['done'] == 1).all() and (stages['unit'] == 'steps').all()
+    assert runner.latest_job(['stub'])['job_id'] == job_id
+
+
+def test_unknown_kind_is_rejected(runner):
+    with pytest.raises(ValueError):
+        runner.submit('bogus')
+
+
+def test_cancel_running_job_stops_at_next_progress_report(runner):
+    gates[('job', 1)] = threading.Event()
+    job_id = runner.submit('stub', n_stages=3)
+    wait_for_call(('job', 1))
+
+    runner.cancel(job_id)
+    job = wait_for(runner, job_id)
+
+    assert job['status'] == 'cancelled'
+    assert list(runner.get_stages(job_id)['status']) == ['succeeded', 'cancelled', 'pending']
+    assert ('job', 2) not in calls
+
+
+def test_cancel_queued_job_never_runs_it(runner):
+    gates[('first', 0)] = threading.Event()
+    first = runner.submit('stub', n_stages=1, name='first')
+    wait_for_call(('first', 0))
+    second = runner.submit('stub', n_stages=1, name='second')
+
+    runner.cancel(second)
+    assert runner.get_job(second)['status'] == 'cancelled'
+    gates[('first', 0)].set()
+
+    assert wait_for(runner, first)['status'] == 'succeeded'
+    runner.executor.submit(lambda: None).result(timeout=TIMEOUT_S)  # the second job's turn has passed
+    assert runner.get_job(second)['status'] == 'cancelled'
+    assert ('second', 0) not in calls
+
+
+def test_resume_skips_completed_stages(runner):
+    failures.add(('job', 1))
+    job_id = runner.submit('stub', n_stages=3)
+
+    job = wait_for(runner, job_id)
+    assert job['status'] == 'failed' and 'stage 1 failed' in job['error']
+    assert list(runner.get_stages(job_id)['status']) == ['succeeded', 'failed', 'pending']
+
+    failures.clear()
+    assert runner.resume(job_id)
+    job = wait_for(runner, job_id)
+
+    assert job['status'] == 'succeeded' and job['error'] is None
+    assert calls == [('job', 0), ('job', 1), ('job', 1), ('job', 2)]
+    assert not runner.resume(job_id)  # succeeded jobs are not resumable
+
+
+def test_jobs_of_ended_processes_are_marked_interrupted(runner):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    runner.set_up()
+    with db_connection(JOB_DB) as conn:
+        conn.executemany(
+            "INSERT INTO jobs (job_id, kind, params, status, created, pid) VALUES (?, 'stub', ?, ?, ?, ?)",
+            [('orphan', json.dumps({'n_stages': 1}), 'running', time.time(), process.pid),
+             ('queued_orphan', '{}', 'queued', time.time(), process.pid),
+             ('alive', '{}', 'running', time.time(), os.getpid())])
+        conn.execute("INSERT INTO job_stages (job_id, position, stage, status) VALUES ('orphan', 0, 'stage 0', 'running')")
+
+    # A new process (e.g. after a Streamlit restart) sets up its runner
+    restarted = JobRunner(JOB_DB)
+    try:
+        restarted.set_up()
+        assert jobs._pid_alive(os.getpid()) and not jobs._pid_alive(process.pid)
+        assert restarted.get_job('orphan')['status'] == 'interrupted'
+        assert restarted.get_job('queued_orphan')['status'] == 'interrupted'
+        assert restarted.get_job('alive')['status'] == 'running'
+
+        assert restarted.resume('orphan')
+        assert wait_for(restarted, 'orphan')['status'] == 'succeeded'
+        assert list(restarted.get_stages('orphan')['status']) == ['succeeded']
+    finally:
+        restarted.executor.shutdown(wait=True)
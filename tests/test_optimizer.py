@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import minimize
+from sklearn.covariance import ledoit_wolf
+
+from calculations.calc_optimizer import shrinkage_covariance, project_to_simplex, PortfolioOptimizer
+
+
+def make_returns(n_periods: int = 60, n_assets: int = 12, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.005, 0.04, size=n_periods)
+    return pd.DataFrame(
+        market[:, None] * rng.uniform(0.3, 1.5, size=n_assets) + rng.normal(0.003, 0.03, size=(n_periods, n_assets)),
+        columns=[f"A{i:02d}" for i in range(n_assets)])
+
+
+def make_optimizer(returns: pd.DataFrame, risk_free: float = 0.0) -> PortfolioOptimizer:
+    covariance, mean, _ = shrinkage_covariance(returns)
+    return PortfolioOptimizer(covariance, mean, risk_free=risk_free)
+
+
+def slsqp(objective, n_assets: int) -> np.ndarray:
+    result = minimize(objective, np.full(n_assets, 1 / n_assets), method='SLSQP', bounds=[(0, 1)] * n_assets,
+                      constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1}], options={'ftol': 1e-14, 'maxiter': 1000})
+    assert result.success
+    return result.x
+
+
+def sharpe(w, mean, covariance, risk_free=0.0) -> float:
+    return (w @ mean - risk_free) / np.sqrt(w @ covariance @ w)
+
+
+@pytest.mark.parametrize('n_periods, n_assets', [(60, 12), (30, 80)])
+def test_shrinkage_covariance_matches_ledoit_wolf(n_periods, n_assets):
+    returns = make_returns(n_periods, n_assets)
+
+    covariance, mean, shrinkage = shrinkage_covariance(returns, min_periods=2)
+    expected, expected_shrinkage = ledoit_wolf(returns.to_numpy())
+
+    np.testing.assert_allclose(covariance.to_numpy(), expected, rtol=1e-10, atol=1e-15)
+    assert shrinkage == pytest.approx(expected_shrinkage, rel=1e-10)
+    np.testing.assert_allclose(mean.to_numpy(), returns.mean().to_numpy())
+
+
+def test_shrinkage_covariance_leaves_out_short_histories():
+    returns = make_returns()
+    returns.iloc[:50, 3] = np.nan
+
+    covariance, mean, _ = shrinkage_covariance(returns, min_periods=24)
+
+    assert 'A03' not in covariance.index and list(covariance.index) == list(mean.index)
+
+
+def test_projection_onto_simplex():
+    V = np.array([[0.5, 0.8, -0.2, 3.0], [0.1, 0.1, 0.1, 0.1]])
+    mask = np.array([[True, True, True, False], [True, True, True, True]])
+
+    W = project_to_simplex(V, mask)
+
+    np.testing.assert_allclose(W, [[0.35, 0.65, 0.0, 0.0], [0.25, 0.25, 0.25, 0.25]])
+
+
+def test_min_variance_matches_slsqp():
+    returns = make_returns()
+    optimizer = make_optimizer(returns)
+    C = optimizer.covariance
+    mask = np.ones((1, C.shape[0]), dtype=bool)
+
+    W = optimizer.min_variance(mask)
+    expected = slsqp(lambda w: w @ C @ w, C.shape[0])
+
+    assert W[0] @ C @ W[0] <= expected @ C @ expected + 1e-12
+    np.testing.assert_allclose(W[0], expected, atol=1e-4)
+
+
+def test_max_sharpe_matches_slsqp():
+    returns = make_returns()
+    optimizer = make_optimizer(returns, risk_free=0.001)
+    C, mu = optimizer.covariance, optimizer.mean
+    mask = np.ones((1, C.shape[0]), dtype=bool)
+
+    W = optimizer.max_sharpe(mask)
+    expected = slsqp(lambda w: -sharpe(w, mu, C, 0.001), C.shape[0])
+
+    assert sharpe(W[0], mu, C, 0.001) >= sharpe(expected, mu, C, 0.001) - 1e-9
+    np.testing.assert_allclose(W[0], expected, atol=1e-4)
+
+
+def test_risk_parity_contributions_are_equal():
+    returns = make_returns()
+    optimizer = make_optimizer(returns)
+    mask = np.ones((2, len(optimizer.assets)), dtype=bool)
+    mask[1, ::2] = False
+
+    W = optimizer.risk_parity(mask)
+
+    for weights, held in zip(W, mask):
+        contributions = weights * (optimizer.covariance @ weights)
+        contributions /= contributions.sum()
+        assert weights.sum() == pytest.approx(1.0)
+        assert (weights[~held] == 0).all() and (weights[held] > 0).all()
+        np.testing.assert_allclose(contributions[held], 1 / held.sum(), atol=1e-7)
+
+
+@pytest.mark.parametrize('mode', ['min_variance', 'risk_parity', 'max_sharpe'])
+def test_masked_assets_are_left_out(mode):
+    returns = make_returns()
+    mask = np.ones((2, returns.shape[1]), dtype=bool)
+    mask[1, [2, 5]] = False
+    held = np.flatnonzero(mask[1])
+
+    covariance, mean, _ = shrinkage_covariance(returns)
+    W = PortfolioOptimizer(covariance, mean).optimize(mode, mask)
+    alone = PortfolioOptimizer(covariance.iloc[held, held], mean.iloc[held]).optimize(mode, np.ones((1, len(held)), dtype=bool))
+
+    assert (W[1, [2, 5]] == 0).all()
+    np.testing.assert_allclose(W.sum(axis=1), 1.0)
+    np.testing.assert_allclose(W[1, held], alone[0], atol=1e-6)
+
+
+def test_max_sharpe_without_positive_excess_return_falls_back_to_min_variance():
+    returns = make_returns()
+    returns.iloc[:, :4] -= returns.iloc[:, :4].mean() + 0.01  # negative mean returns
+    optimizer = make_optimizer(returns)
+    mask = np.zeros((2, returns.shape[1]), dtype=bool)
+    mask[0, :4] = True
+    mask[1, 2:8] = True
+
+    W = optimizer.max_sharpe(mask)
+
+    np.testing.assert_allclose(W[0], optimizer.min_variance(mask[:1])[0], atol=1e-7)
+    assert sharpe(W[1], optimizer.mean, optimizer.covariance) > 0
+
+
+def test_unknown_mode_raises():
+    optimizer = make_optimizer(make_returns())
+    with pytest.raises(ValueError):
+        optimizer.optimize('max_return', np.ones((1, len(optimizer.assets)), dtype=bool))
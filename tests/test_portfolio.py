@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculations.calc_portfolio import PortfolioReturnsEngine, calc_portfolio_price, calc_portfolio_returns
+
+DATES = pd.date_range('2020-01-31', periods=24, freq='ME').strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def inputs():
+    rng = np.random.default_rng(0)
+    rows = []
+    for i, asset_id in enumerate(['AAA', 'BBB', 'CCC', 'DDD']):
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.05, size=len(DATES))))
+        for date, price in zip(DATES, prices):
+            rows.append((asset_id, date, price))
+    prices = pd.DataFrame(rows, columns=['asset_id', 'date', 'asset_price'])
+    # CCC is listed late, DDD has a gap in its history
+    prices = prices[~((prices['asset_id'] == 'CCC') & (prices['date'] < DATES[6]))]
+    prices = prices[~((prices['asset_id'] == 'DDD') & prices['date'].isin(DATES[10:13]))]
+
+    allocation = pd.DataFrame([
+        ('PF_1', 'AAA', 0.6), ('PF_1', 'BBB', 0.4),
+        ('PF_2', 'CCC', 0.5), ('PF_2', 'DDD', 0.5),
+        ('PF_3', 'CCC', 0.7), ('PF_3', 'ZZZ', 0.3),  # ZZZ has no prices
+    ], columns=['portfolio_id', 'asset_id', 'asset_weight'])
+    return prices.reset_index(drop=True), allocation
+
+
+def naive_portfolio_returns(prices: pd.DataFrame, allocation: pd.DataFrame) -> pd.DataFrame:
+    # Loop over portfolios, dates and holdings with last known prices
+    price_tbl = prices.pivot(index='date', columns='asset_id', values='asset_price').sort_index().ffill()
+    rows = []
+    for pf_id, holdings in allocation.groupby('portfolio_id'):
+        holdings = holdings[holdings['asset_id'].isin(price_tbl.columns)]
+        started = False
+        for t, date in enumerate(price_tbl.index):
+            started = started or price_tbl.loc[date, holdings['asset_id']].notna().any()
+            if not started:
+                continue
+            pct, log = 0.0, 0.0
+            for asset_id, weight in zip(holdings['asset_id'], holdings['asset_weight']):
+                if t == 0 or np.isnan(price_tbl[asset_id].iloc[t - 1]) or np.isnan(price_tbl[asset_id].iloc[t]):
+                    continue
+                ratio = price_tbl[asset_id].iloc[t] / price_tbl[asset_id].iloc[t - 1]
+                pct += weight * (ratio - 1)
+                log += weight * np.log(ratio)
+            rows.append((pf_id, date, pct, log))
+    return pd.DataFrame(rows, columns=['portfolio_id', 'date', 'pct_return', 'log_return'])
+
+
+def test_portfolio_returns_match_naive_loop(inputs):
+    prices, allocation = inputs
+    engine = PortfolioReturnsEngine(prices, allocation)
+
+    result = engine.portfolio_returns_frame()
+    expected = naive_portfolio_returns(prices, allocation)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-12, atol=1e-15)
+    assert result.groupby('portfolio_id')['date'].min().to_dict() == {'PF_1': DATES[0], 'PF_2': DATES[0], 'PF_3': DATES[6]}
+
+
+def test_selected_portfolios_and_duplicate_prices(inputs):
+    prices, allocation = inputs
+    # A corrected price for the same asset and date replaces the earlier one
+    corrected = pd.DataFrame({'asset_id': ['AAA'], 'date': [DATES[5]], 'asset_price': [1.0]})
+    prices = pd.concat([prices, corrected], ignore_index=True)
+    engine = PortfolioReturnsEngine(prices, allocation)
+
+    result = engine.portfolio_returns_frame(['PF_1', 'UNKNOWN'])
+    expected = naive_portfolio_returns(prices.drop_duplicates(['asset_id', 'date'], keep='last'), allocation)
+
+    pd.testing.assert_frame_equal(
+        result, expected[expected['portfolio_id'] == 'PF_1'].reset_index(drop=True),
+        check_dtype=False, rtol=1e-12, atol=1e-15)
+
+
+def test_asset_returns_add_up_to_portfolio_returns(inputs):
+    prices, allocation = inputs
+    assets_tbl = allocation.merge(prices, on='asset_id')
+
+    asset_returns = calc_portfolio_price(assets_tbl)
+    pf_returns = calc_portfolio_returns(asset_returns)
+    expected = PortfolioReturnsEngine(prices, allocation).portfolio_returns_frame()
+
+    # Assets without prices are not held
+    assert asset_returns.groupby('portfolio_id')['asset_id'].nunique().to_dict() == {'PF_1': 2, 'PF_2': 2, 'PF_3': 1}
+    pd.testing.assert_frame_equal(pf_returns, expected, check_dtype=False, rtol=1e-12, atol=1e-15)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.rendering import lttb_indices, minmax_indices, downsample
+
+
+def lttb_reference(x, y, n_out):
+    # Point-by-point Largest-Triangle-Three-Buckets, with the same buckets as lttb_indices
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected, a = [0], 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = [abs((x[a] - next_x) * (y[j] - y[a]) - (x[a] - x[j]) * (next_y - y[a])) for j in range(lo, hi)]
+        a = lo + int(np.argmax(areas))
+        selected.append(a)
+    return np.array(selected + [n - 1])
+
+
+@pytest.mark.parametrize('n, n_out', [(1000, 100), (997, 37), (50, 3)])
+def test_lttb_matches_reference(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 100, size=n))
+    y = np.cumsum(rng.normal(size=n))
+
+    selected = lttb_indices(x, y, n_out)
+
+    np.testing.assert_array_equal(selected, lttb_reference(x, y, n_out))
+    assert len(selected) == n_out and selected[0] == 0 and selected[-1] == n - 1
+    assert (np.diff(selected) > 0).all()
+
+
+def test_lttb_processes_series_together_as_one_by_one():
+    rng = np.random.default_rng(0)
+    x = np.tile(np.arange(500, dtype=float), (4, 1))
+    y = np.cumsum(rng.normal(size=(4, 500)), axis=1)
+
+    selected = lttb_indices(x, y, 60)
+
+    for row in range(4):
+        np.testing.assert_array_equal(selected[row], lttb_indices(x[row], y[row], 60))
+
+
+def test_lttb_keeps_short_series():
+    np.testing.assert_array_equal(lttb_indices(np.arange(10.0), np.arange(10.0), 20), np.arange(10))
+
+
+def test_minmax_keeps_every_spike():
+    y = np.zeros(1000)
+    y[[123, 456, 789]] = [5.0, -7.0, 3.0]
+
+    selected = minmax_indices(y, 20)
+
+    assert {123, 456, 789, 0, 999} <= set(selected)
+    assert len(selected) <= 20 + 2
+
+
+def test_downsample_limits_points_per_series():
+    dates = pd.date_range('2000-01-01', periods=3000, freq='D')
+    data = pd.DataFrame({
+        'date': np.tile(dates, 2),
+        'series': np.repeat(['a', 'b'], len(dates)),
+        'value': np.cumsum(np.random.default_rng(0).normal(size=2 * len(dates))),
+    })
+
+    sampled = downsample(data, 'date', 'value', 'series', max_points=200)
+
+    assert sampled.groupby('series').size().max() <= 200
+    assert set(sampled['series']) == {'a', 'b'}
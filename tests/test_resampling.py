@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.constants import *
+from preprocessing.resampling import resample_prices, compound_returns, window_periods
+
+
+def make_daily_prices(seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frames = []
+    for asset_id, first in [('AAA', '2019-01-01'), ('BBB', '2019-05-15')]:
+        days = pd.bdate_range(first, '2021-12-31')
+        days = days[rng.random(len(days)) > 0.05]  # holidays
+        frames.append(pd.DataFrame({
+            'asset_id': asset_id, 'date': days.year * 10000 + days.month * 100 + days.day,
+            'asset_price': 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(days)))),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def pandas_resample(prices: pd.DataFrame, rule: str, date_format: str) -> pd.DataFrame:
+    frames = []
+    for asset_id, rows in prices.groupby('asset_id'):
+        dates = pd.to_datetime(rows['date'].astype(str), format='%Y%m%d' if rows['date'].dtype != object else DATE_FORMAT)
+        means = pd.Series(rows['asset_price'].to_numpy(), index=dates).resample(rule).mean().dropna()
+        frames.append(pd.DataFrame({'asset_id': asset_id, 'date': means.index.strftime(date_format), 'asset_price': means.to_numpy()}))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize('frequency, rule, date_format', [
+    ('weekly', 'W-FRI', '%Y-%m-%d'), ('monthly', 'ME', DATE_FORMAT), ('quarterly', 'QE', DATE_FORMAT), ('annual', 'YE', DATE_FORMAT),
+])
+def test_resampled_daily_prices_match_pandas(frequency, rule, date_format):
+    prices = make_daily_prices()
+
+    result = resample_prices(prices, frequency)
+
+    pd.testing.assert_frame_equal(result, pandas_resample(prices, rule, date_format), check_dtype=False, rtol=1e-12)
+
+
+def test_monthly_prices_resample_to_quarters():
+    monthly = resample_prices(make_daily_prices(), 'monthly')
+
+    result = resample_prices(monthly, 'quarterly')
+
+    pd.testing.assert_frame_equal(result, pandas_resample(monthly, 'QE', DATE_FORMAT), check_dtype=False, rtol=1e-12)
+
+
+def test_daily_prices_are_kept_and_missing_prices_dropped():
+    prices = make_daily_prices()
+    prices.loc[3, 'asset_price'] = np.nan
+
+    result = resample_prices(prices, 'daily')
+
+    assert len(result) == len(prices) - 1
+    assert result['date'].iloc[0] == pd.to_datetime(str(prices['date'].iloc[0])).strftime('%Y-%m-%d')
+    with pytest.raises(ValueError):
+        resample_prices(prices, 'hourly')
+
+
+def test_compound_returns_match_pandas():
+    rng = np.random.default_rng(1)
+    months = pd.date_range('2018-01-31', periods=36, freq='ME')
+    returns = pd.DataFrame(rng.normal(0.005, 0.04, size=(36, 3)), index=months.strftime(DATE_FORMAT), columns=['A', 'B', 'C'])
+    returns.iloc[:7, 1] = np.nan  # starts in the third quarter
+    returns.iloc[10, 2] = np.nan
+
+    for frequency, rule in [('quarterly', 'QE'), ('annual', 'YE')]:
+        result = compound_returns(returns, frequency)
+        expected = (1 + returns.set_axis(months)).resample(rule).prod(min_count=1) - 1
+        pd.testing.assert_frame_equal(result, expected.set_axis(expected.index.strftime(DATE_FORMAT)), rtol=1e-12)
+
+    assert compound_returns(returns, 'monthly') is returns
+    pd.testing.assert_series_equal(compound_returns(returns['A'], 'annual'), compound_returns(returns, 'annual')['A'])
+    with pytest.raises(ValueError):
+        compound_returns(returns, 'weekly')
+
+
+def test_window_periods():
+    assert window_periods(12, 'monthly') == 12
+    assert window_periods(12, 'quarterly') == 4
+    assert window_periods(36, 'weekly') == 156
+    assert window_periods(6, 'annual') == 1
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.constants import *
+from calculations.calc_risk import RiskMetricsEngine, RISK_METRICS
+
+PERIODS_PER_YEAR = 12
+RISK_FREE_RATE = 0.02
+LEVEL = 0.95
+
+
+def make_returns(n_periods: int = 120, n_portfolios: int = 4, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2010-01-31', periods=n_periods, freq='ME').strftime(DATE_FORMAT)
+    benchmark = pd.Series(rng.normal(0.006, 0.04, size=n_periods), index=index)
+    betas = np.linspace(0.5, 1.5, n_portfolios)
+    returns = pd.DataFrame(benchmark.to_numpy()[:, None] * betas + rng.normal(0.001, 0.02, size=(n_periods, n_portfolios)),
+                           index=index, columns=[f"PF_{i}" for i in range(n_portfolios)])
+    returns.iloc[:30, 1] = np.nan  # portfolio starting late
+    return returns, benchmark
+
+
+def engine(returns, benchmark=None) -> RiskMetricsEngine:
+    return RiskMetricsEngine(returns, benchmark, periods_per_year=PERIODS_PER_YEAR, risk_free_rate=RISK_FREE_RATE, level=LEVEL)
+
+
+def naive_metrics(r: np.ndarray, b: np.ndarray) -> dict:
+    # Metrics of one window of returns, computed directly
+    rf = RISK_FREE_RATE / PERIODS_PER_YEAR
+    annual = np.sqrt(PERIODS_PER_YEAR)
+    ordered = np.sort(r)
+    lo = int(np.floor((1 - LEVEL) * (len(r) - 1)))
+
+    wealth = np.concatenate([[1.0], np.cumprod(1 + r)])
+    drawdown = max(1 - w / peak for w, peak in zip(wealth, np.maximum.accumulate(wealth)))
+
+    return {
+        'volatility': r.std(ddof=1) * annual,
+        'max_drawdown': drawdown,
+        'sharpe': (r.mean() - rf) / r.std(ddof=1) * annual,
+        'sortino': (r.mean() - rf) / np.sqrt(np.mean(np.minimum(r - rf, 0) ** 2)) * annual,
+        'var': -np.quantile(r, 1 - LEVEL),
+        'cvar': -ordered[:lo + 1].mean(),
+        'beta': np.cov(r, b)[0, 1] / np.var(b, ddof=1),
+    }
+
+
+@pytest.mark.parametrize('window', [12, 36])
+def test_rolling_metrics_match_pandas(window):
+    returns, benchmark = make_returns()
+
+    metrics = engine(returns, benchmark).rolling(window)
+
+    annual = np.sqrt(PERIODS_PER_YEAR)
+    np.testing.assert_allclose(metrics['volatility'], returns.rolling(window).std().to_numpy() * annual, rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(metrics['var'], -returns.rolling(window).quantile(1 - LEVEL).to_numpy(), rtol=1e-12, atol=1e-15)
+    expected_beta = returns.rolling(window).cov(benchmark).div(benchmark.rolling(window).var(), axis=0)
+    np.testing.assert_allclose(metrics['beta'], expected_beta.to_numpy(), rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('window', [12, 36])
+def test_rolling_metrics_match_naive_loop(window):
+    returns, benchmark = make_returns()
+
+    metrics = engine(returns, benchmark).rolling(window)
+
+    R, b = returns.to_numpy(), benchmark.to_numpy()
+    for j in range(R.shape[1]):
+        for end in range(len(R)):
+            r = R[max(end - window + 1, 0):end + 1, j]
+            if end < window - 1 or np.isnan(r).any():
+                assert all(np.isnan(metrics[metric][end, j]) for metric in RISK_METRICS)
+                continue
+            expected = naive_metrics(r, b[end - window + 1:end + 1])
+            for metric in RISK_METRICS:
+                np.testing.assert_allclose(metrics[metric][end, j], expected[metric], rtol=1e-12, atol=1e-15, err_msg=metric)
+
+
+def test_summary_full_history_leaves_out_missing_returns():
+    returns, benchmark = make_returns()
+
+    summary = engine(returns, benchmark).summary(windows=(12,))
+
+    assert list(summary.columns) == ['portfolio_id', 'window', 'date'] + RISK_METRICS
+    assert len(summary) == 2 * returns.shape[1]
+    full = summary[summary['window'] == 'full'].set_index('portfolio_id')
+    r = returns['PF_1'].dropna()
+    expected = naive_metrics(r.to_numpy(), benchmark[r.index].to_numpy())
+    for metric in RISK_METRICS:
+        np.testing.assert_allclose(full.loc['PF_1', metric], expected[metric], rtol=1e-12, atol=1e-15, err_msg=metric)
+
+    latest = summary[summary['window'] == '12'].set_index('portfolio_id')
+    rolling = engine(returns, benchmark).rolling(12)
+    for metric in RISK_METRICS:
+        np.testing.assert_array_equal(latest[metric].to_numpy(), rolling[metric][-1])
+
+
+def test_undefined_metrics():
+    returns, _ = make_returns(n_periods=24)
+    returns['PF_3'] = 0.01  # constant
+
+    metrics = engine(returns).rolling(12)
+
+    assert np.isnan(metrics['beta']).all()  # no benchmark
+    assert np.isnan(metrics['sharpe'][:, 3]).all() and np.isnan(metrics['sortino'][:, 3]).all()
+    assert np.isnan(metrics['volatility'][:11]).all()
+    assert all(np.isnan(values).all() for values in engine(returns).rolling(25).values())
+
+
+def test_summary_and_rolling_frame_of_empty_index():
+    returns = pd.DataFrame(columns=['PF_0', 'PF_1'], dtype=float)
+
+    summary = engine(returns).summary()
+    frame = engine(returns).rolling_frame()
+
+    assert len(summary) == 0 and list(summary.columns) == ['portfolio_id', 'window', 'date'] + RISK_METRICS
+    assert len(frame) == 0
@@ -0,0 +1,104 @@
+import os
+import copy
+import json
+import shutil
+import sqlite3
+import pytest
+
+from common.constants import *
+from common.cache import CACHE
+from common.utils import db_connection, close_db_connections
+from db.setup import DataBase
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Tables added to the schema after the first release of the database
+NEW_TABLES = ['asset_prices_daily', 'ingestion_state']
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # Empty project (config and db folders) as the working directory
+    shutil.copytree(os.path.join(PROJECT_ROOT, 'config'), tmp_path / 'config')
+    (tmp_path / 'db').mkdir()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    close_db_connections()
+    CACHE.clear()
+
+
+def load_schema() -> dict:
+    with open('config/database_schema.json', 'r') as file:
+        return json.load(file)
+
+
+def write_schema(schema: dict) -> None:
+    with open('config/database_schema.json', 'w') as file:
+        json.dump(schema, file, indent=4)
+
+
+def create_baseline_database() -> None:
+    # Database as created by the first release: no indexes, none of the newer tables
+    baseline = copy.deepcopy(load_schema())
+    for table in NEW_TABLES:
+        del baseline[table]
+    for schema in baseline.values():
+        schema.pop('indexes', None)
+
+    conn = sqlite3.connect(f"db/{DB_NAME}")
+    for table, schema in baseline.items():
+        for sql_cmd in DataBase.create_sql_cmd(table, schema):
+            conn.execute(sql_cmd)
+    conn.executemany("INSERT INTO assets VALUES (?, ?)", [('AAA', 'Asset A'), ('BBB', None)])
+    conn.executemany("INSERT INTO factors VALUES (?, ?)", [('F1', 'Factor 1'), ('F2', 'Factor 2')])
+    conn.executemany(
+        "INSERT INTO factor_data VALUES (?, ?, ?, ?)",
+        [('F1', 'R1', '2020-01-31', 1.5), ('F1', 'R1', '2020-02-29', None), ('F2', 'R1', '2020-01-31', -0.5)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def dump(table: str) -> list:
+    with db_connection() as conn:
+        return sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=repr)
+
+
+def live_schema() -> list:
+    with db_connection() as conn:
+        return sorted(conn.execute("SELECT type, name, sql FROM sqlite_master").fetchall(), key=repr)
+
+
+def test_baseline_database_is_migrated_in_place(project):
+    create_baseline_database()
+    assets, factor_data = dump('assets'), dump('factor_data')
+    baseline_tables = [row for row in live_schema() if row[0] == 'table']
+
+    DataBase()
+
+    tables = {name for kind, name, _ in live_schema() if kind == 'table'}
+    indexes = {name for kind, name, _ in live_schema() if kind == 'index'}
+    assert tables == set(load_schema())
+    assert {'idx_asset_allocation_asset_id', 'idx_factors_factor_name', 'idx_regions_region_name'} <= indexes
+    # Existing tables were not rebuilt, only indexes and the new tables were created
+    assert all(row in live_schema() for row in baseline_tables)
+    assert dump('assets') == assets
+    assert dump('factor_data') == factor_data
+    assert DataBase().migrate_tables() == []
+
+
+def test_constraint_violation_rolls_back_and_raises(project):
+    create_baseline_database()
+    DataBase()
+    before, factor_data = live_schema(), dump('factor_data')
+
+    # factor_data holds a NULL value, which the new declaration forbids
+    schema = load_schema()
+    schema['factor_data']['columns']['value']['nullable'] = False
+    schema['assets']['indexes'] = {'idx_assets_asset_name': ['asset_name']}
+    write_schema(schema)
+
+    with pytest.raises(sqlite3.IntegrityError, match='violate the declared schema'):
+        DataBase()
+
+    assert live_schema() == before
+    assert dump('factor_data') == factor_data